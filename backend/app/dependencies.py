@@ -11,7 +11,8 @@ from dotenv import load_dotenv
 
 from app.database import get_db
 from app.models import User, Tenant
-from app.services.auth_service import decode_access_token, is_token_revoked
+from app.services.auth_cache import get_principal, is_revoked
+from app.services.auth_service import decode_access_token
 
 load_dotenv()
 logger = logging.getLogger(__name__)
@@ -25,6 +26,8 @@ async def get_current_user(
 ) -> User:
     """
     Valide le JWT bearer, vérifie la blacklist de révocation, retourne l'utilisateur.
+    Blacklist et utilisateur servis depuis le cache d'authentification (services/auth_cache.py) :
+    aucune requête SQL dans le cas courant.
     """
     token = credentials.credentials
     
@@ -37,7 +40,7 @@ async def get_current_user(
 
     # Vérifier si le token a été révoqué explicitement (logout)
     jti = payload.get("jti")
-    if jti and is_token_revoked(db, jti):
+    if jti and is_revoked(db, jti):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Token révoqué — veuillez vous reconnecter",
@@ -50,7 +53,7 @@ async def get_current_user(
             detail="Token invalide",
         )
     
-    user = db.query(User).filter(User.id == user_id).first()
+    user = get_principal(db, jti, user_id, payload.get("exp"))
     if user is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -1,31 +1,34 @@
 """
-Global HTTP Client with connection pooling for external API calls
-Réutilise les connexions au lieu de les créer à chaque fois
+Registre HTTP global — un pool de connexions nommé par upstream
+Réutilise les connexions au lieu de les créer à chaque fois.
+
+    client = get_client("korapay")
+    await client.post(url, json=..., timeout=...)   # timeout par requête si besoin
+
+Chaque pool a ses limites/timeouts (UPSTREAMS), HTTP/2 optionnel (si le paquet
+h2 est installé et HTTPX_HTTP2 != false) et des métriques : histogramme de
+latence, erreurs par type, requêtes en vol / pic vs max_connections (saturation),
+pool timeouts. Consultables via http_client_stats() (GET /api/admin/http-clients).
 """
 
 import httpx
+import json
 import os
-from typing import Optional
+import time
+from typing import AsyncIterator, Optional
 import logging
 
 logger = logging.getLogger(__name__)
 
-# ========== GLOBAL HTTP CLIENT CONFIGURATION ==========
-# Créer un client global avec pooling pour réutiliser les connexions
-# Cela réduit DRASTIQUEMENT la latence des requêtes externes
-
-HTTPX_LIMITS = httpx.Limits(
-    max_connections=100,           # Max connexions totales
-    max_keepalive_connections=20,  # Max connexions réutilisables
-    keepalive_expiry=30.0          # Garder les connexions 30s
-)
+# ========== CONFIGURATION DES POOLS ==========
 
 # Timeout courts : appels internes, service WhatsApp, webhooks
 HTTPX_TIMEOUT = httpx.Timeout(
     timeout=10.0,       # Total timeout: 10 secondes
     connect=3.0,        # Connection timeout: 3 secondes
     read=8.0,           # Read timeout: 8 secondes
-    write=3.0           # Write timeout: 3 secondes
+    write=3.0,          # Write timeout: 3 secondes
+    pool=5.0,           # Attente d'une connexion libre dans le pool
 )
 
 # Timeout longs : appels LLM (génération, chat IA) — DeepSeek peut mettre 15-30s
@@ -33,52 +36,257 @@ HTTPX_TIMEOUT_AI = httpx.Timeout(
     timeout=60.0,       # Total timeout: 60 secondes
     connect=5.0,        # Connection timeout: 5 secondes
     read=55.0,          # Read timeout: 55 secondes (stream de tokens)
-    write=5.0           # Write timeout: 5 secondes
+    write=5.0,          # Write timeout: 5 secondes
+    pool=5.0,
 )
 
-# Client global singleton
-_http_client: Optional[httpx.AsyncClient] = None
+# Timeout APIs tierces (paiement, email, GitHub)
+HTTPX_TIMEOUT_API = httpx.Timeout(15.0, connect=5.0, pool=5.0)
+
+# Surchargeable pour les tests de charge (scripts/fake_deepseek_server.py)
+DEEPSEEK_BASE_URL = os.getenv("DEEPSEEK_BASE_URL", "https://api.deepseek.com").rstrip("/")
+
+UPSTREAMS: dict[str, dict] = {
+    # Service Baileys (Render) : beaucoup de petits appels (envoi, typing, QR)
+    "whatsapp-service": {
+        "limits": httpx.Limits(max_connections=50, max_keepalive_connections=20, keepalive_expiry=30.0),
+        "timeout": HTTPX_TIMEOUT,
+        "http2": False,   # Node/Express : HTTP/1.1 uniquement
+        "follow_redirects": True,
+    },
+    "deepseek": {
+        "limits": httpx.Limits(max_connections=40, max_keepalive_connections=20, keepalive_expiry=60.0),
+        "timeout": HTTPX_TIMEOUT_AI,
+        "http2": True,
+    },
+    "anthropic": {
+        "limits": httpx.Limits(max_connections=10, max_keepalive_connections=5, keepalive_expiry=60.0),
+        "timeout": HTTPX_TIMEOUT_AI,
+        "http2": True,
+    },
+    "brevo": {
+        "limits": httpx.Limits(max_connections=10, max_keepalive_connections=5, keepalive_expiry=30.0),
+        "timeout": httpx.Timeout(10.0, connect=5.0, pool=5.0),
+        "http2": True,
+    },
+    "korapay": {
+        "limits": httpx.Limits(max_connections=10, max_keepalive_connections=5, keepalive_expiry=30.0),
+        "timeout": HTTPX_TIMEOUT_API,
+        "http2": False,
+    },
+    "campay": {
+        "limits": httpx.Limits(max_connections=10, max_keepalive_connections=5, keepalive_expiry=30.0),
+        "timeout": HTTPX_TIMEOUT_API,
+        "http2": False,
+    },
+    # Pages web / YouTube des sources de connaissance : redirections suivies à la main
+    # (chaque saut est revérifié — pas d'accès au réseau interne)
+    "knowledge-fetch": {
+        "limits": httpx.Limits(max_connections=20, max_keepalive_connections=10, keepalive_expiry=30.0),
+        "timeout": httpx.Timeout(20.0, connect=5.0, pool=10.0),
+        "http2": True,
+    },
+    "github": {
+        "limits": httpx.Limits(max_connections=5, max_keepalive_connections=2, keepalive_expiry=30.0),
+        "timeout": HTTPX_TIMEOUT_API,
+        "http2": True,
+    },
+}
+
+try:
+    import h2  # noqa: F401
+    _H2_AVAILABLE = True
+except ImportError:
+    _H2_AVAILABLE = False   # h2 non installé — HTTP/1.1 partout
+
+_HTTP2_ENABLED = _H2_AVAILABLE and os.getenv("HTTPX_HTTP2", "true").lower() != "false"
+
+# Bornes (ms) de l'histogramme de latence (jusqu'aux en-têtes de réponse)
+LATENCY_BUCKETS_MS = (25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000)
+
+
+# ========== MÉTRIQUES ==========
+
+class _PoolMetrics:
+    """Compteurs d'un pool. Tout tourne dans la boucle asyncio : pas de verrou."""
+
+    def __init__(self, max_connections: Optional[int]):
+        self.max_connections = max_connections
+        self.requests = 0
+        self.errors: dict[str, int] = {}
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)   # dernier = +Inf
+        self.latency_sum_ms = 0.0
+
+    def observe(self, elapsed_ms: float) -> None:
+        self.latency_sum_ms += elapsed_ms
+        for i, bound in enumerate(LATENCY_BUCKETS_MS):
+            if elapsed_ms <= bound:
+                self.buckets[i] += 1
+                return
+        self.buckets[-1] += 1
+
+    def error(self, kind: str) -> None:
+        self.errors[kind] = self.errors.get(kind, 0) + 1
+
+    def percentile(self, q: float) -> Optional[float]:
+        """Borne haute du bucket contenant le quantile q (approximation)."""
+        total = sum(self.buckets)
+        if not total:
+            return None
+        rank, seen = q * total, 0
+        for i, count in enumerate(self.buckets):
+            seen += count
+            if seen >= rank:
+                return float(LATENCY_BUCKETS_MS[i]) if i < len(LATENCY_BUCKETS_MS) else float("inf")
+        return float("inf")
+
+    def to_dict(self) -> dict:
+        count = sum(self.buckets)
+        cumulative, running = {}, 0
+        for i, bound in enumerate(LATENCY_BUCKETS_MS):
+            running += self.buckets[i]
+            cumulative[str(bound)] = running
+        cumulative["+Inf"] = count
+        return {
+            "requests": self.requests,
+            "errors": dict(self.errors),
+            "in_flight": self.in_flight,
+            "peak_in_flight": self.peak_in_flight,
+            "max_connections": self.max_connections,
+            "saturation": (
+                round(self.peak_in_flight / self.max_connections, 3)
+                if self.max_connections else None
+            ),
+            "latency_ms": {
+                "count": count,
+                "sum": round(self.latency_sum_ms, 1),
+                "p50": self.percentile(0.50),
+                "p95": self.percentile(0.95),
+                "p99": self.percentile(0.99),
+                "buckets": cumulative,
+            },
+        }
+
+
+class _InstrumentedTransport(httpx.AsyncBaseTransport):
+    """Enveloppe le transport du pool pour mesurer latence, erreurs et requêtes en vol."""
+
+    def __init__(self, inner: httpx.AsyncBaseTransport, metrics: _PoolMetrics):
+        self._inner = inner
+        self._metrics = metrics
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        m = self._metrics
+        m.requests += 1
+        m.in_flight += 1
+        m.peak_in_flight = max(m.peak_in_flight, m.in_flight)
+        start = time.perf_counter()
+        try:
+            response = await self._inner.handle_async_request(request)
+        except httpx.PoolTimeout:
+            m.error("pool_timeout")   # pool saturé : aucune connexion libre à temps
+            raise
+        except httpx.TimeoutException:
+            m.error("timeout")
+            raise
+        except httpx.TransportError:
+            m.error("transport")
+            raise
+        finally:
+            m.in_flight -= 1
+            m.observe((time.perf_counter() - start) * 1000)
+        if response.status_code == 429:
+            m.error("429")
+        elif response.status_code >= 500:
+            m.error("5xx")
+        elif response.status_code >= 400:
+            m.error("4xx")
+        return response
+
+    async def aclose(self) -> None:
+        await self._inner.aclose()
+
+
+# ========== REGISTRE ==========
+
+_clients: dict[str, httpx.AsyncClient] = {}
+_metrics: dict[str, _PoolMetrics] = {}
+# Transport imposé par upstream (tests, benchmarks contre un faux serveur)
+_transport_overrides: dict[str, httpx.AsyncBaseTransport] = {}
+
+
+def _build_client(name: str) -> httpx.AsyncClient:
+    cfg = UPSTREAMS[name]
+    limits: httpx.Limits = cfg["limits"]
+    metrics = _metrics.setdefault(name, _PoolMetrics(limits.max_connections))
+    inner = _transport_overrides.get(name) or httpx.AsyncHTTPTransport(
+        limits=limits,
+        http2=bool(cfg.get("http2")) and _HTTP2_ENABLED,
+    )
+    return httpx.AsyncClient(
+        transport=_InstrumentedTransport(inner, metrics),
+        timeout=cfg["timeout"],
+        follow_redirects=cfg.get("follow_redirects", False),
+    )
 
-def get_http_client() -> httpx.AsyncClient:
+
+def get_client(name: str) -> httpx.AsyncClient:
     """
-    Obtenir le client HTTP global
-    Réutilise les connexions au lieu de les créer à chaque appel
-    Performance: -50% latency vs nouveau client chaque fois
+    Client poolé de l'upstream `name` (voir UPSTREAMS), créé au premier appel.
+    Ne jamais le fermer côté appelant (pas de `async with`).
     """
-    global _http_client
-    
-    if _http_client is None:
-        _http_client = httpx.AsyncClient(
-            limits=HTTPX_LIMITS,
-            timeout=HTTPX_TIMEOUT,
-            http2=False,  # h2 non installé dans le venv — HTTP/1.1 suffisant
+    client = _clients.get(name)
+    if client is None or client.is_closed:
+        if name not in UPSTREAMS:
+            raise KeyError(f"Upstream HTTP inconnu : {name}")
+        client = _clients[name] = _build_client(name)
+        cfg = UPSTREAMS[name]
+        logger.info(
+            "✅ Pool HTTP '%s' initialisé (max %s connexions, http2=%s)",
+            name, cfg["limits"].max_connections, bool(cfg.get("http2")) and _HTTP2_ENABLED,
         )
-        logger.info("✅ Global HTTP client initialized with connection pooling")
-    
-    return _http_client
-
-async def close_http_client():
-    """Fermer le client au shutdown"""
-    global _http_client
-    if _http_client is not None:
-        await _http_client.aclose()
-        _http_client = None
-        logger.info("✅ HTTP client closed")
-
-# ========== BUDGET JOURNALIER (partagé avec services/http_client.py) ==========
-# Limite globale pour éviter les fuites : 500 appels/jour max
-try:
-    from .services.http_client import _ds_budget_ok as _budget_ok
-except Exception:
-    def _budget_ok() -> bool:
-        return True  # fallback si import circulaire
+    return client
+
+
+async def set_transport(name: str, transport: Optional[httpx.AsyncBaseTransport]) -> None:
+    """
+    Remplace le transport réseau d'un upstream (ex. httpx.ASGITransport vers un faux
+    serveur). None rétablit le transport réel. Le client existant est fermé.
+    """
+    if transport is None:
+        _transport_overrides.pop(name, None)
+    else:
+        _transport_overrides[name] = transport
+    client = _clients.pop(name, None)
+    if client is not None and not client.is_closed:
+        await client.aclose()
+
+
+def http_client_stats() -> dict:
+    """Métriques par upstream (pools jamais utilisés inclus, à zéro)."""
+    return {
+        name: _metrics.get(name, _PoolMetrics(cfg["limits"].max_connections)).to_dict()
+        for name, cfg in UPSTREAMS.items()
+    }
+
+
+async def close_http_clients() -> None:
+    """Fermer tous les pools au shutdown"""
+    for name, client in list(_clients.items()):
+        if not client.is_closed:
+            await client.aclose()
+    _clients.clear()
+    logger.info("✅ Pools HTTP fermés")
+
 
 # ========== API CLIENTS ==========
 
 class DeepSeekClient:
     """Client pour l'API DeepSeek avec retry et fallback"""
 
-    DEEPSEEK_URL = "https://api.deepseek.com/v1/chat/completions"
+    DEEPSEEK_URL = f"{DEEPSEEK_BASE_URL}/v1/chat/completions"
     DEEPSEEK_API_KEY = os.getenv("DEEPSEEK_API_KEY", "")
     
     @staticmethod
@@ -86,46 +294,173 @@ class DeepSeekClient:
         messages: list,
         model: str = "deepseek-chat",
         temperature: float = 0.7,
-        max_tokens: int = 120
+        max_tokens: int = 120,
+        tenant_id: Optional[int] = None,
+        purpose: str = "webhook_reply",
     ) -> dict:
         """
-        Appeler l'API DeepSeek avec le client global (pooling)
+        Appeler l'API DeepSeek avec le pool "deepseek"
         ~50% plus rapide que de créer un nouveau client
+        Passe par le generation_scheduler (file équitable par tenant) ;
+        retourne {"error": ..., "shed": True} si l'appel est délesté.
+        Débite le budget de tokens (tenant, purpose) ; {"error": ..., "budget": True} s'il est épuisé.
         """
+        # Imports locaux : services.http_client importe ce module
+        from .services.http_client import _usage_tokens
+        from .services.generation_scheduler import generation_scheduler, GenerationShed
+        from .services.token_budget import token_budget
+
         try:
             if not DeepSeekClient.DEEPSEEK_API_KEY:
                 return {"error": "DEEPSEEK_API_KEY is not configured"}
 
-            if not _budget_ok():
-                return {"error": "Budget journalier DeepSeek atteint"}
-
-            client = get_http_client()
-
-            response = await client.post(
-                DeepSeekClient.DEEPSEEK_URL,
-                headers={
-                    "Authorization": f"Bearer {DeepSeekClient.DEEPSEEK_API_KEY}",
-                    "Content-Type": "application/json"
-                },
-                json={
-                    "model": model,
-                    "messages": messages,
-                    "temperature": temperature,
-                    "max_tokens": min(max_tokens, 400),
-                    "stream": False
-                },
-                timeout=HTTPX_TIMEOUT_AI,  # Override : LLM peut prendre jusqu'à 60s
-            )
+            if not token_budget.allow(tenant_id, purpose):
+                return {"error": "Budget IA épuisé pour aujourd'hui", "budget": True}
+
+            client = get_client("deepseek")
+
+            async with generation_scheduler.slot(tenant_id, cost=max_tokens / 100):
+                response = await client.post(
+                    DeepSeekClient.DEEPSEEK_URL,
+                    headers={
+                        "Authorization": f"Bearer {DeepSeekClient.DEEPSEEK_API_KEY}",
+                        "Content-Type": "application/json"
+                    },
+                    json={
+                        "model": model,
+                        "messages": messages,
+                        "temperature": temperature,
+                        "max_tokens": min(max_tokens, 400),
+                        "stream": False
+                    },
+                )
             
             if response.status_code == 200:
-                return response.json()
+                data = response.json()
+                token_budget.consume(tenant_id, purpose, _usage_tokens(data, messages, max_tokens))
+                return data
             else:
                 logger.error(f"DeepSeek API error: {response.status_code}")
                 return {"error": f"API returned {response.status_code}"}
                 
+        except GenerationShed as e:
+            return {"error": "Service IA saturé, réessayez dans un instant", "shed": True, "reason": e.reason}
         except httpx.TimeoutException:
             logger.warning("DeepSeek API timeout (>60s)")
             return {"error": "API timeout"}
         except Exception as e:
             logger.error(f"DeepSeek API error: {e}")
             return {"error": str(e)}
+
+    @staticmethod
+    async def stream(
+        messages: list,
+        model: str = "deepseek-chat",
+        temperature: float = 0.7,
+        max_tokens: int = 120,
+        tenant_id: Optional[int] = None,
+        purpose: str = "webhook_reply",
+    ) -> AsyncIterator[dict]:
+        """
+        Variante streaming de call() : "stream": true, SSE DeepSeek parsé au fil de
+        l'eau sur le pool "deepseek" (même scheduler, même budget de tokens).
+
+        Produit {"delta": fragment} à chaque token puis
+        {"done": True, "content", "usage", "ttft_ms"} ; en cas d'échec un unique
+        {"error": ...} (+ "shed" / "budget" comme call()).
+        Fermer le générateur (client déconnecté → annulation) ferme la connexion
+        amont : DeepSeek arrête de générer et seuls les tokens produits sont débités.
+        """
+        from .services.generation_scheduler import generation_scheduler, GenerationShed
+        from .services.token_budget import token_budget
+        from .metrics import metrics
+
+        if not DeepSeekClient.DEEPSEEK_API_KEY:
+            yield {"error": "DEEPSEEK_API_KEY is not configured"}
+            return
+        if not token_budget.allow(tenant_id, purpose):
+            yield {"error": "Budget IA épuisé pour aujourd'hui", "budget": True}
+            return
+
+        client = get_client("deepseek")
+        started = time.perf_counter()
+        parts: list[str] = []
+        usage: dict = {}
+        ttft: Optional[float] = None
+        finished = False
+        try:
+            async with generation_scheduler.slot(tenant_id, cost=max_tokens / 100):
+                async with client.stream(
+                    "POST",
+                    DeepSeekClient.DEEPSEEK_URL,
+                    headers={
+                        "Authorization": f"Bearer {DeepSeekClient.DEEPSEEK_API_KEY}",
+                        "Content-Type": "application/json",
+                        "Accept": "text/event-stream",
+                    },
+                    json={
+                        "model": model,
+                        "messages": messages,
+                        "temperature": temperature,
+                        "max_tokens": min(max_tokens, 400),
+                        "stream": True,
+                        "stream_options": {"include_usage": True},
+                    },
+                ) as response:
+                    if response.status_code != 200:
+                        await response.aread()
+                        logger.error(f"DeepSeek API error (stream): {response.status_code}")
+                        finished = True
+                        yield {"error": f"API returned {response.status_code}"}
+                        return
+                    async for line in response.aiter_lines():
+                        if not line.startswith("data:"):
+                            continue   # lignes vides, commentaires keep-alive ": ..."
+                        data = line[5:].strip()
+                        if data == "[DONE]":
+                            break
+                        try:
+                            chunk = json.loads(data)
+                        except ValueError:
+                            continue
+                        usage = chunk.get("usage") or usage
+                        for choice in chunk.get("choices") or []:
+                            delta = (choice.get("delta") or {}).get("content")
+                            if not delta:
+                                continue
+                            if ttft is None:
+                                ttft = time.perf_counter() - started
+                                metrics.observe("neobot_llm_ttft_seconds", ttft, purpose=purpose)
+                            parts.append(delta)
+                            yield {"delta": delta}
+            finished = True
+            yield {
+                "done": True,
+                "content": "".join(parts),
+                "usage": usage,
+                "ttft_ms": round(ttft * 1000) if ttft is not None else None,
+            }
+        except GenerationShed as e:
+            finished = True
+            yield {"error": "Service IA saturé, réessayez dans un instant", "shed": True, "reason": e.reason}
+        except httpx.TimeoutException:
+            finished = True
+            logger.warning("DeepSeek API timeout (stream)")
+            yield {"error": "API timeout"}
+        except httpx.HTTPError as e:
+            finished = True
+            logger.error(f"DeepSeek API error (stream): {e}")
+            yield {"error": str(e)}
+        finally:
+            if not finished:
+                metrics.inc("neobot_llm_stream_cancelled_total", purpose=purpose)
+                logger.info(
+                    f"🛑 Génération {purpose} abandonnée par le client après {len(parts)} fragments "
+                    f"(tenant={tenant_id}) — connexion DeepSeek fermée"
+                )
+            # Tokens réellement produits (usage final, sinon estimation chars/4 prompt + sortie)
+            total = usage.get("total_tokens") or (
+                (sum(len(m.get("content") or "") for m in messages) + len("".join(parts))) // 4 if parts else 0
+            )
+            if total:
+                token_budget.consume(tenant_id, purpose, int(total))
@@ -1,8 +1,21 @@
 """
 Limiter global — partagé entre main.py (app.state) et les routers.
 Identifie chaque client par IP réelle (X-Forwarded-For respecté derrière Cloudflare).
+
+Compteurs en mémoire avec STATE_BACKEND=memory ; sinon stockés dans le backend
+d'état partagé (storage "state://") pour que la limite vaille pour tous les workers.
+RATE_LIMIT_STORAGE_URI force un autre stockage `limits` (ex. "memory://").
 """
+import os
+
 from slowapi import Limiter
 from slowapi.util import get_remote_address
 
-limiter = Limiter(key_func=get_remote_address)
+from .state_backend import STATE_BACKEND, StateBackendStorage  # noqa: F401 — enregistre le schéma state://
+
+RATE_LIMIT_STORAGE_URI = os.getenv(
+    "RATE_LIMIT_STORAGE_URI",
+    "memory://" if STATE_BACKEND == "memory" else "state://",
+)
+
+limiter = Limiter(key_func=get_remote_address, storage_uri=RATE_LIMIT_STORAGE_URI)
@@ -5,11 +5,11 @@ Version: 1.0.0
 from fastapi import FastAPI, HTTPException, Request, Depends, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.gzip import GZipMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
 from starlette.exceptions import HTTPException as StarletteHTTPException
 from sqlalchemy.orm import Session
 from sqlalchemy import text
-from datetime import datetime
+from datetime import datetime, timedelta
 from contextlib import asynccontextmanager
 import logging
 import os
@@ -50,14 +50,26 @@ from .routers.neopay import router as neopay_router
 from .routers.sentry_webhook import router as sentry_webhook_router
 from .routers.monitoring import router as monitoring_router
 from .routers.demo import router as demo_router
+from .routers.media import router as media_router
+from .routers.campaigns import router as campaigns_router
 from .services import neopay_service
 from .services import monitoring_service
 from .services.email_service import send_internal_alert
+from .services.email_outbox import email_outbox_loop
+from .services.knowledge_ingestion import knowledge_ingestion_loop, shutdown_ingestion_pool
+from .services.knowledge_sync import knowledge_sync_loop
+from .services.campaign_service import campaign_loop
+from .services.delayed_sender import stop_delayed_sender
+from .services.scheduler_service import (
+    scheduler, ScheduledJob, IntervalSchedule, CronSchedule,
+)
 from .services.business_kb_service import BusinessKBService
-from .http_client import close_http_client as _close_root_http_client
-from .services.http_client import close_http_client as _close_services_http_client
+from .http_client import close_http_clients, get_client
 from .middleware_subscription import SubscriptionMiddleware
 from .limiter import limiter
+from .state_backend import get_state_backend
+from .metrics import TimingMiddleware, metrics, METRICS_TOKEN, instrument_engine
+from .services.token_budget import token_budget_sync_loop, flush_token_budgets
 
 # ========== LOGGING CONFIGURATION ==========
 import os as _os_logging
@@ -211,6 +223,11 @@ async def _startup_tasks():
             "ALTER TABLE conversations ADD COLUMN IF NOT EXISTS outcome_detected_at TIMESTAMP WITH TIME ZONE;",
             # messages : colonnes potentiellement manquantes
             "ALTER TABLE messages ADD COLUMN IF NOT EXISTS tenant_id INTEGER;",
+            # messages : index pour la sélection des lots d'archivage (created_at < cutoff)
+            "CREATE INDEX IF NOT EXISTS idx_messages_created_at ON messages (created_at);",
+            # messages : id WhatsApp (messageKey.id) du message entrant — idempotence du webhook
+            "ALTER TABLE messages ADD COLUMN IF NOT EXISTS external_id VARCHAR(128);",
+            "CREATE UNIQUE INDEX IF NOT EXISTS uq_messages_external_id ON messages (external_id) WHERE external_id IS NOT NULL;",
             # contacts : colonnes ajoutées progressivement
             "ALTER TABLE contacts ADD COLUMN IF NOT EXISTS is_whitelisted BOOLEAN DEFAULT FALSE;",
             "ALTER TABLE contacts ADD COLUMN IF NOT EXISTS is_blacklisted BOOLEAN DEFAULT FALSE;",
@@ -220,6 +237,13 @@ async def _startup_tasks():
             "ALTER TABLE contacts ADD COLUMN IF NOT EXISTS message_count INTEGER DEFAULT 0;",
             # knowledge_sources : content_text (ancien nom, conservé pour compatibilité)
             "ALTER TABLE knowledge_sources ADD COLUMN IF NOT EXISTS content_text TEXT;",
+            # knowledge_sources : hash du fichier — dédup des réuploads (ingestion PDF en tâche de fond)
+            "ALTER TABLE knowledge_sources ADD COLUMN IF NOT EXISTS content_hash VARCHAR(64);",
+            "CREATE INDEX IF NOT EXISTS ix_knowledge_sources_content_hash ON knowledge_sources (content_hash);",
+            # knowledge_sources : synchronisation URL/YouTube (GET conditionnels)
+            "ALTER TABLE knowledge_sources ADD COLUMN IF NOT EXISTS next_sync_at TIMESTAMP;",
+            "ALTER TABLE knowledge_sources ADD COLUMN IF NOT EXISTS etag VARCHAR(255);",
+            "ALTER TABLE knowledge_sources ADD COLUMN IF NOT EXISTS last_modified VARCHAR(64);",
             # tenants : colonnes supplémentaires
             "ALTER TABLE tenants ADD COLUMN IF NOT EXISTS last_active_at TIMESTAMP WITH TIME ZONE;",
             "ALTER TABLE tenants ADD COLUMN IF NOT EXISTS messages_this_month INTEGER DEFAULT 0;",
@@ -447,180 +471,197 @@ async def _startup_tasks():
 
 async def _shutdown_tasks():
     """Cleanup au shutdown"""
-    await _close_root_http_client()
-    await _close_services_http_client()
+    await flush_token_budgets()
+    await close_http_clients()
     logger.info("🛑 Application arrêtée")
 
 
-async def _retry_webhooks_loop():
-    """Background task : retente les webhooks échoués toutes les 5 min."""
-    while True:
-        await asyncio.sleep(300)  # 5 minutes
-        db = SessionLocal()
-        try:
-            await neopay_service.retry_failed_webhooks(db)
-        except Exception as exc:
-            import sentry_sdk as _sentry
-            _sentry.capture_exception(exc)
-            logger.error(f"❌ retry_webhooks_loop error: {exc}")
-        finally:
-            db.close()
+async def _retry_webhooks_job():
+    """Retente les webhooks échoués (toutes les 5 min)."""
+    db = SessionLocal()
+    try:
+        await neopay_service.retry_failed_webhooks(db)
+    finally:
+        db.close()
 
 
-async def _credits_check_loop():
-    """Vérifie les balances API DeepSeek + Anthropic toutes les heures."""
-    while True:
-        await asyncio.sleep(3600)  # 1h
-        db = SessionLocal()
-        try:
-            await monitoring_service.check_and_store_credits(db)
-        except Exception as exc:
-            sentry_sdk.capture_exception(exc)
-            logger.error(f"❌ credits_check_loop error: {exc}")
-        finally:
-            db.close()
+async def _credits_check_job():
+    """Vérifie les balances API DeepSeek + Anthropic (toutes les heures)."""
+    db = SessionLocal()
+    try:
+        await monitoring_service.check_and_store_credits(db)
+    finally:
+        db.close()
 
 
-async def _morning_summary_loop():
-    """Envoie un résumé des alertes Sentry ouvertes à 8h UTC chaque jour."""
-    from datetime import datetime as _dt, timezone as _tz
-    while True:
-        now = _dt.now(_tz.utc)
-        # Prochain 8h00 UTC
-        target = now.replace(hour=8, minute=0, second=0, microsecond=0)
-        if now >= target:
-            # On est déjà passé 8h aujourd'hui — attendre demain
-            from datetime import timedelta as _td
-            target += _td(days=1)
-        await asyncio.sleep((target - now).total_seconds())
-        db = SessionLocal()
-        try:
-            await monitoring_service.send_morning_summary(db)
-        except Exception as exc:
-            sentry_sdk.capture_exception(exc)
-            logger.error(f"❌ morning_summary_loop error: {exc}")
-        finally:
-            db.close()
+async def _morning_summary_job():
+    """Envoie un résumé des alertes Sentry ouvertes (8h UTC chaque jour)."""
+    db = SessionLocal()
+    try:
+        await monitoring_service.send_morning_summary(db)
+    finally:
+        db.close()
 
 
-async def _db_cleanup_loop():
+async def _db_cleanup_job():
     """
     Cron hebdomadaire : dimanche à 3h UTC.
     - Archive les conversations de plus de 6 mois dans conversations_archive
+    - Déplace les messages de plus de 6 mois vers le stockage froid (NDJSON gzip)
+    - Purge l'historique du scheduler (> 30 jours)
     - Log la taille actuelle de la base Neon
     - Envoie une alerte email si la base dépasse 400 MB (limite Neon free : 512 MB)
     """
-    from datetime import datetime as _dt, timezone as _tz, timedelta as _td
-    while True:
-        now = _dt.now(_tz.utc)
-        # Prochain dimanche 3h00 UTC
-        days_until_sunday = (6 - now.weekday()) % 7  # 6 = dimanche
-        next_run = now.replace(hour=3, minute=0, second=0, microsecond=0) + _td(days=days_until_sunday)
-        if next_run <= now:
-            next_run += _td(weeks=1)
-        await asyncio.sleep((next_run - now).total_seconds())
-
-        db = SessionLocal()
-        try:
-            # 1. Créer la table d'archive si elle n'existe pas
-            db.execute(text("""
-                CREATE TABLE IF NOT EXISTS conversations_archive (
-                    id             INTEGER,
-                    tenant_id      INTEGER,
-                    customer_phone VARCHAR(50),
-                    customer_name  VARCHAR(255),
-                    channel        VARCHAR(50),
-                    status         VARCHAR(50),
-                    created_at     TIMESTAMP,
-                    last_message_at TIMESTAMP,
-                    outcome_type   VARCHAR(50),
-                    outcome_detected_at TIMESTAMP,
-                    archived_at    TIMESTAMPTZ DEFAULT NOW()
-                )
-            """))
-            db.commit()
-
-            # 2. Copier les conversations de plus de 6 mois (sans supprimer — safe pour MVP)
-            result = db.execute(text("""
-                INSERT INTO conversations_archive
-                    (id, tenant_id, customer_phone, customer_name, channel, status,
-                     created_at, last_message_at, outcome_type, outcome_detected_at, archived_at)
-                SELECT id, tenant_id, customer_phone, customer_name, channel, status,
-                       created_at, last_message_at, outcome_type, outcome_detected_at, NOW()
-                FROM conversations
-                WHERE created_at < NOW() - INTERVAL '6 months'
-                  AND id NOT IN (SELECT id FROM conversations_archive WHERE id IS NOT NULL)
-            """))
-            db.commit()
-            archived_count = result.rowcount
-            logger.info(f"✅ DB cleanup : {archived_count} conversations archivées")
-
-            # 3. Mesurer la taille de la base
-            size_result = db.execute(text(
-                "SELECT pg_database_size(current_database()) AS bytes"
-            )).fetchone()
-            size_mb = round(size_result.bytes / (1024 * 1024), 1) if size_result else 0
-            logger.info(f"📊 Taille base Neon : {size_mb} MB")
-
-            # 4. Alerte si on approche de la limite
-            alert_email = os.getenv("NEOPAY_ALERT_EMAIL", "neobot561@gmail.com")
-            if size_mb > 400:
-                await send_internal_alert(
-                    subject=f"⚠️ NéoBot — Base de données à {size_mb} MB (limite : 512 MB)",
-                    body=(
-                        f"La base de données Neon atteint {size_mb} MB.\n\n"
-                        f"Conversations archivées ce cycle : {archived_count}\n\n"
-                        f"Action requise : supprimer les anciennes données ou migrer vers un plan supérieur.\n"
-                        f"Limite Neon free tier : 512 MB."
-                    )
-                )
-                logger.warning(f"⚠️ Alerte taille DB envoyée : {size_mb} MB > 400 MB")
-            else:
-                logger.info(f"✅ Taille DB OK : {size_mb} MB / 512 MB")
+    db = SessionLocal()
+    try:
+        # 1. Créer la table d'archive si elle n'existe pas
+        db.execute(text("""
+            CREATE TABLE IF NOT EXISTS conversations_archive (
+                id             INTEGER,
+                tenant_id      INTEGER,
+                customer_phone VARCHAR(50),
+                customer_name  VARCHAR(255),
+                channel        VARCHAR(50),
+                status         VARCHAR(50),
+                created_at     TIMESTAMP,
+                last_message_at TIMESTAMP,
+                outcome_type   VARCHAR(50),
+                outcome_detected_at TIMESTAMP,
+                archived_at    TIMESTAMPTZ DEFAULT NOW()
+            )
+        """))
+        db.execute(text(
+            "CREATE INDEX IF NOT EXISTS idx_conversations_archive_id ON conversations_archive (id)"
+        ))
+        db.commit()
 
-        except Exception as exc:
-            sentry_sdk.capture_exception(exc)
-            logger.error(f"❌ db_cleanup_loop error: {exc}")
-        finally:
-            db.close()
+        # 2. Copier les conversations de plus de 6 mois (sans supprimer — safe pour MVP)
+        result = db.execute(text("""
+            INSERT INTO conversations_archive
+                (id, tenant_id, customer_phone, customer_name, channel, status,
+                 created_at, last_message_at, outcome_type, outcome_detected_at, archived_at)
+            SELECT id, tenant_id, customer_phone, customer_name, channel, status,
+                   created_at, last_message_at, outcome_type, outcome_detected_at, NOW()
+            FROM conversations c
+            WHERE c.created_at < NOW() - INTERVAL '6 months'
+              AND NOT EXISTS (SELECT 1 FROM conversations_archive a WHERE a.id = c.id)
+        """))
+        db.commit()
+        archived_count = result.rowcount
+        logger.info(f"✅ DB cleanup : {archived_count} conversations archivées")
 
+        # 2b. Messages > 6 mois → fichiers d'archive, supprimés de la table chaude par petits lots.
+        # Thread dédié avec sa propre session : ne bloque pas l'event loop pendant l'export.
+        from app.services.message_archive_service import MessageArchiveService
 
-async def _wa_keepalive_loop():
+        def _archive_messages_job() -> dict:
+            _db = SessionLocal()
+            try:
+                return MessageArchiveService.archive_old_messages(_db)
+            finally:
+                _db.close()
+
+        archive_stats = await asyncio.to_thread(_archive_messages_job)
+        if archive_stats["skipped"]:
+            logger.info(f"⏭️ DB cleanup : archivage des messages non effectué ({archive_stats['skipped']})")
+        else:
+            logger.info(f"✅ DB cleanup : {archive_stats['archived']} messages archivés")
+
+        purged_runs = scheduler.purge_history(db)
+        logger.info(f"✅ DB cleanup : {purged_runs} runs du scheduler purgés")
+
+        # 3. Mesurer la taille de la base
+        size_result = db.execute(text(
+            "SELECT pg_database_size(current_database()) AS bytes"
+        )).fetchone()
+        size_mb = round(size_result.bytes / (1024 * 1024), 1) if size_result else 0
+        logger.info(f"📊 Taille base Neon : {size_mb} MB")
+
+        # 4. Alerte si on approche de la limite
+        alert_email = os.getenv("NEOPAY_ALERT_EMAIL", "neobot561@gmail.com")
+        if size_mb > 400:
+            await send_internal_alert(
+                subject=f"⚠️ NéoBot — Base de données à {size_mb} MB (limite : 512 MB)",
+                body=(
+                    f"La base de données Neon atteint {size_mb} MB.\n\n"
+                    f"Conversations archivées ce cycle : {archived_count}\n"
+                    f"Messages archivés ce cycle : {archive_stats['archived']}\n\n"
+                    f"Action requise : supprimer les anciennes données ou migrer vers un plan supérieur.\n"
+                    f"Limite Neon free tier : 512 MB."
+                )
+            )
+            logger.warning(f"⚠️ Alerte taille DB envoyée : {size_mb} MB > 400 MB")
+        else:
+            logger.info(f"✅ Taille DB OK : {size_mb} MB / 512 MB")
+    finally:
+        db.close()
+
+
+async def _wa_keepalive_job():
     """Ping le service WhatsApp toutes les 10 min pour l'empêcher de dormir.
     Sur Render free tier, les services dorment après 15 min d'inactivité,
     ce qui provoque un cold start de 30-60s à la prochaine requête.
     """
     wa_url = os.getenv("WHATSAPP_SERVICE_URL", "")
     if not wa_url:
-        logger.info("WA keep-alive désactivé : WHATSAPP_SERVICE_URL non défini")
         return
-    await asyncio.sleep(60)  # laisser le service démarrer complètement
-    while True:
-        try:
-            async with httpx.AsyncClient(timeout=10.0) as client:
-                await client.get(f"{wa_url}/health")
-            logger.debug("WA keep-alive OK")
-        except Exception as e:
-            logger.debug(f"WA keep-alive ping échoué (normal au démarrage): {e}")
-        await asyncio.sleep(600)  # 10 min
+    try:
+        await get_client("whatsapp-service").get(f"{wa_url}/health")
+        logger.debug("WA keep-alive OK")
+    except Exception as e:
+        logger.debug(f"WA keep-alive ping échoué (normal au démarrage): {e}")
+
+
+async def _state_purge_job():
+    """Supprime les clés expirées du backend d'état (table state_kv ; no-op en mémoire/Redis)."""
+    purged = await asyncio.to_thread(get_state_backend().purge_expired)
+    if purged:
+        logger.info(f"🧹 Backend d'état : {purged} clés expirées purgées")
+
+
+# Un seul process (le leader) exécute ces jobs, même avec plusieurs workers/instances.
+scheduler.add_job(ScheduledJob("retry_webhooks", _retry_webhooks_job, IntervalSchedule(300), jitter=30))
+scheduler.add_job(ScheduledJob("credits_check", _credits_check_job, IntervalSchedule(3600), jitter=120))
+scheduler.add_job(ScheduledJob(
+    "morning_summary", _morning_summary_job, CronSchedule("0 8 * * *"),
+    jitter=60, catch_up_window=timedelta(hours=4),   # un résumé de 8h envoyé l'après-midi n'a plus de sens
+))
+scheduler.add_job(ScheduledJob(
+    "db_cleanup", _db_cleanup_job, CronSchedule("0 3 * * 0"),
+    jitter=300, catch_up_window=timedelta(days=3),
+))
+scheduler.add_job(ScheduledJob(
+    "wa_keepalive", _wa_keepalive_job, IntervalSchedule(600),
+    catch_up=False, initial_delay=60,   # laisser le service démarrer complètement
+))
+scheduler.add_job(ScheduledJob("state_purge", _state_purge_job, IntervalSchedule(3600), jitter=300, catch_up=False))
 
 
 @asynccontextmanager
 async def lifespan(_app: FastAPI):
     await _startup_tasks()
-    retry_task     = asyncio.create_task(_retry_webhooks_loop())
-    credits_task   = asyncio.create_task(_credits_check_loop())
-    morning_task   = asyncio.create_task(_morning_summary_loop())
-    cleanup_task   = asyncio.create_task(_db_cleanup_loop())
-    keepalive_task = asyncio.create_task(_wa_keepalive_loop())
+    scheduler_task = asyncio.create_task(scheduler.run())
+    # Outbox : tourne sur chaque instance (SKIP LOCKED), pas besoin de leader
+    outbox_task    = asyncio.create_task(email_outbox_loop())
+    # Budgets IA : chaque worker synchronise ses seaux par lots
+    budget_task    = asyncio.create_task(token_budget_sync_loop())
+    # Ingestion PDF : chaque instance traite les fichiers reçus sur son disque
+    ingestion_task = asyncio.create_task(knowledge_ingestion_loop())
+    # Sources URL/YouTube : SKIP LOCKED, chaque instance prend sa part
+    sync_task      = asyncio.create_task(knowledge_sync_loop())
+    # Campagnes sortantes : bail par tenant dans le backend d'état, chaque instance prend sa part
+    campaign_task  = asyncio.create_task(campaign_loop())
     try:
         yield
     finally:
-        retry_task.cancel()
-        credits_task.cancel()
-        morning_task.cancel()
-        cleanup_task.cancel()
-        keepalive_task.cancel()
+        scheduler_task.cancel()
+        outbox_task.cancel()
+        budget_task.cancel()
+        ingestion_task.cancel()
+        sync_task.cancel()
+        campaign_task.cancel()
+        stop_delayed_sender()       # démarré à la demande par queue_response
+        shutdown_ingestion_pool()
         await _shutdown_tasks()
 
 
@@ -685,6 +726,8 @@ app.include_router(neopay_router)
 app.include_router(sentry_webhook_router)
 app.include_router(monitoring_router)
 app.include_router(demo_router)
+app.include_router(media_router)
+app.include_router(campaigns_router)
 
 # ========== CORS MIDDLEWARE ==========
 # Note : les middlewares Starlette s'exécutent dans l'ordre inverse d'ajout.
@@ -709,6 +752,9 @@ logger.info(f"CORS allow_origins : {_CORS_ORIGINS}")
 app.add_middleware(GZipMiddleware, minimum_size=500)
 app.add_middleware(SubscriptionMiddleware)
 app.add_middleware(SecurityHeadersMiddleware)
+# Chronométrage : ventilation par étape (Server-Timing), histogrammes /metrics, slow log
+app.add_middleware(TimingMiddleware)
+instrument_engine(engine)
 # CORSMiddleware DERNIER = PREMIER à s'exécuter = traite TOUTES les requêtes/réponses,
 # y compris les 500 qui remontent jusqu'à ServerErrorMiddleware.
 # CORSMiddleware est un ASGI middleware pur (pas BaseHTTPMiddleware), il capture
@@ -774,15 +820,27 @@ async def service_health():
     """Proxy public vers le health check du service WhatsApp — utilisé par la page /status."""
     whatsapp_url = os.getenv("WHATSAPP_SERVICE_URL", "http://localhost:3001")
     try:
-        async with httpx.AsyncClient(timeout=6.0) as client:
-            resp = await client.get(f"{whatsapp_url}/health")
-            data = resp.json()
-            return JSONResponse(status_code=resp.status_code, content=data)
+        resp = await get_client("whatsapp-service").get(f"{whatsapp_url}/health", timeout=6.0)
+        data = resp.json()
+        return JSONResponse(status_code=resp.status_code, content=data)
     except httpx.TimeoutException:
         return JSONResponse(status_code=503, content={"status": "down", "detail": "timeout"})
     except Exception as exc:
         return JSONResponse(status_code=503, content={"status": "down", "detail": str(exc)})
 
+# ========== MÉTRIQUES PROMETHEUS ==========
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics(request: Request):
+    """Histogrammes par étape / route + pools HTTP, file LLM, budgets, déduplication (process courant).
+    Séries par tenant : fermé en production tant que METRICS_TOKEN n'est pas défini."""
+    if not METRICS_TOKEN and os.getenv("APP_ENV", "development") == "production":
+        raise HTTPException(status_code=403, detail="Métriques désactivées : METRICS_TOKEN non configuré")
+    if METRICS_TOKEN:
+        import hmac
+        if not hmac.compare_digest(request.headers.get("authorization", ""), f"Bearer {METRICS_TOKEN}"):
+            raise HTTPException(status_code=401, detail="Token métriques invalide")
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
 # ========== ROOT ENDPOINT ==========
 @app.get("/")
 async def root():
@@ -901,14 +959,25 @@ async def get_conversations(tenant_id: int, db: Session = Depends(get_db)):
 @app.get("/api/messages/{conversation_id}")
 async def get_messages(conversation_id: int, db: Session = Depends(get_db)):
     """Récupérer les messages d'une conversation"""
+    from app.services.message_archive_service import MessageArchiveService
+    archived = await asyncio.to_thread(MessageArchiveService.get_archived_messages, conversation_id, db)
     messages = db.query(Message).filter(
         Message.conversation_id == conversation_id
     ).order_by(Message.created_at).all()
     
     return {
         "conversation_id": conversation_id,
-        "count": len(messages),
+        "count": len(archived) + len(messages),
         "messages": [
+            {
+                "id": m["id"],
+                "content": m["content"],
+                "direction": m["direction"],
+                "is_ai": m["is_ai"],
+                "created_at": m["created_at"]
+            }
+            for m in archived
+        ] + [
             {
                 "id": m.id,
                 "content": m.content,
@@ -0,0 +1,311 @@
+"""
+Metrics — Latence par étape du pipeline message + export Prometheus
+
+  - span("llm") : chronomètre une étape ; la durée alimente l'histogramme
+    neobot_stage_seconds{stage=...} et la ventilation de la requête en cours.
+  - TimingMiddleware (ASGI pur) : ouvre la ventilation de chaque requête, ajoute
+    l'en-tête Server-Timing (une entrée par étape + requêtes SQL + total), alimente
+    neobot_http_request_seconds{method,route,status} et, au-delà de
+    SLOW_REQUEST_MS, journalise la ventilation complète (slow log).
+  - instrument_engine(engine) : compte les requêtes SQL (neobot_db_queries_total
+    et ventilation de la requête HTTP en cours, tâches de fond comprises).
+  - GET /metrics : format texte Prometheus ; inclut les pools HTTP, le scheduler
+    de génération, les budgets de tokens et la déduplication webhook.
+
+Histogrammes en mémoire, par process : chaque worker est scrapé séparément.
+"""
+
+import bisect
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+SLOW_REQUEST_MS = int(os.getenv("SLOW_REQUEST_MS", "0"))   # 0 = slow log désactivé
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
+# Secondes : de la requête DB (1 ms) à la réponse LLM lente (60 s)
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0)
+
+
+class Histogram:
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds: tuple = DEFAULT_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)   # dernier = +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self) -> list[tuple[str, int]]:
+        out, running = [], 0
+        for bound, count in zip(self.bounds, self.counts):
+            running += count
+            out.append((repr(float(bound)), running))
+        out.append(("+Inf", self.count))
+        return out
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in sorted(labels.items())) + "}"
+
+
+class MetricsRegistry:
+
+    def __init__(self):
+        self._histograms: dict[str, dict[tuple, Histogram]] = {}
+        self._counters: dict[str, dict[tuple, float]] = {}
+        self._help: dict[str, str] = {}
+        self._collectors: list[Callable[[], list[tuple[str, str, str, list[tuple[dict, float]]]]]] = []
+        self._lock = threading.Lock()
+
+    def describe(self, name: str, help_text: str) -> None:
+        self._help[name] = help_text
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            hist = series.get(key)
+            if hist is None:
+                hist = series[key] = Histogram()
+            hist.observe(value)
+
+    def inc(self, name: str, amount: float = 1.0, **labels) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0.0) + amount
+
+    def register_collector(self, fn: Callable) -> None:
+        """fn() → [(nom, type, aide, [(labels, valeur), ...]), ...] évalué à chaque scrape."""
+        self._collectors.append(fn)
+
+    def histogram(self, name: str, **labels) -> Optional[Histogram]:
+        return self._histograms.get(name, {}).get(tuple(sorted(labels.items())))
+
+    def reset(self) -> None:
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+    def render(self) -> str:
+        """Exposition au format texte Prometheus 0.0.4."""
+        lines: list[str] = []
+        with self._lock:
+            for name, series in sorted(self._histograms.items()):
+                lines.append(f"# HELP {name} {self._help.get(name, name)}")
+                lines.append(f"# TYPE {name} histogram")
+                for key, hist in sorted(series.items()):
+                    labels = dict(key)
+                    for le, count in hist.cumulative():
+                        lines.append(f"{name}_bucket{_labels({**labels, 'le': le})} {count}")
+                    lines.append(f"{name}_sum{_labels(labels)} {hist.sum:.6f}")
+                    lines.append(f"{name}_count{_labels(labels)} {hist.count}")
+            for name, series in sorted(self._counters.items()):
+                lines.append(f"# HELP {name} {self._help.get(name, name)}")
+                lines.append(f"# TYPE {name} counter")
+                for key, value in sorted(series.items()):
+                    lines.append(f"{name}{_labels(dict(key))} {value:.15g}")
+        for collector in self._collectors:
+            try:
+                families = collector()
+            except Exception as exc:
+                logger.warning(f"⚠️ Collecteur de métriques en échec : {exc}")
+                continue
+            for name, kind, help_text, samples in families:
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples:
+                    lines.append(f"{name}{_labels(labels)} {float(value):g}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+metrics.describe("neobot_stage_seconds", "Durée des étapes du pipeline message (secondes)")
+metrics.describe("neobot_http_request_seconds", "Durée des requêtes HTTP jusqu'au dernier octet de réponse (secondes)")
+metrics.describe("neobot_slow_requests_total", "Requêtes au-delà de SLOW_REQUEST_MS")
+metrics.describe("neobot_db_queries_total", "Requêtes SQL exécutées (process)")
+metrics.describe("neobot_llm_ttft_seconds", "Délai avant le premier token des réponses LLM en streaming (secondes)")
+metrics.describe("neobot_llm_stream_cancelled_total", "Générations en streaming abandonnées (client déconnecté)")
+
+
+# ── Ventilation par requête ───────────────────────────────────────────────────
+
+class RequestTimings:
+    __slots__ = ("started", "spans", "queries")
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.spans: list[tuple[str, float]] = []
+        self.queries = 0
+
+    def by_stage(self) -> dict[str, float]:
+        """Durée cumulée par étape (une étape peut apparaître plusieurs fois : save, ...)."""
+        totals: dict[str, float] = {}
+        for stage, seconds in self.spans:
+            totals[stage] = totals.get(stage, 0.0) + seconds
+        return totals
+
+    def server_timing(self) -> str:
+        entries = [f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in self.by_stage().items()]
+        if self.queries:
+            entries.append(f'db_queries;desc="{self.queries}"')
+        entries.append(f"total;dur={(time.perf_counter() - self.started) * 1000:.1f}")
+        return ", ".join(entries)
+
+
+_current_timings: ContextVar[Optional[RequestTimings]] = ContextVar("request_timings", default=None)
+
+
+@contextmanager
+def span(stage: str):
+    """
+    with span("llm"):
+        ... étape chronométrée ...
+    Utilisable en code sync et async ; sans requête en cours, seul l'histogramme est alimenté.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        metrics.observe("neobot_stage_seconds", elapsed, stage=stage)
+        timings = _current_timings.get()
+        if timings is not None:
+            timings.spans.append((stage, elapsed))
+
+
+def instrument_engine(engine) -> None:
+    """Branche le compteur de requêtes SQL sur un engine (idempotent)."""
+    from sqlalchemy import event
+
+    if event.contains(engine, "before_cursor_execute", _count_query):
+        return
+    event.listen(engine, "before_cursor_execute", _count_query)
+
+
+def _count_query(*_args) -> None:
+    metrics.inc("neobot_db_queries_total")
+    timings = _current_timings.get()
+    if timings is not None:
+        timings.queries += 1
+
+
+_route_paths: dict = {}
+
+
+def _route_template(scope) -> str:
+    """Gabarit de la route servie ("/api/agents/{agent_id}") : cardinalité bornée, jamais l'URL brute."""
+    endpoint = scope.get("endpoint")
+    if endpoint is None:
+        return "unmatched"
+    path = _route_paths.get(endpoint)
+    if path is None:
+        app = scope.get("app")
+        path = next(
+            (r.path for r in getattr(app, "routes", []) if getattr(r, "endpoint", None) is endpoint),
+            getattr(endpoint, "__name__", "unknown"),
+        )
+        _route_paths[endpoint] = path
+    return path
+
+
+class TimingMiddleware:
+    """ASGI pur : Server-Timing, histogramme HTTP par route, slow log."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timings = RequestTimings()
+        token = _current_timings.set(timings)
+        status = {"code": 500}
+
+        async def _send(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", timings.server_timing().encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                self._finish(scope, timings, status["code"])
+
+        try:
+            await self.app(scope, receive, _send)
+        finally:
+            _current_timings.reset(token)
+
+    @staticmethod
+    def _finish(scope, timings: RequestTimings, status: int) -> None:
+        elapsed = time.perf_counter() - timings.started
+        route = _route_template(scope)
+        metrics.observe("neobot_http_request_seconds", elapsed, method=scope["method"], route=route, status=str(status))
+        if SLOW_REQUEST_MS and elapsed * 1000 >= SLOW_REQUEST_MS:
+            metrics.inc("neobot_slow_requests_total", route=route)
+            breakdown = " ".join(
+                f"{stage}={seconds * 1000:.0f}ms"
+                for stage, seconds in sorted(timings.by_stage().items(), key=lambda kv: -kv[1])
+            )
+            logger.warning(
+                f"🐢 Requête lente {scope['method']} {scope['path']} → {status} en {elapsed * 1000:.0f}ms "
+                f"({timings.queries} requêtes SQL) : {breakdown or 'aucune étape'}"
+            )
+
+
+# ── Métriques des autres composants (évaluées au scrape) ─────────────────────
+
+def _platform_collector() -> list:
+    from .http_client import http_client_stats
+    from .services.generation_scheduler import generation_scheduler
+    from .services.token_budget import token_budget
+    from .services.webhook_idempotency import webhook_dedup
+
+    pools = http_client_stats()
+    sched = generation_scheduler.stats()
+    budgets = token_budget.stats()
+    dedup = webhook_dedup.stats()
+    return [
+        ("neobot_http_pool_requests_total", "counter", "Requêtes sortantes par upstream",
+         [({"upstream": n}, p["requests"]) for n, p in pools.items()]),
+        ("neobot_http_pool_in_flight", "gauge", "Requêtes sortantes en vol par upstream",
+         [({"upstream": n}, p["in_flight"]) for n, p in pools.items()]),
+        ("neobot_http_pool_errors_total", "counter", "Erreurs sortantes par upstream et type",
+         [({"upstream": n, "kind": k}, v) for n, p in pools.items() for k, v in p["errors"].items()]),
+        ("neobot_generation_in_flight", "gauge", "Appels LLM en vol (process)",
+         [({}, sched["in_flight"])]),
+        ("neobot_generation_queued", "gauge", "Appels LLM en file (process)",
+         [({}, sched["queued"])]),
+        ("neobot_generation_shed_total", "counter", "Appels LLM délestés par tenant",
+         [({"tenant": t}, s["shed"]) for t, s in sched["tenants"].items()]),
+        ("neobot_token_budget_remaining", "gauge", "Tokens restants par tenant et usage",
+         [({"tenant": str(b["tenant_id"]), "purpose": b["purpose"]}, b["remaining"]) for b in budgets]),
+        ("neobot_webhook_deliveries_total", "counter", "Livraisons webhook WhatsApp avec messageKey",
+         [({}, dedup["received"])]),
+        ("neobot_webhook_duplicates_total", "counter", "Livraisons webhook dupliquées court-circuitées",
+         [({"source": "memory"}, dedup["duplicates_memory"]), ({"source": "db"}, dedup["duplicates_db"])]),
+    ]
+
+
+metrics.register_collector(_platform_collector)
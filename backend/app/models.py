@@ -1,7 +1,7 @@
 """
 MODÈLES NÉOBOT OPTIMISÉS - Version robuste sans dépendances circulaires
 """
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text, ForeignKey, Enum as SQLEnum, JSON, Float, UniqueConstraint
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text, ForeignKey, Enum as SQLEnum, JSON, Float, UniqueConstraint, LargeBinary
 from sqlalchemy.orm import relationship
 from datetime import datetime, timedelta
 import enum
@@ -289,6 +289,7 @@ class Message(Base):
     content = Column(Text, nullable=False)
     direction = Column(String(20), nullable=False)
     is_ai = Column(Boolean, default=False)
+    external_id = Column(String(128), nullable=True, unique=True)  # "{tenant_id}:{messageKey.id}" (idempotence webhook)
     created_at = Column(DateTime, default=datetime.utcnow)
     
     conversation = relationship("Conversation", back_populates="messages")
@@ -321,7 +322,7 @@ class TenantBusinessConfig(Base):
     company_description = Column(Text, nullable=True)
     
     # Produits/Services en JSON
-    products_services = Column(JSON, nullable=True)            # [{"name": "Pizza", "price": 5000}...]
+    products_services = Column(JSON, nullable=True)            # [{"name": "Pizza", "price": 5000, "image_id": sha256}...] — images dans media_blobs
     
     # Configuration IA
     tone = Column(String(50), nullable=True)                   # "Friendly", "Professional"
@@ -544,6 +545,18 @@ class ConversationHumanState(Base):
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
 
+class ConversationProductImage(Base):
+    """
+    Photos produits déjà envoyées dans une conversation (1 photo par produit par conversation).
+    Une ligne par envoi — remplace le rescan des 30 derniers messages IA.
+    """
+    __tablename__ = "conversation_product_images"
+
+    conversation_id = Column(Integer, ForeignKey("conversations.id", ondelete="CASCADE"), primary_key=True)
+    image_key = Column(String(80), primary_key=True)        # image_id (sha256) ou "name:<nom normalisé>"
+    sent_at = Column(DateTime, default=datetime.utcnow)
+
+
 # 4. Tenant Settings - Configuration délai réponse
 class TenantSettings(Base):
     """Configuration tenant: délai réponse, etc."""
@@ -655,19 +668,23 @@ class KnowledgeSource(Base):
     source_type = Column(SQLEnum(KnowledgeSourceType), nullable=False)  # url, pdf, youtube, faq, text
     name = Column(String(255), nullable=True)                           # Nom lisible
     source_url = Column(Text, nullable=True)                            # URL ou lien YouTube
-    file_path = Column(Text, nullable=True)                             # Chemin vers le fichier uploadé
+    file_path = Column(Text, nullable=True)                             # Chemin vers le fichier uploadé (vidé après ingestion)
+    content_hash = Column(String(64), nullable=True, index=True)        # SHA-256 du fichier — réupload = copie, pas de réextraction
 
     # Contenu extrait (indexé pour injection dans le prompt)
     content_extracted = Column(Text, nullable=True)
     content_preview = Column(Text, nullable=True)                       # 500 premiers chars pour aperçu
 
     # Sync
-    sync_status = Column(String(50), default="pending")                 # pending, synced, error
+    sync_status = Column(String(50), default="pending")                 # pending, fetching, extracting, synced, error
     sync_error = Column(Text, nullable=True)
     last_synced_at = Column(DateTime, nullable=True)
+    next_sync_at = Column(DateTime, nullable=True, index=True)          # URL/YouTube : prochain rafraîchissement (bail pendant le fetch)
+    etag = Column(String(255), nullable=True)                           # Validateurs HTTP du dernier fetch → GET conditionnel (304)
+    last_modified = Column(String(64), nullable=True)
     
     created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)   # Version du cache de prompt : ne bouge qu'au changement de contenu
 
     agent = relationship("AgentTemplate", back_populates="knowledge_sources")
 
@@ -909,3 +926,220 @@ class RevokedToken(Base):
     user_id    = Column(Integer, nullable=False)
     expires_at = Column(DateTime, nullable=False, index=True)
     revoked_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+
+class MessageArchiveSegment(Base):
+    """
+    Index des segments d'archive de messages (stockage froid).
+    Chaque ligne pointe vers un membre gzip NDJSON ajouté en fin de fichier
+    archives/<tenant>/<YYYY-MM>.ndjson.gz — lecture directe par offset, sans
+    décompresser le fichier entier.
+    """
+    __tablename__ = "message_archive_segments"
+
+    id               = Column(Integer, primary_key=True, index=True)
+    tenant_id        = Column(Integer, nullable=False, index=True)
+    conversation_id  = Column(Integer, nullable=False, index=True)
+    month            = Column(String(7), nullable=False)         # "YYYY-MM"
+    file_path        = Column(String(500), nullable=False)       # Relatif à MESSAGE_ARCHIVE_DIR
+    byte_offset      = Column(Integer, nullable=False)
+    byte_length      = Column(Integer, nullable=False)
+    message_count    = Column(Integer, nullable=False, default=0)
+    first_message_id = Column(Integer, nullable=False)
+    last_message_id  = Column(Integer, nullable=False)
+    first_created_at = Column(DateTime, nullable=True)
+    last_created_at  = Column(DateTime, nullable=True)
+    created_at       = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+
+class BroadcastJob(Base):
+    """
+    Job d'envoi d'un broadcast email superadmin (exécuté en arrière-plan).
+    Progression persistée : le dashboard interroge GET /api/admin/broadcast-email/{id}.
+    """
+    __tablename__ = "broadcast_jobs"
+
+    id          = Column(Integer, primary_key=True, index=True)
+    subject     = Column(String(200), nullable=False)
+    body        = Column(Text, nullable=False)
+    target      = Column(String(20), nullable=False, default="all")   # all | trial | single
+    tenant_id   = Column(Integer, nullable=True)                      # si target == 'single'
+    status      = Column(String(20), nullable=False, default="pending", index=True)  # pending | running | completed | failed
+    total       = Column(Integer, nullable=False, default=0)
+    sent        = Column(Integer, nullable=False, default=0)
+    failed      = Column(Integer, nullable=False, default=0)
+    error       = Column(Text, nullable=True)
+    created_by  = Column(Integer, nullable=True)                      # users.id du superadmin
+    created_at  = Column(DateTime, nullable=False, default=datetime.utcnow)
+    started_at  = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+
+class ContactImportJob(Base):
+    """
+    Import d'une liste de contacts (CSV / XLSX) exécuté en arrière-plan.
+    Progression persistée après chaque lot : GET /api/tenants/{id}/contacts/import/{job_id}.
+    """
+    __tablename__ = "contact_import_jobs"
+
+    id          = Column(Integer, primary_key=True, index=True)
+    tenant_id   = Column(Integer, ForeignKey("tenants.id"), nullable=False, index=True)
+    filename    = Column(String(255), nullable=True)
+    file_type   = Column(String(10), nullable=False, default="csv")            # csv | xlsx
+    status      = Column(String(20), nullable=False, default="pending")        # pending | running | completed | failed
+    ai_enabled  = Column(Boolean, nullable=True)                               # None = ne pas toucher au réglage IA existant
+    bytes_total = Column(Integer, nullable=False, default=0)
+    bytes_read  = Column(Integer, nullable=False, default=0)
+    rows_read   = Column(Integer, nullable=False, default=0)
+    created     = Column(Integer, nullable=False, default=0)
+    updated     = Column(Integer, nullable=False, default=0)
+    invalid     = Column(Integer, nullable=False, default=0)
+    duplicates  = Column(Integer, nullable=False, default=0)
+    error       = Column(Text, nullable=True)
+    created_by  = Column(Integer, nullable=True)                               # users.id
+    created_at  = Column(DateTime, nullable=False, default=datetime.utcnow)
+    started_at  = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+
+class Campaign(Base):
+    """
+    Campagne WhatsApp sortante d'un tenant (promo, rappels, suivi commande).
+    Audience matérialisée dans campaign_recipients à la création ; envoi cadencé
+    par le worker services/campaign_service.py (pause / reprise / annulation).
+    """
+    __tablename__ = "campaigns"
+
+    id           = Column(Integer, primary_key=True, index=True)
+    tenant_id    = Column(Integer, ForeignKey("tenants.id"), nullable=False, index=True)
+    name         = Column(String(120), nullable=False)
+    trigger_type = Column(String(30), nullable=False, default="promo")      # clé de PLAN_LIMITS["outbound_triggers"]
+    template     = Column(Text, nullable=False)                             # "Bonjour {{first_name|}} …"
+    variables    = Column(JSON, nullable=True)                              # variables fixes de la campagne
+    audience     = Column(JSON, nullable=True)                              # filtres utilisés à la sélection
+    # draft | pending | running | paused | completed | cancelled | failed
+    status       = Column(String(20), nullable=False, default="pending", index=True)
+    total        = Column(Integer, nullable=False, default=0)               # destinataires éligibles
+    excluded     = Column(Integer, nullable=False, default=0)               # écartés à la sélection (STOP, limite)
+    sent         = Column(Integer, nullable=False, default=0)
+    failed       = Column(Integer, nullable=False, default=0)
+    skipped      = Column(Integer, nullable=False, default=0)               # devenus inéligibles avant l'envoi
+    error        = Column(Text, nullable=True)
+    locked_by    = Column(String(120), nullable=True)                       # instance qui envoie
+    heartbeat_at = Column(DateTime, nullable=True)
+    created_by   = Column(Integer, nullable=True)                           # users.id
+    created_at   = Column(DateTime, nullable=False, default=datetime.utcnow)
+    started_at   = Column(DateTime, nullable=True)
+    finished_at  = Column(DateTime, nullable=True)
+
+
+class CampaignRecipient(Base):
+    """Un destinataire d'une campagne — statut d'envoi individuel."""
+    __tablename__ = "campaign_recipients"
+
+    id              = Column(Integer, primary_key=True, index=True)
+    campaign_id     = Column(Integer, ForeignKey("campaigns.id", ondelete="CASCADE"), nullable=False, index=True)
+    conversation_id = Column(Integer, nullable=True)
+    phone_number    = Column(String(50), nullable=False)
+    contact_name    = Column(String(255), nullable=True)
+    status          = Column(String(20), nullable=False, default="pending")   # pending | sent | failed | skipped
+    reason          = Column(String(200), nullable=True)
+    message_id      = Column(String(128), nullable=True)                     # id renvoyé par le service WhatsApp
+    sent_at         = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        UniqueConstraint('campaign_id', 'phone_number', name='uq_campaign_recipient_phone'),
+    )
+
+
+class EmailOutbox(Base):
+    """
+    File d'attente des emails transactionnels (pattern outbox).
+    Les requêtes HTTP insèrent et rendent la main ; le worker envoie via Brevo
+    avec backoff exponentiel. Après max_attempts échecs → status 'dead'.
+    """
+    __tablename__ = "email_outbox"
+
+    id              = Column(Integer, primary_key=True, index=True)
+    template        = Column(String(50), nullable=False)             # welcome, confirmation, internal_alert…
+    to_email        = Column(String(255), nullable=False, index=True)
+    payload         = Column(JSON, nullable=False)                   # Payload Brevo complet (HTML rendu)
+    dedup_key       = Column(String(255), unique=True, nullable=True, index=True)
+    status          = Column(String(20), nullable=False, default="pending", index=True)  # pending | sending | sent | dead
+    attempts        = Column(Integer, nullable=False, default=0)
+    max_attempts    = Column(Integer, nullable=False, default=6)
+    next_attempt_at = Column(DateTime, nullable=False, default=datetime.utcnow, index=True)
+    last_error      = Column(Text, nullable=True)
+    created_at      = Column(DateTime, nullable=False, default=datetime.utcnow)
+    sent_at         = Column(DateTime, nullable=True)
+
+
+class SchedulerJobState(Base):
+    """
+    État persistant d'un job planifié (scheduler_service).
+    last_scheduled_at = échéance théorique du dernier run : sert à détecter
+    les exécutions manquées (redémarrage, crash, changement de leader).
+    """
+    __tablename__ = "scheduler_jobs"
+
+    name              = Column(String(100), primary_key=True)
+    schedule          = Column(String(100), nullable=False)          # "every 300s" | "cron 0 8 * * *"
+    last_scheduled_at = Column(DateTime, nullable=True)
+    last_started_at   = Column(DateTime, nullable=True)
+    last_finished_at  = Column(DateTime, nullable=True)
+    last_status       = Column(String(20), nullable=True)            # success | failed
+    last_duration_ms  = Column(Integer, nullable=True)
+    last_error        = Column(Text, nullable=True)
+    next_run_at       = Column(DateTime, nullable=True)
+    updated_at        = Column(DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class SchedulerRun(Base):
+    """Historique des exécutions des jobs planifiés (consulté par le superadmin)."""
+    __tablename__ = "scheduler_runs"
+
+    id            = Column(Integer, primary_key=True, index=True)
+    job_name      = Column(String(100), nullable=False, index=True)
+    scheduled_for = Column(DateTime, nullable=False)
+    started_at    = Column(DateTime, nullable=False, default=datetime.utcnow, index=True)
+    finished_at   = Column(DateTime, nullable=True)
+    status        = Column(String(20), nullable=False, default="running")  # running | success | failed | missed
+    duration_ms   = Column(Integer, nullable=True)
+    error         = Column(Text, nullable=True)
+    catch_up      = Column(Boolean, nullable=False, default=False)        # rattrapage d'une échéance manquée
+    missed        = Column(Integer, nullable=False, default=0)            # échéances fusionnées dans ce run
+    instance      = Column(String(100), nullable=True)                    # hostname:pid du leader
+
+
+class StateEntry(Base):
+    """Clé/valeur partagée entre workers (backend d'état STATE_BACKEND=postgres)."""
+    __tablename__ = "state_kv"
+
+    key        = Column(String(255), primary_key=True)
+    value      = Column(Text, nullable=False)
+    expires_at = Column(DateTime, nullable=True, index=True)   # NULL = pas d'expiration
+
+
+class TokenBucket(Base):
+    """Seau de tokens DeepSeek par tenant et par usage (tenant_id 0 = plateforme)."""
+    __tablename__ = "token_buckets"
+    __table_args__ = (UniqueConstraint("tenant_id", "purpose", name="uq_token_bucket_tenant_purpose"),)
+
+    id         = Column(Integer, primary_key=True, index=True)
+    tenant_id  = Column(Integer, nullable=False, index=True)
+    purpose    = Column(String(40), nullable=False)     # webhook_reply | chat_test | prompt_generation | demo | neo_assistant | _global
+    level      = Column(Float, nullable=False)          # tokens disponibles à updated_at (peut être < 0)
+    capacity   = Column(Float, nullable=False)          # allocation journalière = taille du seau
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+
+class MediaBlob(Base):
+    """Image produit adressée par contenu (media store MEDIA_STORE=db) — full + vignette."""
+    __tablename__ = "media_blobs"
+
+    sha256       = Column(String(64), primary_key=True)       # SHA-256 du JPEG "full"
+    variant      = Column(String(16), primary_key=True)       # full | thumb
+    content_type = Column(String(50), nullable=False, default="image/jpeg")
+    size_bytes   = Column(Integer, nullable=False)
+    data         = Column(LargeBinary, nullable=False)
+    created_at   = Column(DateTime, nullable=False, default=datetime.utcnow)
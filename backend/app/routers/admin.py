@@ -22,7 +22,7 @@ from app.models import (
     User, Tenant, AgentTemplate, AgentType, PlanType, PLAN_LIMITS,
     Subscription, Conversation, WhatsAppSession, UsageTracking, Message,
     KnowledgeSource, Contact, PromptVariable, ConversationHumanState,
-    Escalation, ConversationContext,
+    Escalation, ConversationContext, EmailOutbox, SchedulerRun,
 )
 from typing import List
 from fastapi import BackgroundTasks
@@ -32,8 +32,14 @@ from app.services.email_service import (
     send_welcome_email,
     send_password_reset_email,
     send_confirmation_email,
-    send_custom_broadcast,
 )
+from app.services.broadcast_service import BroadcastService, job_to_dict
+from app.services.email_outbox import EmailOutboxWorker
+from app.services.scheduler_service import scheduler, run_to_dict, INSTANCE_ID
+from app.http_client import get_client, http_client_stats
+from app.services.generation_scheduler import generation_scheduler
+from app.services.token_budget import token_budget
+from app.services.webhook_idempotency import webhook_dedup
 
 
 def _fmt_dt(dt) -> str | None:
@@ -885,7 +891,8 @@ async def test_email(
     _: User = Depends(get_superadmin_user),
 ):
     """
-    Envoie un email de test vers l'adresse fournie.
+    Met en file un email de test vers l'adresse fournie (envoi par le worker outbox,
+    suivi via GET /api/admin/email-outbox).
     Types disponibles : welcome | reset | confirmation
     Réservé aux superadmins — ne pas exposer en production sans auth.
     """
@@ -898,6 +905,7 @@ async def test_email(
             user_name="Test User",
             tenant_name="Entreprise Test",
             trial_end_date=None,
+            dedup_key=f"test-welcome:{request.to}:{datetime.utcnow().timestamp()}",
         )
     elif request.type == "reset":
         success = await send_password_reset_email(
@@ -913,7 +921,7 @@ async def test_email(
         raise HTTPException(status_code=400, detail="type doit être: welcome | reset | confirmation")
 
     if not success:
-        raise HTTPException(status_code=502, detail="Brevo n'a pas pu envoyer l'email — vérifier BREVO_API_KEY et les logs")
+        raise HTTPException(status_code=502, detail="Email non mis en file — vérifier BREVO_API_KEY et les logs")
 
     return {"success": True, "to": request.to, "type": request.type}
 
@@ -998,12 +1006,12 @@ async def send_whatsapp_to_tenant(
         raise HTTPException(status_code=400, detail="Ce client n'a pas de numéro WhatsApp enregistré")
 
     try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            r = await client.post(
-                f"{WHATSAPP_SERVICE_URL}/api/whatsapp/tenants/1/send-message",
-                json={"to": phone, "message": body.message.strip()},
-                headers={"x-api-key": INTERNAL_API_KEY},
-            )
+        client = get_client("whatsapp-service")
+        r = await client.post(
+            f"{WHATSAPP_SERVICE_URL}/api/whatsapp/tenants/1/send-message",
+            json={"to": phone, "message": body.message.strip()},
+            headers={"x-api-key": INTERNAL_API_KEY},
+        )
         if r.status_code == 200:
             return {"sent": True, "phone": phone, "tenant": tenant.name}
         raise HTTPException(status_code=503, detail=f"WhatsApp service: {r.text[:200]}")
@@ -1020,13 +1028,15 @@ async def send_whatsapp_to_tenant(
 @router.post("/broadcast-email")
 async def broadcast_email(
     request: BroadcastEmailRequest,
+    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db),
-    _: User = Depends(get_superadmin_user),
+    admin: User = Depends(get_superadmin_user),
 ):
     """
     Envoie un email personnalisé à tous les clients actifs (non supprimés, non suspendus).
     target='all' → tous, 'trial' → uniquement les clients en trial.
-    Retourne {sent, failed, total} pour affichage dans le modal.
+    L'envoi tourne en arrière-plan (lots Brevo) : retourne immédiatement le job
+    {job_id, status, sent, failed, total} — suivre via GET /broadcast-email/{job_id}.
     """
     if not request.subject.strip() or not request.body.strip():
         raise HTTPException(status_code=400, detail="Sujet et corps requis")
@@ -1044,24 +1054,144 @@ async def broadcast_email(
         ).first()
         if not tenant:
             raise HTTPException(status_code=404, detail="Tenant non trouvé")
-        tenants = [tenant]
-    else:
-        q = db.query(Tenant).filter(Tenant.is_deleted == False, Tenant.is_suspended == False)
-        if request.target == "trial":
-            q = q.filter(Tenant.is_trial == True)
-        tenants = q.all()
 
-    sent, failed = 0, 0
-    for t in tenants:
-        ok = await send_custom_broadcast(
-            to_email=t.email,
-            to_name=t.name,
-            subject=request.subject,
-            body=request.body,
-        )
-        if ok:
-            sent += 1
-        else:
-            failed += 1
+    job = BroadcastService.create_job(
+        db,
+        subject=request.subject,
+        body=request.body,
+        target=request.target,
+        tenant_id=request.tenant_id if request.target == "single" else None,
+        created_by=admin.id,
+    )
+    background_tasks.add_task(BroadcastService.run_job, job.id, db.get_bind())
+    return job_to_dict(job)
+
+
+@router.get("/broadcast-email/{job_id}")
+async def get_broadcast_job(
+    job_id: int,
+    db: Session = Depends(get_db),
+    _: User = Depends(get_superadmin_user),
+):
+    """Progression d'un broadcast : status (pending|running|completed|failed), sent, failed, total."""
+    job = BroadcastService.get_job(db, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Broadcast non trouvé")
+    return job_to_dict(job)
+
+
+# ======================== EMAIL OUTBOX ========================
+
+@router.get("/email-outbox")
+async def list_email_outbox(
+    status: Optional[str] = None,
+    limit: int = 50,
+    db: Session = Depends(get_db),
+    _: User = Depends(get_superadmin_user),
+):
+    """Emails transactionnels en file / envoyés / en dead-letter (status=dead)."""
+    q = db.query(EmailOutbox)
+    if status:
+        q = q.filter(EmailOutbox.status == status)
+    rows = q.order_by(EmailOutbox.id.desc()).limit(min(limit, 200)).all()
+    counts = dict(db.query(EmailOutbox.status, func.count(EmailOutbox.id)).group_by(EmailOutbox.status).all())
+    return {
+        "counts": counts,
+        "emails": [
+            {
+                "id": r.id,
+                "template": r.template,
+                "to_email": r.to_email,
+                "status": r.status,
+                "attempts": r.attempts,
+                "last_error": r.last_error,
+                "next_attempt_at": _fmt_dt(r.next_attempt_at),
+                "created_at": _fmt_dt(r.created_at),
+                "sent_at": _fmt_dt(r.sent_at),
+            }
+            for r in rows
+        ],
+    }
+
+
+@router.post("/email-outbox/{outbox_id}/retry")
+async def retry_dead_email(
+    outbox_id: int,
+    db: Session = Depends(get_db),
+    _: User = Depends(get_superadmin_user),
+):
+    """Remet en file un email en dead-letter."""
+    row = EmailOutboxWorker.requeue(db, outbox_id)
+    if not row:
+        raise HTTPException(status_code=404, detail="Email dead-letter non trouvé ou non rejouable (lien secret effacé)")
+    return {"id": row.id, "status": row.status}
+
 
-    return {"sent": sent, "failed": failed, "total": len(tenants)}
+# ── Pools HTTP sortants ───────────────────────────────────────────────────────
+
+@router.get("/http-clients")
+async def get_http_clients_stats(
+    _: User = Depends(get_superadmin_user),
+):
+    """Métriques par upstream : latences (histogramme, p50/p95/p99), erreurs, saturation du pool."""
+    return {"upstreams": http_client_stats()}
+
+
+# ── File de génération LLM ────────────────────────────────────────────────────
+
+@router.get("/generation-scheduler")
+async def get_generation_scheduler_stats(
+    _: User = Depends(get_superadmin_user),
+):
+    """Files par tenant : profondeur, appels en vol, attente p95, délestages (process courant)."""
+    return generation_scheduler.stats()
+
+
+@router.get("/token-budgets")
+async def get_token_budgets(
+    tenant_id: Optional[int] = None,
+    _: User = Depends(get_superadmin_user),
+):
+    """Seaux de tokens DeepSeek (vue du process courant, resynchronisée avec la base toutes les 10s)."""
+    return {"buckets": token_budget.stats(tenant_id)}
+
+
+@router.get("/webhook-dedup")
+async def get_webhook_dedup_stats(
+    _: User = Depends(get_superadmin_user),
+):
+    """Livraisons WhatsApp reçues / dupliquées (mémoire ou base) et taux de déduplication (process courant)."""
+    return webhook_dedup.stats()
+
+
+# ── Scheduler (jobs planifiés) ────────────────────────────────────────────────
+
+@router.get("/scheduler/jobs")
+async def get_scheduler_jobs(
+    db: Session = Depends(get_db),
+    _: User = Depends(get_superadmin_user),
+):
+    """État des jobs planifiés : dernier run, statut, prochaine échéance."""
+    return {
+        "instance": INSTANCE_ID,
+        "is_leader": scheduler.is_leader,   # leadership de l'instance qui répond
+        "jobs": scheduler.jobs_status(db),
+    }
+
+
+@router.get("/scheduler/runs")
+async def get_scheduler_runs(
+    job: Optional[str] = None,
+    status_filter: Optional[str] = None,
+    limit: int = 50,
+    db: Session = Depends(get_db),
+    _: User = Depends(get_superadmin_user),
+):
+    """Historique des exécutions (plus récentes d'abord), filtrable par job et statut."""
+    q = db.query(SchedulerRun)
+    if job:
+        q = q.filter(SchedulerRun.job_name == job)
+    if status_filter:
+        q = q.filter(SchedulerRun.status == status_filter)
+    runs = q.order_by(SchedulerRun.started_at.desc(), SchedulerRun.id.desc()).limit(min(limit, 500)).all()
+    return {"runs": [run_to_dict(r) for r in runs]}
@@ -16,7 +16,9 @@ from app.services.agent_service import (
     compute_prompt_score,
     AGENT_SYSTEM_PROMPTS,
 )
+from app.services.knowledge_ingestion import save_upload, UploadRejected
 from app.http_client import DeepSeekClient
+from app.sse import sse_from_llm, sse_response
 import logging
 
 logger = logging.getLogger(__name__)
@@ -379,6 +381,8 @@ Réponds UNIQUEMENT avec le prompt, sans introduction ni explication. Commence d
         model="deepseek-chat",
         temperature=0.8,
         max_tokens=600,
+        tenant_id=tenant_id,
+        purpose="prompt_generation",
     )
 
     if "error" in result:
@@ -447,6 +451,7 @@ async def list_knowledge(tenant_id: int, agent_id: int, db: Session = Depends(ge
                 "source_type": s.source_type,
                 "source_url": s.source_url,
                 "sync_status": s.sync_status,
+                "sync_error": s.sync_error,
                 "content_preview": s.content_preview,
                 "last_synced_at": s.last_synced_at.isoformat() if s.last_synced_at else None,
             }
@@ -488,36 +493,18 @@ async def upload_pdf_knowledge(
     name: str = Form(default=""),
     db: Session = Depends(get_db),
 ):
-    """Importe un PDF comme source de connaissance — extrait le texte et le sauvegarde."""
+    """
+    Importe un PDF comme source de connaissance. Le fichier est écrit sur disque
+    et la source créée en 'pending' : l'extraction et le découpage se font dans le
+    worker d'ingestion (suivre sync_status via GET .../knowledge).
+    """
     if not file.filename or not file.filename.lower().endswith(".pdf"):
         raise HTTPException(status_code=400, detail="Fichier PDF requis (.pdf)")
 
-    content = await file.read()
-    if len(content) > 10 * 1024 * 1024:
-        raise HTTPException(status_code=400, detail="Fichier trop volumineux (max 10 Mo)")
-
-    # Extraction du texte PDF
-    extracted_text = ""
     try:
-        import io
-        import pypdf
-        reader = pypdf.PdfReader(io.BytesIO(content))
-        parts = []
-        for page in reader.pages:
-            text = page.extract_text()
-            if text:
-                parts.append(text.strip())
-        extracted_text = "\n\n".join(parts)
-    except ImportError:
-        # pypdf pas installé — sauvegarder quand même avec un placeholder
-        logger.warning("pypdf not installed — PDF text extraction skipped")
-        extracted_text = f"[Contenu PDF : {file.filename}]"
-    except Exception as e:
-        logger.error(f"PDF extraction error: {e}")
-        raise HTTPException(status_code=422, detail=f"Impossible d'extraire le texte du PDF : {e}")
-
-    if not extracted_text.strip():
-        raise HTTPException(status_code=422, detail="Le PDF ne contient pas de texte extractible (PDF image/scanné)")
+        file_path, content_hash, size = await save_upload(file)
+    except UploadRejected as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
     source_name = name.strip() or file.filename.replace(".pdf", "").replace("_", " ")
     source = AgentService.add_knowledge_source(
@@ -526,7 +513,8 @@ async def upload_pdf_knowledge(
         source_type="pdf",
         db=db,
         name=source_name,
-        content_text=extracted_text,
+        file_path=file_path,
+        content_hash=content_hash,
     )
     return {
         "status": "created",
@@ -535,7 +523,7 @@ async def upload_pdf_knowledge(
             "name": source.name,
             "source_type": str(source.source_type),
             "sync_status": source.sync_status,
-            "chars_extracted": len(extracted_text),
+            "size_bytes": size,
         },
     }
 
@@ -563,15 +551,8 @@ class ChatTestRequest(BaseModel):
     history: Optional[List[dict]] = []
 
 
-@router.post("/{tenant_id}/agents/{agent_id}/chat-test")
-async def chat_test(
-    tenant_id: int, agent_id: int, body: ChatTestRequest, db: Session = Depends(get_db)
-):
-    """
-    Teste l'agent en temps réel depuis le dashboard.
-    Utilise le prompt système complet (variables résolues, base de connaissance) + l'historique.
-    Limité à 5 échanges côté frontend — pas de suivi de quota ici.
-    """
+def _chat_test_messages(tenant_id: int, agent_id: int, body: ChatTestRequest, db: Session) -> list:
+    """Prompt système complet de l'agent + historique du test au format OpenAI."""
     agent = db.query(AgentTemplate).filter(
         AgentTemplate.id == agent_id,
         AgentTemplate.tenant_id == tenant_id,
@@ -590,12 +571,32 @@ async def chat_test(
         if role in ("user", "assistant") and turn.get("content"):
             messages.append({"role": role, "content": turn["content"]})
     messages.append({"role": "user", "content": body.message})
+    return messages
+
+
+@router.post("/{tenant_id}/agents/{agent_id}/chat-test")
+async def chat_test(
+    tenant_id: int,
+    agent_id: int,
+    body: ChatTestRequest,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """
+    Teste l'agent en temps réel depuis le dashboard.
+    Utilise le prompt système complet (variables résolues, base de connaissance) + l'historique.
+    Limité à 5 échanges côté frontend — pas de suivi de quota ici.
+    """
+    _check_tenant_access(tenant_id, current_user)
+    messages = _chat_test_messages(tenant_id, agent_id, body, db)
 
     result = await DeepSeekClient.call(
         messages=messages,
         model="deepseek-chat",
         temperature=0.7,
         max_tokens=300,
+        tenant_id=tenant_id,
+        purpose="chat_test",
     )
 
     if "error" in result:
@@ -607,3 +608,33 @@ async def chat_test(
         raise HTTPException(status_code=503, detail="Réponse IA invalide")
 
     return {"response": response_text, "agent_id": agent_id}
+
+
+@router.post("/{tenant_id}/agents/{agent_id}/chat-test/stream")
+async def chat_test_stream(
+    tenant_id: int,
+    agent_id: int,
+    body: ChatTestRequest,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """
+    Variante streaming (text/event-stream) de chat-test : les tokens s'affichent
+    au fil de la génération. Événements delta / done / error (voir app/sse.py).
+    """
+    _check_tenant_access(tenant_id, current_user)
+    messages = _chat_test_messages(tenant_id, agent_id, body, db)
+
+    events = DeepSeekClient.stream(
+        messages=messages,
+        model="deepseek-chat",
+        temperature=0.7,
+        max_tokens=300,
+        tenant_id=tenant_id,
+        purpose="chat_test",
+    )
+    return sse_response(sse_from_llm(
+        events,
+        final=lambda text: {"response": text, "agent_id": agent_id},
+        error_detail="Erreur IA : service indisponible",
+    ))
@@ -0,0 +1,156 @@
+"""
+Router Campaigns — campagnes WhatsApp sortantes par tenant
+Endpoints:
+  POST /api/tenants/{tenant_id}/campaigns/preview           audience + exemples rendus
+  POST /api/tenants/{tenant_id}/campaigns                   création (+ mise en file)
+  GET  /api/tenants/{tenant_id}/campaigns
+  GET  /api/tenants/{tenant_id}/campaigns/{campaign_id}     progression + rapport d'envoi
+  POST /api/tenants/{tenant_id}/campaigns/{campaign_id}/{action}   start | pause | resume | cancel
+"""
+
+from typing import Dict, List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException
+from pydantic import BaseModel, Field
+from sqlalchemy.orm import Session
+
+from app.database import get_db
+from app.dependencies import get_current_user
+from app.models import Tenant, User
+from app.services.campaign_service import (
+    CampaignRejected,
+    CampaignService,
+    campaign_to_dict,
+    enqueue_campaigns,
+)
+import logging
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/api/tenants", tags=["campaigns"])
+
+
+class CampaignAudience(BaseModel):
+    active_within_days: Optional[int] = Field(None, ge=1, le=365)     # dernier message il y a moins de N jours
+    inactive_for_days: Optional[int] = Field(None, ge=1, le=365)      # relance : silence depuis N jours
+    outcome_types: Optional[List[str]] = Field(None, max_length=20)
+    phones: Optional[List[str]] = Field(None, max_length=10000)
+
+
+class CampaignDraft(BaseModel):
+    template: str = Field(..., min_length=1, max_length=4000)
+    trigger_type: str = "promo"
+    audience: CampaignAudience = Field(default_factory=CampaignAudience)
+    variables: Dict[str, str] = Field(default_factory=dict)
+
+
+class CampaignCreate(CampaignDraft):
+    name: str = Field(..., min_length=1, max_length=120)
+    start: bool = True
+
+
+def _check_tenant_access(tenant_id: int, current_user: User) -> None:
+    if current_user.is_superadmin:
+        return
+    if current_user.tenant_id != tenant_id:
+        raise HTTPException(status_code=403, detail="Accès refusé à ce tenant")
+
+
+def _get_tenant(db: Session, tenant_id: int) -> Tenant:
+    tenant = db.get(Tenant, tenant_id)
+    if tenant is None:
+        raise HTTPException(status_code=404, detail="Tenant introuvable")
+    return tenant
+
+
+@router.post("/{tenant_id}/campaigns/preview")
+async def preview_campaign(
+    tenant_id: int,
+    body: CampaignDraft,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """Taille de l'audience, exclusions (STOP, limite) et exemples de messages — rien n'est créé."""
+    _check_tenant_access(tenant_id, current_user)
+    tenant = _get_tenant(db, tenant_id)
+    try:
+        return CampaignService.preview(
+            db, tenant, body.template, body.trigger_type,
+            body.audience.model_dump(exclude_none=True), body.variables,
+        )
+    except CampaignRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+
+
+@router.post("/{tenant_id}/campaigns", status_code=201)
+async def create_campaign(
+    tenant_id: int,
+    body: CampaignCreate,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """
+    Crée la campagne et sélectionne les destinataires éligibles.
+    start=false → brouillon, à lancer via POST …/{campaign_id}/start.
+    """
+    _check_tenant_access(tenant_id, current_user)
+    tenant = _get_tenant(db, tenant_id)
+    try:
+        campaign = CampaignService.create(
+            db, tenant, body.name, body.template, body.trigger_type,
+            audience=body.audience.model_dump(exclude_none=True), variables=body.variables,
+            start=body.start, created_by=current_user.id,
+        )
+    except CampaignRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    if campaign.status == "pending":
+        enqueue_campaigns()
+    return campaign_to_dict(campaign)
+
+
+@router.get("/{tenant_id}/campaigns")
+async def list_campaigns(
+    tenant_id: int,
+    limit: int = 50,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    _check_tenant_access(tenant_id, current_user)
+    campaigns = CampaignService.list_for_tenant(db, tenant_id, min(max(limit, 1), 200))
+    return {"campaigns": [campaign_to_dict(c) for c in campaigns]}
+
+
+@router.get("/{tenant_id}/campaigns/{campaign_id}")
+async def get_campaign(
+    tenant_id: int,
+    campaign_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """Progression (sent, failed, skipped, remaining) + répartition des raisons d'échec."""
+    _check_tenant_access(tenant_id, current_user)
+    campaign = CampaignService.get(db, tenant_id, campaign_id)
+    if not campaign:
+        raise HTTPException(status_code=404, detail="Campagne introuvable")
+    return {**campaign_to_dict(campaign), "report": CampaignService.delivery_report(db, campaign.id)}
+
+
+@router.post("/{tenant_id}/campaigns/{campaign_id}/{action}")
+async def control_campaign(
+    tenant_id: int,
+    campaign_id: int,
+    action: str,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """start | pause | resume | cancel. La pause est prise en compte par l'envoi en cours sous ~1s."""
+    _check_tenant_access(tenant_id, current_user)
+    campaign = CampaignService.get(db, tenant_id, campaign_id)
+    if not campaign:
+        raise HTTPException(status_code=404, detail="Campagne introuvable")
+    try:
+        campaign = CampaignService.transition(db, campaign, action)
+    except CampaignRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    logger.info(f"📣 Campagne #{campaign_id} (tenant {tenant_id}) : {action} → {campaign.status}")
+    return campaign_to_dict(campaign)
@@ -3,13 +3,16 @@ Contacts Management Endpoints - Phase 8M: Feature 1
 Whitelist/Blacklist pour contrôler qui peut recevoir des réponses IA
 """
 
-from fastapi import APIRouter, HTTPException, Depends
+from typing import Optional
+
+from fastapi import APIRouter, BackgroundTasks, HTTPException, Depends, File, UploadFile
 from sqlalchemy.orm import Session
 import logging
 
 from ..database import get_db
 from ..models import ContactSetting, User
 from ..services.contact_filter_service import ContactFilterService
+from ..services.contact_import import ContactImportService, ImportRejected, job_to_dict, save_upload
 from ..schemas import AIToggleRequest, BulkPhoneRequest
 from ..dependencies import get_current_user
 
@@ -170,6 +173,53 @@ async def bulk_enable_ai(
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.post("/{tenant_id}/contacts/import", status_code=202)
+async def import_contacts(
+    tenant_id: int,
+    background_tasks: BackgroundTasks,
+    file: UploadFile = File(...),
+    ai_enabled: Optional[bool] = None,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """
+    Importe la liste clients du tenant (CSV ou XLSX, 50 Mo max).
+    Colonnes reconnues : téléphone / phone / numéro (obligatoire), nom / name (optionnel).
+    ai_enabled (query) : true/false applique ce réglage IA à tous les contacts importés ;
+    absent = nouveaux contacts avec IA active, réglage des existants inchangé.
+    L'import tourne en arrière-plan : suivre via GET /contacts/import/{job_id}.
+    """
+    if not getattr(current_user, "is_superadmin", False) and current_user.tenant_id != tenant_id:
+        raise HTTPException(status_code=403, detail="Accès refusé")
+    try:
+        path, kind, size = await save_upload(file)
+    except ImportRejected as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    job = ContactImportService.create_job(
+        db, tenant_id, file.filename, kind, size, ai_enabled=ai_enabled, created_by=current_user.id,
+    )
+    background_tasks.add_task(ContactImportService.run_job, job.id, path, db.get_bind())
+    logger.info(f"📥 Import contacts #{job.id} en file (tenant {tenant_id}, {kind}, {size} octets)")
+    return job_to_dict(job)
+
+
+@router.get("/{tenant_id}/contacts/import/{job_id}")
+async def get_import_job(
+    tenant_id: int,
+    job_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """Progression d'un import : status (pending|running|completed|failed), percent, created, updated, invalid, duplicates."""
+    if not getattr(current_user, "is_superadmin", False) and current_user.tenant_id != tenant_id:
+        raise HTTPException(status_code=403, detail="Accès refusé")
+    job = ContactImportService.get_job(db, tenant_id, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Import non trouvé")
+    return job_to_dict(job)
+
+
 @router.get("/{tenant_id}/contacts/{phone}")
 async def get_contact_info(
     tenant_id: int,
@@ -3,21 +3,27 @@ Router Conversations — Listing et détail des conversations/messages par tenan
 Endpoints:
   GET  /api/tenants/{tenant_id}/conversations
   GET  /api/tenants/{tenant_id}/conversations/{conv_id}/messages
+  GET  /api/tenants/{tenant_id}/export
   POST /api/tenants/{tenant_id}/conversations/{conv_id}/send
   POST /api/tenants/{tenant_id}/conversations/{conv_id}/toggle-bot
 """
+import asyncio
 import os
-import httpx
 from datetime import datetime, timedelta
 from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
 from sqlalchemy.orm import Session
 from sqlalchemy import desc, func, case
 from typing import Optional
 
 from app.database import get_db
+from app.http_client import get_client
 from app.models import Conversation, Message, User, ConversationHumanState
 from app.dependencies import get_current_user
+from app.services.message_archive_service import MessageArchiveService
+from app.services.conversation_lock import conversation_locks, get_or_create_conversation
+from app.services.export_service import ExportService, EXPORT_FORMATS, EXPORT_DIRECTIONS, decode_cursor
 import logging
 
 logger = logging.getLogger(__name__)
@@ -148,13 +154,9 @@ async def get_messages(
     if not conv:
         raise HTTPException(status_code=404, detail="Conversation non trouvée")
 
-    msgs = (
-        db.query(Message)
-        .filter(Message.conversation_id == conv_id)
-        .order_by(Message.created_at.asc().nullsfirst(), Message.id.asc())
-        .offset(offset)
-        .limit(limit)
-        .all()
+    # Lecture transparente : messages archivés (stockage froid) puis table chaude — gzip hors boucle
+    msgs, total = await asyncio.to_thread(
+        MessageArchiveService.get_conversation_messages, conv_id, db, limit=limit, offset=offset
     )
 
     return {
@@ -163,18 +165,69 @@ async def get_messages(
         "customer_name": conv.customer_name or conv.customer_phone,
         "messages": [
             {
-                "id": m.id,
-                "content": m.content,
-                "direction": m.direction,   # "incoming" | "outgoing"
-                "is_ai": m.is_ai,
-                "created_at": m.created_at.isoformat() if m.created_at else None,
+                "id": m["id"],
+                "content": m["content"],
+                "direction": m["direction"],   # "incoming" | "outgoing"
+                "is_ai": m["is_ai"],
+                "created_at": m["created_at"],
             }
             for m in msgs
         ],
-        "total": db.query(Message).filter(Message.conversation_id == conv_id).count(),
+        "total": total,
     }
 
 
+# ── Export streaming (BI) ──────────────────────────────────────────────────
+
+@router.get("/{tenant_id}/export")
+async def export_conversations(
+    tenant_id: int,
+    format: str = "csv",
+    gzip: bool = False,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    outcome: Optional[str] = None,
+    direction: Optional[str] = None,
+    cursor: Optional[str] = None,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """
+    Exporte tous les messages du tenant (avec contexte conversation) en streaming.
+    - format : csv | ndjson — gzip=true pour compresser
+    - filtres : date_from / date_to (ISO 8601), outcome, direction (incoming|outgoing)
+    - cursor : reprise après coupure (valeur `cursor` de la dernière ligne reçue)
+    """
+    _check_tenant_access(tenant_id, current_user)
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail="Format invalide (csv ou ndjson)")
+    if direction and direction not in EXPORT_DIRECTIONS:
+        raise HTTPException(status_code=400, detail="Direction invalide (incoming ou outgoing)")
+    try:
+        after_id = decode_cursor(cursor) if cursor else 0
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    media_type = "text/csv; charset=utf-8" if format == "csv" else "application/x-ndjson"
+    filename = f"neobot_export_tenant{tenant_id}_{datetime.utcnow():%Y%m%d}.{format}"
+    headers = {"Content-Disposition": f'attachment; filename="{filename}{".gz" if gzip else ""}"'}
+    if gzip:
+        media_type = "application/gzip"
+
+    stream = ExportService.stream_export(
+        db.get_bind(),
+        tenant_id,
+        fmt=format,
+        compress=gzip,
+        after_id=after_id,
+        date_from=date_from,
+        date_to=date_to,
+        outcome=outcome,
+        direction=direction,
+    )
+    return StreamingResponse(stream, media_type=media_type, headers=headers)
+
+
 # ── Schémas ────────────────────────────────────────────────────────────────
 
 class ManualMessageBody(BaseModel):
@@ -245,22 +298,22 @@ async def send_manual_message(
     wa_ok = False
     wa_error = None
     try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
+        client = get_client("whatsapp-service")
+        r = await client.post(
+            f"{WHATSAPP_SERVICE_URL}/api/whatsapp/tenants/{tenant_id}/send-message",
+            json={"to": conv.customer_phone, "message": body.message},
+            headers={"x-api-key": INTERNAL_API_KEY},
+        )
+        # Fallback : endpoint multi-tenant absent (service WA plus ancien)
+        if r.status_code == 404:
             r = await client.post(
-                f"{WHATSAPP_SERVICE_URL}/api/whatsapp/tenants/{tenant_id}/send-message",
-                json={"to": conv.customer_phone, "message": body.message},
-                headers={"x-api-key": INTERNAL_API_KEY},
+                f"{WHATSAPP_SERVICE_URL}/send",
+                json={"to": conv.customer_phone, "text": body.message},
             )
-            # Fallback : endpoint multi-tenant absent (service WA plus ancien)
-            if r.status_code == 404:
-                r = await client.post(
-                    f"{WHATSAPP_SERVICE_URL}/send",
-                    json={"to": conv.customer_phone, "text": body.message},
-                )
-            wa_ok = r.status_code == 200
-            if not wa_ok:
-                wa_error = r.text[:200]
-                logger.warning(f"WA send failed ({r.status_code}): {wa_error}")
+        wa_ok = r.status_code == 200
+        if not wa_ok:
+            wa_error = r.text[:200]
+            logger.warning(f"WA send failed ({r.status_code}): {wa_error}")
     except Exception as e:
         wa_error = str(e)
         logger.error(f"WA service unreachable: {e}")
@@ -349,21 +402,8 @@ async def initiate_conversation(
 
     now = datetime.utcnow()
 
-    conv = db.query(Conversation).filter(
-        Conversation.tenant_id == tenant_id,
-        Conversation.customer_phone == phone,
-    ).first()
-
-    if not conv:
-        conv = Conversation(
-            tenant_id=tenant_id,
-            customer_phone=phone,
-            customer_name=phone,
-            status="active",
-            last_message_at=now,
-        )
-        db.add(conv)
-        db.flush()
+    async with conversation_locks.hold(tenant_id, phone):
+        conv, _ = get_or_create_conversation(db, tenant_id, phone, sender_name=phone)
 
     msg = Message(
         conversation_id=conv.id,
@@ -381,16 +421,16 @@ async def initiate_conversation(
     wa_ok = False
     wa_error = None
     try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            r = await client.post(
-                f"{WHATSAPP_SERVICE_URL}/api/whatsapp/tenants/{tenant_id}/send-message",
-                json={"to": phone, "message": body.message},
-                headers={"x-api-key": INTERNAL_API_KEY},
-            )
-            wa_ok = r.status_code == 200
-            if not wa_ok:
-                wa_error = r.text[:200]
-                logger.warning(f"WA initiate failed ({r.status_code}): {wa_error}")
+        client = get_client("whatsapp-service")
+        r = await client.post(
+            f"{WHATSAPP_SERVICE_URL}/api/whatsapp/tenants/{tenant_id}/send-message",
+            json={"to": phone, "message": body.message},
+            headers={"x-api-key": INTERNAL_API_KEY},
+        )
+        wa_ok = r.status_code == 200
+        if not wa_ok:
+            wa_error = r.text[:200]
+            logger.warning(f"WA initiate failed ({r.status_code}): {wa_error}")
     except Exception as e:
         wa_error = str(e)
         logger.error(f"WA service unreachable during initiate: {e}")
@@ -5,26 +5,26 @@ Sécurité :
 - Public par conception (aucun token requis) — rate limit par IP
 - Prompt système chargé depuis la DB (tenant configuré par DEMO_TENANT_ID)
   ou fallback hard codé si absent — non injectable par le client
-- Sessions en mémoire uniquement (pas de DB, pas de PII persisté)
+- Sessions dans le backend d'état partagé avec TTL 30 min (pas de PII persisté durablement)
 - Max 5 échanges / session, messages tronqués à 480 chars en entrée
 - Max 200 tokens / réponse (coût maîtrisé)
 
 Dette technique :
-- Session store in-memory = ne survit pas au redémarrage / multi-instance.
-  À remplacer par Redis si on scale avant 6 mois.
 - Le prompt est mis en cache au premier appel (recharge au redémarrage uniquement).
 """
 
 import os
 import logging
-from datetime import datetime, timedelta
-from typing import Dict, Optional
+from datetime import datetime
+from typing import Optional
 
 from fastapi import APIRouter, Request, HTTPException
 from pydantic import BaseModel, Field
 
 from ..limiter import limiter
 from ..http_client import DeepSeekClient
+from ..sse import sse_from_llm, sse_response
+from ..state_backend import get_state_backend
 
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/api/demo", tags=["demo"])
@@ -39,12 +39,10 @@ _MAX_EXCHANGES = 5       # messages visiteur max par session
 _MAX_INPUT_CHARS = 480
 _DAILY_CALL_LIMIT = 100  # plafond global journalier pour toute la démo
 
-# ── Session store in-memory ───────────────────────────────────────────────
-# { session_id: { messages: [...], created_at: datetime, count: int } }
-_SESSIONS: Dict[str, dict] = {}
-# ── Compteur global journalier (reset à minuit UTC) ───────────────────────
-_daily_calls: int = 0
-_daily_reset_date: Optional[str] = None   # "YYYY-MM-DD"
+# ── Sessions + compteur journalier : backend d'état partagé ───────────────
+# demo:count:{sid}    échanges consommés (incr atomique, TTL = durée de session)
+# demo:session:{sid}  historique [{role, content}, ...] (même échéance)
+# demo:daily:{date}   appels DeepSeek de la journée (UTC)
 # ── Cache du prompt (chargé une seule fois par démarrage) ─────────────────
 _cached_system_prompt: Optional[str] = None
 
@@ -138,27 +136,30 @@ def _load_system_prompt_from_db() -> str:
 
     return _cached_system_prompt
 
-def _cleanup_expired() -> None:
-    """Nettoie les sessions expirées. Appelé à chaque requête (coût O(n) négligeable à MVP)."""
-    cutoff = datetime.utcnow() - timedelta(minutes=_SESSION_TTL_MINUTES)
-    expired = [sid for sid, s in _SESSIONS.items() if s["created_at"] < cutoff]
-    for sid in expired:
-        del _SESSIONS[sid]
+def _daily_key() -> str:
+    return f"demo:daily:{datetime.utcnow().strftime('%Y-%m-%d')}"
 
 
 def _check_daily_limit() -> bool:
     """Retourne True si le plafond journalier est atteint."""
-    global _daily_calls, _daily_reset_date
-    today = datetime.utcnow().strftime("%Y-%m-%d")
-    if _daily_reset_date != today:
-        _daily_calls = 0
-        _daily_reset_date = today
-    return _daily_calls >= _DAILY_CALL_LIMIT
+    return int(get_state_backend().get(_daily_key()) or 0) >= _DAILY_CALL_LIMIT
 
 
 def _increment_daily() -> None:
-    global _daily_calls
-    _daily_calls += 1
+    get_state_backend().incr(_daily_key(), ttl=2 * 86400)
+
+
+def _claim_exchange(sid: str) -> int:
+    """
+    Réserve un échange pour la session (atomique entre workers).
+    Le premier échange crée la session et fixe son expiration.
+    """
+    return get_state_backend().incr(f"demo:count:{sid}", ttl=_SESSION_TTL_MINUTES * 60)
+
+
+def _release_exchange(sid: str) -> None:
+    """Rend l'échange réservé (erreur DeepSeek → non décompté)."""
+    get_state_backend().incr(f"demo:count:{sid}", -1, ttl=_SESSION_TTL_MINUTES * 60)
 
 
 # ── Schémas ───────────────────────────────────────────────────────────────
@@ -173,68 +174,105 @@ class DemoChatResponse(BaseModel):
     max_exchanges: int
 
 
-# ── Route ─────────────────────────────────────────────────────────────────
-@router.post("/chat", response_model=DemoChatResponse)
-@limiter.limit("8/minute")
-async def demo_chat(request: Request, body: DemoChatRequest):
+# ── Routes ────────────────────────────────────────────────────────────────
+def _open_exchange(body: DemoChatRequest) -> tuple[int, list, list]:
     """
-    Chat demo public. Aucune auth. Rate-limited à 8 req/min par IP.
-    Retourne 429 si la limite de session est atteinte.
+    Contrôles (clé API, plafond journalier, limite de session), réservation de
+    l'échange et contexte envoyé à DeepSeek → (count, history, messages).
     """
     if not DEEPSEEK_API_KEY:
         raise HTTPException(status_code=503, detail="Service temporairement indisponible")
 
-    if _check_daily_limit():
-        raise HTTPException(status_code=429, detail="Démo temporairement indisponible, réessayez demain")
-
-    _cleanup_expired()
-
+    state = get_state_backend()
     sid = body.session_id
-    if sid not in _SESSIONS:
-        _SESSIONS[sid] = {
-            "messages": [],
-            "created_at": datetime.utcnow(),
-            "count": 0,
-        }
-
-    session = _SESSIONS[sid]
+    try:
+        if _check_daily_limit():
+            raise HTTPException(status_code=429, detail="Démo temporairement indisponible, réessayez demain")
+        count = _claim_exchange(sid)
+        history = state.get_json(f"demo:session:{sid}", default=[])
+    except HTTPException:
+        raise
+    except Exception as exc:
+        logger.error("Demo: backend d'état indisponible (%s)", exc)
+        raise HTTPException(status_code=503, detail="Service temporairement indisponible")
 
-    if session["count"] >= _MAX_EXCHANGES:
+    if count > _MAX_EXCHANGES:
+        _release_exchange(sid)
         raise HTTPException(status_code=429, detail="Limite de la démo atteinte")
 
     user_text = body.message[:_MAX_INPUT_CHARS]
-    session["messages"].append({"role": "user", "content": user_text})
-    session["count"] += 1
+    history.append({"role": "user", "content": user_text})
 
     # Fenêtre de contexte : system + 10 derniers messages
     system_prompt = _load_system_prompt_from_db()
-    messages = [{"role": "system", "content": system_prompt}] + session["messages"][-10:]
+    messages = [{"role": "system", "content": system_prompt}] + history[-10:]
+    return count, history, messages
 
-    result = await DeepSeekClient.call(messages, temperature=0.72, max_tokens=200)
+
+def _close_exchange(sid: str, count: int, history: list, reply: str) -> DemoChatResponse:
+    """Persiste la réponse dans l'historique de session et décompte l'appel du jour."""
+    history.append({"role": "assistant", "content": reply})
+    # L'historique expire avec le compteur de la session
+    state = get_state_backend()
+    remaining = state.ttl(f"demo:count:{sid}") or _SESSION_TTL_MINUTES * 60
+    state.set_json(f"demo:session:{sid}", history[-10:], ttl=remaining)
+    _increment_daily()
+
+    return DemoChatResponse(
+        reply=reply,
+        exchange_count=count,
+        max_exchanges=_MAX_EXCHANGES,
+    )
+
+
+@router.post("/chat", response_model=DemoChatResponse)
+@limiter.limit("8/minute")
+async def demo_chat(request: Request, body: DemoChatRequest):
+    """
+    Chat demo public. Aucune auth. Rate-limited à 8 req/min par IP.
+    Retourne 429 si la limite de session est atteinte.
+    """
+    sid = body.session_id
+    count, history, messages = _open_exchange(body)
+
+    result = await DeepSeekClient.call(messages, temperature=0.72, max_tokens=200, purpose="demo")
 
     # DeepSeekClient.call() retourne {"error": "..."} en cas d'échec API (pas d'exception)
     if "error" in result:
         logger.error("Demo chat DeepSeek error: %s", result["error"])
-        session["count"] -= 1
-        session["messages"].pop()
+        _release_exchange(sid)
         raise HTTPException(status_code=502, detail="Erreur lors de la génération de la réponse")
 
     try:
         reply = result["choices"][0]["message"]["content"].strip()
     except (KeyError, IndexError, TypeError) as exc:
         logger.error("Demo: structure réponse DeepSeek inattendue (%s): %s", exc, result)
-        session["count"] -= 1
-        session["messages"].pop()
+        _release_exchange(sid)
         raise HTTPException(status_code=502, detail="Erreur lors de la génération de la réponse")
 
-    session["messages"].append({"role": "assistant", "content": reply})
-    _increment_daily()
+    return _close_exchange(sid, count, history, reply)
 
-    return DemoChatResponse(
-        reply=reply,
-        exchange_count=session["count"],
-        max_exchanges=_MAX_EXCHANGES,
-    )
+
+@router.post("/chat/stream")
+@limiter.limit("8/minute")
+async def demo_chat_stream(request: Request, body: DemoChatRequest):
+    """
+    Variante streaming (text/event-stream) de /chat : delta / done / error (voir app/sse.py).
+    Mêmes limites ; une génération abandonnée par le visiteur reste décomptée de sa session.
+    """
+    sid = body.session_id
+    count, history, messages = _open_exchange(body)
+
+    def _on_error(event: dict) -> None:
+        logger.error("Demo chat DeepSeek error (stream): %s", event["error"])
+        _release_exchange(sid)
+
+    events = DeepSeekClient.stream(messages, temperature=0.72, max_tokens=200, purpose="demo")
+    return sse_response(sse_from_llm(
+        events,
+        final=lambda reply: _close_exchange(sid, count, history, reply).model_dump(),
+        on_error=_on_error,
+    ))
 
 
 # ── Reset cache prompt (appelé après modification de l'agent dans le dashboard) ──
@@ -0,0 +1,79 @@
+"""
+Router Media — images produits du media store
+  POST /api/tenants/{tenant_id}/media     upload (vignette + recompression une fois)
+  GET  /media/{sha}.jpg | {sha}.thumb.jpg public, cache 1 an (contenu immuable)
+"""
+
+import asyncio
+import logging
+
+from fastapi import APIRouter, Depends, File, HTTPException, Request, UploadFile
+from fastapi.responses import FileResponse, Response
+
+from app.dependencies import verify_tenant_access
+from app.limiter import limiter
+from app.services.media_store import (
+    CACHE_CONTROL,
+    MAX_UPLOAD_BYTES,
+    MediaRejected,
+    get_media_store,
+    media_path,
+    parse_media_ref,
+    store_image,
+)
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(tags=["media"])
+
+
+@router.post("/api/tenants/{tenant_id}/media", status_code=201)
+@limiter.limit("30/minute")
+async def upload_media(
+    request: Request,
+    tenant_id: int,
+    file: UploadFile = File(...),
+    _: bool = Depends(verify_tenant_access),
+):
+    """Stocke une image produit. Le produit ne garde que image_id (ou image_url renvoyée)."""
+    data = await file.read(MAX_UPLOAD_BYTES + 1)
+    try:
+        stored = await asyncio.to_thread(store_image, data)
+    except MediaRejected as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    image_id = stored["image_id"]
+    logger.info(f"🖼️ Image produit stockée (tenant {tenant_id}) : {image_id[:12]}… {stored['size_bytes']} octets")
+    return {
+        **stored,
+        "image_url": media_path(image_id),
+        "thumb_url": media_path(image_id, "thumb"),
+    }
+
+
+@router.get("/media/{filename}")
+async def get_media(filename: str, request: Request):
+    """
+    Sert une image. L'URL contient le hash du contenu : réponse immuable,
+    ETag = hash → If-None-Match renvoie 304 sans lire le store.
+    """
+    image_id = parse_media_ref(f"media/{filename}")
+    if image_id is None:
+        raise HTTPException(status_code=404, detail="Image introuvable")
+    variant = "thumb" if filename.endswith(".thumb.jpg") else "full"
+    etag = f'"{image_id}{"-t" if variant == "thumb" else ""}"'
+    headers = {
+        "Cache-Control": CACHE_CONTROL,
+        "ETag": etag,
+        "Content-Encoding": "identity",   # JPEG déjà compressé : GZipMiddleware passe son tour
+    }
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+
+    store = get_media_store()
+    path = store.path(image_id, variant)
+    if path:
+        return FileResponse(path, media_type="image/jpeg", headers=headers)
+    data = await asyncio.to_thread(store.get, image_id, variant)
+    if data is None:
+        raise HTTPException(status_code=404, detail="Image introuvable")
+    return Response(content=data, media_type="image/jpeg", headers=headers)
@@ -10,6 +10,7 @@ import logging
 from app.dependencies import get_current_user
 from app.http_client import DeepSeekClient
 from app.models import User
+from app.sse import sse_from_llm, sse_response
 
 logger = logging.getLogger(__name__)
 
@@ -99,7 +100,20 @@ class NeoChatResponse(BaseModel):
     page: str
 
 
-# ========== ENDPOINT ==========
+# ========== ENDPOINTS ==========
+def _neo_messages(body: NeoChatRequest) -> tuple[list, str]:
+    """Prompt système (page courante) + 4 derniers échanges × 300 chars max — économie de tokens."""
+    page_clean = (body.page or "dashboard").strip()[:50]
+
+    system_prompt = _NEO_SYSTEM_PROMPT.format(page=page_clean)
+
+    messages: list = [{"role": "system", "content": system_prompt}]
+    for turn in (body.history or [])[-4:]:
+        messages.append({"role": turn.role, "content": turn.content[:300]})
+    messages.append({"role": "user", "content": body.message[:500]})
+    return messages, page_clean
+
+
 @router.post("/chat", response_model=NeoChatResponse)
 async def neo_chat(
     body: NeoChatRequest,
@@ -110,21 +124,15 @@ async def neo_chat(
     Prompt strict, répond uniquement sur NeoBot.
     Protégé par JWT — un utilisateur non authentifié ne peut pas llm-inject.
     """
-    page_clean = (body.page or "dashboard").strip()[:50]
-
-    system_prompt = _NEO_SYSTEM_PROMPT.format(page=page_clean)
-
-    # Historique limité à 4 derniers échanges × 300 chars max — économie de tokens
-    messages: list = [{"role": "system", "content": system_prompt}]
-    for turn in (body.history or [])[-4:]:
-        messages.append({"role": turn.role, "content": turn.content[:300]})
-    messages.append({"role": "user", "content": body.message[:500]})
+    messages, page_clean = _neo_messages(body)
 
     result = await DeepSeekClient.call(
         messages=messages,
         model="deepseek-chat",
         temperature=0.5,   # Plus bas que les agents clients : réponses plus stables et factuelles
         max_tokens=250,
+        tenant_id=current_user.tenant_id,
+        purpose="neo_assistant",
     )
 
     if "error" in result:
@@ -141,3 +149,30 @@ async def neo_chat(
         raise HTTPException(status_code=503, detail="Réponse IA invalide")
 
     return NeoChatResponse(response=response_text, page=page_clean)
+
+
+@router.post("/chat/stream")
+async def neo_chat_stream(
+    body: NeoChatRequest,
+    current_user: User = Depends(get_current_user),
+):
+    """
+    Variante streaming (text/event-stream) de /chat : delta / done / error (voir app/sse.py).
+    Le payload "done" a la forme de NeoChatResponse.
+    """
+    messages, page_clean = _neo_messages(body)
+
+    events = DeepSeekClient.stream(
+        messages=messages,
+        model="deepseek-chat",
+        temperature=0.5,
+        max_tokens=250,
+        tenant_id=current_user.tenant_id,
+        purpose="neo_assistant",
+    )
+    return sse_response(sse_from_llm(
+        events,
+        final=lambda text: {"response": text, "page": page_clean},
+        error_detail="Service temporairement indisponible. Réessaie dans quelques secondes.",
+        on_error=lambda event: logger.error(f"Neo assistant DeepSeek error (stream): {event['error']}"),
+    ))
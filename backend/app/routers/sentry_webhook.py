@@ -13,7 +13,6 @@ import os
 from datetime import datetime, timedelta
 from typing import Optional
 
-import httpx
 import sentry_sdk
 from fastapi import APIRouter, Depends, HTTPException, Request, status
 from sqlalchemy.orm import Session
@@ -22,6 +21,7 @@ from ..database import get_db
 from ..models import SentryAlert
 from ..services import claude_service
 from ..services.email_service import send_internal_alert, SENDER_EMAIL
+from ..http_client import get_client
 
 logger = logging.getLogger(__name__)
 
@@ -195,20 +195,20 @@ async def _create_github_issue(
     }
 
     try:
-        async with httpx.AsyncClient(timeout=15.0) as client:
-            resp = await client.post(
-                f"https://api.github.com/repos/{repo}/issues",
-                json=issue_payload,
-                headers={
-                    "Authorization": f"Bearer {GITHUB_TOKEN}",
-                    "Accept": "application/vnd.github+json",
-                    "X-GitHub-Api-Version": "2022-11-28",
-                },
-            )
-            resp.raise_for_status()
-            issue_url = resp.json().get("html_url", "")
-            logger.info("GitHub Issue créée: %s", issue_url)
-            return issue_url
+        client = get_client("github")
+        resp = await client.post(
+            f"https://api.github.com/repos/{repo}/issues",
+            json=issue_payload,
+            headers={
+                "Authorization": f"Bearer {GITHUB_TOKEN}",
+                "Accept": "application/vnd.github+json",
+                "X-GitHub-Api-Version": "2022-11-28",
+            },
+        )
+        resp.raise_for_status()
+        issue_url = resp.json().get("html_url", "")
+        logger.info("GitHub Issue créée: %s", issue_url)
+        return issue_url
     except Exception as exc:
         logger.error("Échec création GitHub Issue: %s", exc)
         sentry_sdk.capture_exception(exc)
@@ -223,18 +223,18 @@ async def _update_github_issue_count(issue_url: str, new_count: int) -> None:
     try:
         parts = issue_url.rstrip("/").split("/")
         owner, repo_name, issue_number = parts[-4], parts[-3], parts[-1]
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            resp = await client.get(
+        client = get_client("github")
+        resp = await client.get(
+            f"https://api.github.com/repos/{owner}/{repo_name}/issues/{issue_number}",
+            headers={"Authorization": f"Bearer {GITHUB_TOKEN}", "Accept": "application/vnd.github+json"},
+        )
+        if resp.status_code == 200:
+            current = resp.json()
+            await client.patch(
                 f"https://api.github.com/repos/{owner}/{repo_name}/issues/{issue_number}",
+                json={"body": current["body"] + f"\n\n> 🔄 Mise à jour : **{new_count} occurrences** — {datetime.utcnow().strftime('%d/%m %H:%M')}"},
                 headers={"Authorization": f"Bearer {GITHUB_TOKEN}", "Accept": "application/vnd.github+json"},
             )
-            if resp.status_code == 200:
-                current = resp.json()
-                await client.patch(
-                    f"https://api.github.com/repos/{owner}/{repo_name}/issues/{issue_number}",
-                    json={"body": current["body"] + f"\n\n> 🔄 Mise à jour : **{new_count} occurrences** — {datetime.utcnow().strftime('%d/%m %H:%M')}"},
-                    headers={"Authorization": f"Bearer {GITHUB_TOKEN}", "Accept": "application/vnd.github+json"},
-                )
     except Exception as exc:
         logger.warning("Mise à jour Issue GitHub échouée: %s", exc)
 
@@ -15,7 +15,10 @@ from app.models import (
     BusinessTypeModel
 )
 from app.services.business_kb_service import BusinessKBService
+from app.services.catalog_index import invalidate_catalog_index
+from app.services.media_store import MediaRejected, normalize_product_images, present_products
 from ..http_client import DeepSeekClient
+import asyncio
 import os
 import json
 import logging
@@ -31,7 +34,10 @@ class ProductServiceItem(BaseModel):
     price: float
     description: Optional[str] = None
     category: Optional[str] = None
-    image_url: Optional[str] = None  # base64 — envoyé par le bot si le client demande ce produit
+    image_url: Optional[str] = None  # /media/{sha}.jpg (ou base64 "data:" — converti en image_id à l'enregistrement)
+    image_id: Optional[str] = None   # référence media store — envoyée par le bot si le client demande ce produit
+    aliases: Optional[List[str]] = None  # autres noms du produit ("boubou", "grand boubou") — index catalogue
+    in_stock: Optional[bool] = None      # None = non renseigné : la disponibilité passe par l'IA
 
 class BusinessConfigRequest(BaseModel):
     business_type_slug: str
@@ -108,19 +114,26 @@ async def configure_business(
             TenantBusinessConfig.tenant_id == tenant_id
         ).first()
         
-        # Stocker les produits comme liste Python (la colonne est JSON/JSONB)
+        # Stocker les produits comme liste Python (la colonne est JSON/JSONB).
+        # Images : uniquement une référence image_id — le base64 part dans le media store.
         products_list = None
         if config.products_services:
-            products_list = [
-                {
-                    "name": p.name,
-                    "price": p.price,
-                    "description": p.description,
-                    "category": p.category,
-                    "image_url": p.image_url,
-                }
-                for p in config.products_services
-            ]
+            try:
+                products_list = await asyncio.to_thread(normalize_product_images, [
+                    {
+                        "name": p.name,
+                        "price": p.price,
+                        "description": p.description,
+                        "category": p.category,
+                        "image_url": p.image_url,
+                        "image_id": p.image_id,
+                        "aliases": [a.strip() for a in p.aliases or [] if a.strip()],
+                        "in_stock": p.in_stock,
+                    }
+                    for p in config.products_services
+                ])
+            except MediaRejected as e:
+                raise HTTPException(status_code=400, detail=f"Image produit invalide : {e}")
         
         if existing_config:
             # Mise à jour
@@ -146,6 +159,7 @@ async def configure_business(
             db.add(new_config)
             db.commit()
             logger.info(f"✅ Business config created for tenant {tenant_id}")
+        invalidate_catalog_index(tenant_id)
         
         return {
             "status": "success",
@@ -254,7 +268,7 @@ async def get_business_config(
             "business_type": config.business_type.slug if config.business_type else None,
             "company_name": config.company_name,
             "company_description": config.company_description,
-            "products_services": products,
+            "products_services": present_products(products),
             "tone": config.tone,
             "selling_focus": config.selling_focus,
             # Champs compatibles avec la page Paramètres
@@ -297,6 +311,7 @@ async def delete_business_config(
         
         db.delete(config)
         db.commit()
+        invalidate_catalog_index(tenant_id)
         logger.info(f"✅ Business config deleted for tenant {tenant_id}")
         
         return {
@@ -351,7 +366,9 @@ async def generate_business_description(
             },
         ]
 
-        result = await DeepSeekClient.call(messages, temperature=0.7, max_tokens=200)
+        result = await DeepSeekClient.call(
+            messages, temperature=0.7, max_tokens=200, tenant_id=tenant_id, purpose="prompt_generation",
+        )
         if "error" in result:
             raise HTTPException(status_code=503, detail="Erreur de génération IA")
 
@@ -14,7 +14,8 @@ import httpx
 from app.database import get_db
 from app.dependencies import verify_tenant_access
 from app.models import WhatsAppSession, WhatsAppSessionQR, Tenant, User
-from app.services.whatsapp_qr_service import _qr_response_cache
+from app.services.whatsapp_qr_service import invalidate_qr_cache
+from app.http_client import get_client
 
 logger = logging.getLogger(__name__)
 
@@ -189,11 +190,12 @@ async def request_pairing_code(
         raise HTTPException(status_code=422, detail="Numéro invalide — format international sans +, ex: 22612345678")
 
     async def _call_wa_service() -> httpx.Response:
-        async with httpx.AsyncClient(timeout=40.0) as client:
-            return await client.post(
-                f"{WHATSAPP_SERVICE_URL}/api/whatsapp/tenants/{tenant_id}/request-pairing-code",
-                json={"phone_number": phone},
-            )
+        client = get_client("whatsapp-service")
+        return await client.post(
+            f"{WHATSAPP_SERVICE_URL}/api/whatsapp/tenants/{tenant_id}/request-pairing-code",
+            json={"phone_number": phone},
+            timeout=40.0,   # génération du code côté Baileys : lente au cold start
+        )
 
     try:
         resp = await _call_wa_service()
@@ -282,8 +284,8 @@ async def mark_whatsapp_connected(
     db.commit()
     db.refresh(session)
 
-    # Vider le cache mémoire QR — le prochain poll retournera "connected" immédiatement
-    _qr_response_cache.pop(tenant_id, None)
+    # Vider le cache QR — le prochain poll retournera "connected" immédiatement
+    invalidate_qr_cache(tenant_id)
 
     logger.info(f"✅ WhatsApp session marked as connected for tenant {tenant_id}: {session.whatsapp_phone}")
 
@@ -383,8 +385,8 @@ async def disconnect_whatsapp(
     # Notifier le service Baileys
     service_disconnect_url = f"{WHATSAPP_SERVICE_URL}/api/whatsapp/tenants/{tenant_id}/disconnect"
     try:
-        async with httpx.AsyncClient(timeout=8) as client:
-            await client.post(service_disconnect_url)
+        client = get_client("whatsapp-service")
+        await client.post(service_disconnect_url, timeout=8.0)
     except Exception as e:
         logger.warning(f"Baileys disconnect call failed for tenant {tenant_id}: {e}")
 
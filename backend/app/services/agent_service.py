@@ -7,6 +7,7 @@ from __future__ import annotations
 import re
 import logging
 from typing import Optional, Dict, List
+from sqlalchemy import func
 from sqlalchemy.orm import Session
 from datetime import datetime
 
@@ -410,6 +411,48 @@ def _build_business_preamble(tenant_id: int, db: Session) -> str:
         return ""
 
 
+# Bloc "BASE DE CONNAISSANCE" par agent : évite de recharger le texte complet des
+# sources à chaque message. Version = (nombre de sources synced, max(updated_at)) —
+# toute modification de contenu change la version, y compris depuis un autre worker.
+_knowledge_blocks: Dict[int, tuple] = {}
+_KNOWLEDGE_VERSION_COLUMNS = (func.count(KnowledgeSource.id), func.max(KnowledgeSource.updated_at))
+KNOWLEDGE_BLOCK_CACHE_MAX = 2000
+
+
+def invalidate_prompt_cache(agent_id: int) -> None:
+    """Oublie le bloc de connaissance mis en cache pour l'agent (contenu d'une source modifié)."""
+    _knowledge_blocks.pop(agent_id, None)
+
+
+def _knowledge_block(agent_id: int, db: Session) -> str:
+    synced = (
+        KnowledgeSource.agent_id == agent_id,
+        KnowledgeSource.sync_status == "synced",
+        KnowledgeSource.content_extracted != None,
+    )
+    version = db.query(*_KNOWLEDGE_VERSION_COLUMNS).filter(*synced).first()
+    version = tuple(version) if version is not None else None
+    cached = _knowledge_blocks.get(agent_id)
+    if version is not None and cached is not None and cached[0] == version:
+        return cached[1]
+
+    sources = db.query(KnowledgeSource).filter(*synced).all()
+    knowledge_block = ""
+    if sources:
+        knowledge_block = "\n\n=== BASE DE CONNAISSANCE ===\n"
+        for source in sources:
+            knowledge_block += f"\n--- {source.name or source.source_type} ---\n"
+            # 2000 chars par source — réduit de 8000 pour économiser ~1500 tokens/source
+            content = (source.content_extracted or "")[:2000]
+            knowledge_block += content + "\n"
+
+    if version is not None:
+        if len(_knowledge_blocks) >= KNOWLEDGE_BLOCK_CACHE_MAX:
+            _knowledge_blocks.pop(next(iter(_knowledge_blocks)))
+        _knowledge_blocks[agent_id] = (version, knowledge_block)
+    return knowledge_block
+
+
 def build_agent_system_prompt(agent: AgentTemplate, db: Session) -> str:
     """
     Construit le prompt système final de l'agent :
@@ -431,20 +474,7 @@ def build_agent_system_prompt(agent: AgentTemplate, db: Session) -> str:
     base_prompt = substitute_variables(base_prompt, variables)
 
     # Couche 3 : base de connaissance
-    sources = db.query(KnowledgeSource).filter(
-        KnowledgeSource.agent_id == agent.id,
-        KnowledgeSource.sync_status == "synced",
-        KnowledgeSource.content_extracted != None,
-    ).all()
-
-    if sources:
-        knowledge_block = "\n\n=== BASE DE CONNAISSANCE ===\n"
-        for source in sources:
-            knowledge_block += f"\n--- {source.name or source.source_type} ---\n"
-            # 2000 chars par source — réduit de 8000 pour économiser ~1500 tokens/source
-            content = (source.content_extracted or "")[:2000]
-            knowledge_block += content + "\n"
-        base_prompt += knowledge_block
+    base_prompt += _knowledge_block(agent.id, db)
 
     # Instructions de style
     style_instructions = f"\n\nStyle : {agent.tone}. Langue : {agent.language}. "
@@ -683,9 +713,17 @@ class AgentService:
         name: str = None,
         source_url: str = None,
         content_text: str = None,
+        file_path: str = None,
+        content_hash: str = None,
     ) -> KnowledgeSource:
-        """Ajoute une source de connaissance à un agent."""
-        from app.models import KnowledgeSourceType
+        """
+        Ajoute une source de connaissance à un agent.
+        Avec file_path (PDF uploadé), la source est mise en file pour le worker
+        d'ingestion ('pending') — sauf si un fichier identique (content_hash) est
+        déjà synchronisé : son contenu est copié immédiatement. Une source_url
+        sans contenu fourni est récupérée par le worker de synchronisation.
+        """
+        from app.services import knowledge_ingestion
 
         source = KnowledgeSource(
             agent_id=agent_id,
@@ -693,7 +731,8 @@ class AgentService:
             source_type=source_type,
             name=name,
             source_url=source_url,
-            sync_status="pending" if source_url else "synced",
+            content_hash=content_hash,
+            sync_status="pending" if (source_url or file_path) else "synced",
         )
 
         if content_text:
@@ -702,10 +741,27 @@ class AgentService:
             source.sync_status = "synced"
             source.last_synced_at = datetime.utcnow()
 
+        queued = False
+        if file_path and not content_text:
+            original = knowledge_ingestion.find_synced_duplicate(db, content_hash) if content_hash else None
+            if original is not None:
+                knowledge_ingestion.copy_content(source, original)
+            else:
+                source.file_path = file_path
+                queued = True
+
         db.add(source)
         db.commit()
         db.refresh(source)
 
+        if queued:
+            knowledge_ingestion.enqueue_ingestion()
+        elif source.sync_status == "pending" and source_url:
+            from app.services.knowledge_sync import enqueue_sync
+            enqueue_sync()
+        elif file_path:
+            knowledge_ingestion.release_file(db, file_path)
+
         # Recalculer le score
         agent = db.query(AgentTemplate).filter(AgentTemplate.id == agent_id).first()
         if agent:
@@ -751,19 +807,12 @@ class OutboundService:
         Vérifie si un message sortant peut être envoyé.
         Retourne (can_send: bool, reason: str).
         """
-        from app.models import Conversation, Message
+        from app.services.contact_policy import get_contact_policy
+
+        policy = get_contact_policy(tenant_id, db)
 
         # 1. Vérifier que le contact a un historique (anti cold outreach)
-        has_history = (
-            db.query(Message)
-            .join(Conversation)
-            .filter(
-                Conversation.tenant_id == tenant_id,
-                Conversation.phone_number == phone_number,
-            )
-            .first()
-        )
-        if not has_history:
+        if not policy.has_history(phone_number, db):
             return False, "Aucun historique — cold outreach interdit"
 
         # 2. Vérifier les limites plan
@@ -773,21 +822,11 @@ class OutboundService:
             if allowed_triggers != ["all"] and trigger_type not in allowed_triggers:
                 return False, f"Trigger '{trigger_type}' non autorisé sur ce plan"
 
-        # 3. Vérifier le compteur OutboundTracking
-        record = (
-            db.query(OutboundTracking)
-            .filter(
-                OutboundTracking.tenant_id == tenant_id,
-                OutboundTracking.phone_number == phone_number,
-            )
-            .first()
-        )
-
-        if record:
-            if record.opted_out:
-                return False, "Contact a demandé STOP"
-            if record.total_outbound_count >= OutboundService.MAX_OUTBOUND_PER_CONTACT:
-                return False, f"Limite {OutboundService.MAX_OUTBOUND_PER_CONTACT} messages sortants atteinte"
+        # 3. Vérifier STOP et le compteur (index mémoire, tenu à jour par record_outbound / handle_stop)
+        if phone_number in policy.opted_out:
+            return False, "Contact a demandé STOP"
+        if policy.outbound.get(phone_number) >= OutboundService.MAX_OUTBOUND_PER_CONTACT:
+            return False, f"Limite {OutboundService.MAX_OUTBOUND_PER_CONTACT} messages sortants atteinte"
 
         return True, "OK"
 
@@ -800,6 +839,7 @@ class OutboundService:
     ) -> None:
         """Incrémente les compteurs après envoi d'un message sortant."""
         from datetime import datetime
+        from app.services.contact_policy import publish_outbound
 
         record = (
             db.query(OutboundTracking)
@@ -836,11 +876,70 @@ class OutboundService:
             record.promo_outbound_count = (record.promo_outbound_count or 0) + 1
 
         db.commit()
+        publish_outbound(tenant_id, phone_number)
+
+    TRIGGER_COUNTERS = {
+        "rdv_reminder": "rdv_outbound_count",
+        "order_followup": "order_outbound_count",
+        "subscription_expiry": "subscription_outbound_count",
+        "promo": "promo_outbound_count",
+    }
+
+    @staticmethod
+    def record_outbound_bulk(
+        tenant_id: int,
+        phone_numbers: list,
+        trigger_type: str,
+        db,
+    ) -> None:
+        """
+        record_outbound pour un lot de contacts (campagnes) : un seul
+        INSERT … ON CONFLICT DO UPDATE en executemany, un seul commit.
+        """
+        from datetime import datetime
+        from app.services.contact_policy import publish_outbound_many
+
+        phones = list(dict.fromkeys(p for p in phone_numbers if p))
+        if not phones:
+            return
+        if db.get_bind().dialect.name == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert
+
+        now = datetime.utcnow()
+        counter = OutboundService.TRIGGER_COUNTERS.get(trigger_type)
+        stmt = insert(OutboundTracking)
+        update = {
+            "total_outbound_count": func.coalesce(OutboundTracking.total_outbound_count, 0) + 1,
+            "last_outbound_at": stmt.excluded.last_outbound_at,
+            "last_trigger_type": stmt.excluded.last_trigger_type,
+            "updated_at": stmt.excluded.updated_at,
+        }
+        if counter:
+            column = getattr(OutboundTracking, counter)
+            update[counter] = func.coalesce(column, 0) + 1
+        rows = []
+        for phone in phones:
+            row = {
+                "tenant_id": tenant_id, "phone_number": phone, "total_outbound_count": 1,
+                "rdv_outbound_count": 0, "order_outbound_count": 0,
+                "subscription_outbound_count": 0, "promo_outbound_count": 0,
+                "last_outbound_at": now, "last_trigger_type": trigger_type,
+                "opted_out": False, "window_start": now, "created_at": now, "updated_at": now,
+            }
+            if counter:
+                row[counter] = 1
+            rows.append(row)
+        db.execute(stmt.on_conflict_do_update(index_elements=["tenant_id", "phone_number"], set_=update), rows)
+        db.commit()
+        publish_outbound_many(tenant_id, phones)
 
     @staticmethod
     def handle_stop(tenant_id: str, phone_number: str, db) -> None:
         """Enregistre le opt-out d'un contact (réponse STOP)."""
         from datetime import datetime
+        from app.services.contact_policy import publish_opt_out
 
         record = (
             db.query(OutboundTracking)
@@ -862,3 +961,4 @@ class OutboundService:
         record.opted_out = True
         record.opted_out_at = datetime.utcnow()
         db.commit()
+        publish_opt_out(tenant_id, phone_number)
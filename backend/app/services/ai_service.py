@@ -4,14 +4,14 @@ import time
 import httpx
 import logging
 from typing import Union
-from ..http_client import DeepSeekClient
+from ..http_client import DeepSeekClient, DEEPSEEK_BASE_URL
 
 logger = logging.getLogger(__name__)
 
 DEEPSEEK_API_KEY = os.getenv("DEEPSEEK_API_KEY", "")
 if not DEEPSEEK_API_KEY:
     logger.error("❌ DEEPSEEK_API_KEY non défini — les réponses IA seront non-fonctionnelles")
-DEEPSEEK_URL = "https://api.deepseek.com/v1/chat/completions"
+DEEPSEEK_URL = f"{DEEPSEEK_BASE_URL}/v1/chat/completions"
 
 # ── Cache TTL en mémoire pour les réponses DeepSeek ───────────────────────────
 # Clé = SHA-256(system_prompt + message) — ne cache PAS l'historique à dessein.
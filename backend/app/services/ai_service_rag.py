@@ -7,7 +7,7 @@ import os
 import logging
 from typing import Union, Optional
 from sqlalchemy.orm import Session
-from .http_client import DeepSeekClient
+from ..http_client import DeepSeekClient
 from .knowledge_base_service import KnowledgeBaseService
 
 logger = logging.getLogger(__name__)
@@ -152,7 +152,8 @@ async def generate_ai_response_with_db(
             messages=messages,
             model="deepseek-chat",
             temperature=0.7,
-            max_tokens=150
+            max_tokens=150,
+            tenant_id=tenant_id,
         )
         
         # 6️⃣ TRAITER LA RÉPONSE
@@ -0,0 +1,248 @@
+"""
+Cache d'authentification — principal par JWT (jti) + blacklist des jti en mémoire
+
+Avant : chaque requête authentifiée = SELECT revoked_tokens + SELECT users. Un
+chargement du dashboard lance des dizaines d'appels API en parallèle avec le
+même token, donc des dizaines de lectures identiques.
+
+Maintenant, par process :
+  revoked     jti révoqués (logout) → expiration du JWT ; chargés une fois, puis
+              complétés de façon incrémentale (revoked_at ≥ dernier vu - marge)
+              quand un autre worker en publie ; purgés à expiration du JWT
+  principals  jti → instantané détaché de l'utilisateur, TTL = min(expiration du
+              JWT, AUTH_PRINCIPAL_TTL_SECONDS) ; rattaché à la session de la
+              requête par merge(load=False), sans requête SQL
+
+Cohérence : revoke_token (logout) applique la révocation localement et incrémente
+une génération partagée dans le backend d'état ; toute écriture ORM sur un User
+(rôle, 2FA, email vérifié, mot de passe…) invalide ses principals après commit et
+incrémente une seconde génération. Les autres workers relisent les générations au
+plus toutes les AUTH_RECHECK_SECONDS — au-delà de cette fenêtre, un token révoqué
+ailleurs est refusé partout. Backend d'état injoignable : relecture de la base au
+plus tard après AUTH_MAX_STALE_SECONDS.
+
+Un set de jti plutôt qu'un filtre de Bloom : la blacklist ne contient que les
+tokens révoqués encore valides (≤ ACCESS_TOKEN_EXPIRE_MINUTES), quelques milliers
+d'entrées au plus, et un set n'a pas de faux positifs.
+"""
+
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional, Set, Tuple
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, make_transient_to_detached
+
+from ..models import RevokedToken, User
+from ..state_backend import StateBackendError, get_state_backend
+import logging
+
+logger = logging.getLogger(__name__)
+
+AUTH_RECHECK_SECONDS = float(os.getenv("AUTH_RECHECK_SECONDS", "2"))
+AUTH_PRINCIPAL_TTL_SECONDS = float(os.getenv("AUTH_PRINCIPAL_TTL_SECONDS", "60"))
+AUTH_MAX_STALE_SECONDS = 30               # backend d'état injoignable : relecture de la base au-delà
+AUTH_PRINCIPAL_CACHE_MAX = 10000          # tokens actifs gardés en mémoire par process
+REVOCATION_OVERLAP = timedelta(seconds=60)   # commits tardifs / horloges des workers
+
+_REVOKED_GEN_KEY = "auth:revoked:gen"
+_USERS_GEN_KEY = "auth:users:gen"
+_USER_COLUMNS = [attr.key for attr in inspect(User).column_attrs]
+
+_lock = threading.Lock()
+
+
+def _read_generation(key: str) -> Optional[int]:
+    """Génération partagée ; None si le backend d'état est injoignable."""
+    try:
+        return int(get_state_backend().get(key) or 0)
+    except (StateBackendError, ValueError) as e:
+        logger.debug(f"Génération {key} illisible : {e}")
+        return None
+
+
+def _publish_generation(key: str) -> Optional[int]:
+    try:
+        return get_state_backend().incr(key)
+    except StateBackendError as e:
+        logger.warning(f"⚠️ Génération {key} non publiée : {e}")
+        return None
+
+
+class _Revocations:
+    """jti révoqués → expiration (epoch), synchronisés avec revoked_tokens."""
+
+    def __init__(self):
+        self.jtis: Dict[str, float] = {}
+        self.watermark: Optional[datetime] = None     # revoked_at le plus récent lu en base
+        self.generation: Optional[int] = None
+        self.loaded_at = 0.0
+        self.checked_at = 0.0
+
+    def sync(self, db: Session) -> None:
+        now = time.monotonic()
+        if self.watermark is not None and now - self.checked_at < AUTH_RECHECK_SECONDS:
+            return
+        generation = _read_generation(_REVOKED_GEN_KEY)
+        if self.watermark is not None:
+            if generation is not None and generation == self.generation:
+                self.checked_at = now
+                return
+            if generation is None and now - self.loaded_at < AUTH_MAX_STALE_SECONDS:
+                self.checked_at = now
+                return
+        self._refresh(db, generation, now)
+
+    def _refresh(self, db: Session, generation: Optional[int], now: float) -> None:
+        q = db.query(RevokedToken.jti, RevokedToken.expires_at, RevokedToken.revoked_at).filter(
+            RevokedToken.expires_at > datetime.utcnow()
+        )
+        if self.watermark is not None:
+            q = q.filter(RevokedToken.revoked_at >= self.watermark - REVOCATION_OVERLAP)
+        rows = q.all()
+        epoch = time.time()
+        with _lock:
+            for jti, expires_at, revoked_at in rows:
+                self.jtis[jti] = _epoch(expires_at)
+                _principals.pop(jti, None)
+                if self.watermark is None or revoked_at > self.watermark:
+                    self.watermark = revoked_at
+            for jti in [j for j, exp in self.jtis.items() if exp <= epoch]:
+                del self.jtis[jti]
+            if self.watermark is None:
+                self.watermark = datetime.utcnow() - REVOCATION_OVERLAP
+            self.generation, self.loaded_at, self.checked_at = generation, now, now
+        if rows:
+            logger.debug(f"🔐 Blacklist JWT : {len(rows)} révocation(s) relue(s), {len(self.jtis)} active(s)")
+
+
+_revocations = _Revocations()
+# jti → (instantané détaché, échéance monotonic, user_id)
+_principals: Dict[str, Tuple[User, float, int]] = {}
+_principals_generation: Optional[int] = None
+_principals_checked_at = 0.0
+_principals_loaded_at = 0.0
+
+
+def _epoch(value: datetime) -> float:
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+def is_revoked(db: Session, jti: str) -> bool:
+    """Remplace la lecture de revoked_tokens par requête : set en mémoire, resynchronisé au besoin."""
+    _revocations.sync(db)
+    exp = _revocations.jtis.get(jti)
+    return exp is not None and exp > time.time()
+
+
+def _sync_principals() -> None:
+    """Un User modifié sur un autre worker : la génération change → on repart d'un cache vide."""
+    global _principals_generation, _principals_checked_at, _principals_loaded_at
+    now = time.monotonic()
+    if now - _principals_checked_at < AUTH_RECHECK_SECONDS:
+        return
+    generation = _read_generation(_USERS_GEN_KEY)
+    stale = (generation is not None and generation != _principals_generation) or (
+        generation is None and now - _principals_loaded_at >= AUTH_MAX_STALE_SECONDS
+    )
+    with _lock:
+        if stale:
+            _principals.clear()
+            _principals_generation, _principals_loaded_at = generation, now
+        _principals_checked_at = now
+
+
+def _snapshot(user: User) -> User:
+    """Copie détachée, toutes colonnes chargées : fusionnable dans n'importe quelle session sans SELECT."""
+    snapshot = User(**{key: getattr(user, key) for key in _USER_COLUMNS})
+    make_transient_to_detached(snapshot)
+    return snapshot
+
+
+def get_principal(db: Session, jti: Optional[str], user_id: int, exp: Optional[float]) -> Optional[User]:
+    """Utilisateur du token, rattaché à db. None si l'utilisateur n'existe plus."""
+    if not jti:
+        return db.query(User).filter(User.id == user_id).first()
+
+    _sync_principals()
+    now = time.monotonic()
+    cached = _principals.get(jti)
+    if cached is not None and cached[1] > now and cached[2] == user_id:
+        return db.merge(cached[0], load=False)
+
+    user = db.query(User).filter(User.id == user_id).first()
+    if user is None:
+        return None
+    ttl = AUTH_PRINCIPAL_TTL_SECONDS
+    if exp is not None:
+        ttl = min(ttl, exp - time.time())
+    if ttl > 0:
+        entry = (_snapshot(user), now + ttl, user_id)
+        with _lock:
+            _principals.pop(jti, None)
+            if len(_principals) >= AUTH_PRINCIPAL_CACHE_MAX:
+                expired = [j for j, (_, deadline, _) in _principals.items() if deadline <= now]
+                for j in expired or [next(iter(_principals))]:
+                    del _principals[j]
+            _principals[jti] = entry
+    return user
+
+
+def publish_revocation(jti: str, expires_at: datetime) -> None:
+    """Après commit de revoke_token : effet immédiat ici, génération publiée pour les autres workers."""
+    generation = _publish_generation(_REVOKED_GEN_KEY)
+    with _lock:
+        _revocations.jtis[jti] = _epoch(expires_at)
+        _principals.pop(jti, None)
+        if generation is not None and _revocations.generation is not None \
+                and generation == _revocations.generation + 1:
+            _revocations.generation = generation       # seule notre révocation depuis la dernière lecture
+        else:
+            _revocations.checked_at = 0.0               # revérifier au prochain accès
+
+
+def invalidate_users(user_ids: Set[int]) -> None:
+    """Après commit d'une écriture sur des User : principals locaux retirés, génération publiée."""
+    global _principals_generation
+    generation = _publish_generation(_USERS_GEN_KEY)
+    with _lock:
+        for jti in [j for j, (_, _, uid) in _principals.items() if uid in user_ids]:
+            del _principals[jti]
+        if generation is not None and _principals_generation is not None \
+                and generation == _principals_generation + 1:
+            _principals_generation = generation
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_user_writes(session: Session, _flush_context) -> None:
+    ids = {obj.id for obj in session.deleted if isinstance(obj, User)}
+    ids.update(obj.id for obj in session.dirty if isinstance(obj, User) and session.is_modified(obj))
+    ids.discard(None)
+    if ids:
+        session.info.setdefault("auth_cache_users", set()).update(ids)
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_user_writes(session: Session) -> None:
+    ids = session.info.pop("auth_cache_users", None)
+    if ids:
+        invalidate_users(ids)
+
+
+@event.listens_for(Session, "after_rollback")
+def _drop_user_writes(session: Session) -> None:
+    session.info.pop("auth_cache_users", None)
+
+
+def reset_auth_cache() -> None:
+    """Vide les caches de ce process (tests)."""
+    global _revocations, _principals_generation, _principals_checked_at, _principals_loaded_at
+    with _lock:
+        _revocations = _Revocations()
+        _principals.clear()
+        _principals_generation = None
+        _principals_checked_at = _principals_loaded_at = 0.0
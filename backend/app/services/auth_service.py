@@ -10,6 +10,7 @@ from jose import jwt, JWTError
 from sqlalchemy.orm import Session
 
 from app.models import User, RevokedToken
+from app.services.auth_cache import publish_revocation
 from app.utils.security import verify_password, get_password_hash as hash_password
 
 _jwt_secret_env = os.getenv("JWT_SECRET", "")
@@ -69,6 +70,8 @@ def revoke_token(db: Session, jti: str, user_id: int, expires_at: datetime) -> N
     entry = RevokedToken(jti=jti, user_id=user_id, expires_at=expires_at)
     db.add(entry)
     db.commit()
+    # Blacklist en mémoire + principal en cache : effet immédiat, autres workers notifiés
+    publish_revocation(jti, expires_at)
 
 
 def purge_expired_revoked_tokens(db: Session) -> int:
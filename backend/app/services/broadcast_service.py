@@ -0,0 +1,144 @@
+"""
+Broadcast Service — Envoi des broadcasts email superadmin en arrière-plan
+Les destinataires sont envoyés par lots Brevo (messageVersions), plusieurs lots
+en parallèle (concurrence bornée), avec retry. La progression est persistée
+dans broadcast_jobs à chaque lot.
+"""
+
+import asyncio
+import os
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from ..database import SessionLocal
+from ..models import BroadcastJob, Tenant
+from .email_service import send_broadcast_batch
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Destinataires par requête Brevo (messageVersions)
+BROADCAST_BATCH_SIZE = int(os.getenv("BROADCAST_BATCH_SIZE", "100"))
+# Requêtes Brevo simultanées
+BROADCAST_CONCURRENCY = int(os.getenv("BROADCAST_CONCURRENCY", "4"))
+
+
+def job_to_dict(job: BroadcastJob) -> dict:
+    return {
+        "job_id": job.id,
+        "status": job.status,
+        "target": job.target,
+        "total": job.total,
+        "sent": job.sent,
+        "failed": job.failed,
+        "error": job.error,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "started_at": job.started_at.isoformat() if job.started_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+    }
+
+
+class BroadcastService:
+    """Création et exécution des jobs de broadcast email"""
+
+    @staticmethod
+    def _recipients_query(db: Session, target: str, tenant_id: Optional[int] = None):
+        q = db.query(Tenant.email, Tenant.name).filter(Tenant.is_deleted == False)  # noqa: E712
+        if target == "single":
+            return q.filter(Tenant.id == tenant_id)
+        q = q.filter(Tenant.is_suspended == False)  # noqa: E712
+        if target == "trial":
+            q = q.filter(Tenant.is_trial == True)  # noqa: E712
+        return q
+
+    @staticmethod
+    def create_job(
+        db: Session,
+        subject: str,
+        body: str,
+        target: str = "all",
+        tenant_id: Optional[int] = None,
+        created_by: Optional[int] = None,
+    ) -> BroadcastJob:
+        total = BroadcastService._recipients_query(db, target, tenant_id).count()
+        job = BroadcastJob(
+            subject=subject,
+            body=body,
+            target=target,
+            tenant_id=tenant_id,
+            status="pending",
+            total=total,
+            created_by=created_by,
+        )
+        db.add(job)
+        db.commit()
+        db.refresh(job)
+        return job
+
+    @staticmethod
+    def get_job(db: Session, job_id: int) -> Optional[BroadcastJob]:
+        return db.query(BroadcastJob).filter(BroadcastJob.id == job_id).first()
+
+    @staticmethod
+    async def run_job(job_id: int, bind: Optional[Engine] = None) -> None:
+        """
+        Exécute le job (BackgroundTasks). Ouvre sa propre session : celle de la
+        requête HTTP est déjà fermée quand la tâche démarre.
+        """
+        db = Session(bind=bind, expire_on_commit=False) if bind is not None else SessionLocal()
+        try:
+            job = BroadcastService.get_job(db, job_id)
+            if not job or job.status != "pending":
+                return
+            job.status = "running"
+            job.started_at = datetime.utcnow()
+            db.commit()
+
+            recipients = [
+                {"email": email, "name": name or email}
+                for email, name in BroadcastService._recipients_query(db, job.target, job.tenant_id)
+                if email
+            ]
+            skipped = job.total - len(recipients)   # tenants sans email
+            if skipped > 0:
+                job.failed = skipped
+                db.commit()
+
+            batches = [
+                recipients[i:i + BROADCAST_BATCH_SIZE]
+                for i in range(0, len(recipients), BROADCAST_BATCH_SIZE)
+            ]
+            semaphore = asyncio.Semaphore(BROADCAST_CONCURRENCY)
+
+            async def _send_batch(batch: list[dict]) -> None:
+                async with semaphore:
+                    ok = await send_broadcast_batch(batch, job.subject, job.body)
+                # Compteurs incrémentés en SQL : pas de lecture-modification-écriture
+                column = BroadcastJob.sent if ok else BroadcastJob.failed
+                db.query(BroadcastJob).filter(BroadcastJob.id == job_id).update(
+                    {column: column + len(batch)}, synchronize_session=False
+                )
+                db.commit()
+
+            await asyncio.gather(*(_send_batch(b) for b in batches))
+
+            db.refresh(job)
+            job.status = "completed"
+            job.finished_at = datetime.utcnow()
+            db.commit()
+            logger.info(
+                f"📣 Broadcast #{job_id} terminé : {job.sent} envoyés, {job.failed} échecs / {job.total}"
+            )
+        except Exception as exc:
+            logger.error(f"❌ Broadcast #{job_id} échoué : {exc}", exc_info=True)
+            db.rollback()
+            db.query(BroadcastJob).filter(BroadcastJob.id == job_id).update(
+                {"status": "failed", "error": str(exc)[:500], "finished_at": datetime.utcnow()},
+                synchronize_session=False,
+            )
+            db.commit()
+        finally:
+            db.close()
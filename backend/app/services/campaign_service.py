@@ -0,0 +1,800 @@
+"""
+Campaign Service — campagnes WhatsApp sortantes (promo, rappels, suivi commande)
+
+Création (quelques requêtes, quel que soit le nombre de destinataires) :
+- audience : conversations du tenant (jamais de cold outreach) filtrées par
+  activité récente / inactivité / outcome / liste de numéros
+- éligibilité en masse : STOP et limite MAX_OUTBOUND_PER_CONTACT écartés en SQL
+  (NOT EXISTS sur outbound_tracking), déclencheur vérifié une fois contre le plan
+- destinataires insérés par INSERT … SELECT dans campaign_recipients
+- template "{{variable|défaut}}" compilé une fois : variables fixes (business,
+  variables de campagne) résolues à la compilation, rendu = concaténation
+
+Envoi (campaign_loop, sur chaque instance) :
+- bail par tenant dans le backend d'état : une seule campagne d'un tenant envoie
+  à la fois, toutes instances confondues → la cadence locale est exacte
+- cadence : seau à jetons par tenant (CAMPAIGN_TENANT_PER_MINUTE, rafale
+  CAMPAIGN_TENANT_BURST) + écart minimum avec jitter par session WhatsApp
+  (CAMPAIGN_SESSION_GAP_SECONDS ± CAMPAIGN_JITTER)
+- STOP / limite revérifiés juste avant l'envoi (index mémoire contact_policy)
+- comptabilité par lot de CAMPAIGN_FLUSH_EVERY envois : statuts destinataires,
+  compteurs campagne, messages de conversation, outbound_tracking — un commit
+- pause / annulation relues au plus toutes les CONTROL_SECONDS ; reprise = retour
+  en file, seuls les destinataires 'pending' repartent
+- 503 / service injoignable : retries avec backoff puis pause automatique
+
+Aucune connexion n'est gardée pendant les attentes (cadence, réseau) : une
+campagne n'occupe le pool que le temps de ses lectures et de ses lots.
+Si l'instance meurt entre un envoi et l'écriture de son lot, ce lot (au plus
+CAMPAIGN_FLUSH_EVERY messages) peut être renvoyé à la reprise.
+"""
+
+import asyncio
+import os
+import random
+import re
+import socket
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+
+import httpx
+import sentry_sdk
+from sqlalchemy import and_, case, exists, func, insert, literal, select, update
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from ..database import SessionLocal
+from ..http_client import get_client
+from ..models import (
+    PLAN_LIMITS, Campaign, CampaignRecipient, ContactSetting, Conversation, Message,
+    OutboundTracking, Tenant, WhatsAppSession,
+)
+from ..state_backend import StateBackendError, get_state_backend
+from .agent_service import OutboundService
+from .contact_policy import get_contact_policy
+import logging
+
+logger = logging.getLogger(__name__)
+
+WHATSAPP_SERVICE_URL = os.getenv("WHATSAPP_SERVICE_URL", "http://localhost:3001")
+INTERNAL_API_KEY = os.getenv("INTERNAL_API_KEY", "")
+
+# Messages par minute et par tenant (0 = pas de plafond), rafale autorisée
+CAMPAIGN_TENANT_PER_MINUTE = float(os.getenv("CAMPAIGN_TENANT_PER_MINUTE", "20"))
+CAMPAIGN_TENANT_BURST = int(os.getenv("CAMPAIGN_TENANT_BURST", "3"))
+# Écart moyen entre deux messages d'une même session WhatsApp, ± jitter (fraction)
+CAMPAIGN_SESSION_GAP_SECONDS = float(os.getenv("CAMPAIGN_SESSION_GAP_SECONDS", "2"))
+CAMPAIGN_JITTER = float(os.getenv("CAMPAIGN_JITTER", "0.5"))
+# Campagnes envoyées en parallèle par instance (tenants différents)
+CAMPAIGN_MAX_ACTIVE = int(os.getenv("CAMPAIGN_MAX_ACTIVE", "20"))
+
+CAMPAIGN_FLUSH_EVERY = 20
+CAMPAIGN_FLUSH_SECONDS = 5
+CAMPAIGN_FETCH = 200
+CAMPAIGN_POLL_SECONDS = 10
+CAMPAIGN_PACER_CACHE_MAX = 1000
+CONTROL_SECONDS = 1.0
+LEASE_TTL_SECONDS = 60                       # > une attente de retry ou une requête (25s) : renouvelé entre les deux
+STALE_AFTER = timedelta(minutes=3)           # heartbeat absent → instance morte, campagne remise en file
+RETRY_DELAYS = (5, 12, 20, 30)               # reconnexion Baileys ~10s (cf. send_whatsapp_response)
+PREVIEW_SAMPLES = 3
+
+TRIGGER_TYPES = ("promo", "rdv_reminder", "order_followup", "subscription_expiry")
+RECIPIENT_VARIABLES = ("name", "first_name", "phone")
+TRANSITIONS = {
+    "start":  (("draft",), "pending"),
+    "pause":  (("pending", "running"), "paused"),
+    "resume": (("paused",), "pending"),
+    "cancel": (("draft", "pending", "running", "paused"), "cancelled"),
+}
+
+INSTANCE_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+_VARIABLE = re.compile(r"\{\{\s*([A-Za-z_][A-Za-z0-9_]*)\s*(?:\|([^{}]*))?\}\}")
+
+
+class CampaignRejected(ValueError):
+    """Campagne refusée (template, plan, transition) — message affichable tel quel."""
+
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def campaign_to_dict(campaign: Campaign) -> dict:
+    processed = campaign.sent + campaign.failed + campaign.skipped
+    return {
+        "campaign_id": campaign.id,
+        "name": campaign.name,
+        "status": campaign.status,
+        "trigger_type": campaign.trigger_type,
+        "template": campaign.template,
+        "audience": campaign.audience or {},
+        "total": campaign.total,
+        "excluded": campaign.excluded,
+        "sent": campaign.sent,
+        "failed": campaign.failed,
+        "skipped": campaign.skipped,
+        "remaining": max(campaign.total - processed, 0),
+        "percent": round(100 * processed / campaign.total, 1) if campaign.total else 100.0,
+        "error": campaign.error,
+        "created_at": campaign.created_at.isoformat() if campaign.created_at else None,
+        "started_at": campaign.started_at.isoformat() if campaign.started_at else None,
+        "finished_at": campaign.finished_at.isoformat() if campaign.finished_at else None,
+    }
+
+
+# ─── Template ───────────────────────────────────────────────────────────────
+
+class CampaignTemplate:
+    """
+    "Bonjour {{first_name|cher client}}, -20% chez {{business}} jusqu'au {{date}}"
+    Variables par destinataire : name, first_name, phone. Les autres (business +
+    variables de la campagne) sont fixes et remplacées une fois pour toutes.
+    """
+
+    def __init__(self, source: str, constants: Optional[Dict[str, str]] = None):
+        constants = {k: str(v) for k, v in (constants or {}).items()}
+        self.parts: list = []          # str littérale | (variable, défaut)
+        literal_text, pos, unknown = "", 0, []
+        for match in _VARIABLE.finditer(source):
+            name, default = match.group(1), (match.group(2) or "").strip()
+            literal_text += source[pos:match.start()]
+            pos = match.end()
+            if name in RECIPIENT_VARIABLES:
+                self.parts.append(literal_text)
+                self.parts.append((name, default))
+                literal_text = ""
+            elif name in constants:
+                literal_text += constants[name] or default
+            else:
+                unknown.append(name)
+        self.parts.append(literal_text + source[pos:])
+        if unknown:
+            raise CampaignRejected(f"Variable(s) inconnue(s) : {', '.join(sorted(set(unknown)))}")
+
+    def render(self, name: Optional[str], phone: str) -> str:
+        name = (name or "").strip()
+        values = {"name": name, "first_name": name.split()[0] if name else "", "phone": phone}
+        return "".join(
+            part if isinstance(part, str) else (values[part[0]] or part[1])
+            for part in self.parts
+        ).strip()
+
+
+def build_template(campaign: Campaign, business_name: str) -> CampaignTemplate:
+    reserved = set(RECIPIENT_VARIABLES) & set(campaign.variables or {})
+    if reserved:
+        raise CampaignRejected(f"Variable(s) réservée(s) : {', '.join(sorted(reserved))}")
+    return CampaignTemplate(campaign.template, {"business": business_name, **(campaign.variables or {})})
+
+
+# ─── Cadence ────────────────────────────────────────────────────────────────
+
+class TokenBucket:
+    """Seau à jetons par tenant. reserve() prend un jeton et retourne l'attente en secondes."""
+
+    def __init__(self, per_minute: float, burst: int, clock=time.monotonic):
+        self.rate = per_minute / 60
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.clock = clock
+        self.updated = clock()
+
+    def reserve(self) -> float:
+        if self.rate <= 0:
+            return 0.0
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate) - 1
+        self.updated = now
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+
+class SessionPacer:
+    """Écart minimum entre deux messages d'une session WhatsApp, avec jitter (rythme non mécanique)."""
+
+    def __init__(self, gap: float, jitter: float, clock=time.monotonic, rng=random.random):
+        self.gap = gap
+        self.jitter = min(max(jitter, 0.0), 1.0)
+        self.clock = clock
+        self.rng = rng
+        self.next_at = 0.0
+
+    def reserve(self) -> float:
+        now = self.clock()
+        at = max(now, self.next_at)
+        self.next_at = at + self.gap * (1 + self.jitter * (2 * self.rng() - 1))
+        return at - now
+
+
+class Pacer:
+    def __init__(self, bucket: TokenBucket, session: SessionPacer):
+        self.bucket = bucket
+        self.session = session
+
+    async def wait(self) -> None:
+        delay = self.bucket.reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        delay = self.session.reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+_tenant_buckets: Dict[int, TokenBucket] = {}
+_session_pacers: Dict[str, SessionPacer] = {}
+
+
+def get_pacer(tenant_id: int, session_key: str) -> Pacer:
+    """Cadence du tenant et de sa session WhatsApp, conservée d'une campagne à l'autre."""
+    bucket = _tenant_buckets.get(tenant_id)
+    if bucket is None:
+        if len(_tenant_buckets) >= CAMPAIGN_PACER_CACHE_MAX:
+            _tenant_buckets.pop(next(iter(_tenant_buckets)))
+        bucket = _tenant_buckets[tenant_id] = TokenBucket(CAMPAIGN_TENANT_PER_MINUTE, CAMPAIGN_TENANT_BURST)
+    session = _session_pacers.get(session_key)
+    if session is None:
+        if len(_session_pacers) >= CAMPAIGN_PACER_CACHE_MAX:
+            _session_pacers.pop(next(iter(_session_pacers)))
+        session = _session_pacers[session_key] = SessionPacer(CAMPAIGN_SESSION_GAP_SECONDS, CAMPAIGN_JITTER)
+    return Pacer(bucket, session)
+
+
+def reset_pacers() -> None:
+    """Oublie les cadences de ce process (tests, bench)."""
+    _tenant_buckets.clear()
+    _session_pacers.clear()
+
+
+def _session_key(db: Session, tenant_id: int) -> str:
+    phone = db.query(WhatsAppSession.whatsapp_phone).filter(WhatsAppSession.tenant_id == tenant_id).scalar()
+    return f"wa:{phone}" if phone else f"tenant:{tenant_id}"
+
+
+# ─── Audience ───────────────────────────────────────────────────────────────
+
+def _tracking(*conditions):
+    return exists().where(and_(
+        OutboundTracking.tenant_id == Conversation.tenant_id,
+        OutboundTracking.phone_number == Conversation.customer_phone,
+        *conditions,
+    ))
+
+
+def _audience_select(tenant_id: int, audience: dict, *columns):
+    """SELECT sur les conversations du tenant + contact_settings (nom), filtres d'audience appliqués."""
+    stmt = select(*columns).select_from(Conversation).outerjoin(ContactSetting, and_(
+        ContactSetting.tenant_id == Conversation.tenant_id,
+        ContactSetting.phone_number == Conversation.customer_phone,
+    )).where(Conversation.tenant_id == tenant_id)
+    now = datetime.utcnow()
+    if audience.get("active_within_days"):
+        stmt = stmt.where(Conversation.last_message_at >= now - timedelta(days=audience["active_within_days"]))
+    if audience.get("inactive_for_days"):
+        stmt = stmt.where(Conversation.last_message_at < now - timedelta(days=audience["inactive_for_days"]))
+    if audience.get("outcome_types"):
+        stmt = stmt.where(Conversation.outcome_type.in_(audience["outcome_types"]))
+    if audience.get("phones"):
+        stmt = stmt.where(Conversation.customer_phone.in_(audience["phones"]))
+    return stmt
+
+
+def _contact_name():
+    return func.coalesce(ContactSetting.contact_name, Conversation.customer_name)
+
+
+# ─── Service ────────────────────────────────────────────────────────────────
+
+class CampaignService:
+    """Création, suivi et pilotage des campagnes"""
+
+    @staticmethod
+    def check_trigger(tenant: Tenant, trigger_type: str) -> None:
+        if trigger_type not in TRIGGER_TYPES:
+            raise CampaignRejected(f"Déclencheur inconnu : {trigger_type}")
+        allowed = PLAN_LIMITS.get(tenant.plan, {}).get("outbound_triggers", [])
+        if allowed != ["all"] and trigger_type not in allowed:
+            raise CampaignRejected(f"Déclencheur '{trigger_type}' non inclus dans votre plan", status_code=403)
+
+    @staticmethod
+    def audience_counts(db: Session, tenant_id: int, audience: dict) -> dict:
+        """Taille de l'audience et exclusions (STOP, limite sortants) en une requête."""
+        opted_out = _tracking(OutboundTracking.opted_out == True)  # noqa: E712
+        over_limit = _tracking(OutboundTracking.total_outbound_count >= OutboundService.MAX_OUTBOUND_PER_CONTACT)
+        row = db.execute(_audience_select(
+            tenant_id, audience,
+            func.count(),
+            func.sum(case((opted_out, 1), else_=0)),
+            func.sum(case((and_(over_limit, ~opted_out), 1), else_=0)),
+        )).one()
+        audience_size, stopped, limited = row[0], int(row[1] or 0), int(row[2] or 0)
+        return {
+            "audience": audience_size,
+            "eligible": audience_size - stopped - limited,
+            "excluded_stop": stopped,
+            "excluded_limit": limited,
+        }
+
+    @staticmethod
+    def _eligible(stmt):
+        return stmt.where(
+            ~_tracking(OutboundTracking.opted_out == True),  # noqa: E712
+            ~_tracking(OutboundTracking.total_outbound_count >= OutboundService.MAX_OUTBOUND_PER_CONTACT),
+        )
+
+    @staticmethod
+    def preview(db: Session, tenant: Tenant, template: str, trigger_type: str,
+                audience: dict, variables: Optional[dict] = None) -> dict:
+        """Comptage + quelques messages rendus, sans rien créer."""
+        CampaignService.check_trigger(tenant, trigger_type)
+        draft = Campaign(template=template, variables=variables or {})
+        compiled = build_template(draft, tenant.name)
+        rows = db.execute(CampaignService._eligible(_audience_select(
+            tenant.id, audience, Conversation.customer_phone, _contact_name(),
+        )).order_by(Conversation.id).limit(PREVIEW_SAMPLES)).all()
+        return {
+            **CampaignService.audience_counts(db, tenant.id, audience),
+            "samples": [{"phone": phone, "message": compiled.render(name, phone)} for phone, name in rows],
+        }
+
+    @staticmethod
+    def create(
+        db: Session,
+        tenant: Tenant,
+        name: str,
+        template: str,
+        trigger_type: str = "promo",
+        audience: Optional[dict] = None,
+        variables: Optional[dict] = None,
+        start: bool = True,
+        created_by: Optional[int] = None,
+    ) -> Campaign:
+        audience = audience or {}
+        CampaignService.check_trigger(tenant, trigger_type)
+        campaign = Campaign(
+            tenant_id=tenant.id, name=name, template=template, trigger_type=trigger_type,
+            variables=variables or {}, audience=audience,
+            status="pending" if start else "draft", created_by=created_by,
+        )
+        build_template(campaign, tenant.name)           # valide le template avant toute écriture
+        counts = CampaignService.audience_counts(db, tenant.id, audience)
+        if counts["eligible"] == 0:
+            raise CampaignRejected("Aucun contact éligible pour cette audience")
+        db.add(campaign)
+        db.flush()
+
+        # Destinataires : un seul INSERT … SELECT, l'éligibilité est évaluée par la base
+        inserted = db.execute(insert(CampaignRecipient).from_select(
+            ["campaign_id", "conversation_id", "phone_number", "contact_name", "status"],
+            CampaignService._eligible(_audience_select(
+                tenant.id, audience,
+                literal(campaign.id), Conversation.id, Conversation.customer_phone,
+                _contact_name(), literal("pending"),
+            )),
+        )).rowcount
+        campaign.total = inserted if inserted is not None and inserted >= 0 else counts["eligible"]
+        campaign.excluded = counts["excluded_stop"] + counts["excluded_limit"]
+        db.commit()
+        db.refresh(campaign)
+        logger.info(
+            f"📣 Campagne #{campaign.id} créée (tenant {tenant.id}) : {campaign.total} destinataires, "
+            f"{campaign.excluded} exclus"
+        )
+        return campaign
+
+    @staticmethod
+    def get(db: Session, tenant_id: int, campaign_id: int) -> Optional[Campaign]:
+        return db.query(Campaign).filter(Campaign.id == campaign_id, Campaign.tenant_id == tenant_id).first()
+
+    @staticmethod
+    def list_for_tenant(db: Session, tenant_id: int, limit: int = 50) -> List[Campaign]:
+        return (
+            db.query(Campaign).filter(Campaign.tenant_id == tenant_id)
+            .order_by(Campaign.created_at.desc(), Campaign.id.desc()).limit(limit).all()
+        )
+
+    @staticmethod
+    def transition(db: Session, campaign: Campaign, action: str) -> Campaign:
+        """start | pause | resume | cancel. Écriture conditionnelle : le worker peut avoir changé le statut."""
+        if action not in TRANSITIONS:
+            raise CampaignRejected(f"Action inconnue : {action}", status_code=404)
+        sources, target = TRANSITIONS[action]
+        values = {"status": target}
+        if target == "pending":
+            values["error"] = None
+        if target == "cancelled":
+            values["finished_at"] = datetime.utcnow()
+        changed = db.query(Campaign).filter(
+            Campaign.id == campaign.id, Campaign.status.in_(sources),
+        ).update(values, synchronize_session=False)
+        db.commit()
+        db.refresh(campaign)
+        if not changed:
+            raise CampaignRejected(
+                f"Impossible de {action} une campagne au statut '{campaign.status}'", status_code=409
+            )
+        if target == "pending":
+            enqueue_campaigns()
+        return campaign
+
+    @staticmethod
+    def delivery_report(db: Session, campaign_id: int) -> dict:
+        """Répartition par statut + principales raisons d'échec / d'exclusion."""
+        by_status = dict(
+            db.query(CampaignRecipient.status, func.count())
+            .filter(CampaignRecipient.campaign_id == campaign_id)
+            .group_by(CampaignRecipient.status).all()
+        )
+        reasons = (
+            db.query(CampaignRecipient.status, CampaignRecipient.reason, func.count().label("n"))
+            .filter(CampaignRecipient.campaign_id == campaign_id, CampaignRecipient.status.in_(("failed", "skipped")))
+            .group_by(CampaignRecipient.status, CampaignRecipient.reason)
+            .order_by(func.count().desc()).limit(10).all()
+        )
+        return {
+            "by_status": by_status,
+            "reasons": [{"status": s, "reason": r, "count": n} for s, r, n in reasons],
+        }
+
+
+# ─── Envoi ──────────────────────────────────────────────────────────────────
+
+async def deliver(tenant_id: int, phone: str, text: str,
+                  keepalive: Optional[Callable[[], bool]] = None) -> Tuple[str, Optional[str]]:
+    """
+    Un message via le service WhatsApp. ("sent", message_id) | ("failed", raison)
+    | ("unavailable", raison) si la session reste déconnectée après les retries.
+    Les retries durent jusqu'à ~3 min : `keepalive` (heartbeat + bail) est appelé avant
+    et après chaque attente — ("lost", raison) s'il signale que le bail n'est plus à nous.
+    """
+    client = get_client("whatsapp-service")
+    url = f"{WHATSAPP_SERVICE_URL}/api/whatsapp/tenants/{tenant_id}/send-message"
+    reason = "WhatsApp déconnecté"
+    for wait in (0, *RETRY_DELAYS):
+        if wait:
+            if keepalive and not keepalive():
+                return "lost", "Bail du tenant repris par une autre instance"
+            await asyncio.sleep(wait)
+            if keepalive and not keepalive():
+                return "lost", "Bail du tenant repris par une autre instance"
+        try:
+            response = await client.post(
+                url, json={"to": phone, "message": text}, headers={"x-api-key": INTERNAL_API_KEY}, timeout=25,
+            )
+        except httpx.TransportError as e:
+            reason = f"Service WhatsApp injoignable : {e.__class__.__name__}"
+            continue
+        if response.status_code == 200:
+            try:
+                message_id = response.json().get("messageId")
+            except ValueError:
+                message_id = None
+            return "sent", message_id
+        if response.status_code != 503:
+            return "failed", f"HTTP {response.status_code} : {response.text[:150]}"
+        reason = "WhatsApp déconnecté"
+    return "unavailable", reason
+
+
+def _lease_key(tenant_id: int) -> str:
+    return f"campaign:tenant:{tenant_id}"
+
+
+def _lease_value(campaign_id: int) -> str:
+    return f"{INSTANCE_ID}:{campaign_id}"
+
+
+class CampaignRunner:
+    """Envoi d'une campagne réclamée par cette instance (bail du tenant détenu)."""
+
+    def __init__(self, db: Session, campaign: Campaign, template: CampaignTemplate, pacer: Pacer):
+        self.db = db
+        self.campaign_id = campaign.id
+        self.tenant_id = campaign.tenant_id
+        self.trigger_type = campaign.trigger_type
+        self.template = template
+        self.pacer = pacer
+        self.results: list = []
+        self.flushed_at = time.monotonic()
+        self.checked_at = time.monotonic()
+
+    def _status(self, force: bool = False) -> str:
+        now = time.monotonic()
+        if not force and now - self.checked_at < CONTROL_SECONDS:
+            return "running"
+        self.checked_at = now
+        return self.db.query(Campaign.status).filter(Campaign.id == self.campaign_id).scalar()
+
+    def _record(self, recipient, status: str, reason: Optional[str] = None,
+                message_id: Optional[str] = None, text: Optional[str] = None) -> None:
+        self.results.append({
+            "id": recipient.id, "status": status, "reason": reason, "message_id": message_id,
+            "sent_at": datetime.utcnow() if status == "sent" else None,
+            "_phone": recipient.phone_number, "_conversation_id": recipient.conversation_id, "_text": text,
+        })
+
+    def flush(self) -> bool:
+        """Écrit le lot en une transaction. False si le bail du tenant n'est plus à nous."""
+        self.flushed_at = time.monotonic()
+        results, self.results = self.results, []
+        now = datetime.utcnow()
+        if results:
+            db = self.db
+            db.execute(update(CampaignRecipient), [
+                {k: v for k, v in r.items() if not k.startswith("_")} for r in results
+            ])
+            counts = {s: sum(1 for r in results if r["status"] == s) for s in ("sent", "failed", "skipped")}
+            db.query(Campaign).filter(Campaign.id == self.campaign_id).update({
+                Campaign.sent: Campaign.sent + counts["sent"],
+                Campaign.failed: Campaign.failed + counts["failed"],
+                Campaign.skipped: Campaign.skipped + counts["skipped"],
+                Campaign.heartbeat_at: now,
+            }, synchronize_session=False)
+            sent = [r for r in results if r["status"] == "sent"]
+            with_conversation = [r for r in sent if r["_conversation_id"]]
+            if with_conversation:
+                db.execute(insert(Message), [
+                    {"conversation_id": r["_conversation_id"], "content": r["_text"], "direction": "outgoing",
+                     "is_ai": False, "created_at": r["sent_at"]}
+                    for r in with_conversation
+                ])
+                db.query(Conversation).filter(
+                    Conversation.id.in_([r["_conversation_id"] for r in with_conversation])
+                ).update({"last_message_at": now}, synchronize_session=False)
+            if sent:
+                # Commit commun : statuts, compteurs, messages et outbound_tracking
+                OutboundService.record_outbound_bulk(self.tenant_id, [r["_phone"] for r in sent], self.trigger_type, db)
+            else:
+                db.commit()
+        else:
+            self.db.query(Campaign).filter(Campaign.id == self.campaign_id).update(
+                {Campaign.heartbeat_at: now}, synchronize_session=False
+            )
+            self.db.commit()
+        return self._renew_lease()
+
+    def _renew_lease(self) -> bool:
+        backend, key = get_state_backend(), _lease_key(self.tenant_id)
+        try:
+            if backend.get(key) not in (None, _lease_value(self.campaign_id)):
+                return False
+            backend.set(key, _lease_value(self.campaign_id), ttl=LEASE_TTL_SECONDS)
+        except StateBackendError as e:
+            logger.warning(f"⚠️ Bail campagne #{self.campaign_id} non renouvelé : {e}")
+        return True
+
+    def _finish(self, status: str, error: Optional[str] = None) -> None:
+        """Sortie de la boucle : statut final si la campagne est toujours à nous ('running')."""
+        values = {"status": status}
+        if status == "completed":
+            values["finished_at"] = datetime.utcnow()
+        if error:
+            values["error"] = error[:500]
+        self.db.query(Campaign).filter(
+            Campaign.id == self.campaign_id, Campaign.status == "running",
+        ).update(values, synchronize_session=False)
+        # Pause / annulation venues de l'API : statut déjà écrit, seul le verrou est rendu
+        self.db.query(Campaign).filter(Campaign.id == self.campaign_id).update(
+            {"locked_by": None}, synchronize_session=False
+        )
+        self.db.commit()
+
+    async def run(self) -> str:
+        """Envoie les destinataires 'pending'. Retourne le statut de sortie."""
+        db, last_id = self.db, 0
+        while True:
+            batch = (
+                db.query(CampaignRecipient.id, CampaignRecipient.phone_number,
+                         CampaignRecipient.contact_name, CampaignRecipient.conversation_id)
+                .filter(CampaignRecipient.campaign_id == self.campaign_id,
+                        CampaignRecipient.status == "pending", CampaignRecipient.id > last_id)
+                .order_by(CampaignRecipient.id).limit(CAMPAIGN_FETCH).all()
+            )
+            if not batch:
+                break
+            for recipient in batch:
+                last_id = recipient.id
+                status = self._status()
+                if status != "running":
+                    self.flush()
+                    self._finish(status)
+                    return status
+
+                phone = recipient.phone_number
+                policy = get_contact_policy(self.tenant_id, db)
+                if phone in policy.opted_out:
+                    self._record(recipient, "skipped", "Contact a demandé STOP")
+                    continue
+                if policy.outbound.get(phone) >= OutboundService.MAX_OUTBOUND_PER_CONTACT:
+                    self._record(recipient, "skipped", "Limite messages sortants atteinte")
+                    continue
+
+                text = self.template.render(recipient.contact_name, phone)
+                if db.in_transaction():
+                    db.commit()          # rend la connexion au pool avant d'attendre (cadence, réseau)
+                await self.pacer.wait()
+                result, detail = await deliver(self.tenant_id, phone, text, keepalive=self.flush)
+                if result == "lost":
+                    self._finish("pending")
+                    logger.warning(f"⚠️ Campagne #{self.campaign_id} : bail repris par une autre instance")
+                    return "pending"
+                if result == "unavailable":
+                    self.flush()
+                    self._finish("paused", f"{detail} — reprendre la campagne une fois la session reconnectée")
+                    logger.warning(f"⏸️ Campagne #{self.campaign_id} mise en pause : {detail}")
+                    return "paused"
+                if result == "sent":
+                    self._record(recipient, "sent", message_id=detail, text=text)
+                else:
+                    self._record(recipient, "failed", detail)
+
+                if len(self.results) >= CAMPAIGN_FLUSH_EVERY or time.monotonic() - self.flushed_at > CAMPAIGN_FLUSH_SECONDS:
+                    if not self.flush():
+                        self._finish("pending")
+                        logger.warning(f"⚠️ Campagne #{self.campaign_id} : bail repris par une autre instance")
+                        return "pending"
+
+        self.flush()
+        status = self._status(force=True)
+        if status == "running":
+            self._finish("completed")
+            return "completed"
+        self._finish(status)
+        return status
+
+
+class CampaignWorker:
+    """Réclamation et exécution des campagnes en file"""
+
+    @staticmethod
+    def recover_stale(db: Session) -> int:
+        """Campagnes 'running' sans heartbeat (instance morte) → remises en file."""
+        count = db.query(Campaign).filter(
+            Campaign.status == "running",
+            Campaign.heartbeat_at < datetime.utcnow() - STALE_AFTER,
+        ).update({"status": "pending", "locked_by": None}, synchronize_session=False)
+        db.commit()
+        return count
+
+    @staticmethod
+    def claim(db: Session, slots: int, busy_tenants: set) -> List[int]:
+        """
+        Réclame jusqu'à `slots` campagnes 'pending' de tenants différents. SKIP LOCKED
+        + bail par tenant dans le backend d'état : un tenant n'envoie qu'une
+        campagne à la fois sur l'ensemble des instances.
+        """
+        if slots <= 0:
+            return []
+        candidates = (
+            db.query(Campaign).filter(Campaign.status == "pending")
+            .order_by(Campaign.created_at.asc(), Campaign.id.asc())
+            .limit(slots * 4).with_for_update(skip_locked=True).all()
+        )
+        backend, now, claimed = get_state_backend(), datetime.utcnow(), []
+        for campaign in candidates:
+            if len(claimed) >= slots or campaign.tenant_id in busy_tenants:
+                continue
+            try:
+                acquired = backend.set(
+                    _lease_key(campaign.tenant_id), _lease_value(campaign.id), ttl=LEASE_TTL_SECONDS, nx=True,
+                )
+            except StateBackendError as e:
+                logger.warning(f"⚠️ Campagnes : backend d'état injoignable, réclamation reportée ({e})")
+                break
+            if not acquired:
+                continue
+            campaign.status = "running"
+            campaign.locked_by = INSTANCE_ID
+            campaign.heartbeat_at = now
+            campaign.started_at = campaign.started_at or now
+            busy_tenants.add(campaign.tenant_id)
+            claimed.append(campaign.id)
+        db.commit()
+        return claimed
+
+    @staticmethod
+    async def run(campaign_id: int, bind: Optional[Engine] = None) -> str:
+        """Exécute une campagne réclamée. Ouvre sa propre session, libère le bail en sortie."""
+        db = Session(bind=bind, expire_on_commit=False) if bind is not None else SessionLocal()
+        tenant_id = None
+        try:
+            campaign = db.get(Campaign, campaign_id)
+            if campaign is None or campaign.status != "running":
+                return campaign.status if campaign else "missing"
+            tenant_id = campaign.tenant_id
+            tenant_name = db.query(Tenant.name).filter(Tenant.id == tenant_id).scalar() or ""
+            runner = CampaignRunner(
+                db, campaign, build_template(campaign, tenant_name), get_pacer(tenant_id, _session_key(db, tenant_id)),
+            )
+            started = time.perf_counter()
+            status = await runner.run()
+            db.refresh(campaign)
+            logger.info(
+                f"📣 Campagne #{campaign_id} → {status} : {campaign.sent} envoyés, {campaign.failed} échecs, "
+                f"{campaign.skipped} ignorés / {campaign.total} en {time.perf_counter() - started:.0f}s"
+            )
+            return status
+        except Exception as exc:
+            logger.error(f"❌ Campagne #{campaign_id} échouée : {exc}", exc_info=True)
+            sentry_sdk.capture_exception(exc)
+            db.rollback()
+            db.query(Campaign).filter(Campaign.id == campaign_id).update(
+                {"status": "failed", "error": str(exc)[:500], "finished_at": datetime.utcnow(), "locked_by": None},
+                synchronize_session=False,
+            )
+            db.commit()
+            return "failed"
+        finally:
+            if tenant_id is not None:
+                _release_lease(tenant_id, campaign_id)
+            db.close()
+
+
+def _release_lease(tenant_id: int, campaign_id: int) -> None:
+    backend, key = get_state_backend(), _lease_key(tenant_id)
+    try:
+        if backend.get(key) == _lease_value(campaign_id):
+            backend.delete(key)
+    except StateBackendError as e:
+        logger.debug(f"Bail campagne tenant {tenant_id} non libéré (expirera) : {e}")
+
+
+_wakeup: Optional[asyncio.Event] = None
+_wakeup_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def enqueue_campaigns() -> None:
+    """Réveille le worker : une campagne vient d'être mise en 'pending'."""
+    if _wakeup is None or _wakeup_loop is None or _wakeup_loop.is_closed():
+        return
+    try:
+        if asyncio.get_running_loop() is _wakeup_loop:
+            _wakeup.set()
+            return
+    except RuntimeError:
+        pass
+    _wakeup_loop.call_soon_threadsafe(_wakeup.set)
+
+
+def _on_done(active: dict, campaign_id: int) -> None:
+    """Fin d'une campagne : place libérée, le worker peut réclamer la suivante tout de suite."""
+    active.pop(campaign_id, None)
+    if _wakeup is not None:
+        _wakeup.set()
+
+
+async def campaign_loop() -> None:
+    """Background task : réclame les campagnes en file et les envoie (une tâche par campagne)."""
+    global _wakeup, _wakeup_loop
+    _wakeup = asyncio.Event()
+    _wakeup_loop = asyncio.get_running_loop()
+    active: Dict[int, Tuple[int, asyncio.Task]] = {}
+    last_maintenance = 0.0
+
+    while True:
+        db = SessionLocal()
+        try:
+            if time.monotonic() - last_maintenance > 60:
+                recovered = CampaignWorker.recover_stale(db)
+                if recovered:
+                    logger.info(f"🔁 Campagnes : {recovered} campagne(s) sans heartbeat remises en file")
+                last_maintenance = time.monotonic()
+            busy = {tenant_id for tenant_id, _ in active.values()}
+            for campaign_id in CampaignWorker.claim(db, CAMPAIGN_MAX_ACTIVE - len(active), busy):
+                tenant_id = db.query(Campaign.tenant_id).filter(Campaign.id == campaign_id).scalar()
+                task = asyncio.create_task(CampaignWorker.run(campaign_id))
+                active[campaign_id] = (tenant_id, task)
+                task.add_done_callback(lambda _task, cid=campaign_id: _on_done(active, cid))
+        except Exception as exc:
+            sentry_sdk.capture_exception(exc)
+            logger.error(f"❌ campaign_loop error: {exc}")
+            db.rollback()
+        finally:
+            db.close()
+
+        try:
+            await asyncio.wait_for(_wakeup.wait(), timeout=CAMPAIGN_POLL_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+        _wakeup.clear()
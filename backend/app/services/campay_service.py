@@ -15,8 +15,8 @@ import hashlib
 import hmac
 import logging
 from typing import Optional
-import httpx
 import sentry_sdk
+from ..http_client import get_client
 
 logger = logging.getLogger(__name__)
 
@@ -63,20 +63,20 @@ async def _get_access_token() -> str:
     Obtient un token d'accès CamPay via username/password.
     Le token expire — à obtenir à chaque appel (ou mettre en cache si besoin perf).
     """
-    async with httpx.AsyncClient(timeout=10.0) as client:
-        response = await client.post(
-            f"{_get_base_url()}/user/token/",
-            data={
-                "username": _get_username(),
-                "password": _get_password(),
-            },
-        )
-        response.raise_for_status()
-        data = response.json()
-        token = data.get("token")
-        if not token:
-            raise RuntimeError("CamPay n'a pas retourné de token d'accès")
-        return token
+    client = get_client("campay")
+    response = await client.post(
+        f"{_get_base_url()}/user/token/",
+        data={
+            "username": _get_username(),
+            "password": _get_password(),
+        },
+    )
+    response.raise_for_status()
+    data = response.json()
+    token = data.get("token")
+    if not token:
+        raise RuntimeError("CamPay n'a pas retourné de token d'accès")
+    return token
 
 
 # ─── Création d'une collecte Mobile Money ────────────────────────────────────
@@ -126,14 +126,14 @@ async def initialize_collection(
         "webhook": webhook_url,
     }
 
-    async with httpx.AsyncClient(timeout=15.0) as client:
-        response = await client.post(
-            f"{_get_base_url()}/collect/",
-            json=payload,
-            headers=headers,
-        )
-        response.raise_for_status()
-        data = response.json()
+    client = get_client("campay")
+    response = await client.post(
+        f"{_get_base_url()}/collect/",
+        json=payload,
+        headers=headers,
+    )
+    response.raise_for_status()
+    data = response.json()
 
     logger.info(
         "CamPay collection initiée — ref: %s, mode: %s",
@@ -150,13 +150,13 @@ async def verify_transaction(reference: str) -> dict:
     token = await _get_access_token()
     headers = {"Authorization": f"Token {token}"}
 
-    async with httpx.AsyncClient(timeout=10.0) as client:
-        response = await client.get(
-            f"{_get_base_url()}/transaction/{reference}/",
-            headers=headers,
-        )
-        response.raise_for_status()
-        return response.json()
+    client = get_client("campay")
+    response = await client.get(
+        f"{_get_base_url()}/transaction/{reference}/",
+        headers=headers,
+    )
+    response.raise_for_status()
+    return response.json()
 
 
 # ─── Vérification de signature webhook CamPay ────────────────────────────────
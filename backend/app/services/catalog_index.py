@@ -0,0 +1,249 @@
+"""
+Index catalogue — produits du tenant compilés une fois par version de config
+
+Avant : après chaque réponse IA, le webhook relisait products_services, chargeait
+les 30 derniers messages IA et testait chaque nom de produit dans chaque message
+(produits × messages × longueur) pour décider quelles photos envoyer.
+
+Maintenant :
+- CatalogIndex : noms normalisés (minuscules, sans accents, pluriels simples)
+  + alias, compilés en trie de mots → une passe sur le texte, correspondance
+  la plus longue d'abord ("robe wax longue" avant "robe wax").
+- Cache par tenant, version = (id, updated_at) de TenantBusinessConfig : une
+  modification depuis n'importe quel worker reconstruit l'index.
+- Photos déjà envoyées : table conversation_product_images, une ligne par envoi.
+- answer() : réponse directe aux questions exactes de prix ("prix robe wax ?")
+  sans appel LLM ; disponibilité seulement si le produit porte un champ in_stock.
+"""
+
+import json
+import logging
+import os
+import re
+import unicodedata
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from ..models import ConversationProductImage, TenantBusinessConfig
+
+logger = logging.getLogger(__name__)
+
+CATALOG_FAST_PATH = os.getenv("CATALOG_FAST_PATH", "true").lower() == "true"
+CATALOG_INDEX_CACHE_MAX = 2000
+FAST_PATH_MAX_TOKENS = 14          # au-delà, la question n'est plus "exacte" → LLM
+
+_NON_ALNUM = re.compile(r"[^a-z0-9]+")
+_END = ""                          # clé terminale du trie (un mot n'est jamais vide)
+
+
+def _stem(token: str) -> str:
+    # Pluriels simples : "robes" ≈ "robe", "chapeaux" ≈ "chapeau"
+    return token[:-1] if len(token) > 3 and token[-1] in "sx" else token
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    """Texte → mots normalisés (minuscules, sans accents ni ponctuation, pluriels ramenés)."""
+    ascii_text = unicodedata.normalize("NFKD", str(text or "")).encode("ascii", "ignore").decode()
+    return [_stem(t) for t in _NON_ALNUM.sub(" ", ascii_text.lower()).split()]
+
+
+def _word_set(words: str) -> frozenset:
+    return frozenset(tokenize(words))
+
+
+_PRICE_WORDS = _word_set("prix combien coute coutent cout tarif tarifs montant vaut")
+_STOCK_WORDS = _word_set("dispo disponible disponibles stock avez vendez reste restent existe")
+_FILLER_WORDS = _word_set(
+    "bonjour bonsoir salut slt hello coucou svp stp merci s il vous te plait plaît ok oui alors et "
+    "le la les l un une des de du d c est ce cet cette ca ça quel quelle quels quelles qu que quoi "
+    "a au aux en pour sur tu t on je j me m moi veux voudrais voudrait aimerais savoir connaitre "
+    "dire donner votre vos ton ta tes mon ma mes encore toujours actuellement maintenant aujourd hui "
+    "fait faites please"
+)
+
+
+def parse_products(raw) -> list:
+    """products_services tel que stocké (liste JSON ou chaîne JSON héritée) → liste."""
+    if isinstance(raw, str):
+        try:
+            raw = json.loads(raw)
+        except ValueError:
+            return []
+    return raw if isinstance(raw, list) else []
+
+
+def image_key(product: dict) -> str:
+    """Clé de la photo d'un produit pour conversation_product_images."""
+    if product.get("image_id"):
+        return product["image_id"]
+    return f"name:{' '.join(tokenize(product.get('name')))}"[:80]
+
+
+def format_price(price) -> Optional[str]:
+    """15000 → "15 000 FCFA" ; None si pas de prix (0 = sur devis)."""
+    try:
+        value = float(price)
+    except (TypeError, ValueError):
+        return None
+    if value <= 0:
+        return None
+    amount = f"{int(value):,}" if value.is_integer() else f"{value:,.2f}"
+    return f"{amount.replace(',', ' ')} FCFA"
+
+
+class CatalogIndex:
+    """Catalogue compilé d'un tenant. Immuable : reconstruit à chaque nouvelle version."""
+
+    def __init__(self, products: Iterable):
+        self.products: List[dict] = [p for p in products if isinstance(p, dict) and p.get("name")]
+        self._trie: dict = {}
+        self._alias_words: List[frozenset] = []
+        for idx, product in enumerate(self.products):
+            words = set()
+            for alias in self._aliases(product):
+                tokens = tokenize(alias)
+                if not tokens:
+                    continue
+                words.update(tokens)
+                node = self._trie
+                for token in tokens:
+                    node = node.setdefault(token, {})
+                node[_END] = node.get(_END, ()) + (idx,)
+            self._alias_words.append(frozenset(words))
+
+    @staticmethod
+    def _aliases(product: dict) -> List[str]:
+        aliases = product.get("aliases") or []
+        if isinstance(aliases, str):
+            aliases = aliases.split(",")
+        return [product["name"], *[a for a in aliases if isinstance(a, str)]]
+
+    def __len__(self) -> int:
+        return len(self.products)
+
+    def find(self, text: Optional[str]) -> List[int]:
+        """Index des produits cités dans le texte, dans l'ordre d'apparition (sans doublon)."""
+        tokens = tokenize(text)
+        found: List[int] = []
+        i = 0
+        while i < len(tokens):
+            node = self._trie.get(tokens[i])
+            end, hits, j = None, (), i
+            while node is not None:
+                j += 1
+                if _END in node:
+                    end, hits = j, node[_END]
+                node = node.get(tokens[j]) if j < len(tokens) else None
+            if end is None:
+                i += 1
+                continue
+            for idx in hits:
+                if idx not in found:
+                    found.append(idx)
+            i = end
+        return found
+
+    def illustrate(self, response_text: str, already_sent: set) -> List[dict]:
+        """
+        Produits avec photo cités dans la réponse IA et dont la photo n'a pas encore
+        été envoyée dans la conversation (1 seule photo par produit par conversation).
+        """
+        selected, keys = [], set(already_sent)
+        for idx in self.find(response_text):
+            product = self.products[idx]
+            if not (product.get("image_id") or product.get("image_url")):
+                continue
+            key = image_key(product)
+            if key not in keys:
+                keys.add(key)
+                selected.append(product)
+        return selected
+
+    def answer(self, question: str) -> Optional[str]:
+        """
+        Réponse directe à une question exacte de prix ou de disponibilité portant sur
+        un seul produit du catalogue. None dès qu'il y a un doute (autre produit,
+        mot inconnu, pas de prix, stock non renseigné) → le message suit le chemin LLM habituel.
+        """
+        tokens = tokenize(question)
+        if not tokens or len(tokens) > FAST_PATH_MAX_TOKENS:
+            return None
+        matched = self.find(question)
+        if len(matched) != 1:
+            return None
+        words = set(tokens)
+        asks_price = bool(words & _PRICE_WORDS)
+        asks_stock = bool(words & _STOCK_WORDS)
+        if not (asks_price or asks_stock):
+            return None
+        if words - _FILLER_WORDS - _PRICE_WORDS - _STOCK_WORDS - self._alias_words[matched[0]]:
+            return None   # précision en plus (taille, couleur, livraison…) → LLM
+
+        product = self.products[matched[0]]
+        price = format_price(product.get("price"))
+        if asks_price and not price:
+            return None
+        if asks_stock:
+            in_stock = product.get("in_stock")
+            if not isinstance(in_stock, bool):
+                return None   # le catalogue ne dit rien du stock → LLM (pas de « oui » inventé)
+            if not in_stock:
+                return f"Désolé, {product['name']} n'est plus disponible pour le moment 🙏"
+            reply = f"Oui, {product['name']} est disponible" + (f" à {price}" if price else "") + " 😊"
+        else:
+            reply = f"{product['name']} : {price} 😊"
+        return reply + "\nSouhaitez-vous passer commande ?"
+
+
+# ─── Cache par tenant ───────────────────────────────────────────────────────
+
+_indexes: Dict[int, tuple] = {}
+
+
+def invalidate_catalog_index(tenant_id: int) -> None:
+    """Oublie l'index du tenant (config business modifiée dans ce process)."""
+    _indexes.pop(tenant_id, None)
+
+
+def get_catalog_index(tenant_id: int, db: Session) -> Optional[CatalogIndex]:
+    """Index du catalogue, reconstruit seulement si la config a changé. None si pas de config."""
+    version = db.query(TenantBusinessConfig.id, TenantBusinessConfig.updated_at).filter(
+        TenantBusinessConfig.tenant_id == tenant_id
+    ).first()
+    if version is None:
+        _indexes.pop(tenant_id, None)
+        return None
+    version = tuple(version)
+    cached = _indexes.get(tenant_id)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+
+    row = db.query(TenantBusinessConfig.products_services).filter(TenantBusinessConfig.id == version[0]).first()
+    index = CatalogIndex(parse_products(row.products_services if row else None))
+    if len(_indexes) >= CATALOG_INDEX_CACHE_MAX:
+        _indexes.pop(next(iter(_indexes)))
+    _indexes[tenant_id] = (version, index)
+    logger.debug(f"📇 Index catalogue reconstruit (tenant {tenant_id}) : {len(index)} produit(s)")
+    return index
+
+
+# ─── Photos déjà envoyées par conversation ──────────────────────────────────
+
+def images_already_sent(db: Session, conversation_id: int) -> set:
+    rows = db.query(ConversationProductImage.image_key).filter(
+        ConversationProductImage.conversation_id == conversation_id
+    ).all()
+    return {row.image_key for row in rows}
+
+
+def record_images_sent(db: Session, conversation_id: int, products: List[dict]) -> None:
+    """Ajoute les photos choisies à l'ensemble persistant (doublon concurrent ignoré)."""
+    for product in products:
+        try:
+            with db.begin_nested():
+                db.add(ConversationProductImage(conversation_id=conversation_id, image_key=image_key(product)))
+        except IntegrityError:
+            pass
+    db.commit()
@@ -14,6 +14,8 @@ from typing import Optional
 
 import sentry_sdk
 
+from ..http_client import get_client
+
 logger = logging.getLogger(__name__)
 
 ANTHROPIC_API_KEY = os.getenv("ANTHROPIC_API_KEY", "")
@@ -88,7 +90,8 @@ async def analyze_sentry_error(
 Analyse cette erreur et retourne le JSON demandé."""
 
     try:
-        client = anthropic.AsyncAnthropic(api_key=ANTHROPIC_API_KEY)
+        # Pool "anthropic" du registre : connexions réutilisées + métriques
+        client = anthropic.AsyncAnthropic(api_key=ANTHROPIC_API_KEY, http_client=get_client("anthropic"))
 
         response = await client.messages.create(
             model=CLAUDE_MODEL,
@@ -4,8 +4,9 @@ Phase 8M: Feature 1 - Trier contacts
 """
 
 from sqlalchemy.orm import Session
-from sqlalchemy import and_
+from sqlalchemy import and_, text
 from ..models import ContactSetting
+from .contact_policy import get_contact_policy, publish_ai_enabled
 from datetime import datetime
 import logging
 
@@ -18,20 +19,10 @@ class ContactFilterService:
     @staticmethod
     def is_ai_enabled_for_contact(tenant_id: int, phone_number: str, db: Session) -> bool:
         """
-        Vérifie si IA doit répondre à ce contact
+        Vérifie si IA doit répondre à ce contact (index mémoire, pas de requête par message).
+        Par défaut, IA activée.
         """
-        setting = db.query(ContactSetting).filter(
-            and_(
-                ContactSetting.tenant_id == tenant_id,
-                ContactSetting.phone_number == phone_number
-            )
-        ).first()
-        
-        # Par défaut, IA activée
-        if not setting:
-            return True
-        
-        return setting.ai_enabled
+        return get_contact_policy(tenant_id, db).is_ai_enabled(phone_number)
     
     @staticmethod
     def toggle_ai_for_contact(tenant_id: int, phone_number: str, 
@@ -59,6 +50,7 @@ class ContactFilterService:
             setting.updated_at = datetime.utcnow()
         
         db.commit()
+        publish_ai_enabled(tenant_id, [phone_number], ai_enabled)
         
         status = "✅ Activé" if ai_enabled else "❌ Désactivé"
         logger.info(f"{status} IA pour {phone_number}")
@@ -117,35 +109,48 @@ class ContactFilterService:
             for c in contacts
         ]
     
+    @staticmethod
+    def _bulk_set_ai(tenant_id: int, phone_numbers: list, ai_enabled: bool, db: Session) -> int:
+        """
+        Un seul INSERT … ON CONFLICT DO UPDATE pour toute la liste (au lieu d'une
+        requête + un insert/update par numéro). Retourne le nombre de numéros distincts.
+        """
+        phones = list(dict.fromkeys(p for p in phone_numbers if p))
+        if not phones:
+            return 0
+        now = datetime.utcnow()
+        if db.get_bind().dialect.name == "postgresql":
+            # Tableau unnest : une seule requête, quel que soit le nombre de numéros
+            db.execute(text("""
+                INSERT INTO contact_settings
+                       (tenant_id, phone_number, ai_enabled, message_count, first_seen, last_seen, created_at, updated_at)
+                SELECT :tenant_id, phone, :ai_enabled, 0, :now, :now, :now, :now
+                  FROM unnest(CAST(:phones AS VARCHAR[])) AS phone
+                ON CONFLICT (tenant_id, phone_number) DO UPDATE
+                   SET ai_enabled = EXCLUDED.ai_enabled, updated_at = EXCLUDED.updated_at
+            """), {"tenant_id": tenant_id, "ai_enabled": ai_enabled, "now": now, "phones": phones})
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+            for i in range(0, len(phones), 500):     # limite de variables SQLite
+                stmt = insert(ContactSetting).values([
+                    {"tenant_id": tenant_id, "phone_number": phone, "ai_enabled": ai_enabled, "message_count": 0,
+                     "first_seen": now, "last_seen": now, "created_at": now, "updated_at": now}
+                    for phone in phones[i:i + 500]
+                ])
+                db.execute(stmt.on_conflict_do_update(
+                    index_elements=["tenant_id", "phone_number"],
+                    set_={"ai_enabled": stmt.excluded.ai_enabled, "updated_at": stmt.excluded.updated_at},
+                ))
+        db.commit()
+        publish_ai_enabled(tenant_id, phones, ai_enabled)
+        return len(phones)
+
     @staticmethod
     def bulk_disable_ai(tenant_id: int, phone_numbers: list, db: Session) -> dict:
         """
         Désactive IA pour plusieurs contacts à la fois
         """
-        updated = 0
-        
-        for phone in phone_numbers:
-            setting = db.query(ContactSetting).filter(
-                and_(
-                    ContactSetting.tenant_id == tenant_id,
-                    ContactSetting.phone_number == phone
-                )
-            ).first()
-            
-            if not setting:
-                setting = ContactSetting(
-                    tenant_id=tenant_id,
-                    phone_number=phone,
-                    ai_enabled=False
-                )
-                db.add(setting)
-            else:
-                setting.ai_enabled = False
-                setting.updated_at = datetime.utcnow()
-            
-            updated += 1
-        
-        db.commit()
+        updated = ContactFilterService._bulk_set_ai(tenant_id, phone_numbers, False, db)
         logger.info(f"⏹️ Désactivé IA pour {updated} contacts")
         
         return {
@@ -158,30 +163,7 @@ class ContactFilterService:
         """
         Réactive IA pour plusieurs contacts à la fois
         """
-        updated = 0
-        
-        for phone in phone_numbers:
-            setting = db.query(ContactSetting).filter(
-                and_(
-                    ContactSetting.tenant_id == tenant_id,
-                    ContactSetting.phone_number == phone
-                )
-            ).first()
-            
-            if not setting:
-                setting = ContactSetting(
-                    tenant_id=tenant_id,
-                    phone_number=phone,
-                    ai_enabled=True
-                )
-                db.add(setting)
-            else:
-                setting.ai_enabled = True
-                setting.updated_at = datetime.utcnow()
-            
-            updated += 1
-        
-        db.commit()
+        updated = ContactFilterService._bulk_set_ai(tenant_id, phone_numbers, True, db)
         logger.info(f"✅ Réactivé IA pour {updated} contacts")
         
         return {
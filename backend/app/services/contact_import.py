@@ -0,0 +1,412 @@
+"""
+Contact Import — import de la liste clients d'un tenant (CSV / XLSX) en arrière-plan
+
+Le fichier est copié sur disque par blocs, puis lu en flux : CSV ligne par ligne
+(séparateur détecté), XLSX via zipfile + iterparse (aucune dépendance, aucune
+feuille chargée en entier). Chaque ligne : numéro normalisé (chiffres, indicatif
+pays ajouté aux numéros locaux), doublons du fichier écartés, puis chargement
+par lots de CONTACT_IMPORT_CHUNK dans contact_settings :
+  Postgres  COPY vers une table temporaire + INSERT … SELECT … ON CONFLICT DO UPDATE
+  autres    INSERT … ON CONFLICT DO UPDATE en executemany (SQLite, tests)
+
+La progression (octets lus, lignes, créés, mis à jour, invalides, doublons) est
+persistée dans contact_import_jobs après chaque lot :
+GET /api/tenants/{id}/contacts/import/{job_id}.
+"""
+
+import csv
+import io
+import os
+import re
+import tempfile
+import unicodedata
+import uuid
+import zipfile
+from datetime import datetime
+from typing import Iterator, List, Optional, Tuple
+from xml.etree import ElementTree
+
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from ..database import SessionLocal
+from ..models import ContactImportJob, ContactSetting
+from .contact_policy import publish_ai_enabled
+import logging
+
+logger = logging.getLogger(__name__)
+
+CONTACT_IMPORT_DIR = os.getenv(
+    "CONTACT_IMPORT_DIR", os.path.join(tempfile.gettempdir(), "neobot_contact_import")
+)
+# Indicatif ajouté aux numéros locaux ("690 00 00 01" → 237690000001)
+CONTACT_IMPORT_COUNTRY_CODE = os.getenv("CONTACT_IMPORT_COUNTRY_CODE", "237")
+CONTACT_IMPORT_CHUNK = int(os.getenv("CONTACT_IMPORT_CHUNK", "5000"))
+MAX_IMPORT_BYTES = 50 * 1024 * 1024
+UPLOAD_READ_SIZE = 256 * 1024
+LOCAL_NUMBER_MAX_DIGITS = 9
+
+_XLSX_NS = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+_SCIENTIFIC = re.compile(r"^\d+(\.\d+)?[eE]\+?\d+$")
+_CELL_COLUMN = re.compile(r"^([A-Z]+)")
+_PHONE_HEADERS = ("phone", "telephone", "tel", "numero", "mobile", "whatsapp", "portable", "gsm")
+_NAME_HEADERS = ("name", "nom", "client", "contact", "prenom")
+
+
+class ImportRejected(ValueError):
+    """Fichier refusé à l'upload (taille, format) — message affichable tel quel."""
+
+
+def job_to_dict(job: ContactImportJob) -> dict:
+    percent = round(100 * job.bytes_read / job.bytes_total, 1) if job.bytes_total else 0.0
+    return {
+        "job_id": job.id,
+        "status": job.status,
+        "filename": job.filename,
+        "percent": 100.0 if job.status == "completed" else percent,
+        "rows_read": job.rows_read,
+        "created": job.created,
+        "updated": job.updated,
+        "invalid": job.invalid,
+        "duplicates": job.duplicates,
+        "error": job.error,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "started_at": job.started_at.isoformat() if job.started_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+    }
+
+
+# ─── Normalisation ──────────────────────────────────────────────────────────
+
+def normalize_phone(raw, country_code: str = CONTACT_IMPORT_COUNTRY_CODE) -> Optional[str]:
+    """
+    "+237 690-00-00-01", "00237690000001", "690000001", 2.3769e+11 (cellule Excel)
+    → "237690000001". None si le résultat n'est pas un numéro E.164 plausible (8-15 chiffres).
+    """
+    value = str(raw or "").strip()
+    if not value:
+        return None
+    if _SCIENTIFIC.match(value):
+        value = str(int(float(value)))
+    elif value.endswith(".0") and value[:-2].isdigit():
+        value = value[:-2]
+    digits = "".join(ch for ch in value if ch.isdigit())
+    if value.startswith("+"):
+        pass
+    elif digits.startswith("00"):
+        digits = digits[2:]
+    elif country_code and len(digits.lstrip("0")) <= LOCAL_NUMBER_MAX_DIGITS:
+        digits = country_code + digits.lstrip("0")
+    return digits if 8 <= len(digits) <= 15 else None
+
+
+def _header_key(value: str) -> str:
+    ascii_value = unicodedata.normalize("NFKD", str(value or "")).encode("ascii", "ignore").decode()
+    return ascii_value.strip().lower()
+
+
+def detect_columns(first_row: List[str]) -> Tuple[Optional[int], Optional[int], bool]:
+    """
+    (colonne téléphone, colonne nom, première ligne = en-tête).
+    Sans en-tête reconnu : la première colonne contenant un numéro valide est le téléphone.
+    """
+    keys = [_header_key(v) for v in first_row]
+    phone_col = next((i for i, k in enumerate(keys) if any(h in k for h in _PHONE_HEADERS)), None)
+    if phone_col is not None:
+        name_col = next(
+            (i for i, k in enumerate(keys) if i != phone_col and any(h in k for h in _NAME_HEADERS)), None
+        )
+        return phone_col, name_col, True
+    for i, value in enumerate(first_row):
+        if normalize_phone(value):
+            other = [j for j, v in enumerate(first_row) if j != i and str(v or "").strip()]
+            return i, (other[0] if other else None), False
+    return None, None, True
+
+
+# ─── Lecture en flux ────────────────────────────────────────────────────────
+
+def _iter_csv_rows(path: str, progress: dict) -> Iterator[List[str]]:
+    with open(path, "rb") as raw:
+        sample = raw.read(64 * 1024).decode("utf-8-sig", errors="replace")
+        raw.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=",;\t|")
+        except csv.Error:
+            dialect = csv.excel
+        reader = csv.reader(io.TextIOWrapper(raw, encoding="utf-8-sig", errors="replace", newline=""), dialect)
+        for row in reader:
+            progress["bytes_read"] = raw.tell()
+            yield row
+
+
+def _column_index(ref: str) -> int:
+    """"C12" → 2."""
+    index = 0
+    for ch in _CELL_COLUMN.match(ref).group(1):
+        index = index * 26 + (ord(ch) - 64)
+    return index - 1
+
+
+def _first_sheet(zf: zipfile.ZipFile) -> str:
+    sheets = sorted(
+        (n for n in zf.namelist() if n.startswith("xl/worksheets/sheet") and n.endswith(".xml")),
+        key=lambda n: int(re.sub(r"\D", "", n.rsplit("/", 1)[-1]) or 0),
+    )
+    if not sheets:
+        raise ImportRejected("Classeur XLSX sans feuille")
+    return sheets[0]
+
+
+def _iter_xlsx_rows(path: str, progress: dict) -> Iterator[List[str]]:
+    try:
+        zf = zipfile.ZipFile(path)
+    except zipfile.BadZipFile:
+        raise ImportRejected("Fichier XLSX illisible")
+    with zf:
+        shared: List[str] = []
+        if "xl/sharedStrings.xml" in zf.namelist():
+            with zf.open("xl/sharedStrings.xml") as f:
+                for _, el in ElementTree.iterparse(f):
+                    if el.tag == f"{_XLSX_NS}si":
+                        shared.append("".join(t.text or "" for t in el.iter(f"{_XLSX_NS}t")))
+                        el.clear()
+        sheet = _first_sheet(zf)
+        sheet_size = zf.getinfo(sheet).file_size or 1
+        total = progress["bytes_total"]
+        with zf.open(sheet) as f:
+            for _, el in ElementTree.iterparse(f):
+                if el.tag != f"{_XLSX_NS}row":
+                    continue
+                row: List[str] = []
+                for cell in el.iter(f"{_XLSX_NS}c"):
+                    ref = cell.get("r")
+                    col = _column_index(ref) if ref else len(row)
+                    row.extend([""] * (col - len(row)))
+                    kind = cell.get("t")
+                    if kind == "s":
+                        value = shared[int(cell.findtext(f"{_XLSX_NS}v") or 0)]
+                    elif kind == "inlineStr":
+                        value = "".join(t.text or "" for t in cell.iter(f"{_XLSX_NS}t"))
+                    else:
+                        value = cell.findtext(f"{_XLSX_NS}v") or ""
+                    row.append(value)
+                el.clear()
+                # Progression : position dans la feuille décompressée, ramenée à la taille du fichier
+                progress["bytes_read"] = int(total * min(f.tell() / sheet_size, 1.0))
+                yield row
+
+
+def iter_contacts(path: str, kind: str, stats: dict) -> Iterator[Tuple[str, Optional[str]]]:
+    """(téléphone normalisé, nom) uniques du fichier. stats : compteurs mis à jour au fil de l'eau."""
+    rows = _iter_xlsx_rows(path, stats) if kind == "xlsx" else _iter_csv_rows(path, stats)
+    phone_col = name_col = None
+    seen = set()
+    for row in rows:
+        if not any(str(v or "").strip() for v in row):
+            continue
+        if phone_col is None:
+            phone_col, name_col, is_header = detect_columns(row)
+            if phone_col is None:
+                raise ImportRejected("Colonne téléphone introuvable (en-tête attendu : téléphone, phone, numéro…)")
+            if is_header:
+                continue
+        stats["rows_read"] += 1
+        phone = normalize_phone(row[phone_col] if phone_col < len(row) else "")
+        if phone is None:
+            stats["invalid"] += 1
+            continue
+        if phone in seen:
+            stats["duplicates"] += 1
+            continue
+        seen.add(phone)
+        name = str(row[name_col]).strip()[:255] if name_col is not None and name_col < len(row) else ""
+        yield phone, (name or None)
+
+
+# ─── Chargement par lots ────────────────────────────────────────────────────
+
+def _copy_rows(db: Session, rows: List[Tuple[str, Optional[str]]]) -> None:
+    """COPY … FROM STDIN vers contact_import_rows (psycopg 3 ou psycopg2)."""
+    cursor = db.connection().connection.cursor()
+    try:
+        if hasattr(cursor, "copy"):
+            with cursor.copy("COPY contact_import_rows (phone_number, contact_name) FROM STDIN") as copy:
+                for row in rows:
+                    copy.write_row(row)
+        else:
+            buffer = io.StringIO()
+            csv.writer(buffer).writerows(rows)
+            buffer.seek(0)
+            cursor.copy_expert("COPY contact_import_rows (phone_number, contact_name) FROM STDIN WITH (FORMAT csv)", buffer)
+    finally:
+        cursor.close()
+
+
+def _load_chunk_postgres(db: Session, tenant_id: int, rows: list, ai_enabled: Optional[bool]) -> Tuple[int, int]:
+    db.execute(text(
+        "CREATE TEMP TABLE IF NOT EXISTS contact_import_rows "
+        "(phone_number VARCHAR(50), contact_name VARCHAR(255)) ON COMMIT DELETE ROWS"
+    ))
+    _copy_rows(db, rows)
+    ai_update = ", ai_enabled = EXCLUDED.ai_enabled" if ai_enabled is not None else ""
+    result = db.execute(text(f"""
+        INSERT INTO contact_settings (tenant_id, phone_number, contact_name, ai_enabled, message_count, created_at, updated_at)
+        SELECT :tenant_id, phone_number, contact_name, :ai_enabled, 0, :now, :now FROM contact_import_rows
+        ON CONFLICT (tenant_id, phone_number) DO UPDATE
+           SET contact_name = COALESCE(EXCLUDED.contact_name, contact_settings.contact_name),
+               updated_at = EXCLUDED.updated_at{ai_update}
+        RETURNING (xmax = 0) AS inserted
+    """), {"tenant_id": tenant_id, "ai_enabled": True if ai_enabled is None else ai_enabled, "now": datetime.utcnow()})
+    created = sum(1 for r in result if r.inserted)
+    return created, len(rows) - created
+
+
+def _load_chunk_generic(db: Session, tenant_id: int, rows: list, ai_enabled: Optional[bool]) -> Tuple[int, int]:
+    from sqlalchemy import func
+    if db.get_bind().dialect.name == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        from sqlalchemy.dialects.postgresql import insert
+    phones = [phone for phone, _ in rows]
+    existing = db.query(func.count(ContactSetting.id)).filter(
+        ContactSetting.tenant_id == tenant_id, ContactSetting.phone_number.in_(phones),
+    ).scalar()
+    now = datetime.utcnow()
+    stmt = insert(ContactSetting)
+    update = {
+        "contact_name": func.coalesce(stmt.excluded.contact_name, ContactSetting.contact_name),
+        "updated_at": stmt.excluded.updated_at,
+    }
+    if ai_enabled is not None:
+        update["ai_enabled"] = stmt.excluded.ai_enabled
+    # executemany : un seul statement compilé, lignes envoyées en lot par le driver
+    db.execute(stmt.on_conflict_do_update(index_elements=["tenant_id", "phone_number"], set_=update), [
+        {"tenant_id": tenant_id, "phone_number": phone, "contact_name": name,
+         "ai_enabled": True if ai_enabled is None else ai_enabled, "message_count": 0,
+         "first_seen": None, "last_seen": None, "created_at": now, "updated_at": now}
+        for phone, name in rows
+    ])
+    return len(rows) - existing, existing
+
+
+def load_chunk(db: Session, tenant_id: int, rows: list, ai_enabled: Optional[bool] = None) -> Tuple[int, int]:
+    """Écrit un lot de (téléphone, nom) et commit. Retourne (créés, mis à jour)."""
+    if db.get_bind().dialect.name == "postgresql":
+        created, updated = _load_chunk_postgres(db, tenant_id, rows, ai_enabled)
+    else:
+        created, updated = _load_chunk_generic(db, tenant_id, rows, ai_enabled)
+    db.commit()
+    if ai_enabled is not None:
+        publish_ai_enabled(tenant_id, [phone for phone, _ in rows], ai_enabled)
+    return created, updated
+
+
+# ─── Job ────────────────────────────────────────────────────────────────────
+
+async def save_upload(upload) -> Tuple[str, str, int]:
+    """Copie l'UploadFile sur disque par blocs. Retourne (chemin, type csv|xlsx, taille)."""
+    os.makedirs(CONTACT_IMPORT_DIR, exist_ok=True)
+    path = os.path.join(CONTACT_IMPORT_DIR, f"{uuid.uuid4().hex}.part")
+    size, head = 0, b""
+    try:
+        with open(path, "wb") as out:
+            while True:
+                block = await upload.read(UPLOAD_READ_SIZE)
+                if not block:
+                    break
+                if not head:
+                    head = block[:4]
+                size += len(block)
+                if size > MAX_IMPORT_BYTES:
+                    raise ImportRejected("Fichier trop volumineux (max 50 Mo)")
+                out.write(block)
+        if size == 0:
+            raise ImportRejected("Fichier vide")
+    except Exception:
+        os.remove(path)
+        raise
+    is_xlsx = head == b"PK\x03\x04" or (upload.filename or "").lower().endswith(".xlsx")
+    return path, "xlsx" if is_xlsx else "csv", size
+
+
+class ContactImportService:
+    """Création et exécution des jobs d'import de contacts"""
+
+    @staticmethod
+    def create_job(db: Session, tenant_id: int, filename: str, kind: str, size: int,
+                   ai_enabled: Optional[bool] = None, created_by: Optional[int] = None) -> ContactImportJob:
+        job = ContactImportJob(
+            tenant_id=tenant_id, filename=(filename or "contacts")[:255], file_type=kind, status="pending",
+            ai_enabled=ai_enabled, bytes_total=size, created_by=created_by,
+        )
+        db.add(job)
+        db.commit()
+        db.refresh(job)
+        return job
+
+    @staticmethod
+    def get_job(db: Session, tenant_id: int, job_id: int) -> Optional[ContactImportJob]:
+        return db.query(ContactImportJob).filter(
+            ContactImportJob.id == job_id, ContactImportJob.tenant_id == tenant_id,
+        ).first()
+
+    @staticmethod
+    def run_job(job_id: int, path: str, bind: Optional[Engine] = None) -> None:
+        """
+        Exécute l'import (BackgroundTasks → threadpool : lecture et écritures bloquantes).
+        Ouvre sa propre session ; le fichier est supprimé à la fin, quel que soit le résultat.
+        """
+        db = Session(bind=bind, expire_on_commit=False) if bind is not None else SessionLocal()
+        try:
+            job = db.query(ContactImportJob).filter(ContactImportJob.id == job_id).first()
+            if not job or job.status != "pending":
+                return
+            job.status = "running"
+            job.started_at = datetime.utcnow()
+            db.commit()
+
+            stats = {"bytes_total": job.bytes_total or 0, "bytes_read": 0,
+                     "rows_read": 0, "invalid": 0, "duplicates": 0, "created": 0, "updated": 0}
+
+            def _flush(chunk: list) -> None:
+                if chunk:
+                    created, updated = load_chunk(db, job.tenant_id, chunk, job.ai_enabled)
+                    stats["created"] += created
+                    stats["updated"] += updated
+                for key in ("bytes_read", "rows_read", "invalid", "duplicates", "created", "updated"):
+                    setattr(job, key, stats[key])
+                db.commit()
+
+            chunk: list = []
+            for contact in iter_contacts(path, job.file_type, stats):
+                chunk.append(contact)
+                if len(chunk) >= CONTACT_IMPORT_CHUNK:
+                    _flush(chunk)
+                    chunk = []
+            stats["bytes_read"] = stats["bytes_total"]
+            _flush(chunk)
+
+            job.status = "completed"
+            job.finished_at = datetime.utcnow()
+            db.commit()
+            logger.info(
+                f"📥 Import contacts #{job_id} (tenant {job.tenant_id}) : {job.created} créés, "
+                f"{job.updated} mis à jour, {job.invalid} invalides, {job.duplicates} doublons"
+            )
+        except Exception as exc:
+            if not isinstance(exc, ImportRejected):
+                logger.error(f"❌ Import contacts #{job_id} échoué : {exc}", exc_info=True)
+            db.rollback()
+            db.query(ContactImportJob).filter(ContactImportJob.id == job_id).update(
+                {"status": "failed", "error": str(exc)[:500], "finished_at": datetime.utcnow()},
+                synchronize_session=False,
+            )
+            db.commit()
+        finally:
+            db.close()
+            try:
+                os.remove(path)
+            except OSError:
+                pass
@@ -0,0 +1,305 @@
+"""
+Index des règles par contact — en mémoire, par tenant
+
+Remplace les requêtes par message / par destinataire :
+- contact_settings (IA désactivée ?) à chaque message entrant
+- jointure messages + outbound_tracking à chaque vérification d'envoi sortant
+
+Par tenant, chargé à la première utilisation :
+  ai_disabled   contacts dont l'IA est désactivée
+  opted_out     contacts ayant répondu STOP
+  outbound      compteur de messages sortants par contact
+  contacted     contacts ayant déjà une conversation (anti cold outreach),
+                chargé seulement à la première vérification d'envoi
+
+Représentation compacte : numéros convertis en int64, tableaux triés (array "q")
++ recherche dichotomique — ~8 octets par numéro au lieu de ~70 pour un set de
+chaînes, soit < 1 Mo pour 100k contacts. Les numéros non numériques (ou avec
+un 0 initial, qui serait perdu) restent dans un petit set à part.
+
+Cohérence : les chemins d'écriture (ContactFilterService, OutboundService)
+mettent l'index à jour après commit et incrémentent une génération par tenant
+dans le backend d'état partagé. Les autres workers la relisent au plus toutes
+les CONTACT_POLICY_RECHECK_SECONDS et rechargent le tenant si elle a changé.
+"""
+
+import bisect
+import os
+import threading
+import time
+from array import array
+from typing import Dict, Iterable, Optional, Tuple
+
+from sqlalchemy import and_, exists
+from sqlalchemy.orm import Session
+
+from ..models import ContactSetting, Conversation, OutboundTracking
+from ..state_backend import StateBackendError, get_state_backend
+import logging
+
+logger = logging.getLogger(__name__)
+
+CONTACT_POLICY_RECHECK_SECONDS = float(os.getenv("CONTACT_POLICY_RECHECK_SECONDS", "2"))
+CONTACT_POLICY_MAX_STALE_SECONDS = 30     # backend d'état injoignable : rechargement au-delà
+CONTACT_POLICY_CACHE_MAX = 500            # tenants gardés en mémoire par process
+_INT64_DIGITS = 18
+
+
+def _phone_int(phone: str) -> Optional[int]:
+    """Numéro → int64 si la conversion est réversible, sinon None."""
+    if phone and phone.isdigit() and phone[0] != "0" and len(phone) <= _INT64_DIGITS:
+        return int(phone)
+    return None
+
+
+class PhoneSet:
+    """Ensemble de numéros : tableau int64 trié + set de repli pour les numéros non numériques."""
+
+    __slots__ = ("_ints", "_other")
+
+    def __init__(self, phones: Iterable[str] = ()):
+        ints, other = set(), set()
+        for phone in phones:
+            value = _phone_int(phone)
+            if value is None:
+                other.add(phone)
+            else:
+                ints.add(value)
+        self._ints = array("q", sorted(ints))
+        self._other = other
+
+    def __len__(self) -> int:
+        return len(self._ints) + len(self._other)
+
+    def __contains__(self, phone: str) -> bool:
+        value = _phone_int(phone)
+        if value is None:
+            return phone in self._other
+        i = bisect.bisect_left(self._ints, value)
+        return i < len(self._ints) and self._ints[i] == value
+
+    def add(self, phone: str) -> None:
+        value = _phone_int(phone)
+        if value is None:
+            self._other.add(phone)
+            return
+        i = bisect.bisect_left(self._ints, value)
+        if i == len(self._ints) or self._ints[i] != value:
+            self._ints.insert(i, value)
+
+    def discard(self, phone: str) -> None:
+        value = _phone_int(phone)
+        if value is None:
+            self._other.discard(phone)
+            return
+        i = bisect.bisect_left(self._ints, value)
+        if i < len(self._ints) and self._ints[i] == value:
+            del self._ints[i]
+
+    def update(self, phones: Iterable[str]) -> None:
+        """Ajout en masse : une fusion triée au lieu de n insertions."""
+        added = PhoneSet(phones)
+        self._ints = array("q", sorted(set(self._ints).union(added._ints)))
+        self._other |= added._other
+
+    def difference_update(self, phones: Iterable[str]) -> None:
+        removed = PhoneSet(phones)
+        if removed._ints:
+            drop = set(removed._ints)
+            self._ints = array("q", (v for v in self._ints if v not in drop))
+        self._other -= removed._other
+
+
+class PhoneCounter:
+    """Compteur par numéro : clés int64 triées + valeurs alignées (array "l")."""
+
+    __slots__ = ("_keys", "_values", "_other")
+
+    def __init__(self, counts: Iterable[Tuple[str, int]] = ()):
+        ints: Dict[int, int] = {}
+        self._other: Dict[str, int] = {}
+        for phone, count in counts:
+            if not count:
+                continue
+            value = _phone_int(phone)
+            if value is None:
+                self._other[phone] = count
+            else:
+                ints[value] = count
+        keys = sorted(ints)
+        self._keys = array("q", keys)
+        self._values = array("l", (ints[k] for k in keys))
+
+    def get(self, phone: str) -> int:
+        value = _phone_int(phone)
+        if value is None:
+            return self._other.get(phone, 0)
+        i = bisect.bisect_left(self._keys, value)
+        return self._values[i] if i < len(self._keys) and self._keys[i] == value else 0
+
+    def incr(self, phone: str, amount: int = 1) -> int:
+        value = _phone_int(phone)
+        if value is None:
+            self._other[phone] = self._other.get(phone, 0) + amount
+            return self._other[phone]
+        i = bisect.bisect_left(self._keys, value)
+        if i < len(self._keys) and self._keys[i] == value:
+            self._values[i] += amount
+        else:
+            self._keys.insert(i, value)
+            self._values.insert(i, amount)
+        return self._values[i]
+
+
+class ContactPolicy:
+    """Règles d'un tenant. Construit par _load(), modifié uniquement sous _lock."""
+
+    def __init__(self, tenant_id: int, generation: Optional[int]):
+        self.tenant_id = tenant_id
+        self.generation = generation
+        self.loaded_at = self.checked_at = time.monotonic()
+        self.ai_disabled = PhoneSet()
+        self.opted_out = PhoneSet()
+        self.outbound = PhoneCounter()
+        self.contacted: Optional[PhoneSet] = None
+
+    def is_ai_enabled(self, phone: str) -> bool:
+        return phone not in self.ai_disabled
+
+    def has_history(self, phone: str, db: Session) -> bool:
+        """
+        Contact déjà en conversation avec le tenant. Un numéro absent de l'index est
+        revérifié en base (conversation créée par un autre worker) puis ajouté.
+        """
+        if self.contacted is None:
+            rows = db.query(Conversation.customer_phone).filter(Conversation.tenant_id == self.tenant_id).all()
+            self.contacted = PhoneSet(r.customer_phone for r in rows)
+        if phone in self.contacted:
+            return True
+        found = db.query(exists().where(and_(
+            Conversation.tenant_id == self.tenant_id,
+            Conversation.customer_phone == phone,
+        ))).scalar()
+        if found:
+            with _lock:
+                self.contacted.add(phone)
+        return bool(found)
+
+
+_policies: Dict[int, ContactPolicy] = {}
+_lock = threading.Lock()
+
+
+def _generation_key(tenant_id: int) -> str:
+    return f"contact_policy:gen:{tenant_id}"
+
+
+def _read_generation(tenant_id: int) -> Optional[int]:
+    """Génération partagée du tenant ; None si le backend d'état est injoignable."""
+    try:
+        return int(get_state_backend().get(_generation_key(tenant_id)) or 0)
+    except (StateBackendError, ValueError) as e:
+        logger.debug(f"Génération contact_policy illisible (tenant {tenant_id}) : {e}")
+        return None
+
+
+def _load(tenant_id: int, db: Session, generation: Optional[int]) -> ContactPolicy:
+    policy = ContactPolicy(tenant_id, generation)
+    disabled = db.query(ContactSetting.phone_number).filter(
+        ContactSetting.tenant_id == tenant_id,
+        ContactSetting.ai_enabled == False,
+    ).all()
+    policy.ai_disabled = PhoneSet(r.phone_number for r in disabled)
+    tracking = db.query(
+        OutboundTracking.phone_number, OutboundTracking.opted_out, OutboundTracking.total_outbound_count,
+    ).filter(OutboundTracking.tenant_id == tenant_id).all()
+    policy.opted_out = PhoneSet(r.phone_number for r in tracking if r.opted_out)
+    policy.outbound = PhoneCounter((r.phone_number, r.total_outbound_count or 0) for r in tracking)
+    logger.debug(
+        f"📇 Règles contacts chargées (tenant {tenant_id}) : {len(policy.ai_disabled)} IA off, "
+        f"{len(policy.opted_out)} STOP, {len(tracking)} suivis sortants"
+    )
+    return policy
+
+
+def get_contact_policy(tenant_id: int, db: Session) -> ContactPolicy:
+    """Index du tenant, chargé à la demande et rechargé si un autre worker a écrit."""
+    now = time.monotonic()
+    policy = _policies.get(tenant_id)
+    if policy is not None and now - policy.checked_at < CONTACT_POLICY_RECHECK_SECONDS:
+        return policy
+
+    generation = _read_generation(tenant_id)
+    if policy is not None:
+        if generation is not None and generation == policy.generation:
+            policy.checked_at = now
+            return policy
+        if generation is None and now - policy.loaded_at < CONTACT_POLICY_MAX_STALE_SECONDS:
+            policy.checked_at = now
+            return policy
+
+    fresh = _load(tenant_id, db, generation)
+    with _lock:
+        _policies.pop(tenant_id, None)
+        if len(_policies) >= CONTACT_POLICY_CACHE_MAX:
+            _policies.pop(next(iter(_policies)))
+        _policies[tenant_id] = fresh
+    return fresh
+
+
+def _publish(tenant_id: int, apply) -> None:
+    """
+    Après commit d'une écriture : applique la modification à l'index local (s'il est
+    chargé) et incrémente la génération partagée pour les autres workers.
+    """
+    try:
+        generation = get_state_backend().incr(_generation_key(tenant_id))
+    except StateBackendError as e:
+        logger.warning(f"⚠️ Génération contact_policy non publiée (tenant {tenant_id}) : {e}")
+        generation = None
+    with _lock:
+        policy = _policies.get(tenant_id)
+        if policy is None:
+            return
+        apply(policy)
+        if generation is not None and policy.generation is not None and generation == policy.generation + 1:
+            policy.generation = generation          # seule notre écriture depuis le chargement
+        else:
+            policy.checked_at = 0.0                 # autre écriture concurrente → revérifier au prochain accès
+
+
+def publish_ai_enabled(tenant_id: int, phone_numbers: Iterable[str], ai_enabled: bool) -> None:
+    phones = list(phone_numbers)
+
+    def apply(policy: ContactPolicy) -> None:
+        if ai_enabled:
+            policy.ai_disabled.difference_update(phones)
+        else:
+            policy.ai_disabled.update(phones)
+
+    _publish(tenant_id, apply)
+
+
+def publish_opt_out(tenant_id: int, phone_number: str) -> None:
+    _publish(tenant_id, lambda policy: policy.opted_out.add(phone_number))
+
+
+def publish_outbound(tenant_id: int, phone_number: str) -> None:
+    _publish(tenant_id, lambda policy: policy.outbound.incr(phone_number))
+
+
+def publish_outbound_many(tenant_id: int, phone_numbers: Iterable[str]) -> None:
+    """Envoi en lot (campagne) : une seule génération publiée pour tout le lot."""
+    phones = list(phone_numbers)
+
+    def apply(policy: ContactPolicy) -> None:
+        for phone in phones:
+            policy.outbound.incr(phone)
+
+    _publish(tenant_id, apply)
+
+
+def reset_contact_policies() -> None:
+    """Vide l'index de ce process (tests)."""
+    with _lock:
+        _policies.clear()
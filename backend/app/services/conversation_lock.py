@@ -0,0 +1,163 @@
+"""
+Conversation Lock — Sérialisation de la création de conversation par (tenant, téléphone)
+Deux messages simultanés du même expéditeur (retry webhook + original, rafale de
+messages) ne doivent jamais créer deux conversations.
+
+Deux niveaux :
+  1. In-process : un asyncio.Lock par (tenant, phone) compté par référence.
+     Le verrou est retiré du registre dès que plus personne ne le tient ni ne
+     l'attend → mémoire bornée par la concurrence, pas par le nombre de numéros.
+  2. Cross-process (plusieurs workers uvicorn / instances) selon CONVERSATION_LOCK_MODE :
+       upsert   (défaut) INSERT … ON CONFLICT DO NOTHING sur uq_conversation_tenant_phone
+       advisory pg_advisory_xact_lock(hash(tenant, phone)) autour du SELECT → INSERT
+       local    verrou in-process seul ; un doublon concurrent lève IntegrityError,
+                rattrapée par une relecture
+"""
+
+import asyncio
+import hashlib
+import os
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from ..models import Conversation
+import logging
+
+logger = logging.getLogger(__name__)
+
+CONVERSATION_LOCK_MODES = ("upsert", "advisory", "local")
+CONVERSATION_LOCK_MODE = os.getenv("CONVERSATION_LOCK_MODE", "upsert").lower()
+if CONVERSATION_LOCK_MODE not in CONVERSATION_LOCK_MODES:
+    logger.warning(f"CONVERSATION_LOCK_MODE={CONVERSATION_LOCK_MODE} inconnu — 'upsert' utilisé")
+    CONVERSATION_LOCK_MODE = "upsert"
+
+
+class _LockEntry:
+    __slots__ = ("lock", "users")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.users = 0   # détenteur + coroutines en attente
+
+
+class ConversationLockManager:
+    """Verrous asyncio par clé, libérés du registre quand ils ne sont plus utilisés."""
+
+    def __init__(self):
+        self._entries: dict[tuple, _LockEntry] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @asynccontextmanager
+    async def hold(self, tenant_id: int, phone: str):
+        key = (tenant_id, phone)
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = self._entries[key] = _LockEntry()
+        entry.users += 1
+        try:
+            async with entry.lock:
+                yield
+        finally:
+            entry.users -= 1
+            if entry.users == 0:
+                self._entries.pop(key, None)
+
+
+conversation_locks = ConversationLockManager()
+
+
+def advisory_key(tenant_id: int, phone: str) -> int:
+    """Clé bigint stable (indépendante de PYTHONHASHSEED) pour pg_advisory_xact_lock."""
+    digest = hashlib.blake2b(f"conv:{tenant_id}:{phone}".encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big", signed=True)
+
+
+def _find_conversation(db: Session, tenant_id: int, phone: str) -> Optional[Conversation]:
+    return db.query(Conversation).filter(
+        Conversation.tenant_id == tenant_id,
+        Conversation.customer_phone == phone,
+    ).order_by(Conversation.id.desc()).first()
+
+
+def _new_conversation(tenant_id: int, phone: str, sender_name: Optional[str]) -> dict:
+    now = datetime.utcnow()
+    return {
+        "tenant_id": tenant_id,
+        "customer_phone": phone,
+        "customer_name": sender_name,
+        "channel": "whatsapp",
+        "status": "active",
+        "created_at": now,
+        "last_message_at": now,
+    }
+
+
+def _upsert_statement(dialect: str, values: dict):
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        return None
+    return insert(Conversation).values(**values).on_conflict_do_nothing(
+        index_elements=["tenant_id", "customer_phone"],
+    )
+
+
+def get_or_create_conversation(
+    db: Session,
+    tenant_id: int,
+    phone: str,
+    sender_name: Optional[str] = None,
+    mode: Optional[str] = None,
+) -> tuple[Conversation, bool]:
+    """
+    Retourne (conversation, créée). Sûr entre processus selon `mode`
+    (CONVERSATION_LOCK_MODE par défaut). À appeler sous conversation_locks.hold().
+    """
+    mode = mode or CONVERSATION_LOCK_MODE
+    dialect = db.get_bind().dialect.name
+
+    # Cas nominal : la conversation existe déjà → aucune écriture, aucun verrou DB
+    conversation = _find_conversation(db, tenant_id, phone)
+    if conversation is not None:
+        return conversation, False
+
+    values = _new_conversation(tenant_id, phone, sender_name)
+
+    if mode == "advisory" and dialect == "postgresql":
+        # Verrou transactionnel : libéré par le commit/rollback ci-dessous
+        db.execute(text("SELECT pg_advisory_xact_lock(:k)"), {"k": advisory_key(tenant_id, phone)})
+        conversation = _find_conversation(db, tenant_id, phone)
+        if conversation is not None:
+            db.commit()
+            return conversation, False
+        conversation = Conversation(**values)
+        db.add(conversation)
+        db.commit()
+        db.refresh(conversation)
+        return conversation, True
+
+    stmt = _upsert_statement(dialect, values) if mode != "local" else None
+    if stmt is not None:
+        created = db.execute(stmt).rowcount == 1
+        db.commit()
+        return _find_conversation(db, tenant_id, phone), created
+
+    # local : la contrainte unique arbitre, le perdant relit la ligne du gagnant
+    conversation = Conversation(**values)
+    db.add(conversation)
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        return _find_conversation(db, tenant_id, phone), False
+    db.refresh(conversation)
+    return conversation, True
@@ -0,0 +1,314 @@
+"""
+Delayed Sender — envoi des réponses différées (queued_messages) à l'heure exacte
+
+Avant : send_queued_messages, prévu "toutes les secondes" — scan de la table
+même à vide, jusqu'à 1s de retard, un envoi puis un commit par message.
+
+Maintenant :
+- tas en mémoire (heapq) des envois à venir (send_at, id, tenant) : le worker
+  dort jusqu'au prochain send_at exact et se réveille plus tôt si un envoi plus
+  proche est ajouté (queue_response → schedule_delayed_send)
+- à l'échéance, tous les messages dus partent ensemble :
+    réclamation conditionnelle  UPDATE … SET sent = true WHERE sent = false
+                                RETURNING — jamais deux envois du même message
+    humain actif                une requête pour tout le lot, envoi reporté
+    envoi                       groupé par tenant sur le client poolé
+                                "whatsapp-service" (tenants en parallèle,
+                                ordre conservé au sein d'un tenant)
+    historisation               messages + last_message_at + échecs, un commit
+- la boucle ne démarre qu'au premier queue_response du process : tant que le
+  délai modulable n'est pas utilisé, aucune tâche et aucune lecture de la table
+- au démarrage de la boucle, une seule relecture des messages non envoyés ;
+  ceux dont send_at est dépassé de plus de STALE_AFTER sont expirés, pas envoyés
+  (une réponse vieille de plusieurs minutes arriverait hors contexte)
+
+Un tas plutôt qu'une roue temporelle : quelques centaines d'échéances au plus
+(délais ≤ 120s), O(log n) par ajout, réveil à la milliseconde sans tic.
+"""
+
+import asyncio
+import heapq
+import os
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+import sentry_sdk
+from sqlalchemy import insert, update
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from ..database import SessionLocal
+from ..models import Conversation, ConversationHumanState, Message, QueuedMessage
+from .response_delay_service import MAX_QUEUE_RETRIES, ResponseDelayService
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Tenants servis en parallèle par lot (envois séquentiels au sein d'un tenant)
+DELAYED_SEND_CONCURRENCY = int(os.getenv("DELAYED_SEND_CONCURRENCY", "8"))
+# Message non envoyé dont l'échéance est dépassée de plus de STALE_AFTER : expiré
+STALE_AFTER = timedelta(minutes=5)
+HUMAN_ACTIVE_DEFER = timedelta(seconds=60)
+RETRY_BACKOFF = (5, 15, 45)                   # secondes avant la tentative suivante
+CLAIM_AHEAD = timedelta(milliseconds=50)      # tolérance d'horloge entre workers
+
+
+class DelayedSender:
+    """Échéancier en mémoire des queued_messages du process"""
+
+    def __init__(self):
+        self._heap: List[Tuple[datetime, int, int]] = []
+        self._due: Dict[int, datetime] = {}         # id → send_at courant (entrées du tas périmées ignorées)
+        self._wakeup: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self._due)
+
+    # ─── Échéancier ─────────────────────────────────────────────────────────
+
+    def _push(self, message_id: int, tenant_id: int, send_at: datetime) -> None:
+        if self._due.get(message_id) == send_at:
+            return
+        self._due[message_id] = send_at
+        heapq.heappush(self._heap, (send_at, message_id, tenant_id))
+        if self._wakeup is not None and self._heap[0][1] == message_id:
+            self._wakeup.set()                      # nouvelle échéance la plus proche
+
+    def schedule(self, message_id: int, tenant_id: int, send_at: datetime) -> None:
+        """Ajoute un envoi et démarre la boucle si besoin. Appelable depuis n'importe quel thread."""
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            self._push(message_id, tenant_id, send_at)
+            self._start()
+            return
+        try:
+            if asyncio.get_running_loop() is loop:
+                self._push(message_id, tenant_id, send_at)
+                return
+        except RuntimeError:
+            pass
+        loop.call_soon_threadsafe(self._push, message_id, tenant_id, send_at)
+
+    def pop_due(self, now: datetime) -> List[Tuple[int, int]]:
+        """(id, tenant) arrivés à échéance, retirés de l'échéancier."""
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            send_at, message_id, tenant_id = heapq.heappop(self._heap)
+            if self._due.get(message_id) == send_at:
+                del self._due[message_id]
+                due.append((message_id, tenant_id))
+        return due
+
+    def next_delay(self, now: datetime) -> Optional[float]:
+        """Secondes jusqu'à la prochaine échéance valide, None si rien de prévu."""
+        while self._heap and self._due.get(self._heap[0][1]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+        if not self._heap:
+            return None
+        return max((self._heap[0][0] - now).total_seconds(), 0.0)
+
+    def clear(self) -> None:
+        self._heap.clear()
+        self._due.clear()
+
+    def load(self, db: Session) -> int:
+        """
+        Relit les messages non envoyés (redémarrage). Ceux en retard de plus de STALE_AFTER
+        sont expirés (retry_count = MAX_QUEUE_RETRIES) au lieu d'être envoyés.
+        """
+        now = datetime.utcnow()
+        pending = (
+            QueuedMessage.sent == False,  # noqa: E712
+            QueuedMessage.retry_count < MAX_QUEUE_RETRIES,
+        )
+        expired = db.query(QueuedMessage).filter(*pending, QueuedMessage.send_at < now - STALE_AFTER).update(
+            {"retry_count": MAX_QUEUE_RETRIES, "last_retry_at": now}, synchronize_session=False
+        )
+        if expired:
+            logger.warning(f"⌛ Réponses différées : {expired} message(s) trop ancien(s) expiré(s) sans envoi")
+        added = 0
+        for message_id, tenant_id, send_at in db.query(
+            QueuedMessage.id, QueuedMessage.tenant_id, QueuedMessage.send_at
+        ).filter(*pending).all():
+            if message_id not in self._due:
+                self._push(message_id, tenant_id, send_at)
+                added += 1
+        db.commit()
+        return added
+
+    # ─── Envoi d'un lot ─────────────────────────────────────────────────────
+
+    @staticmethod
+    def _claim(db: Session, ids: List[int], now: datetime) -> list:
+        """Marque envoyés les messages encore dus ; seuls ceux réclamés ici sont envoyés."""
+        rows = db.execute(
+            update(QueuedMessage)
+            .where(
+                QueuedMessage.id.in_(ids),
+                QueuedMessage.sent == False,  # noqa: E712
+                QueuedMessage.retry_count < MAX_QUEUE_RETRIES,
+                QueuedMessage.send_at <= now + CLAIM_AHEAD,
+            )
+            .values(sent=True, sent_at=now)
+            .returning(
+                QueuedMessage.id, QueuedMessage.tenant_id, QueuedMessage.conversation_id,
+                QueuedMessage.phone_number, QueuedMessage.response_text, QueuedMessage.retry_count,
+            ),
+            execution_options={"synchronize_session": False},
+        ).all()
+        db.commit()
+        return rows
+
+    async def send_due(self, ids: List[int], bind: Optional[Engine] = None) -> dict:
+        """Envoie un lot de messages dus. Retourne les compteurs du lot."""
+        stats = {"claimed": 0, "sent": 0, "failed": 0, "deferred": 0}
+        if not ids:
+            return stats
+        db = Session(bind=bind, expire_on_commit=False) if bind is not None else SessionLocal()
+        try:
+            now = datetime.utcnow()
+            claimed = self._claim(db, ids, now)
+            stats["claimed"] = len(claimed)
+            if not claimed:
+                return stats
+
+            # Humain en conversation : report (une requête pour tout le lot)
+            human = {
+                cid for (cid,) in db.query(ConversationHumanState.conversation_id).filter(
+                    ConversationHumanState.conversation_id.in_({r.conversation_id for r in claimed}),
+                    ConversationHumanState.human_active == True,  # noqa: E712
+                )
+            }
+            deferred = [r for r in claimed if r.conversation_id in human]
+            if deferred:
+                later = now + HUMAN_ACTIVE_DEFER
+                db.execute(update(QueuedMessage), [
+                    {"id": r.id, "sent": False, "sent_at": None, "send_at": later} for r in deferred
+                ])
+                db.commit()
+                for r in deferred:
+                    self._push(r.id, r.tenant_id, later)
+                stats["deferred"] = len(deferred)
+                logger.info(f"⏸️ {len(deferred)} réponse(s) différée(s) reportée(s) de 60s (humain actif)")
+            to_send = [r for r in claimed if r.conversation_id not in human]
+            if not to_send:
+                return stats
+
+            # Envoi groupé par tenant, tenants en parallèle (bornés)
+            by_tenant: Dict[int, list] = {}
+            for row in sorted(to_send, key=lambda r: r.id):
+                by_tenant.setdefault(row.tenant_id, []).append(row)
+            semaphore = asyncio.Semaphore(DELAYED_SEND_CONCURRENCY)
+            sent, failed = [], []
+
+            async def _send_tenant(rows: list) -> None:
+                async with semaphore:
+                    for row in rows:
+                        try:
+                            await ResponseDelayService._send_via_whatsapp_service(
+                                tenant_id=row.tenant_id, phone_number=row.phone_number,
+                                response_text=row.response_text,
+                            )
+                            sent.append(row)
+                        except Exception as e:
+                            logger.error(f"❌ Erreur envoi message {row.id}: {e}")
+                            failed.append(row)
+
+            await asyncio.gather(*(_send_tenant(rows) for rows in by_tenant.values()))
+            self._record(db, sent, failed, datetime.utcnow())
+            stats["sent"], stats["failed"] = len(sent), len(failed)
+            return stats
+        finally:
+            db.close()
+
+    def _record(self, db: Session, sent: list, failed: list, now: datetime) -> None:
+        """Historisation du lot en un commit ; échecs remis dans l'échéancier avec backoff."""
+        if sent:
+            db.execute(insert(Message), [
+                {"conversation_id": r.conversation_id, "content": r.response_text,
+                 "direction": "outgoing", "is_ai": True, "created_at": now}
+                for r in sent
+            ])
+            db.query(Conversation).filter(
+                Conversation.id.in_({r.conversation_id for r in sent})
+            ).update({"last_message_at": now}, synchronize_session=False)
+        retries = []
+        for r in failed:
+            attempts = (r.retry_count or 0) + 1
+            send_at = now + timedelta(seconds=RETRY_BACKOFF[min(attempts, len(RETRY_BACKOFF)) - 1])
+            retries.append({"id": r.id, "sent": False, "sent_at": None, "retry_count": attempts,
+                            "last_retry_at": now, "send_at": send_at})
+            if attempts >= MAX_QUEUE_RETRIES:
+                logger.error(f"❌ Message {r.id}: abandon après {MAX_QUEUE_RETRIES} tentatives")
+        if retries:
+            db.execute(update(QueuedMessage), retries)
+        db.commit()
+        for r, retry in zip(failed, retries):
+            if retry["retry_count"] < MAX_QUEUE_RETRIES:
+                self._push(r.id, r.tenant_id, retry["send_at"])
+        if sent:
+            logger.info(f"✅ {len(sent)} réponse(s) différée(s) envoyée(s)")
+
+    # ─── Boucle ─────────────────────────────────────────────────────────────
+
+    def _start(self) -> None:
+        """Premier envoi programmé depuis la boucle d'événements → lance run()."""
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return      # hors boucle : l'envoi attend le prochain schedule depuis la boucle
+        self._loop = loop
+        self._task = loop.create_task(self.run())
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def run(self, bind: Optional[Engine] = None) -> None:
+        """Background task : relit la base une fois, puis dort jusqu'à la prochaine échéance."""
+        self._wakeup = asyncio.Event()
+        self._loop = asyncio.get_running_loop()
+        loaded = False
+
+        while True:
+            self._wakeup.clear()
+            try:
+                if not loaded:
+                    db = Session(bind=bind) if bind is not None else SessionLocal()
+                    try:
+                        reloaded = self.load(db)
+                    finally:
+                        db.close()
+                    if reloaded:
+                        logger.info(f"🔁 Réponses différées : {reloaded} message(s) rechargé(s) depuis la base")
+                    loaded = True
+
+                due = self.pop_due(datetime.utcnow())
+                if due:
+                    await self.send_due([message_id for message_id, _ in due], bind)
+                    continue
+            except Exception as exc:
+                sentry_sdk.capture_exception(exc)
+                logger.error(f"❌ delayed_sender loop error: {exc}")
+                await asyncio.sleep(1)
+                continue
+
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.next_delay(datetime.utcnow()))
+            except asyncio.TimeoutError:
+                pass
+
+
+delayed_sender = DelayedSender()
+
+
+def schedule_delayed_send(message_id: int, tenant_id: int, send_at: datetime) -> None:
+    delayed_sender.schedule(message_id, tenant_id, send_at)
+
+
+def stop_delayed_sender() -> None:
+    """Shutdown : arrête la boucle si un queue_response l'a démarrée."""
+    delayed_sender.stop()
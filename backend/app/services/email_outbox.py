@@ -0,0 +1,261 @@
+"""
+Email Outbox — File d'attente + worker des emails transactionnels
+Les fonctions de email_service mettent le payload Brevo en file (table email_outbox)
+et rendent la main : aucune requête HTTP n'attend Brevo.
+
+Le worker (lancé dans le lifespan) :
+  - réclame des lots (FOR UPDATE SKIP LOCKED → plusieurs instances possibles)
+  - envoie en parallèle borné via le client Brevo keep-alive partagé
+  - backoff exponentiel avec jitter sur 429/5xx/timeout
+  - passe en 'dead' après max_attempts échecs (ou erreur non récupérable) + alerte Sentry
+  - dedup_key unique : un même email (ex. bienvenue) n'est jamais mis en file deux fois
+  - emails porteurs d'un lien secret (reset, confirmation) : le HTML est effacé
+    dès l'envoi ou la dead-letter — le lien ne reste pas en base pendant la rétention
+"""
+
+import asyncio
+import random
+import time
+from datetime import datetime, timedelta
+from typing import Optional
+
+import sentry_sdk
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from ..database import SessionLocal
+from ..models import EmailOutbox
+import logging
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_BATCH_SIZE = 20
+OUTBOX_CONCURRENCY = 5
+OUTBOX_POLL_SECONDS = 5
+# 30s, 1min, 2min, 4min, 8min → dead au 6e échec (~15 min de tentatives)
+BACKOFF_BASE_SECONDS = 30
+BACKOFF_MAX_SECONDS = 3600
+# Une ligne restée 'sending' au-delà (crash pendant l'envoi) repasse en 'pending'
+SENDING_TIMEOUT = timedelta(minutes=5)
+# Recherche des lignes 'sending' expirées : un reset de mot de passe en cours d'envoi
+# lors d'un déploiement repart au plus SENDING_TIMEOUT + RECOVER_SECONDS après
+RECOVER_SECONDS = 60
+PURGE_SECONDS = 3600
+SENT_RETENTION_DAYS = 30
+# Le HTML de ces templates contient un jeton bearer (lien de reset / confirmation)
+SECRET_TEMPLATES = {"password_reset", "confirmation"}
+_REDACTED_KEEP = ("sender", "to", "subject")
+
+# Réveil immédiat du worker à chaque mise en file (sinon polling toutes les 5s)
+_wakeup: Optional[asyncio.Event] = None
+_wakeup_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def _notify_worker() -> None:
+    if _wakeup is None or _wakeup_loop is None or _wakeup_loop.is_closed():
+        return
+    try:
+        if asyncio.get_running_loop() is _wakeup_loop:
+            _wakeup.set()
+            return
+    except RuntimeError:
+        pass
+    # Appel depuis un thread (BackgroundTasks sync, to_thread…)
+    _wakeup_loop.call_soon_threadsafe(_wakeup.set)
+
+
+def _backoff_delay(attempts: int) -> float:
+    delay = min(BACKOFF_BASE_SECONDS * (2 ** max(attempts - 1, 0)), BACKOFF_MAX_SECONDS)
+    return delay * random.uniform(0.8, 1.2)
+
+
+def _redact(row: EmailOutbox) -> None:
+    """Ne garde que l'enveloppe (expéditeur, destinataire, sujet) d'un email à lien secret."""
+    if row.template in SECRET_TEMPLATES and not (row.payload or {}).get("redacted"):
+        row.payload = {**{k: v for k, v in row.payload.items() if k in _REDACTED_KEEP}, "redacted": True}
+
+
+def enqueue_email(
+    payload: dict,
+    template: str,
+    dedup_key: Optional[str] = None,
+    db: Optional[Session] = None,
+) -> bool:
+    """
+    Insère l'email dans l'outbox. Retourne True s'il est en file
+    (y compris s'il y était déjà pour ce dedup_key), False si l'insertion échoue.
+    """
+    own_session = db is None
+    db = db or SessionLocal()
+    to_email = (payload.get("to") or [{}])[0].get("email", "") or ""
+    try:
+        db.add(EmailOutbox(
+            template=template,
+            to_email=to_email,
+            payload=payload,
+            dedup_key=dedup_key,
+            status="pending",
+            next_attempt_at=datetime.utcnow(),
+        ))
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        logger.info("📭 Email déjà en file (dedup_key=%s) — ignoré", dedup_key)
+        return True
+    except Exception as exc:
+        db.rollback()
+        logger.error("❌ Mise en file email échouée (%s -> %s) : %s", template, to_email, exc)
+        sentry_sdk.capture_exception(exc)
+        return False
+    finally:
+        if own_session:
+            db.close()
+
+    _notify_worker()
+    return True
+
+
+class EmailOutboxWorker:
+    """Consommation de la table email_outbox"""
+
+    @staticmethod
+    def recover_stale(db: Session) -> int:
+        """Remet en 'pending' les lignes bloquées en 'sending' (crash worker)."""
+        count = db.query(EmailOutbox).filter(
+            EmailOutbox.status == "sending",
+            EmailOutbox.next_attempt_at < datetime.utcnow(),
+        ).update({"status": "pending"}, synchronize_session=False)
+        db.commit()
+        return count
+
+    @staticmethod
+    def claim_batch(db: Session, limit: int = OUTBOX_BATCH_SIZE) -> list[EmailOutbox]:
+        """
+        Réclame un lot d'emails dus. SKIP LOCKED : deux workers ne prennent jamais
+        la même ligne. next_attempt_at sert d'échéance de réclamation pendant l'envoi.
+        """
+        now = datetime.utcnow()
+        rows = (
+            db.query(EmailOutbox)
+            .filter(EmailOutbox.status == "pending", EmailOutbox.next_attempt_at <= now)
+            .order_by(EmailOutbox.next_attempt_at.asc(), EmailOutbox.id.asc())
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+            .all()
+        )
+        for row in rows:
+            row.status = "sending"
+            row.next_attempt_at = now + SENDING_TIMEOUT
+        db.commit()
+        return rows
+
+    @staticmethod
+    async def process_once(db: Session, limit: int = OUTBOX_BATCH_SIZE) -> int:
+        """Envoie un lot. Retourne le nombre de lignes traitées."""
+        from .email_service import _deliver
+
+        rows = EmailOutboxWorker.claim_batch(db, limit)
+        if not rows:
+            return 0
+
+        semaphore = asyncio.Semaphore(OUTBOX_CONCURRENCY)
+
+        async def _one(row: EmailOutbox) -> tuple[EmailOutbox, bool, str, bool]:
+            async with semaphore:
+                ok, error, retryable = await _deliver(dict(row.payload))
+            return row, ok, error, retryable
+
+        results = await asyncio.gather(*(_one(r) for r in rows))
+
+        now = datetime.utcnow()
+        for row, ok, error, retryable in results:
+            row.attempts += 1
+            if ok:
+                row.status = "sent"
+                row.sent_at = now
+                row.last_error = None
+                _redact(row)
+            elif retryable and row.attempts < row.max_attempts:
+                row.status = "pending"
+                row.last_error = error
+                row.next_attempt_at = now + timedelta(seconds=_backoff_delay(row.attempts))
+            else:
+                row.status = "dead"
+                row.last_error = error
+                _redact(row)
+                logger.error(
+                    "☠️ Email dead-letter #%s (%s -> %s) après %s essai(s) : %s",
+                    row.id, row.template, row.to_email, row.attempts, error,
+                )
+                sentry_sdk.capture_message(
+                    f"Email dead-letter: {row.template}",
+                    level="error",
+                    extras={"outbox_id": row.id, "to": row.to_email, "error": error[:300]},
+                )
+        db.commit()
+        return len(rows)
+
+    @staticmethod
+    def purge_sent(db: Session, retention_days: int = SENT_RETENTION_DAYS) -> int:
+        """Supprime les emails envoyés anciens (les 'dead' restent pour inspection)."""
+        count = db.query(EmailOutbox).filter(
+            EmailOutbox.status == "sent",
+            EmailOutbox.sent_at < datetime.utcnow() - timedelta(days=retention_days),
+        ).delete(synchronize_session=False)
+        db.commit()
+        return count
+
+    @staticmethod
+    def requeue(db: Session, outbox_id: int) -> Optional[EmailOutbox]:
+        """
+        Remet un email 'dead' en file (action superadmin).
+        Un email à lien secret effacé n'est pas rejouable : l'utilisateur redemande un lien.
+        """
+        row = db.query(EmailOutbox).filter(EmailOutbox.id == outbox_id).first()
+        if not row or row.status != "dead" or (row.payload or {}).get("redacted"):
+            return None
+        row.status = "pending"
+        row.attempts = 0
+        row.last_error = None
+        row.next_attempt_at = datetime.utcnow()
+        db.commit()
+        _notify_worker()
+        return row
+
+
+async def email_outbox_loop() -> None:
+    """Background task : envoie les emails en file dès leur insertion (polling 5s en secours)."""
+    global _wakeup, _wakeup_loop
+    _wakeup = asyncio.Event()
+    _wakeup_loop = asyncio.get_running_loop()
+    last_recover = last_purge = 0.0
+
+    while True:
+        processed = 0
+        db = SessionLocal()
+        try:
+            if time.monotonic() - last_recover > RECOVER_SECONDS:
+                recovered = EmailOutboxWorker.recover_stale(db)
+                if recovered:
+                    logger.warning(f"♻️ Outbox email : {recovered} email(s) bloqué(s) en envoi remis en file")
+                last_recover = time.monotonic()
+            if time.monotonic() - last_purge > PURGE_SECONDS:
+                purged = EmailOutboxWorker.purge_sent(db)
+                if purged:
+                    logger.info(f"🧹 Outbox email : {purged} emails envoyés purgés")
+                last_purge = time.monotonic()
+            processed = await EmailOutboxWorker.process_once(db)
+        except Exception as exc:
+            sentry_sdk.capture_exception(exc)
+            logger.error(f"❌ email_outbox_loop error: {exc}")
+            db.rollback()
+        finally:
+            db.close()
+
+        if processed >= OUTBOX_BATCH_SIZE:
+            continue   # Encore du travail : pas d'attente
+        try:
+            await asyncio.wait_for(_wakeup.wait(), timeout=OUTBOX_POLL_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+        _wakeup.clear()
@@ -13,22 +13,27 @@ Fonctions :
   send_subscription_expiry_warning(...)
   send_inactivity_reminder(...)
   send_internal_alert(...)
+  send_custom_broadcast(...)
+  send_broadcast_batch(...)
 """
 
 import os
 import re
+import asyncio
 import html as _esc
 import logging
 
+import hashlib
 import httpx
 import sentry_sdk
-from datetime import date
+from datetime import date, datetime
+from ..http_client import get_client
 
 logger = logging.getLogger(__name__)
 
 # ─── Configuration ─────────────────────────────────────────────────────────────
 BREVO_API_KEY  = os.getenv("BREVO_API_KEY", "")
-BREVO_API_URL  = "https://api.brevo.com/v3/smtp/email"
+BREVO_API_URL  = os.getenv("BREVO_API_URL", "https://api.brevo.com/v3/smtp/email")
 SENDER_EMAIL   = os.getenv("BREVO_SENDER_EMAIL", "contact@neobot-ai.com")
 SENDER_NAME    = os.getenv("BREVO_SENDER_NAME", "NeoBot")
 REPLY_TO_EMAIL = os.getenv("BREVO_REPLY_TO", "contact@neobot-ai.com")
@@ -102,10 +107,10 @@ def _footer() -> str:
     )
 
 
-def _wrap(card_rows: str) -> str:
+def _wrap(card_rows: str, locale: str = "fr") -> str:
     """Wrapper HTML complet pour tout email NeoBot — fond blanc, max 560px."""
     return f"""<!DOCTYPE html>
-<html lang="fr">
+<html lang="{locale}">
 <head>
   <meta charset="UTF-8">
   <meta name="viewport" content="width=device-width,initial-scale=1">
@@ -129,88 +134,157 @@ def _wrap(card_rows: str) -> str:
 </html>"""
 
 
+# ─── Cache du HTML rendu ───────────────────────────────────────────────────────
+
+# Le squelette de chaque template (wrapper + en-tête + carte statique) est rendu
+# une seule fois par (template, locale) avec des marqueurs \x00slot\x00 ; chaque
+# envoi ne fait plus qu'insérer les valeurs variables (déjà échappées).
+_TEMPLATE_CACHE: dict[tuple[str, str], list[str]] = {}
+_SLOT_RE = re.compile("\x00([a-z_]+)\x00")
+
+
+def _render_cached(template: str, builder, locale: str = "fr", wrap: bool = True, **slots) -> str:
+    """
+    builder(v) retourne le HTML de la carte (ou la page complète si wrap=False)
+    en lisant ses valeurs variables dans le dict v.
+    """
+    key = (template, locale)
+    parts = _TEMPLATE_CACHE.get(key)
+    if parts is None:
+        card = builder({name: f"\x00{name}\x00" for name in slots})
+        parts = _SLOT_RE.split(_wrap(card, locale) if wrap else card)
+        _TEMPLATE_CACHE[key] = parts
+    # parts alterne [texte, slot, texte, slot, …, texte]
+    return "".join(part if i % 2 == 0 else str(slots[part]) for i, part in enumerate(parts))
+
+
 # ─── Transport HTTP ────────────────────────────────────────────────────────────
 
-async def _send(payload: dict) -> bool:
-    if not BREVO_API_KEY:
-        logger.warning("Email non envoyé : BREVO_API_KEY absent.")
-        return False
+# Statuts Brevo pour lesquels un nouvel essai a du sens
+_RETRYABLE_STATUS = {429, 500, 502, 503, 504}
 
-    if REPLY_TO_EMAIL and "replyTo" not in payload:
-        payload["replyTo"] = {"email": REPLY_TO_EMAIL}
 
-    # Génère automatiquement une version text/plain si absente (corrige MIME_HTML_ONLY)
-    if "htmlContent" in payload and "textContent" not in payload:
-        html_body = payload["htmlContent"]
-        text = re.sub(r'<style[^>]*>.*?</style>', '', html_body, flags=re.DOTALL)
-        text = re.sub(r'<[^>]+>', ' ', text)
-        text = re.sub(r'&nbsp;', ' ', text)
-        text = re.sub(r'&middot;', '·', text)
-        text = re.sub(r'&[a-z]+;', '', text)
-        text = re.sub(r'[ \t]+', ' ', text)
-        text = re.sub(r'\n{3,}', '\n\n', text.strip())
-        payload["textContent"] = text
-
-    headers = {
+def _get_brevo_client() -> httpx.AsyncClient:
+    # Pool keep-alive "brevo" du registre : une seule poignée de main TLS,
+    # réutilisée par tous les envois.
+    return get_client("brevo")
+
+
+def _brevo_headers() -> dict:
+    return {
         "accept":       "application/json",
         "content-type": "application/json",
         "api-key":      BREVO_API_KEY,
     }
-    try:
-        async with httpx.AsyncClient(timeout=10) as client:
-            r = await client.post(BREVO_API_URL, json=payload, headers=headers)
 
+
+def _html_to_text(html_body: str) -> str:
+    """Version text/plain dérivée du HTML (corrige MIME_HTML_ONLY)."""
+    text = re.sub(r'<style[^>]*>.*?</style>', '', html_body, flags=re.DOTALL)
+    text = re.sub(r'<[^>]+>', ' ', text)
+    text = re.sub(r'&nbsp;', ' ', text)
+    text = re.sub(r'&middot;', '·', text)
+    text = re.sub(r'&[a-z]+;', '', text)
+    text = re.sub(r'[ \t]+', ' ', text)
+    return re.sub(r'\n{3,}', '\n\n', text.strip())
+
+
+def _prepare_payload(payload: dict) -> dict:
+    if REPLY_TO_EMAIL and "replyTo" not in payload:
+        payload["replyTo"] = {"email": REPLY_TO_EMAIL}
+    if "htmlContent" in payload and "textContent" not in payload:
+        payload["textContent"] = _html_to_text(payload["htmlContent"])
+    return payload
+
+
+async def _deliver(payload: dict) -> tuple[bool, str, bool]:
+    """
+    Envoi effectif à Brevo (un essai) via le client partagé.
+    Retourne (succès, erreur, retry_possible). Appelé par le worker de l'outbox.
+    """
+    _prepare_payload(payload)
+    try:
+        r = await _get_brevo_client().post(BREVO_API_URL, json=payload, headers=_brevo_headers())
         if r.is_success:
             to_addr = payload.get("to", [{}])[0].get("email", "?")
             logger.info("Email envoyé -> %s [%s]", to_addr, r.status_code)
-            return True
-
+            return True, "", False
         logger.error("Brevo %s : %s", r.status_code, r.text[:300])
-        sentry_sdk.capture_message(
-            f"Brevo email failed: {r.status_code}",
-            level="error",
-            extras={"response_body": r.text[:300], "to": payload.get("to")},
-        )
-        return False
-
+        return False, f"{r.status_code} {r.text[:300]}", r.status_code in _RETRYABLE_STATUS
     except httpx.TimeoutException:
-        logger.error("Brevo timeout — email non envoyé")
-        sentry_sdk.capture_message("Brevo API timeout", level="warning")
-        return False
+        logger.error("Brevo timeout — email remis en file")
+        return False, "timeout", True
+    except httpx.TransportError as exc:
+        logger.error("Brevo transport : %s", exc)
+        return False, f"{type(exc).__name__}: {exc}", True
     except Exception as exc:
         logger.error("Brevo exception : %s", exc)
         sentry_sdk.capture_exception(exc)
+        return False, str(exc)[:300], False
+
+
+async def _send(payload: dict, template: str = "custom", dedup_key: str | None = None) -> bool:
+    """
+    Met l'email en file (table email_outbox) et rend la main immédiatement.
+    L'envoi, les retries et la dead-letter sont gérés par le worker (email_outbox).
+    Retourne True si l'email est en file (ou déjà en file pour ce dedup_key).
+    """
+    if not BREVO_API_KEY:
+        logger.warning("Email non envoyé : BREVO_API_KEY absent.")
         return False
 
+    from .email_outbox import enqueue_email
+    return enqueue_email(payload, template=template, dedup_key=dedup_key)
 
-# ─── 1. Bienvenue ──────────────────────────────────────────────────────────────
 
-async def send_welcome_email(
-    to_email: str,
-    user_name: str,
-    tenant_name: str,
-    trial_end_date: date | None = None,
-    trial_days: int = 14,
-) -> bool:
-    trial_end_str = trial_end_date.strftime("%d/%m/%Y") if trial_end_date else ""
-    date_line = (
-        f"jusqu'au <strong>{trial_end_str}</strong>"
-        if trial_end_str
-        else f"pendant {trial_days}&nbsp;jours"
-    )
+async def _send_with_retry(payload: dict, attempts: int = 3, base_delay: float = 1.0) -> bool:
+    """
+    Envoi avec retry exponentiel (1s, 2s, 4s…) sur 429/5xx/timeout.
+    Respecte l'en-tête Retry-After renvoyé par Brevo en cas de 429.
+    """
+    if not BREVO_API_KEY:
+        logger.warning("Email non envoyé : BREVO_API_KEY absent.")
+        return False
+
+    _prepare_payload(payload)
+    last_error = ""
+    for attempt in range(attempts):
+        delay = base_delay * (2 ** attempt)
+        try:
+            r = await _get_brevo_client().post(BREVO_API_URL, json=payload, headers=_brevo_headers())
+            if r.is_success:
+                return True
+            last_error = f"{r.status_code} {r.text[:200]}"
+            if r.status_code not in _RETRYABLE_STATUS:
+                break
+            retry_after = r.headers.get("retry-after")
+            if retry_after and retry_after.isdigit():
+                delay = max(delay, float(retry_after))
+        except httpx.TransportError as exc:
+            last_error = f"{type(exc).__name__}: {exc}"
+        if attempt < attempts - 1:
+            await asyncio.sleep(delay)
+
+    logger.error("Brevo échec après %d essai(s) : %s", attempts, last_error)
+    sentry_sdk.capture_message(f"Brevo batch failed: {last_error[:100]}", level="error")
+    return False
 
-    card = f"""
+
+# ─── 1. Bienvenue ──────────────────────────────────────────────────────────────
+
+def _card_welcome(v: dict) -> str:
+    return f"""
     {_header("Compte activ&eacute;")}
 
     <tr><td style="padding:32px 36px 8px;">
       <h1 style="margin:0 0 8px;font-family:Arial Black,Arial,sans-serif;
                  font-size:22px;font-weight:900;color:#111111;">
-        Bienvenue, {_esc.escape(user_name)}&nbsp;!
+        Bienvenue, {v["user_name"]}&nbsp;!
       </h1>
       <p style="margin:0 0 24px;font-family:Arial,Helvetica,sans-serif;
                 font-size:14px;color:#555555;line-height:1.7;">
-        Ton espace <strong>{_esc.escape(tenant_name)}</strong> est pr&ecirc;t.
-        Ton essai gratuit <strong>Plan Essential</strong> est actif {date_line}.
+        Ton espace <strong>{v["tenant_name"]}</strong> est pr&ecirc;t.
+        Ton essai gratuit <strong>Plan Essential</strong> est actif {v["date_line"]}.
       </p>
     </td></tr>
 
@@ -283,7 +357,7 @@ async def send_welcome_email(
           <td align="center" style="padding:8px;
               font-family:Arial,Helvetica,sans-serif;font-size:12px;color:#888888;">
             <strong style="display:block;font-size:16px;color:#FF4D00;
-                           font-weight:800;">{trial_days}&nbsp;jours</strong>
+                           font-weight:800;">{v["trial_days"]}&nbsp;jours</strong>
             Essai gratuit
           </td>
           <td width="1" bgcolor="#e8e8e8"
@@ -307,19 +381,43 @@ async def send_welcome_email(
     </td></tr>
     """
 
+
+async def send_welcome_email(
+    to_email: str,
+    user_name: str,
+    tenant_name: str,
+    trial_end_date: date | None = None,
+    trial_days: int = 14,
+    dedup_key: str | None = None,
+) -> bool:
+    trial_end_str = trial_end_date.strftime("%d/%m/%Y") if trial_end_date else ""
+    date_line = (
+        f"jusqu'au <strong>{trial_end_str}</strong>"
+        if trial_end_str
+        else f"pendant {trial_days}&nbsp;jours"
+    )
+
+    html_content = _render_cached(
+        "welcome", _card_welcome,
+        user_name=_esc.escape(user_name),
+        tenant_name=_esc.escape(tenant_name),
+        date_line=date_line,
+        trial_days=trial_days,
+    )
+
     return await _send({
         "sender":      {"name": SENDER_NAME, "email": SENDER_EMAIL},
         "to":          [{"email": to_email, "name": user_name}],
         "replyTo":     {"email": REPLY_TO_EMAIL},
         "subject":     f"Bienvenue sur NeoBot — ton essai de {trial_days} jours commence maintenant",
-        "htmlContent": _wrap(card),
-    })
+        "htmlContent": html_content,
+    }, template="welcome", dedup_key=dedup_key or f"welcome:{to_email.lower()}")
 
 
 # ─── 2. Confirmation d'adresse email ──────────────────────────────────────────
 
-async def send_confirmation_email(to_email: str, confirmation_link: str) -> bool:
-    card = f"""
+def _card_confirmation(v: dict) -> str:
+    return f"""
     {_header("Confirmation d'adresse email", "#00BFA5")}
 
     <tr><td style="padding:32px 36px 8px;text-align:center;">
@@ -336,7 +434,7 @@ async def send_confirmation_email(to_email: str, confirmation_link: str) -> bool
                 font-size:13px;color:#888888;">
         Ce lien est valable <strong>24&nbsp;heures</strong>.
       </p>
-      {_cta("Confirmer mon adresse email", confirmation_link, "#00BFA5")}
+      {_cta("Confirmer mon adresse email", v["confirmation_link"], "#00BFA5")}
       <p style="margin:20px 0 0;font-family:Arial,Helvetica,sans-serif;
                 font-size:12px;color:#bbbbbb;">
         Si vous n'avez pas cr&eacute;&eacute; de compte NeoBot, ignorez cet email.
@@ -345,18 +443,27 @@ async def send_confirmation_email(to_email: str, confirmation_link: str) -> bool
     <tr><td height="32" style="font-size:0;">&nbsp;</td></tr>
     """
 
+
+async def send_confirmation_email(
+    to_email: str, confirmation_link: str, dedup_key: str | None = None
+) -> bool:
+    html_content = _render_cached(
+        "confirmation", _card_confirmation,
+        confirmation_link=confirmation_link,
+    )
+
     return await _send({
         "sender":      {"name": SENDER_NAME, "email": SENDER_EMAIL},
         "to":          [{"email": to_email}],
         "subject":     "Confirmez votre adresse email — NeoBot",
-        "htmlContent": _wrap(card),
-    })
+        "htmlContent": html_content,
+    }, template="confirmation", dedup_key=dedup_key)
 
 
 # ─── 3. Réinitialisation mot de passe ─────────────────────────────────────────
 
-async def send_password_reset_email(to_email: str, reset_link: str) -> bool:
-    card = f"""
+def _card_password_reset(v: dict) -> str:
+    return f"""
     {_header("S&eacute;curit&eacute; du compte")}
 
     <tr><td style="padding:32px 36px 8px;text-align:center;">
@@ -374,7 +481,7 @@ async def send_password_reset_email(to_email: str, reset_link: str) -> bool:
         Ce lien est valable <strong>1&nbsp;heure</strong>.
         Apr&egrave;s expiration, recommencez depuis la page de connexion.
       </p>
-      {_cta("R&eacute;initialiser mon mot de passe", reset_link)}
+      {_cta("R&eacute;initialiser mon mot de passe", v["reset_link"])}
       <p style="margin:20px 0 4px;font-family:Arial,Helvetica,sans-serif;
                 font-size:12px;color:#bbbbbb;">
         Si vous n'avez pas fait cette demande, votre compte est s&eacute;curis&eacute;.
@@ -384,16 +491,54 @@ async def send_password_reset_email(to_email: str, reset_link: str) -> bool:
     <tr><td height="32" style="font-size:0;">&nbsp;</td></tr>
     """
 
+
+async def send_password_reset_email(
+    to_email: str, reset_link: str, dedup_key: str | None = None
+) -> bool:
+    html_content = _render_cached(
+        "password_reset", _card_password_reset,
+        reset_link=reset_link,
+    )
+
     return await _send({
         "sender":      {"name": SENDER_NAME, "email": SENDER_EMAIL},
         "to":          [{"email": to_email}],
         "subject":     "Réinitialisation de votre mot de passe — NeoBot",
-        "htmlContent": _wrap(card),
-    })
+        "htmlContent": html_content,
+    }, template="password_reset", dedup_key=dedup_key)
 
 
 # ─── 4. Confirmation de paiement ──────────────────────────────────────────────
 
+def _card_payment_confirmation(v: dict) -> str:
+    return f"""
+    {_header("Paiement confirm&eacute;", "#22a05d")}
+
+    <tr><td style="padding:28px 36px 8px;">
+      <h1 style="margin:0 0 8px;font-family:Arial Black,Arial,sans-serif;
+                 font-size:22px;font-weight:900;color:#111111;">
+        Merci, {v["tenant_name"]}&nbsp;!
+      </h1>
+      <p style="margin:0 0 20px;font-family:Arial,Helvetica,sans-serif;
+                font-size:14px;color:#555555;line-height:1.7;">
+        Votre abonnement est activ&eacute;. Votre agent IA est op&eacute;rationnel.
+      </p>
+    </td></tr>
+
+    <!-- Recap paiement -->
+    <tr><td style="padding:0 36px 28px;">
+      <table role="presentation" width="100%" cellpadding="0" cellspacing="0"
+             style="border:1px solid #e8e8e8;border-radius:8px;overflow:hidden;">
+        {v["detail_rows"]}
+      </table>
+    </td></tr>
+
+    <tr><td align="center" style="padding:0 36px 32px;">
+      {_cta("Voir mon abonnement", f"{FRONTEND_URL}/billing", "#22a05d")}
+    </td></tr>
+    """
+
+
 async def send_payment_confirmation(
     tenant_email: str,
     tenant_name: str,
@@ -404,6 +549,7 @@ async def send_payment_confirmation(
     payment_date: str = "",
     next_renewal: str = "",
     messages_limit: str = "",
+    dedup_key: str | None = None,
 ) -> bool:
     rows_data = [
         ("Plan", f"<strong>{_esc.escape(plan)}</strong>"),
@@ -429,68 +575,26 @@ async def send_payment_confirmation(
         for k, v in rows_data
     )
 
-    card = f"""
-    {_header("Paiement confirm&eacute;", "#22a05d")}
-
-    <tr><td style="padding:28px 36px 8px;">
-      <h1 style="margin:0 0 8px;font-family:Arial Black,Arial,sans-serif;
-                 font-size:22px;font-weight:900;color:#111111;">
-        Merci, {_esc.escape(tenant_name)}&nbsp;!
-      </h1>
-      <p style="margin:0 0 20px;font-family:Arial,Helvetica,sans-serif;
-                font-size:14px;color:#555555;line-height:1.7;">
-        Votre abonnement est activ&eacute;. Votre agent IA est op&eacute;rationnel.
-      </p>
-    </td></tr>
-
-    <!-- Recap paiement -->
-    <tr><td style="padding:0 36px 28px;">
-      <table role="presentation" width="100%" cellpadding="0" cellspacing="0"
-             style="border:1px solid #e8e8e8;border-radius:8px;overflow:hidden;">
-        {detail_rows}
-      </table>
-    </td></tr>
-
-    <tr><td align="center" style="padding:0 36px 32px;">
-      {_cta("Voir mon abonnement", f"{FRONTEND_URL}/billing", "#22a05d")}
-    </td></tr>
-    """
+    html_content = _render_cached(
+        "payment_confirmation", _card_payment_confirmation,
+        tenant_name=_esc.escape(tenant_name),
+        detail_rows=detail_rows,
+    )
 
     return await _send({
         "sender":      {"name": SENDER_NAME, "email": SENDER_EMAIL},
         "to":          [{"email": tenant_email, "name": tenant_name}],
         "replyTo":     {"email": REPLY_TO_EMAIL},
         "subject":     f"Paiement confirmé — NeoBot {plan}",
-        "htmlContent": _wrap(card),
-    })
+        "htmlContent": html_content,
+    }, template="payment_confirmation", dedup_key=dedup_key or (f"payment:{reference}" if reference else None))
 
 
 # ─── 5. Alerte expiration abonnement ──────────────────────────────────────────
 
-async def send_subscription_expiry_warning(
-    to_email: str,
-    user_name: str,
-    plan_name: str,
-    days_left: int,
-    expiry_date: str,
-    renewal_price: int,
-    currency: str = "XAF",
-) -> bool:
-    if days_left <= 1:
-        accent = "#e53e3e"
-        label  = "EXPIRE DEMAIN"
-        subj   = "Urgent — Votre abonnement NeoBot expire demain"
-    elif days_left <= 3:
-        accent = "#dd6b20"
-        label  = f"EXPIRE DANS {days_left} JOURS"
-        subj   = f"Votre abonnement NeoBot expire dans {days_left} jours"
-    else:
-        accent = "#d69e2e"
-        label  = f"EXPIRE DANS {days_left} JOURS"
-        subj   = f"Votre abonnement NeoBot expire dans {days_left} jours"
-
-    card = f"""
-    {_header(label, accent)}
+def _card_expiry_warning(v: dict) -> str:
+    return f"""
+    {_header(v["label"], v["accent"])}
 
     <tr><td style="padding:28px 36px 8px;">
       <h1 style="margin:0 0 8px;font-family:Arial Black,Arial,sans-serif;
@@ -499,9 +603,9 @@ async def send_subscription_expiry_warning(
       </h1>
       <p style="margin:0 0 20px;font-family:Arial,Helvetica,sans-serif;
                 font-size:14px;color:#555555;line-height:1.7;">
-        Bonjour <strong>{_esc.escape(user_name)}</strong>, votre plan
-        <strong>{_esc.escape(plan_name)}</strong>
-        expire le <strong style="color:{accent};">{_esc.escape(expiry_date)}</strong>.
+        Bonjour <strong>{v["user_name"]}</strong>, votre plan
+        <strong>{v["plan_name"]}</strong>
+        expire le <strong style="color:{v["accent"]};">{v["expiry_date"]}</strong>.
         Sans renouvellement, votre agent s'arr&ecirc;tera automatiquement.
       </p>
     </td></tr>
@@ -517,7 +621,7 @@ async def send_subscription_expiry_warning(
             </div>
             <div style="font-size:24px;font-weight:800;color:#111111;
                         font-family:Arial Black,Arial,sans-serif;">
-              {renewal_price:,}&nbsp;<span style="font-size:16px;">{_esc.escape(currency)}</span>
+              {v["renewal_price"]}&nbsp;<span style="font-size:16px;">{v["currency"]}</span>
               <span style="font-size:13px;font-weight:400;color:#888888;">/mois</span>
             </div>
           </td>
@@ -526,41 +630,69 @@ async def send_subscription_expiry_warning(
     </td></tr>
 
     <tr><td align="center" style="padding:0 36px 32px;">
-      {_cta("Renouveler mon abonnement", f"{FRONTEND_URL}/billing", accent)}
+      {_cta("Renouveler mon abonnement", f"{FRONTEND_URL}/billing", v["accent"])}
     </td></tr>
     """
 
+
+async def send_subscription_expiry_warning(
+    to_email: str,
+    user_name: str,
+    plan_name: str,
+    days_left: int,
+    expiry_date: str,
+    renewal_price: int,
+    currency: str = "XAF",
+    dedup_key: str | None = None,
+) -> bool:
+    if days_left <= 1:
+        accent = "#e53e3e"
+        label  = "EXPIRE DEMAIN"
+        subj   = "Urgent — Votre abonnement NeoBot expire demain"
+    elif days_left <= 3:
+        accent = "#dd6b20"
+        label  = f"EXPIRE DANS {days_left} JOURS"
+        subj   = f"Votre abonnement NeoBot expire dans {days_left} jours"
+    else:
+        accent = "#d69e2e"
+        label  = f"EXPIRE DANS {days_left} JOURS"
+        subj   = f"Votre abonnement NeoBot expire dans {days_left} jours"
+
+    html_content = _render_cached(
+        "expiry_warning", _card_expiry_warning,
+        label=label,
+        accent=accent,
+        user_name=_esc.escape(user_name),
+        plan_name=_esc.escape(plan_name),
+        expiry_date=_esc.escape(expiry_date),
+        renewal_price=f"{renewal_price:,}",
+        currency=_esc.escape(currency),
+    )
+
     return await _send({
         "sender":      {"name": SENDER_NAME, "email": SENDER_EMAIL},
         "to":          [{"email": to_email, "name": user_name}],
         "replyTo":     {"email": REPLY_TO_EMAIL},
         "subject":     subj,
-        "htmlContent": _wrap(card),
-    })
+        "htmlContent": html_content,
+    }, template="expiry_warning", dedup_key=dedup_key or f"expiry:{to_email.lower()}:{expiry_date}:{days_left}")
 
 
 # ─── 6. Relance inactivité ─────────────────────────────────────────────────────
 
-async def send_inactivity_reminder(
-    to_email: str,
-    user_name: str,
-    agent_name: str,
-    plan_name: str,
-    inactive_days: int,
-    total_conversations: int = 0,
-) -> bool:
-    card = f"""
+def _card_inactivity(v: dict) -> str:
+    return f"""
     {_header("Agent en pause", "#00BFA5")}
 
     <tr><td style="padding:28px 36px 8px;">
       <h1 style="margin:0 0 8px;font-family:Arial Black,Arial,sans-serif;
                  font-size:22px;font-weight:900;color:#111111;">
-        Ton agent t'attend, {_esc.escape(user_name)}
+        Ton agent t'attend, {v["user_name"]}
       </h1>
       <p style="margin:0 0 12px;font-family:Arial,Helvetica,sans-serif;
                 font-size:14px;color:#555555;line-height:1.7;">
-        Ton agent <strong>{_esc.escape(agent_name)}</strong> n'a re&ccedil;u aucune
-        conversation depuis <strong style="color:#FF4D00;">{inactive_days}&nbsp;jours</strong>.
+        Ton agent <strong>{v["agent_name"]}</strong> n'a re&ccedil;u aucune
+        conversation depuis <strong style="color:#FF4D00;">{v["inactive_days"]}&nbsp;jours</strong>.
       </p>
       <p style="margin:0 0 20px;font-family:Arial,Helvetica,sans-serif;
                 font-size:13px;color:#888888;line-height:1.6;">
@@ -576,14 +708,14 @@ async def send_inactivity_reminder(
         <tr bgcolor="#f9f9f9" style="background-color:#f9f9f9;">
           <td align="center" style="padding:16px 8px;
               font-family:Arial,Helvetica,sans-serif;">
-            <strong style="display:block;font-size:20px;color:#111111;">{total_conversations}</strong>
+            <strong style="display:block;font-size:20px;color:#111111;">{v["total_conversations"]}</strong>
             <span style="font-size:11px;color:#999999;">conversations totales</span>
           </td>
           <td width="1" bgcolor="#e8e8e8"
               style="background-color:#e8e8e8;font-size:0;">&nbsp;</td>
           <td align="center" style="padding:16px 8px;
               font-family:Arial,Helvetica,sans-serif;">
-            <strong style="display:block;font-size:20px;color:#FF4D00;">{inactive_days}j</strong>
+            <strong style="display:block;font-size:20px;color:#FF4D00;">{v["inactive_days"]}j</strong>
             <span style="font-size:11px;color:#999999;">sans activit&eacute;</span>
           </td>
         </tr>
@@ -595,32 +727,43 @@ async def send_inactivity_reminder(
     </td></tr>
     """
 
+
+async def send_inactivity_reminder(
+    to_email: str,
+    user_name: str,
+    agent_name: str,
+    plan_name: str,
+    inactive_days: int,
+    total_conversations: int = 0,
+    dedup_key: str | None = None,
+) -> bool:
+    html_content = _render_cached(
+        "inactivity", _card_inactivity,
+        user_name=_esc.escape(user_name),
+        agent_name=_esc.escape(agent_name),
+        inactive_days=inactive_days,
+        total_conversations=total_conversations,
+    )
+
     return await _send({
         "sender":      {"name": SENDER_NAME, "email": SENDER_EMAIL},
         "to":          [{"email": to_email, "name": user_name}],
         "replyTo":     {"email": REPLY_TO_EMAIL},
         "subject":     f"Ton agent NeoBot est inactif depuis {inactive_days} jours",
-        "htmlContent": _wrap(card),
-    })
+        "htmlContent": html_content,
+    }, template="inactivity", dedup_key=dedup_key or f"inactivity:{to_email.lower()}:{date.today().isoformat()}")
 
 
 # ─── 7. NeoAlert — alerte interne admin ───────────────────────────────────────
 
-async def send_internal_alert(subject: str, body: str) -> bool:
-    """
-    Alerte technique interne (crédits API, paiements, incidents).
-    Envoyé à NEOPAY_ALERT_EMAIL. Design minimaliste fonctionnel.
-    """
-    alert_email = os.getenv("NEOPAY_ALERT_EMAIL", "neobot561@gmail.com")
-    if not alert_email:
-        logger.warning("NEOPAY_ALERT_EMAIL non défini — alerte ignorée : %s", subject)
-        return False
+def _alert_dedup_key(subject: str, body: str) -> str:
+    """Une même alerte (sujet + corps identiques) n'est envoyée qu'une fois par heure."""
+    digest = hashlib.sha256(f"{subject}\n{body}".encode()).hexdigest()[:24]
+    return f"alert:{digest}:{datetime.utcnow():%Y%m%d%H}"
 
-    env_label = os.getenv("APP_ENV", "development").upper()
-    safe_subj = _esc.escape(subject)
-    safe_body = _esc.escape(body)
 
-    html_content = f"""<!DOCTYPE html>
+def _card_internal_alert(v: dict) -> str:
+    return f"""<!DOCTYPE html>
 <html lang="fr">
 <head><meta charset="UTF-8"><title>NeoAlert</title></head>
 <body style="margin:0;padding:0;background-color:#f4f4f4;" bgcolor="#f4f4f4">
@@ -651,7 +794,7 @@ async def send_internal_alert(subject: str, body: str) -> bool:
             </td>
             <td align="right">
               <span style="font-family:Arial,Helvetica,sans-serif;font-size:11px;
-                           color:#bbbbbb;letter-spacing:0.05em;">{env_label}</span>
+                           color:#bbbbbb;letter-spacing:0.05em;">{v["env_label"]}</span>
             </td>
           </tr>
         </table>
@@ -660,7 +803,7 @@ async def send_internal_alert(subject: str, body: str) -> bool:
       <!-- Titre alerte -->
       <tr><td style="padding:16px 28px 8px;">
         <div style="font-family:Arial Black,Arial,sans-serif;font-size:16px;
-                    font-weight:900;color:#FF4D00;">{safe_subj}</div>
+                    font-weight:900;color:#FF4D00;">{v["subject"]}</div>
       </td></tr>
 
       <!-- Corps technique -->
@@ -669,7 +812,7 @@ async def send_internal_alert(subject: str, body: str) -> bool:
                     font-size:12px;color:#444444;line-height:1.7;
                     background-color:#f8f8f8;border:1px solid #eeeeee;
                     border-radius:6px;padding:14px 16px;
-                    white-space:pre-wrap;word-break:break-all;">{safe_body}</pre>
+                    white-space:pre-wrap;word-break:break-all;">{v["body"]}</pre>
       </td></tr>
 
       <!-- Footer -->
@@ -687,33 +830,40 @@ async def send_internal_alert(subject: str, body: str) -> bool:
 </body>
 </html>"""
 
+
+async def send_internal_alert(subject: str, body: str) -> bool:
+    """
+    Alerte technique interne (crédits API, paiements, incidents).
+    Envoyé à NEOPAY_ALERT_EMAIL. Design minimaliste fonctionnel.
+    """
+    alert_email = os.getenv("NEOPAY_ALERT_EMAIL", "neobot561@gmail.com")
+    if not alert_email:
+        logger.warning("NEOPAY_ALERT_EMAIL non défini — alerte ignorée : %s", subject)
+        return False
+
+    env_label = os.getenv("APP_ENV", "development").upper()
+    safe_subj = _esc.escape(subject)
+    safe_body = _esc.escape(body)
+
+    html_content = _render_cached(
+        "internal_alert", _card_internal_alert, wrap=False,
+        env_label=env_label,
+        subject=safe_subj,
+        body=safe_body,
+    )
+
     return await _send({
         "sender":      {"name": "NeoAlert", "email": SENDER_EMAIL},
         "to":          [{"email": alert_email}],
         "subject":     subject,
         "htmlContent": html_content,
-    })
+    }, template="internal_alert", dedup_key=_alert_dedup_key(subject, body))
 
 
-async def send_custom_broadcast(
-    to_email: str,
-    to_name: str,
-    subject: str,
-    body: str,
-) -> bool:
-    """
-    Email broadcast superadmin — envoi personnalisé à un client.
-    body est du texte brut, converti en HTML sécurisé (XSS-safe via _esc.escape).
-    Appelé en boucle par POST /api/admin/broadcast-email.
-    """
-    safe_name = _esc.escape(to_name)
-    safe_subject = _esc.escape(subject)
-    safe_body = _esc.escape(body).replace("\n", "<br>")
-    accent = "#00E5CC"
-
-    html_content = f"""<!DOCTYPE html>
+def _card_broadcast(v: dict) -> str:
+    return f"""<!DOCTYPE html>
 <html lang="fr">
-<head><meta charset="UTF-8"><title>{safe_subject}</title></head>
+<head><meta charset="UTF-8"><title>{v["subject"]}</title></head>
 <body style="margin:0;padding:0;background-color:#f4f4f4;" bgcolor="#f4f4f4">
 <table role="presentation" width="100%" cellpadding="0" cellspacing="0" bgcolor="#f4f4f4"
        style="background-color:#f4f4f4;">
@@ -721,8 +871,8 @@ async def send_custom_broadcast(
     <table role="presentation" width="100%" cellpadding="0" cellspacing="0" bgcolor="#ffffff"
            style="max-width:560px;width:100%;background-color:#ffffff;border-radius:10px;
                   border:1px solid #e8e8e8;">
-      <tr><td height="4" bgcolor="{accent}"
-             style="background-color:{accent};height:4px;font-size:0;
+      <tr><td height="4" bgcolor="#00E5CC"
+             style="background-color:#00E5CC;height:4px;font-size:0;
                     border-radius:10px 10px 0 0;">&nbsp;</td></tr>
       <tr><td style="padding:24px 28px 16px;">
         <img src="{LOGO_URL}" width="28" height="31" alt="NeoBot" border="0"
@@ -733,11 +883,11 @@ async def send_custom_broadcast(
       </td></tr>
       <tr><td style="padding:8px 28px 16px;">
         <div style="font-family:Arial Black,Arial,sans-serif;font-size:18px;
-                    font-weight:900;color:#111111;line-height:1.3;">{safe_subject}</div>
+                    font-weight:900;color:#111111;line-height:1.3;">{v["subject"]}</div>
       </td></tr>
       <tr><td style="padding:0 28px 24px;">
         <div style="font-family:Arial,Helvetica,sans-serif;font-size:15px;color:#444444;
-                    line-height:1.7;">{safe_body}</div>
+                    line-height:1.7;">{v["body"]}</div>
       </td></tr>
       {_footer()}
     </table>
@@ -746,9 +896,50 @@ async def send_custom_broadcast(
 </body>
 </html>"""
 
+
+def _render_broadcast_html(subject: str, body: str) -> str:
+    """HTML du broadcast — body en texte brut, échappé (XSS-safe) puis converti en HTML."""
+    return _render_cached(
+        "broadcast", _card_broadcast, wrap=False,
+        subject=_esc.escape(subject),
+        body=_esc.escape(body).replace("\n", "<br>"),
+    )
+
+
+async def send_custom_broadcast(
+    to_email: str,
+    to_name: str,
+    subject: str,
+    body: str,
+) -> bool:
+    """
+    Email broadcast superadmin — envoi personnalisé à un client.
+    body est du texte brut, converti en HTML sécurisé (XSS-safe via _esc.escape).
+    """
     return await _send({
         "sender":      {"name": SENDER_NAME, "email": SENDER_EMAIL},
         "to":          [{"email": to_email, "name": to_name}],
         "subject":     subject,
-        "htmlContent": html_content,
+        "htmlContent": _render_broadcast_html(subject, body),
+    }, template="broadcast")
+
+
+async def send_broadcast_batch(
+    recipients: list[dict],
+    subject: str,
+    body: str,
+) -> bool:
+    """
+    Envoie le même broadcast à un lot de destinataires en UNE requête Brevo
+    (messageVersions : une version par destinataire, aucun ne voit les autres).
+    recipients : [{"email": ..., "name": ...}] — BROADCAST_BATCH_SIZE max.
+    Appelé par le job de broadcast (BroadcastService), avec retry.
+    """
+    if not recipients:
+        return True
+    return await _send_with_retry({
+        "sender":          {"name": SENDER_NAME, "email": SENDER_EMAIL},
+        "subject":         subject,
+        "htmlContent":     _render_broadcast_html(subject, body),
+        "messageVersions": [{"to": [r]} for r in recipients],
     })
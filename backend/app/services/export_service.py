@@ -0,0 +1,187 @@
+"""
+Export Service — Export streaming des conversations d'un tenant (BI)
+CSV ou NDJSON, gzip optionnel. Curseur serveur (yield_per / stream_results) :
+la mémoire reste constante quel que soit le volume du tenant.
+
+Reprise : chaque ligne porte un `cursor` opaque (pagination keyset sur messages.id).
+Après une coupure, rappeler l'export avec ?cursor=<dernier cursor reçu>.
+Les messages déjà déplacés en stockage froid (> 6 mois) ne sont pas inclus.
+"""
+
+import asyncio
+import base64
+import csv
+import io
+import json
+import zlib
+from datetime import datetime
+from typing import AsyncIterator, Iterator, Optional
+
+from sqlalchemy import select
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from ..models import Conversation, Message
+import logging
+
+logger = logging.getLogger(__name__)
+
+EXPORT_FORMATS = ("csv", "ndjson")
+EXPORT_DIRECTIONS = ("incoming", "outgoing")
+# Lignes par aller-retour DB (et par chunk HTTP)
+EXPORT_CHUNK_ROWS = 1000
+
+EXPORT_COLUMNS = [
+    "message_id",
+    "conversation_id",
+    "customer_phone",
+    "customer_name",
+    "outcome_type",
+    "direction",
+    "is_ai",
+    "content",
+    "created_at",
+    "cursor",
+]
+
+
+def encode_cursor(message_id: int) -> str:
+    raw = json.dumps({"after_id": message_id}, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(token: str) -> int:
+    """Retourne le dernier messages.id exporté. Lève ValueError si le token est invalide."""
+    padded = token + "=" * (-len(token) % 4)
+    try:
+        data = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        after_id = int(data["after_id"])
+    except Exception as exc:
+        raise ValueError("Curseur invalide") from exc
+    if after_id < 0:
+        raise ValueError("Curseur invalide")
+    return after_id
+
+
+class ExportService:
+    """Construit et sérialise l'export streaming des messages d'un tenant"""
+
+    @staticmethod
+    def _iter_chunks(
+        bind: Engine,
+        tenant_id: int,
+        after_id: int = 0,
+        date_from: Optional[datetime] = None,
+        date_to: Optional[datetime] = None,
+        outcome: Optional[str] = None,
+        direction: Optional[str] = None,
+    ) -> Iterator[list[dict]]:
+        """
+        Générateur synchrone de lots de lignes. Ouvre sa propre session : celle
+        de la requête est fermée avant la fin du streaming.
+        """
+        db = Session(bind=bind)
+        try:
+            stmt = (
+                select(
+                    Message.id,
+                    Message.conversation_id,
+                    Conversation.customer_phone,
+                    Conversation.customer_name,
+                    Conversation.outcome_type,
+                    Message.direction,
+                    Message.is_ai,
+                    Message.content,
+                    Message.created_at,
+                )
+                .join(Conversation, Conversation.id == Message.conversation_id)
+                .where(Conversation.tenant_id == tenant_id, Message.id > after_id)
+                .order_by(Message.id.asc())
+            )
+            if date_from:
+                stmt = stmt.where(Message.created_at >= date_from)
+            if date_to:
+                stmt = stmt.where(Message.created_at <= date_to)
+            if outcome:
+                stmt = stmt.where(Conversation.outcome_type == outcome)
+            if direction:
+                stmt = stmt.where(Message.direction == direction)
+
+            result = db.execute(
+                stmt.execution_options(stream_results=True, yield_per=EXPORT_CHUNK_ROWS)
+            )
+            for partition in result.partitions():
+                yield [
+                    {
+                        "message_id": r.id,
+                        "conversation_id": r.conversation_id,
+                        "customer_phone": r.customer_phone,
+                        "customer_name": r.customer_name,
+                        "outcome_type": r.outcome_type,
+                        "direction": r.direction,
+                        "is_ai": bool(r.is_ai),
+                        "content": r.content,
+                        "created_at": r.created_at.isoformat() if r.created_at else None,
+                        "cursor": encode_cursor(r.id),
+                    }
+                    for r in partition
+                ]
+        finally:
+            db.close()
+
+    @staticmethod
+    def _encode_csv(rows: list[dict], with_header: bool) -> bytes:
+        buf = io.StringIO()
+        writer = csv.DictWriter(buf, fieldnames=EXPORT_COLUMNS)
+        if with_header:
+            writer.writeheader()
+        writer.writerows(rows)
+        return buf.getvalue().encode("utf-8")
+
+    @staticmethod
+    def _encode_ndjson(rows: list[dict]) -> bytes:
+        return "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in rows).encode("utf-8")
+
+    @staticmethod
+    async def stream_export(
+        bind: Engine,
+        tenant_id: int,
+        fmt: str = "csv",
+        compress: bool = False,
+        **filters,
+    ) -> AsyncIterator[bytes]:
+        """
+        Générateur async pour StreamingResponse. Chaque lot DB est lu dans un thread
+        (l'event loop reste libre) ; si le client se déconnecte, le générateur est
+        fermé et la session/curseur serveur libérés.
+        """
+        chunks = ExportService._iter_chunks(bind, tenant_id, **filters)
+        # wbits=31 → en-tête + trailer gzip, compression incrémentale
+        gz = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+        first = True
+        exported = 0
+        try:
+            while True:
+                rows = await asyncio.to_thread(next, chunks, None)
+                if rows is None:
+                    break
+                if fmt == "csv":
+                    data = ExportService._encode_csv(rows, with_header=first)
+                else:
+                    data = ExportService._encode_ndjson(rows)
+                first = False
+                exported += len(rows)
+                if gz:
+                    data = gz.compress(data)
+                if data:
+                    yield data
+
+            if fmt == "csv" and first:
+                # Export vide : au moins l'en-tête CSV
+                data = ExportService._encode_csv([], with_header=True)
+                yield gz.compress(data) if gz else data
+            if gz:
+                yield gz.flush()
+            logger.info(f"📤 Export tenant={tenant_id} : {exported} lignes ({fmt}{'.gz' if compress else ''})")
+        finally:
+            await asyncio.to_thread(chunks.close)
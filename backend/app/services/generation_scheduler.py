@@ -0,0 +1,274 @@
+"""
+Generation Scheduler — Partage équitable des appels LLM entre tenants
+Un tenant qui lance une campagne ne doit pas monopoliser le pool DeepSeek :
+chaque appel de DeepSeekClient.call passe par un créneau (slot) de ce scheduler.
+
+  - Weighted fair queuing : chaque tenant a sa file ; à chaque créneau libéré on
+    sert la tête de file au plus petit tag de fin virtuel
+    (tag = max(temps virtuel, dernier tag du tenant) + coût / poids).
+    Poids selon le plan (PlanType) et le statut payant / essai.
+  - Plafond d'appels en vol par tenant + plafond global (GENERATION_MAX_CONCURRENCY).
+  - Load shedding : si l'attente prévue (ou réelle) dépasse le SLO de latence du
+    tenant, l'appel est refusé (GenerationShed) → l'appelant répond avec un message
+    d'attente prédéfini au lieu de faire patienter le client indéfiniment.
+  - Métriques : profondeur de file, en vol, attente p95, délestages (GET /api/admin/generation-scheduler).
+
+Périmètre : par process (chaque worker a ses créneaux). Les budgets de tokens
+sont portés par token_budget (persistés, partagés entre workers).
+"""
+
+import asyncio
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import Optional, Union
+import logging
+
+from ..models import PlanType
+
+logger = logging.getLogger(__name__)
+
+GENERATION_MAX_CONCURRENCY = int(os.getenv("GENERATION_MAX_CONCURRENCY", "24"))   # < pool deepseek (40)
+PROFILE_CACHE_SECONDS = 300
+
+# plan → (poids, appels en vol max, SLO d'attente en secondes)
+PLAN_CLASSES: dict[str, tuple[float, int, float]] = {
+    PlanType.NEOBOT.value:   (8.0, 8, 30.0),
+    PlanType.PRO.value:      (4.0, 6, 20.0),
+    PlanType.STANDARD.value: (2.0, 4, 20.0),
+    PlanType.BASIC.value:    (1.0, 3, 15.0),
+}
+TRIAL_WEIGHT_FACTOR = 0.5   # un essai gratuit pèse moitié moins que le même plan payant
+TRIAL_MAX_IN_FLIGHT = 2
+TRIAL_SLO_SECONDS = 10.0
+# Appels sans tenant (démo publique, outils plateforme)
+SHARED_KEY = "_shared"
+SHARED_CLASS = (1.0, 4, 10.0)
+
+TenantKey = Union[int, str]
+
+
+class GenerationShed(Exception):
+    """Appel refusé : la file du tenant dépasse son SLO de latence."""
+
+    def __init__(self, tenant: TenantKey, reason: str):
+        super().__init__(f"Génération délestée pour {tenant} ({reason})")
+        self.tenant = tenant
+        self.reason = reason
+
+
+@dataclass
+class TenantProfile:
+    weight: float
+    max_in_flight: int
+    slo_seconds: float
+    label: str
+
+
+def profile_for(plan: Optional[str], is_trial: bool) -> TenantProfile:
+    """Classe de service d'un tenant à partir de son plan et de son statut d'essai."""
+    plan = (plan.value if isinstance(plan, PlanType) else plan) or PlanType.BASIC.value
+    weight, cap, slo = PLAN_CLASSES.get(plan.upper(), PLAN_CLASSES[PlanType.BASIC.value])
+    if is_trial and plan.upper() != PlanType.NEOBOT.value:
+        return TenantProfile(weight * TRIAL_WEIGHT_FACTOR, min(cap, TRIAL_MAX_IN_FLIGHT), TRIAL_SLO_SECONDS, f"{plan}:trial")
+    return TenantProfile(weight, cap, slo, plan)
+
+
+class _Ticket:
+    __slots__ = ("tag", "start", "cost", "future", "enqueued_at")
+
+    def __init__(self, tag: float, start: float, cost: float, future: asyncio.Future):
+        self.tag = tag
+        self.start = start
+        self.cost = cost
+        self.future = future
+        self.enqueued_at = time.monotonic()
+
+
+class _TenantState:
+    def __init__(self, key: TenantKey, profile: TenantProfile):
+        self.key = key
+        self.profile = profile
+        self.queue: deque[_Ticket] = deque()
+        self.in_flight = 0
+        self.last_tag = 0.0
+        self.service_ewma = 2.0                      # durée moyenne d'un appel (s)
+        self.waits: deque[float] = deque(maxlen=200)
+        self.dispatched = 0
+        self.shed = 0
+        self.last_used = time.monotonic()
+
+    def predicted_wait(self) -> float:
+        """Attente estimée d'un nouvel arrivant : files devant lui / parallélisme autorisé."""
+        return (len(self.queue) + 1) * self.service_ewma / max(self.profile.max_in_flight, 1)
+
+
+class GenerationScheduler:
+
+    def __init__(self, max_concurrency: int = GENERATION_MAX_CONCURRENCY):
+        self.max_concurrency = max_concurrency
+        self._tenants: dict[TenantKey, _TenantState] = {}
+        self._profiles: dict[TenantKey, tuple[TenantProfile, float]] = {}
+        self._in_flight = 0
+        self._vtime = 0.0
+
+    # ── Profils (plan / essai), cache 5 min ──────────────────────────────────
+
+    def _load_profile(self, tenant: TenantKey) -> TenantProfile:
+        cached = self._profiles.get(tenant)
+        if cached and time.monotonic() - cached[1] < PROFILE_CACHE_SECONDS:
+            return cached[0]
+        if not isinstance(tenant, int):
+            return TenantProfile(*SHARED_CLASS, label="shared")
+        from ..database import SessionLocal
+        from ..models import Tenant
+        db = SessionLocal()
+        try:
+            row = db.query(Tenant.plan, Tenant.is_trial).filter(Tenant.id == tenant).first()
+        except Exception as exc:
+            logger.warning(f"⚠️ Profil tenant {tenant} illisible ({exc}) — classe BASIC")
+            row = None
+        finally:
+            db.close()
+        profile = profile_for(row.plan if row else None, bool(row.is_trial) if row else False)
+        self._profiles[tenant] = (profile, time.monotonic())
+        return profile
+
+    def set_profile(self, tenant: TenantKey, profile: TenantProfile) -> None:
+        """Force la classe d'un tenant (changement de plan, tests)."""
+        self._profiles[tenant] = (profile, time.monotonic())
+        if tenant in self._tenants:
+            self._tenants[tenant].profile = profile
+
+    def _state(self, tenant: TenantKey) -> _TenantState:
+        state = self._tenants.get(tenant)
+        profile = self._load_profile(tenant)
+        if state is None:
+            state = self._tenants[tenant] = _TenantState(tenant, profile)
+        state.profile = profile
+        state.last_used = time.monotonic()
+        return state
+
+    # ── Ordonnancement ────────────────────────────────────────────────────────
+
+    def _dispatch(self) -> None:
+        """Attribue les créneaux libres aux têtes de file au plus petit tag."""
+        while self._in_flight < self.max_concurrency:
+            best: Optional[_TenantState] = None
+            for state in self._tenants.values():
+                while state.queue and state.queue[0].future.done():
+                    state.queue.popleft()   # appelant parti (timeout, déconnexion)
+                if not state.queue or state.in_flight >= state.profile.max_in_flight:
+                    continue
+                if best is None or state.queue[0].tag < best.queue[0].tag:
+                    best = state
+            if best is None:
+                return
+            ticket = best.queue.popleft()
+            self._grant(best, ticket.start)
+            best.waits.append(time.monotonic() - ticket.enqueued_at)
+            ticket.future.set_result(True)
+
+    def _grant(self, state: _TenantState, start: float) -> None:
+        self._in_flight += 1
+        state.in_flight += 1
+        state.dispatched += 1
+        self._vtime = max(self._vtime, start)
+
+    def _release(self, state: _TenantState, started: float) -> None:
+        self._in_flight -= 1
+        state.in_flight -= 1
+        state.service_ewma = 0.8 * state.service_ewma + 0.2 * (time.monotonic() - started)
+        self._dispatch()
+
+    def _shed(self, state: _TenantState, reason: str) -> GenerationShed:
+        state.shed += 1
+        logger.warning(
+            f"🚦 Génération délestée tenant={state.key} ({state.profile.label}) : {reason} "
+            f"— file={len(state.queue)} en vol={state.in_flight}"
+        )
+        return GenerationShed(state.key, reason)
+
+    @asynccontextmanager
+    async def slot(self, tenant: Optional[TenantKey], cost: float = 1.0):
+        """
+        async with generation_scheduler.slot(tenant_id, cost=max_tokens / 100):
+            ... appel LLM ...
+        Lève GenerationShed si le SLO du tenant ne peut pas être tenu.
+        """
+        state = self._state(SHARED_KEY if tenant is None else tenant)
+        profile = state.profile
+        start = max(self._vtime, state.last_tag)
+        tag = start + cost / profile.weight
+
+        can_run_now = (
+            not state.queue
+            and state.in_flight < profile.max_in_flight
+            and self._in_flight < self.max_concurrency
+            and not any(s.queue for s in self._tenants.values())
+        )
+        if can_run_now:
+            state.last_tag = tag
+            self._grant(state, start)
+            state.waits.append(0.0)
+        else:
+            if state.predicted_wait() > profile.slo_seconds:
+                raise self._shed(state, "file pleine")
+            state.last_tag = tag
+            future = asyncio.get_running_loop().create_future()
+            state.queue.append(_Ticket(tag, start, cost, future))
+            self._dispatch()
+            try:
+                await asyncio.wait({future}, timeout=profile.slo_seconds)
+            except BaseException:
+                # Annulation de l'appelant : rendre le créneau s'il venait d'être attribué
+                if future.done() and not future.cancelled():
+                    self._in_flight -= 1
+                    state.in_flight -= 1
+                    self._dispatch()
+                else:
+                    future.cancel()
+                raise
+            if not future.done():
+                future.cancel()   # retiré de la file au prochain _dispatch
+                raise self._shed(state, f"attente > {profile.slo_seconds:.0f}s")
+
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self._release(state, started)
+
+    # ── Observabilité ─────────────────────────────────────────────────────────
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        tenants = {}
+        for key, state in list(self._tenants.items()):
+            if not state.queue and not state.in_flight and now - state.last_used > 3600:
+                del self._tenants[key]   # tenant inactif depuis 1h
+                continue
+            waits = sorted(state.waits)
+            tenants[str(key)] = {
+                "class": state.profile.label,
+                "weight": state.profile.weight,
+                "max_in_flight": state.profile.max_in_flight,
+                "slo_seconds": state.profile.slo_seconds,
+                "queued": sum(1 for t in state.queue if not t.future.done()),
+                "in_flight": state.in_flight,
+                "dispatched": state.dispatched,
+                "shed": state.shed,
+                "wait_p95_ms": round(waits[min(len(waits) - 1, int(len(waits) * 0.95))] * 1000) if waits else 0,
+                "service_ewma_ms": round(state.service_ewma * 1000),
+            }
+        return {
+            "max_concurrency": self.max_concurrency,
+            "in_flight": self._in_flight,
+            "queued": sum(t["queued"] for t in tenants.values()),
+            "tenants": tenants,
+        }
+
+
+generation_scheduler = GenerationScheduler()
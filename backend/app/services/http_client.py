@@ -1,106 +1,66 @@
 """
-Global HTTP Client avec Connection Pooling
-Utilisé pour les appels IA et APIs externes
-Optimisé pour performance (50% plus rapide que creating new client à chaque fois)
+Budget DeepSeek + client DeepSeek orienté instance (whatsapp_webhook, RAG).
+Les connexions passent par le pool "deepseek" du registre app/http_client.py.
 """
 
 import httpx
 import logging
 from typing import Optional
 
-logger = logging.getLogger(__name__)
-
-# Global async client (reused across all requests)
-_http_client: Optional[httpx.AsyncClient] = None
-
-
-def get_http_client() -> httpx.AsyncClient:
-    """
-    Get or create the global async HTTP client
-    With connection pooling for performance
-    """
-    global _http_client
-    
-    if _http_client is None:
-        logger.info("🌐 Initializing global HTTP client with pooling...")
-        _http_client = httpx.AsyncClient(
-            limits=httpx.Limits(
-                max_connections=100,
-                max_keepalive_connections=20
-            ),
-            timeout=httpx.Timeout(
-                timeout=30.0,      # Total timeout (increased from 5 seconds)
-                connect=5.0,       # Connection timeout
-                read=25.0,         # Read timeout
-                pool=2.0           # Pool timeout
-            ),
-            verify=True,
-            follow_redirects=True
-        )
-        logger.info("✅ Global HTTP client initialized")
-    
-    return _http_client
-
+from ..http_client import get_client, DEEPSEEK_BASE_URL
+from .generation_scheduler import generation_scheduler, GenerationShed
+from .token_budget import token_budget, TokenBudgetExceeded
 
-async def close_http_client():
-    """
-    Close the global HTTP client (called on app shutdown)
-    """
-    global _http_client
-    
-    if _http_client is not None:
-        logger.info("🔌 Closing global HTTP client...")
-        await _http_client.aclose()
-        _http_client = None
-        logger.info("✅ Global HTTP client closed")
-
-
-# ── Budget journalier DeepSeek (reset à minuit UTC) ──────────────────────────
-_ds_daily_calls: int = 0
-_ds_daily_reset: str = ""
-_DS_DAILY_LIMIT: int = 500   # max appels/jour — protège contre les fuites
+logger = logging.getLogger(__name__)
 
 
-def _ds_budget_ok() -> bool:
-    global _ds_daily_calls, _ds_daily_reset
-    from datetime import datetime as _dt, timezone as _tz
-    today = _dt.now(_tz.utc).strftime("%Y-%m-%d")
-    if _ds_daily_reset != today:
-        _ds_daily_calls = 0
-        _ds_daily_reset = today
-    if _ds_daily_calls >= _DS_DAILY_LIMIT:
-        logger.error("🚨 Budget journalier DeepSeek atteint (%d appels) — bloqué jusqu'à demain", _DS_DAILY_LIMIT)
-        return False
-    _ds_daily_calls += 1
-    return True
+def _usage_tokens(data: dict, messages: list, max_tokens: int) -> int:
+    """Tokens réellement consommés (usage DeepSeek), estimation chars/4 si absent."""
+    total = (data.get("usage") or {}).get("total_tokens")
+    if total:
+        return int(total)
+    return sum(len(m.get("content") or "") for m in messages) // 4 + max_tokens
 
 
 class DeepSeekClient:
     """
-    Client for DeepSeek API calls using global HTTP connection pooling
+    Client for DeepSeek API calls using the "deepseek" connection pool
     """
 
-    def __init__(self, api_key: str, base_url: str = "https://api.deepseek.com"):
+    def __init__(self, api_key: str, base_url: str = DEEPSEEK_BASE_URL):
         self.api_key = api_key
         self.base_url = base_url
         self.model = "deepseek-chat"
 
-    async def call(self, messages: list, temperature: float = 0.7, max_tokens: int = 200) -> str:
+    async def call(
+        self,
+        messages: list,
+        temperature: float = 0.7,
+        max_tokens: int = 200,
+        tenant_id: Optional[int] = None,
+        purpose: str = "webhook_reply",
+    ) -> str:
         """
-        Call DeepSeek API with the global pooled HTTP client
+        Call DeepSeek API with the "deepseek" pooled HTTP client
         
         Args:
             messages: List of message dicts with 'role' and 'content'
             temperature: Model temperature (0-1)
             max_tokens: Max tokens in response
+            tenant_id: Tenant for fair scheduling and token budget
+            purpose: Token budget bucket (webhook_reply, chat_test, ...)
         
         Returns:
             Response text from DeepSeek
+
+        Raises:
+            GenerationShed: the tenant's queue exceeds its latency SLO
+            TokenBudgetExceeded: the tenant's token bucket for this purpose is empty
         """
-        if not _ds_budget_ok():
-            raise Exception("Budget journalier DeepSeek atteint")
+        if not token_budget.allow(tenant_id, purpose):
+            raise TokenBudgetExceeded(tenant_id or 0, purpose)
 
-        client = get_http_client()
+        client = get_client("deepseek")
 
         payload = {
             "model": self.model,
@@ -115,20 +75,24 @@ class DeepSeekClient:
         }
         
         # Timeout AI-spécifique : DeepSeek peut prendre 30-45s pour des réponses
-        # complexes. Le client global a read=25s — trop court, coupe les réponses.
+        # complexes. Le pool deepseek a read=55s — marge supplémentaire ici.
         ai_timeout = httpx.Timeout(timeout=65.0, connect=5.0, read=60.0, write=5.0)
         try:
-            response = await client.post(
-                f"{self.base_url}/v1/chat/completions",
-                json=payload,
-                headers=headers,
-                timeout=ai_timeout,
-            )
+            async with generation_scheduler.slot(tenant_id, cost=max_tokens / 100):
+                response = await client.post(
+                    f"{self.base_url}/v1/chat/completions",
+                    json=payload,
+                    headers=headers,
+                    timeout=ai_timeout,
+                )
             response.raise_for_status()
             
             data = response.json()
+            token_budget.consume(tenant_id, purpose, _usage_tokens(data, messages, max_tokens))
             return data["choices"][0]["message"]["content"]
         
+        except GenerationShed:
+            raise
         except httpx.HTTPError as e:
             logger.error(f"❌ DeepSeek API error: {e}")
             raise
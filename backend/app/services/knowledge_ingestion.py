@@ -0,0 +1,325 @@
+"""
+Ingestion des sources de connaissance — job de fond (PDF)
+L'upload écrit le fichier sur disque en streaming (hash SHA-256 au fil de l'eau)
+et crée la source en 'pending' : aucune extraction dans la requête HTTP, la
+boucle d'événements (et donc le webhook) n'est jamais bloquée par pypdf.
+
+Le worker (lancé dans le lifespan) :
+  - réclame une source 'pending' dont le fichier est sur ce disque (SKIP LOCKED)
+  - extrait les pages en parallèle dans un pool de processus (tranches de pages)
+    puis enregistre le texte et passe la source en 'synced'
+  - progression visible dans sync_status : pending → extracting → synced | error
+  - même hash qu'une source déjà synchronisée → copie du contenu, pas de réextraction
+
+Les fichiers vivent dans KNOWLEDGE_UPLOAD_DIR le temps de l'ingestion (disque local
+de l'instance qui a reçu l'upload), puis sont supprimés.
+"""
+
+import asyncio
+import hashlib
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from typing import Optional
+
+import sentry_sdk
+from sqlalchemy.orm import Session
+
+from ..database import SessionLocal
+from ..models import AgentTemplate, KnowledgeSource
+import logging
+
+logger = logging.getLogger(__name__)
+
+KNOWLEDGE_UPLOAD_DIR = os.getenv(
+    "KNOWLEDGE_UPLOAD_DIR", os.path.join(tempfile.gettempdir(), "neobot_knowledge")
+)
+# Processus d'extraction PDF (0 = extraction dans un thread). Un seul par défaut :
+# chaque processus ajoute sa propre mémoire (pypdf + PDF ouvert) sur une petite instance
+KNOWLEDGE_PDF_WORKERS = int(os.getenv("KNOWLEDGE_PDF_WORKERS", "1"))
+MAX_PDF_BYTES = 10 * 1024 * 1024
+UPLOAD_READ_SIZE = 256 * 1024
+PAGES_PER_TASK = 8
+INGESTION_POLL_SECONDS = 10
+# Source restée 'extracting' au-delà (crash worker) → repasse en 'pending'
+PROCESSING_TIMEOUT = timedelta(minutes=15)
+# Source 'pending' dont le fichier n'est sur aucun disque au-delà → 'error'
+MISSING_FILE_TIMEOUT = timedelta(hours=1)
+
+IN_PROGRESS_STATUSES = ("pending", "extracting")
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+# Réveil immédiat du worker à chaque mise en file (sinon polling toutes les 10s)
+_wakeup: Optional[asyncio.Event] = None
+_wakeup_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+class UploadRejected(ValueError):
+    """Fichier refusé à l'upload (taille, format) — message affichable tel quel."""
+
+
+# ─── Upload ─────────────────────────────────────────────────────────────────
+
+async def save_upload(upload) -> tuple[str, str, int]:
+    """
+    Copie l'UploadFile sur disque par blocs, en calculant le SHA-256.
+    Retourne (chemin, hash, taille). Le fichier final est nommé par son hash :
+    deux uploads identiques partagent le même fichier.
+    """
+    os.makedirs(KNOWLEDGE_UPLOAD_DIR, exist_ok=True)
+    digest = hashlib.sha256()
+    size = 0
+    fd, tmp_path = tempfile.mkstemp(dir=KNOWLEDGE_UPLOAD_DIR, suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                block = await upload.read(UPLOAD_READ_SIZE)
+                if not block:
+                    break
+                if size == 0 and not block.startswith(b"%PDF-"):
+                    raise UploadRejected("Fichier PDF requis (.pdf)")
+                size += len(block)
+                if size > MAX_PDF_BYTES:
+                    raise UploadRejected("Fichier trop volumineux (max 10 Mo)")
+                digest.update(block)
+                await asyncio.to_thread(out.write, block)
+        if size == 0:
+            raise UploadRejected("Fichier PDF vide")
+        content_hash = digest.hexdigest()
+        path = os.path.join(KNOWLEDGE_UPLOAD_DIR, f"{content_hash}.pdf")
+        os.replace(tmp_path, path)
+        return path, content_hash, size
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def release_file(db: Session, path: Optional[str]) -> None:
+    """Supprime le fichier uploadé s'il n'est plus attendu par aucune source."""
+    if not path:
+        return
+    still_needed = db.query(KnowledgeSource.id).filter(
+        KnowledgeSource.file_path == path,
+        KnowledgeSource.sync_status.in_(IN_PROGRESS_STATUSES),
+    ).first()
+    if still_needed is None and os.path.exists(path):
+        try:
+            os.remove(path)
+        except OSError as exc:
+            logger.warning(f"⚠️ Suppression fichier d'ingestion impossible ({path}) : {exc}")
+
+
+# ─── Extraction (exécutée dans les processus du pool) ───────────────────────
+
+def _pdf_page_count(path: str) -> int:
+    import pypdf
+    return len(pypdf.PdfReader(path).pages)
+
+
+def _extract_page_range(path: str, start: int, stop: int) -> list[str]:
+    """Texte des pages [start, stop) — chaque processus rouvre le fichier."""
+    import pypdf
+    reader = pypdf.PdfReader(path)
+    return [(reader.pages[i].extract_text() or "").strip() for i in range(start, stop)]
+
+
+def _get_pool() -> Optional[ProcessPoolExecutor]:
+    global _pool
+    if _pool is None and KNOWLEDGE_PDF_WORKERS > 0:
+        _pool = ProcessPoolExecutor(max_workers=KNOWLEDGE_PDF_WORKERS)
+    return _pool
+
+
+def shutdown_ingestion_pool() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+async def extract_pdf_text(path: str) -> str:
+    """Extrait le texte du PDF, tranches de PAGES_PER_TASK pages en parallèle hors boucle."""
+    loop = asyncio.get_running_loop()
+    pool = _get_pool()
+    pages = await loop.run_in_executor(pool, _pdf_page_count, path)
+    ranges = [(start, min(start + PAGES_PER_TASK, pages)) for start in range(0, pages, PAGES_PER_TASK)]
+    parts = await asyncio.gather(*(
+        loop.run_in_executor(pool, _extract_page_range, path, start, stop) for start, stop in ranges
+    ))
+    return "\n\n".join(text for part in parts for text in part if text)
+
+
+# ─── Dédup par hash ─────────────────────────────────────────────────────────
+
+def find_synced_duplicate(db: Session, content_hash: str, exclude_id: Optional[int] = None) -> Optional[KnowledgeSource]:
+    query = db.query(KnowledgeSource).filter(
+        KnowledgeSource.content_hash == content_hash,
+        KnowledgeSource.sync_status == "synced",
+        KnowledgeSource.content_extracted != None,
+    )
+    if exclude_id is not None:
+        query = query.filter(KnowledgeSource.id != exclude_id)
+    return query.order_by(KnowledgeSource.id.asc()).first()
+
+
+def copy_content(source: KnowledgeSource, original: KnowledgeSource) -> None:
+    """Réutilise le texte d'une source identique déjà ingérée."""
+    set_content(source, original.content_extracted)
+
+
+def set_content(source: KnowledgeSource, text: str) -> None:
+    """Enregistre le texte extrait, passe la source en 'synced'."""
+    source.content_extracted = text
+    source.content_preview = text[:500]
+    source.sync_status = "synced"
+    source.sync_error = None
+    source.last_synced_at = datetime.utcnow()
+
+
+def _refresh_prompt_score(db: Session, agent_id: int) -> None:
+    from .agent_service import compute_prompt_score
+    agent = db.query(AgentTemplate).filter(AgentTemplate.id == agent_id).first()
+    if agent:
+        agent.prompt_score = compute_prompt_score(agent, db)
+
+
+# ─── Worker ─────────────────────────────────────────────────────────────────
+
+def enqueue_ingestion() -> None:
+    """Réveille le worker : une source vient d'être mise en 'pending'."""
+    if _wakeup is None or _wakeup_loop is None or _wakeup_loop.is_closed():
+        return
+    try:
+        if asyncio.get_running_loop() is _wakeup_loop:
+            _wakeup.set()
+            return
+    except RuntimeError:
+        pass
+    _wakeup_loop.call_soon_threadsafe(_wakeup.set)
+
+
+class KnowledgeIngestionWorker:
+    """Consommation des sources 'pending' avec fichier à ingérer"""
+
+    @staticmethod
+    def recover_stale(db: Session) -> int:
+        """Remet en 'pending' les sources bloquées en cours d'ingestion (crash worker)."""
+        count = db.query(KnowledgeSource).filter(
+            KnowledgeSource.sync_status == "extracting",
+            KnowledgeSource.updated_at < datetime.utcnow() - PROCESSING_TIMEOUT,
+        ).update({"sync_status": "pending"}, synchronize_session=False)
+        db.commit()
+        return count
+
+    @staticmethod
+    def claim(db: Session) -> Optional[KnowledgeSource]:
+        """
+        Réclame une source dont le fichier est sur ce disque. SKIP LOCKED : deux
+        workers ne prennent jamais la même. Fichier absent depuis trop longtemps
+        (instance redémarrée entre l'upload et l'ingestion) → 'error'.
+        """
+        now = datetime.utcnow()
+        candidates = (
+            db.query(KnowledgeSource)
+            .filter(KnowledgeSource.sync_status == "pending", KnowledgeSource.file_path != None)
+            .order_by(KnowledgeSource.created_at.asc(), KnowledgeSource.id.asc())
+            .limit(10)
+            .with_for_update(skip_locked=True)
+            .all()
+        )
+        claimed = None
+        for source in candidates:
+            if os.path.exists(source.file_path):
+                if claimed is None:
+                    source.sync_status = "extracting"
+                    claimed = source
+            elif source.created_at and source.created_at < now - MISSING_FILE_TIMEOUT:
+                source.sync_status = "error"
+                source.sync_error = "Fichier introuvable — merci de réimporter le PDF"
+        db.commit()
+        return claimed
+
+    @staticmethod
+    async def process(db: Session, source: KnowledgeSource) -> None:
+        started = time.perf_counter()
+        path = source.file_path
+        try:
+            original = find_synced_duplicate(db, source.content_hash, exclude_id=source.id) if source.content_hash else None
+            if original is not None:
+                copy_content(source, original)
+                logger.info(f"♻️ Source {source.id} : PDF déjà ingéré (source {original.id}) — contenu copié")
+            else:
+                try:
+                    text = await extract_pdf_text(path)
+                except ImportError:
+                    # pypdf pas installé — sauvegarder quand même avec un placeholder
+                    logger.warning("pypdf not installed — PDF text extraction skipped")
+                    text = f"[Contenu PDF : {source.name or os.path.basename(path)}]"
+
+                if not text.strip():
+                    source.sync_status = "error"
+                    source.sync_error = "Le PDF ne contient pas de texte extractible (PDF image/scanné)"
+                else:
+                    set_content(source, text)
+                    logger.info(
+                        f"📄 Source {source.id} ingérée : {len(text)} caractères "
+                        f"en {time.perf_counter() - started:.1f}s"
+                    )
+            source.file_path = None
+            _refresh_prompt_score(db, source.agent_id)
+            db.commit()
+        except Exception as exc:
+            db.rollback()
+            logger.error(f"❌ Ingestion source {source.id} échouée : {exc}")
+            sentry_sdk.capture_exception(exc)
+            source.sync_status = "error"
+            source.sync_error = f"Impossible d'extraire le texte du PDF : {exc}"[:500]
+            source.file_path = None
+            db.commit()
+        release_file(db, path)
+
+    @staticmethod
+    async def process_once(db: Session) -> int:
+        """Ingère une source. Retourne 1 si une source a été traitée, 0 sinon."""
+        source = KnowledgeIngestionWorker.claim(db)
+        if source is None:
+            return 0
+        await KnowledgeIngestionWorker.process(db, source)
+        return 1
+
+
+async def knowledge_ingestion_loop() -> None:
+    """Background task : ingère les sources dès leur mise en file (polling 10s en secours)."""
+    global _wakeup, _wakeup_loop
+    _wakeup = asyncio.Event()
+    _wakeup_loop = asyncio.get_running_loop()
+    last_maintenance = 0.0
+
+    while True:
+        processed = 0
+        db = SessionLocal()
+        try:
+            if time.monotonic() - last_maintenance > 600:
+                recovered = KnowledgeIngestionWorker.recover_stale(db)
+                if recovered:
+                    logger.info(f"🔁 Ingestion : {recovered} sources bloquées remises en file")
+                last_maintenance = time.monotonic()
+            processed = await KnowledgeIngestionWorker.process_once(db)
+        except Exception as exc:
+            sentry_sdk.capture_exception(exc)
+            logger.error(f"❌ knowledge_ingestion_loop error: {exc}")
+            db.rollback()
+        finally:
+            db.close()
+
+        if processed:
+            continue   # Encore du travail possible : pas d'attente
+        try:
+            await asyncio.wait_for(_wakeup.wait(), timeout=INGESTION_POLL_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+        _wakeup.clear()
@@ -0,0 +1,370 @@
+"""
+Synchronisation des sources de connaissance URL / YouTube — worker de fond
+add_knowledge_source crée la source en 'pending' et réveille le worker ; ensuite
+chaque source est rafraîchie toutes les KNOWLEDGE_REFRESH_HOURS.
+
+Le worker (lancé dans le lifespan) :
+  - réclame un lot de sources dues (pending, ou next_sync_at échu) — SKIP LOCKED,
+    next_sync_at sert de bail pendant le fetch (crash → reprise à l'échéance)
+  - fetch en parallèle borné via le pool HTTP "knowledge-fetch"
+  - GET conditionnel (If-None-Match / If-Modified-Since) : page inchangée = un 304
+  - texte lisible extrait au fil du téléchargement (HTMLParser incrémental, plafonné)
+  - contenu réécrit seulement si le hash du texte change → invalidation du cache de prompt
+
+YouTube : titre + description de la page (balises meta) — pas de transcription.
+Sécurité : http(s) uniquement, adresses non publiques refusées à chaque saut de
+redirection (la source est fournie par le tenant, le fetch part de nos serveurs).
+"""
+
+import asyncio
+import codecs
+import hashlib
+import ipaddress
+import os
+import random
+import time
+from datetime import datetime, timedelta
+from html.parser import HTMLParser
+from typing import Optional
+
+import httpx
+import sentry_sdk
+from sqlalchemy.orm import Session
+
+from ..database import SessionLocal
+from ..http_client import get_client
+from ..models import KnowledgeSource, KnowledgeSourceType
+from .knowledge_ingestion import set_content
+import logging
+
+logger = logging.getLogger(__name__)
+
+KNOWLEDGE_REFRESH_HOURS = float(os.getenv("KNOWLEDGE_REFRESH_HOURS", "24"))
+KNOWLEDGE_SYNC_CONCURRENCY = int(os.getenv("KNOWLEDGE_SYNC_CONCURRENCY", "5"))
+# Dev/tests uniquement : autorise les URL locales (127.0.0.1, réseau privé)
+KNOWLEDGE_FETCH_ALLOW_PRIVATE = os.getenv("KNOWLEDGE_FETCH_ALLOW_PRIVATE", "false").lower() == "true"
+SYNC_BATCH_SIZE = 20
+SYNC_POLL_SECONDS = 60
+# Bail de réclamation : au-delà, une source restée en cours (crash) est reprise
+FETCH_LEASE = timedelta(minutes=5)
+ERROR_RETRY_DELAY = timedelta(hours=1)
+MAX_REDIRECTS = 5
+MAX_FETCH_BYTES = 3 * 1024 * 1024
+MAX_TEXT_CHARS = 100_000
+USER_AGENT = "NeoBot-KnowledgeSync/1.0 (+https://neobot-ai.com)"
+
+SYNCED_TYPES = (KnowledgeSourceType.URL, KnowledgeSourceType.YOUTUBE)
+
+# Réveil immédiat du worker à chaque nouvelle source (sinon polling toutes les 60s)
+_wakeup: Optional[asyncio.Event] = None
+_wakeup_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+class FetchRejected(Exception):
+    """URL refusée ou réponse inexploitable — message enregistré dans sync_error."""
+
+
+# ─── Extraction du texte lisible ────────────────────────────────────────────
+
+class ReadableTextParser(HTMLParser):
+    """
+    Texte lisible d'une page HTML, alimenté bloc par bloc (feed) pendant le
+    téléchargement. Ignore scripts, styles, navigation et formulaires ;
+    meta_only=True ne garde que le titre et la description (pages YouTube).
+    """
+
+    SKIP_TAGS = {"script", "style", "noscript", "svg", "template", "iframe", "nav", "footer", "form", "button", "select"}
+    BLOCK_TAGS = {
+        "p", "div", "br", "li", "ul", "ol", "tr", "td", "th", "table", "section", "article", "main",
+        "header", "aside", "blockquote", "pre", "dd", "dt", "h1", "h2", "h3", "h4", "h5", "h6",
+    }
+
+    def __init__(self, meta_only: bool = False):
+        super().__init__(convert_charrefs=True)
+        self.meta_only = meta_only
+        self.og_title = ""
+        self.description = ""
+        self.size = 0
+        self._skip = 0
+        self._in_title = False
+        self._title: list[str] = []
+        self._current: list[str] = []
+        self._lines: list[str] = []
+
+    @property
+    def title(self) -> str:
+        return self.og_title or " ".join("".join(self._title).split())
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIP_TAGS:
+            self._skip += 1
+        elif tag == "title":
+            self._in_title = True
+        elif tag == "meta":
+            attrs = dict(attrs)
+            key = (attrs.get("name") or attrs.get("property") or "").lower()
+            content = " ".join((attrs.get("content") or "").split())
+            if key in ("description", "og:description") and not self.description:
+                self.description = content
+            elif key == "og:title" and content:
+                self.og_title = content
+        if tag in self.BLOCK_TAGS:
+            self._break()
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIP_TAGS:
+            self._skip = max(self._skip - 1, 0)
+        elif tag == "title":
+            self._in_title = False
+        if tag in self.BLOCK_TAGS:
+            self._break()
+
+    def handle_data(self, data):
+        if self._in_title:
+            self._title.append(data)
+        elif not self._skip and not self.meta_only:
+            self._current.append(data)
+            self.size += len(data)
+
+    def _break(self):
+        line = " ".join("".join(self._current).split())
+        self._current = []
+        if line and (not self._lines or self._lines[-1] != line):
+            self._lines.append(line)
+
+    def text(self) -> str:
+        self._break()
+        title = self.title
+        parts = [p for p in (title, self.description) if p]
+        parts += [line for line in self._lines if line not in parts]
+        return "\n".join(parts)[:MAX_TEXT_CHARS]
+
+
+# ─── Fetch ──────────────────────────────────────────────────────────────────
+
+async def _check_public_url(url: httpx.URL) -> None:
+    if url.scheme not in ("http", "https") or not url.host:
+        raise FetchRejected("URL invalide (http ou https uniquement)")
+    if KNOWLEDGE_FETCH_ALLOW_PRIVATE:
+        return
+    port = url.port or (443 if url.scheme == "https" else 80)
+    try:
+        infos = await asyncio.get_running_loop().getaddrinfo(url.host, port)
+    except OSError:
+        raise FetchRejected(f"Domaine introuvable : {url.host}")
+    for info in infos:
+        if not ipaddress.ip_address(info[4][0]).is_global:
+            raise FetchRejected("Adresse non publique refusée")
+
+
+async def fetch_source(url: str, source_type: str, etag: Optional[str] = None,
+                       last_modified: Optional[str] = None) -> dict:
+    """
+    GET conditionnel de la source. Retourne
+      {"not_modified": True}                                   (304)
+      {"text", "etag", "last_modified"}                        (200, texte extrait)
+    Lève FetchRejected / httpx.HTTPError sinon.
+    """
+    headers = {"User-Agent": USER_AGENT, "Accept": "text/html,application/xhtml+xml,text/plain;q=0.9"}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+
+    client = get_client("knowledge-fetch")
+    target = httpx.URL(url)
+    for _ in range(MAX_REDIRECTS + 1):
+        await _check_public_url(target)
+        async with client.stream("GET", target, headers=headers) as resp:
+            if resp.has_redirect_location:
+                target = resp.next_request.url
+                continue
+            if resp.status_code == 304:
+                return {"not_modified": True}
+            if resp.status_code != 200:
+                raise FetchRejected(f"La page a répondu {resp.status_code}")
+
+            content_type = resp.headers.get("content-type", "text/html").split(";")[0].strip().lower()
+            if content_type not in ("text/html", "application/xhtml+xml", "text/plain"):
+                raise FetchRejected(f"Type de contenu non pris en charge : {content_type}")
+
+            decoder = codecs.getincrementaldecoder(resp.charset_encoding or "utf-8")(errors="replace")
+            parser = ReadableTextParser(meta_only=source_type == KnowledgeSourceType.YOUTUBE)
+            plain: list[str] = []
+            received = 0
+            async for block in resp.aiter_bytes():
+                received += len(block)
+                chunk = decoder.decode(block)
+                if content_type == "text/plain":
+                    plain.append(chunk)
+                else:
+                    parser.feed(chunk)
+                if received > MAX_FETCH_BYTES or parser.size > MAX_TEXT_CHARS:
+                    break   # assez de texte : on coupe le téléchargement
+            if content_type == "text/plain":
+                text = "".join(plain)[:MAX_TEXT_CHARS].strip()
+            else:
+                parser.close()
+                text = parser.text()
+            return {
+                "text": text,
+                "etag": resp.headers.get("etag"),
+                "last_modified": resp.headers.get("last-modified"),
+            }
+    raise FetchRejected("Trop de redirections")
+
+
+# ─── Worker ─────────────────────────────────────────────────────────────────
+
+def enqueue_sync() -> None:
+    """Réveille le worker : une source URL/YouTube vient d'être créée."""
+    if _wakeup is None or _wakeup_loop is None or _wakeup_loop.is_closed():
+        return
+    try:
+        if asyncio.get_running_loop() is _wakeup_loop:
+            _wakeup.set()
+            return
+    except RuntimeError:
+        pass
+    _wakeup_loop.call_soon_threadsafe(_wakeup.set)
+
+
+def _keep_version(row: KnowledgeSource) -> None:
+    """
+    UPDATE sans toucher updated_at (SET updated_at = updated_at) : updated_at sert
+    de version au cache du prompt (agent_service) et ne doit bouger qu'au
+    changement de contenu — pas à chaque réclamation ou 304.
+    """
+    row.updated_at = KnowledgeSource.updated_at
+
+
+def _next_refresh(now: datetime) -> datetime:
+    # ±10 % : les sources ajoutées ensemble ne se rafraîchissent pas toutes ensemble
+    return now + timedelta(hours=KNOWLEDGE_REFRESH_HOURS * random.uniform(0.9, 1.1))
+
+
+class KnowledgeSyncWorker:
+    """Rafraîchissement des sources URL / YouTube"""
+
+    @staticmethod
+    def claim_batch(db: Session, limit: int = SYNC_BATCH_SIZE) -> list[KnowledgeSource]:
+        """
+        Réclame les sources dues. Une source déjà synchronisée reste 'synced'
+        (toujours servie dans le prompt) pendant son rafraîchissement.
+        """
+        now = datetime.utcnow()
+        rows = (
+            db.query(KnowledgeSource)
+            .filter(
+                KnowledgeSource.source_type.in_(SYNCED_TYPES),
+                KnowledgeSource.source_url != None,
+                (KnowledgeSource.next_sync_at == None) | (KnowledgeSource.next_sync_at <= now),
+            )
+            .order_by(KnowledgeSource.next_sync_at.asc().nullsfirst(), KnowledgeSource.id.asc())
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+            .all()
+        )
+        for row in rows:
+            if row.sync_status == "pending":
+                row.sync_status = "fetching"
+            row.next_sync_at = now + FETCH_LEASE
+            _keep_version(row)
+        db.commit()
+        return rows
+
+    @staticmethod
+    async def process_once(db: Session, limit: int = SYNC_BATCH_SIZE) -> int:
+        """Synchronise un lot. Retourne le nombre de sources traitées."""
+        from .agent_service import invalidate_prompt_cache
+
+        rows = KnowledgeSyncWorker.claim_batch(db, limit)
+        if not rows:
+            return 0
+
+        semaphore = asyncio.Semaphore(KNOWLEDGE_SYNC_CONCURRENCY)
+        jobs = [(row, row.source_url, row.source_type, row.etag, row.last_modified) for row in rows]
+
+        async def _one(url, source_type, etag, last_modified):
+            async with semaphore:
+                try:
+                    return await fetch_source(url, source_type, etag, last_modified), None
+                except FetchRejected as exc:
+                    return None, str(exc)
+                except httpx.HTTPError as exc:
+                    return None, f"Page injoignable ({type(exc).__name__})"
+                except Exception as exc:
+                    logger.warning(f"⚠️ Lecture de {url} impossible : {exc}")
+                    return None, "Contenu de la page illisible"
+
+        started = time.perf_counter()
+        results = await asyncio.gather(*(_one(*job[1:]) for job in jobs))
+
+        now = datetime.utcnow()
+        changed = unchanged = failed = 0
+        for (row, *_), (result, error) in zip(jobs, results):
+            if error is not None:
+                failed += 1
+                # Une source déjà synchronisée garde son contenu : on réessaie plus tard
+                if row.sync_status != "synced":
+                    row.sync_status = "error"
+                row.sync_error = error[:500]
+                row.next_sync_at = now + ERROR_RETRY_DELAY
+                _keep_version(row)
+                continue
+
+            text = result.get("text")
+            text_hash = hashlib.sha256(text.encode()).hexdigest() if text else None
+            if result.get("not_modified") or (text_hash and text_hash == row.content_hash and row.sync_status == "synced"):
+                unchanged += 1
+                _keep_version(row)
+                if not result.get("not_modified"):
+                    row.etag, row.last_modified = result["etag"], result["last_modified"]
+                row.sync_error = None
+            elif not text:
+                failed += 1
+                if row.sync_status != "synced":
+                    row.sync_status = "error"
+                row.sync_error = "Aucun texte lisible sur cette page"
+                _keep_version(row)
+            else:
+                changed += 1
+                set_content(row, text)
+                row.content_hash = text_hash
+                row.etag, row.last_modified = result["etag"], result["last_modified"]
+                invalidate_prompt_cache(row.agent_id)
+            row.last_synced_at = now
+            row.next_sync_at = _next_refresh(now)
+        db.commit()
+        logger.info(
+            f"🌐 Sync connaissances : {len(rows)} sources en {time.perf_counter() - started:.1f}s "
+            f"({changed} modifiées, {unchanged} inchangées, {failed} en échec)"
+        )
+        return len(rows)
+
+
+async def knowledge_sync_loop() -> None:
+    """Background task : synchronise les sources dues (réveil à chaque ajout, polling 60s)."""
+    global _wakeup, _wakeup_loop
+    _wakeup = asyncio.Event()
+    _wakeup_loop = asyncio.get_running_loop()
+
+    while True:
+        processed = 0
+        db = SessionLocal()
+        try:
+            processed = await KnowledgeSyncWorker.process_once(db)
+        except Exception as exc:
+            sentry_sdk.capture_exception(exc)
+            logger.error(f"❌ knowledge_sync_loop error: {exc}")
+            db.rollback()
+        finally:
+            db.close()
+
+        if processed >= SYNC_BATCH_SIZE:
+            continue   # Encore du travail : pas d'attente
+        try:
+            await asyncio.wait_for(_wakeup.wait(), timeout=SYNC_POLL_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+        _wakeup.clear()
@@ -10,8 +10,8 @@ import hmac
 import os
 import logging
 from typing import Optional
-import httpx
 import sentry_sdk
+from ..http_client import get_client
 
 logger = logging.getLogger(__name__)
 
@@ -139,14 +139,14 @@ async def initialize_charge(
         "Content-Type": "application/json",
     }
 
-    async with httpx.AsyncClient(timeout=15.0) as client:
-        response = await client.post(
-            f"{KORAPAY_BASE_URL}/charges/initialize",
-            json=payload,
-            headers=headers,
-        )
-        response.raise_for_status()
-        data = response.json()
+    client = get_client("korapay")
+    response = await client.post(
+        f"{KORAPAY_BASE_URL}/charges/initialize",
+        json=payload,
+        headers=headers,
+    )
+    response.raise_for_status()
+    data = response.json()
 
     logger.info("Korapay charge créée — ref: %s, amount: %s %s", reference, amount, currency)
     return data
@@ -166,13 +166,13 @@ async def verify_transaction(reference: str) -> dict:
         "Authorization": f"Bearer {_get_secret_key()}",
     }
 
-    async with httpx.AsyncClient(timeout=10.0) as client:
-        response = await client.get(
-            f"{KORAPAY_BASE_URL}/charges/{reference}",
-            headers=headers,
-        )
-        response.raise_for_status()
-        return response.json()
+    client = get_client("korapay")
+    response = await client.get(
+        f"{KORAPAY_BASE_URL}/charges/{reference}",
+        headers=headers,
+    )
+    response.raise_for_status()
+    return response.json()
 
 
 # ─── Extraction des données d'un webhook Korapay ─────────────────────────────
@@ -0,0 +1,279 @@
+"""
+Media Store — Images produits adressées par contenu (SHA-256)
+Les produits (TenantBusinessConfig.products_services) ne gardent qu'une référence
+"image_id" : le JSON reste léger, chaque requête qui charge la config business
+(preamble du prompt, persona, détection d'images du webhook) ne tire plus de base64.
+
+À l'upload, l'image est décodée une seule fois : orientation EXIF appliquée,
+redimensionnée (900 px max), recompressée en JPEG progressif + vignette 200 px.
+Clé = SHA-256 du JPEG final : deux uploads identiques → un seul objet.
+
+Servies par GET /media/{sha}.jpg et /media/{sha}.thumb.jpg (cache 1 an, immutable).
+Le service WhatsApp télécharge l'image en streaming depuis cette URL.
+
+MEDIA_STORE :
+  db     (défaut) table media_blobs — durable, aucune infra en plus
+  local  fichiers sous MEDIA_DIR/ab/abcd….jpg — disque persistant requis
+"""
+
+import base64
+import binascii
+import hashlib
+import io
+import os
+import re
+import threading
+from typing import Optional
+
+from ..database import SessionLocal
+from ..models import MediaBlob
+import logging
+
+logger = logging.getLogger(__name__)
+
+MEDIA_STORE = os.getenv("MEDIA_STORE", "db").lower()
+MEDIA_DIR = os.getenv("MEDIA_DIR", "media")
+MAX_UPLOAD_BYTES = 8 * 1024 * 1024
+MAX_SIDE = 900
+THUMB_SIDE = 200
+JPEG_QUALITY = 82
+THUMB_QUALITY = 75
+MAX_PIXELS = 40_000_000          # bombe de décompression → refus
+CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+VARIANTS = ("full", "thumb")
+_MEDIA_PATH_RE = re.compile(r"(?:^|/)media/([0-9a-f]{64})(\.thumb)?\.jpg$")
+_SHA_RE = re.compile(r"^[0-9a-f]{64}$")
+
+
+class MediaRejected(ValueError):
+    """Image refusée (illisible, trop lourde) — message affichable tel quel."""
+
+
+# ─── Backends ───────────────────────────────────────────────────────────────
+
+class MediaStore:
+    """Interface commune. Les objets sont immuables : put() d'une clé existante = no-op."""
+
+    name = "base"
+
+    def put(self, sha: str, variant: str, data: bytes) -> None:
+        raise NotImplementedError
+
+    def get(self, sha: str, variant: str) -> Optional[bytes]:
+        raise NotImplementedError
+
+    def exists(self, sha: str, variant: str = "full") -> bool:
+        raise NotImplementedError
+
+    def path(self, sha: str, variant: str) -> Optional[str]:
+        """Chemin local servable directement (FileResponse), None si le backend n'a pas de fichier."""
+        return None
+
+
+class LocalMediaStore(MediaStore):
+    name = "local"
+
+    def __init__(self, root: str = MEDIA_DIR):
+        self.root = root
+
+    def _file(self, sha: str, variant: str) -> str:
+        suffix = ".thumb.jpg" if variant == "thumb" else ".jpg"
+        return os.path.join(self.root, sha[:2], f"{sha}{suffix}")
+
+    def put(self, sha: str, variant: str, data: bytes) -> None:
+        target = self._file(sha, variant)
+        if os.path.exists(target):
+            return
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        tmp = f"{target}.{os.getpid()}.{threading.get_ident()}.part"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, target)      # atomique : jamais de fichier à moitié écrit servi
+
+    def get(self, sha: str, variant: str) -> Optional[bytes]:
+        target = self._file(sha, variant)
+        if not os.path.exists(target):
+            return None
+        with open(target, "rb") as f:
+            return f.read()
+
+    def exists(self, sha: str, variant: str = "full") -> bool:
+        return os.path.exists(self._file(sha, variant))
+
+    def path(self, sha: str, variant: str) -> Optional[str]:
+        target = self._file(sha, variant)
+        return target if os.path.exists(target) else None
+
+
+class DatabaseMediaStore(MediaStore):
+    """Table media_blobs (BYTEA) — lue uniquement par GET /media, jamais par les requêtes de config."""
+
+    name = "db"
+
+    def put(self, sha: str, variant: str, data: bytes) -> None:
+        from sqlalchemy.exc import IntegrityError
+        db = SessionLocal()
+        try:
+            if self._exists(db, sha, variant):
+                return
+            db.add(MediaBlob(sha256=sha, variant=variant, content_type="image/jpeg", size_bytes=len(data), data=data))
+            db.commit()
+        except IntegrityError:
+            db.rollback()            # upload concurrent du même contenu : déjà stocké
+        finally:
+            db.close()
+
+    def get(self, sha: str, variant: str) -> Optional[bytes]:
+        db = SessionLocal()
+        try:
+            row = db.query(MediaBlob.data).filter(MediaBlob.sha256 == sha, MediaBlob.variant == variant).first()
+            return bytes(row.data) if row else None
+        finally:
+            db.close()
+
+    def exists(self, sha: str, variant: str = "full") -> bool:
+        db = SessionLocal()
+        try:
+            return self._exists(db, sha, variant)
+        finally:
+            db.close()
+
+    @staticmethod
+    def _exists(db, sha: str, variant: str) -> bool:
+        return db.query(MediaBlob.sha256).filter(MediaBlob.sha256 == sha, MediaBlob.variant == variant).first() is not None
+
+
+_store: Optional[MediaStore] = None
+_store_lock = threading.Lock()
+
+
+def get_media_store() -> MediaStore:
+    """Store du process (construit au premier appel selon MEDIA_STORE)."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = LocalMediaStore() if MEDIA_STORE == "local" else DatabaseMediaStore()
+                logger.info(f"🖼️ Media store : {_store.name}")
+    return _store
+
+
+def set_media_store(store: Optional[MediaStore]) -> None:
+    """Remplace le store (tests, scripts). None = reconstruit depuis MEDIA_STORE."""
+    global _store
+    with _store_lock:
+        _store = store
+
+
+# ─── Traitement d'image (une seule fois, à l'upload) ────────────────────────
+
+def _encode_jpeg(image, quality: int) -> bytes:
+    out = io.BytesIO()
+    image.save(out, format="JPEG", quality=quality, optimize=True, progressive=True)
+    return out.getvalue()
+
+
+def prepare_image(data: bytes) -> dict:
+    """Octets bruts → {"full", "thumb", "width", "height"} en JPEG. Lève MediaRejected."""
+    from PIL import Image, ImageOps
+
+    if not data:
+        raise MediaRejected("Image vide")
+    if len(data) > MAX_UPLOAD_BYTES:
+        raise MediaRejected("Image trop volumineuse (max 8 Mo)")
+    try:
+        with Image.open(io.BytesIO(data)) as probe:
+            if probe.width * probe.height > MAX_PIXELS:
+                raise MediaRejected("Image trop grande (dimensions)")
+            image = ImageOps.exif_transpose(probe)
+            image.load()
+    except MediaRejected:
+        raise
+    except Exception:
+        raise MediaRejected("Fichier image non lisible")
+
+    if image.mode not in ("RGB", "L"):
+        # Transparence (PNG, WebP) aplatie sur fond blanc — le JPEG n'a pas d'alpha
+        background = Image.new("RGB", image.size, (255, 255, 255))
+        rgba = image.convert("RGBA")
+        background.paste(rgba, mask=rgba.getchannel("A"))
+        image = background
+    image.thumbnail((MAX_SIDE, MAX_SIDE), Image.LANCZOS)
+    full = _encode_jpeg(image, JPEG_QUALITY)
+    thumb = image.copy()
+    thumb.thumbnail((THUMB_SIDE, THUMB_SIDE), Image.LANCZOS)
+    return {"full": full, "thumb": _encode_jpeg(thumb, THUMB_QUALITY), "width": image.width, "height": image.height}
+
+
+def store_image(data: bytes) -> dict:
+    """
+    Prépare et stocke l'image. Retourne {"image_id", "width", "height", "size_bytes"}.
+    CPU (Pillow) + I/O bloquants : appeler via asyncio.to_thread depuis une route async.
+    """
+    prepared = prepare_image(data)
+    sha = hashlib.sha256(prepared["full"]).hexdigest()
+    store = get_media_store()
+    if not store.exists(sha, "full"):
+        store.put(sha, "thumb", prepared["thumb"])
+        store.put(sha, "full", prepared["full"])     # en dernier : exists() ⇒ les deux variantes sont là
+    return {"image_id": sha, "width": prepared["width"], "height": prepared["height"], "size_bytes": len(prepared["full"])}
+
+
+# ─── Références dans products_services ──────────────────────────────────────
+
+def media_path(image_id: str, variant: str = "full") -> str:
+    return f"/media/{image_id}.thumb.jpg" if variant == "thumb" else f"/media/{image_id}.jpg"
+
+
+def parse_media_ref(value: Optional[str]) -> Optional[str]:
+    """image_id depuis un sha brut ou une URL /media/… (absolue ou relative)."""
+    if not value:
+        return None
+    value = value.strip()
+    if _SHA_RE.match(value):
+        return value
+    match = _MEDIA_PATH_RE.search(value.split("?", 1)[0])
+    return match.group(1) if match else None
+
+
+def decode_data_url(value: str) -> bytes:
+    """"data:image/jpeg;base64,…" (ou base64 nu, anciennes données) → octets."""
+    payload = value.split(",", 1)[1] if value.startswith("data:") else value
+    try:
+        return base64.b64decode(payload, validate=False)
+    except (binascii.Error, ValueError):
+        raise MediaRejected("Image base64 invalide")
+
+
+def normalize_product_images(products: list) -> list:
+    """
+    Remplace les images base64 (image_url "data:…") par une référence image_id
+    stockée dans le media store. image_url fourni fait foi (vide = photo supprimée),
+    sinon image_id est conservé. Appel bloquant (traitement d'image).
+    """
+    normalized = []
+    for product in products or []:
+        if not isinstance(product, dict):
+            normalized.append(product)
+            continue
+        product = dict(product)
+        image_url = product.pop("image_url", None)
+        image_id = parse_media_ref(product.get("image_id"))
+        if image_url is not None:
+            image_id = parse_media_ref(image_url)
+            if image_id is None and image_url.strip():
+                image_id = store_image(decode_data_url(image_url.strip()))["image_id"]
+        product.pop("image_id", None)
+        if image_id:
+            product["image_id"] = image_id
+        normalized.append(product)
+    return normalized
+
+
+def present_products(products: list) -> list:
+    """Produits pour l'API : image_url (chemin /media/…) recalculé depuis image_id."""
+    return [
+        {**p, "image_url": media_path(p["image_id"])} if isinstance(p, dict) and p.get("image_id") else p
+        for p in products or []
+    ]
@@ -0,0 +1,253 @@
+"""
+Message Archive Service — Archivage froid des messages anciens
+Les messages de plus de 6 mois quittent la table `messages` (Neon : 512 MB max)
+et sont écrits dans des fichiers NDJSON gzip append-only, un par tenant et par mois :
+
+    <MESSAGE_ARCHIVE_DIR>/tenant_<id>/<YYYY-MM>.ndjson.gz
+
+Chaque lot est ajouté comme un membre gzip indépendant (un fichier gzip
+multi-membres reste lisible par zcat/gzip). La table message_archive_segments
+garde l'offset et la longueur de chaque membre : la relecture d'une conversation
+ne décompresse que ses propres segments.
+
+Désactivé par défaut : les messages sont SUPPRIMÉS de la base après export, le
+répertoire doit donc être un stockage durable (disque persistant monté). Le
+système de fichiers d'un conteneur Render est effacé à chaque déploiement —
+archiver là reviendrait à perdre les messages. L'archivage ne tourne que si
+MESSAGE_ARCHIVE_ENABLED=true, MESSAGE_ARCHIVE_DIR est un chemin absolu existant
+et contient le fichier témoin ARCHIVE_MARKER, créé à la main une fois le disque
+monté (absent si le volume n'est pas monté → rien n'est supprimé).
+"""
+
+import gzip
+import json
+import os
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from ..models import Conversation, Message, MessageArchiveSegment
+import logging
+
+logger = logging.getLogger(__name__)
+
+MESSAGE_ARCHIVE_ENABLED = os.getenv("MESSAGE_ARCHIVE_ENABLED", "false").lower() == "true"
+MESSAGE_ARCHIVE_DIR = os.getenv("MESSAGE_ARCHIVE_DIR", "")
+ARCHIVE_MARKER = ".neobot-archive"
+ARCHIVE_AFTER_DAYS = int(os.getenv("MESSAGE_ARCHIVE_AFTER_DAYS", "180"))
+# Petits lots : chaque DELETE reste court et ne bloque pas les écritures du webhook
+ARCHIVE_BATCH_SIZE = 500
+
+
+def _message_to_dict(m: Message, tenant_id: Optional[int] = None) -> dict:
+    return {
+        "id": m.id,
+        "conversation_id": m.conversation_id,
+        "tenant_id": tenant_id,
+        "content": m.content,
+        "direction": m.direction,
+        "is_ai": bool(m.is_ai),
+        "created_at": m.created_at.isoformat() if m.created_at else None,
+    }
+
+
+class MessageArchiveService:
+    """Export des messages anciens vers le stockage froid + relecture transparente"""
+
+    @staticmethod
+    def storage_problem() -> Optional[str]:
+        """None si l'archivage peut supprimer des messages en toute sécurité, sinon la raison."""
+        if not MESSAGE_ARCHIVE_ENABLED:
+            return "MESSAGE_ARCHIVE_ENABLED désactivé"
+        if not MESSAGE_ARCHIVE_DIR or not os.path.isabs(MESSAGE_ARCHIVE_DIR):
+            return "MESSAGE_ARCHIVE_DIR doit être un chemin absolu sur un disque persistant"
+        if not os.path.isfile(os.path.join(MESSAGE_ARCHIVE_DIR, ARCHIVE_MARKER)):
+            return f"fichier témoin {ARCHIVE_MARKER} absent de {MESSAGE_ARCHIVE_DIR} (volume non monté ?)"
+        if not os.access(MESSAGE_ARCHIVE_DIR, os.W_OK):
+            return f"{MESSAGE_ARCHIVE_DIR} non accessible en écriture"
+        return None
+
+    @staticmethod
+    def _segment_relpath(tenant_id: int, month: str) -> str:
+        return os.path.join(f"tenant_{tenant_id}", f"{month}.ndjson.gz")
+
+    @staticmethod
+    def _append_member(relpath: str, records: list[dict]) -> tuple[int, int]:
+        """
+        Ajoute un membre gzip en fin de fichier et retourne (offset, longueur).
+        fsync avant retour : l'index n'est commité qu'une fois les octets sur disque.
+        """
+        path = os.path.join(MESSAGE_ARCHIVE_DIR, relpath)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        payload = "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in records)
+        blob = gzip.compress(payload.encode("utf-8"), compresslevel=6)
+        with open(path, "ab") as f:
+            f.seek(0, os.SEEK_END)
+            offset = f.tell()
+            f.write(blob)
+            f.flush()
+            os.fsync(f.fileno())
+        return offset, len(blob)
+
+    @staticmethod
+    def _read_member(relpath: str, offset: int, length: int) -> list[dict]:
+        path = os.path.join(MESSAGE_ARCHIVE_DIR, relpath)
+        with open(path, "rb") as f:
+            f.seek(offset)
+            blob = f.read(length)
+        lines = gzip.decompress(blob).decode("utf-8").splitlines()
+        return [json.loads(line) for line in lines if line]
+
+    @staticmethod
+    def archive_old_messages(
+        db: Session,
+        older_than_days: int = ARCHIVE_AFTER_DAYS,
+        batch_size: int = ARCHIVE_BATCH_SIZE,
+        max_batches: Optional[int] = None,
+    ) -> dict:
+        """
+        Déplace les messages plus vieux que `older_than_days` vers les archives.
+        Par lot : écriture fichier (fsync) → index → DELETE, dans une seule transaction
+        DB. Un crash entre l'écriture et le commit laisse au pire un membre orphelin
+        (jamais référencé) — aucun message n'est perdu.
+        Stockage non durable (voir storage_problem) : rien n'est exporté ni supprimé.
+        """
+        cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+        stats = {"archived": 0, "segments": 0, "batches": 0, "skipped": None}
+
+        problem = MessageArchiveService.storage_problem()
+        if problem:
+            logger.info(f"🗄️ Archive messages ignorée : {problem}")
+            stats["skipped"] = problem
+            return stats
+
+        while max_batches is None or stats["batches"] < max_batches:
+            rows = (
+                db.query(Message, Conversation.tenant_id)
+                .join(Conversation, Conversation.id == Message.conversation_id)
+                .filter(Message.created_at < cutoff)
+                .order_by(Message.id.asc())
+                .limit(batch_size)
+                .all()
+            )
+            if not rows:
+                break
+
+            groups: dict[tuple[int, str, int], list[Message]] = defaultdict(list)
+            for m, tenant_id in rows:
+                groups[(tenant_id, m.created_at.strftime("%Y-%m"), m.conversation_id)].append(m)
+
+            try:
+                for (tenant_id, month, conversation_id), msgs in groups.items():
+                    relpath = MessageArchiveService._segment_relpath(tenant_id, month)
+                    offset, length = MessageArchiveService._append_member(
+                        relpath, [_message_to_dict(m, tenant_id) for m in msgs]
+                    )
+                    db.add(MessageArchiveSegment(
+                        tenant_id=tenant_id,
+                        conversation_id=conversation_id,
+                        month=month,
+                        file_path=relpath,
+                        byte_offset=offset,
+                        byte_length=length,
+                        message_count=len(msgs),
+                        first_message_id=msgs[0].id,
+                        last_message_id=msgs[-1].id,
+                        first_created_at=msgs[0].created_at,
+                        last_created_at=msgs[-1].created_at,
+                    ))
+                    stats["segments"] += 1
+
+                ids = [m.id for m, _ in rows]
+                db.query(Message).filter(Message.id.in_(ids)).delete(synchronize_session=False)
+                db.commit()
+            except Exception:
+                db.rollback()
+                raise
+
+            stats["archived"] += len(rows)
+            stats["batches"] += 1
+
+        if stats["archived"]:
+            logger.info(
+                f"🗄️ Archive messages : {stats['archived']} messages → "
+                f"{stats['segments']} segments ({stats['batches']} lots)"
+            )
+        return stats
+
+    @staticmethod
+    def count_archived_messages(conversation_id: int, db: Session) -> int:
+        total = db.query(func.coalesce(func.sum(MessageArchiveSegment.message_count), 0)).filter(
+            MessageArchiveSegment.conversation_id == conversation_id
+        ).scalar()
+        return int(total or 0)
+
+    @staticmethod
+    def get_archived_messages(
+        conversation_id: int, db: Session, offset: int = 0, limit: Optional[int] = None
+    ) -> list[dict]:
+        """
+        Messages archivés d'une conversation, dans l'ordre chronologique, fenêtre
+        [offset, offset + limit). Les segments sont parcourus par first_created_at
+        avec leur message_count : seuls ceux qui couvrent la fenêtre sont décompressés.
+        Lecture fichier synchrone → appeler hors boucle d'événements (asyncio.to_thread).
+        """
+        segments = (
+            db.query(MessageArchiveSegment)
+            .filter(MessageArchiveSegment.conversation_id == conversation_id)
+            .order_by(
+                MessageArchiveSegment.first_created_at.asc().nullsfirst(),
+                MessageArchiveSegment.first_message_id.asc(),
+            )
+            .all()
+        )
+        end = offset + limit if limit is not None else None
+        messages: list[dict] = []
+        position = 0
+        for seg in segments:
+            start, position = position, position + seg.message_count
+            if position <= offset:
+                continue                      # segment entièrement avant la page
+            if end is not None and start >= end:
+                break                         # page complète
+            try:
+                rows = MessageArchiveService._read_member(seg.file_path, seg.byte_offset, seg.byte_length)
+            except (OSError, ValueError) as exc:
+                logger.error(f"❌ Segment d'archive illisible (id={seg.id}, {seg.file_path}): {exc}")
+                continue
+            rows.sort(key=lambda r: (r.get("created_at") or "", r["id"]))
+            messages.extend(rows[max(offset - start, 0):None if end is None else end - start])
+        return messages
+
+    @staticmethod
+    def get_conversation_messages(
+        conversation_id: int, db: Session, limit: int = 100, offset: int = 0
+    ) -> tuple[list[dict], int]:
+        """
+        Messages d'une conversation (archives puis table chaude), paginés.
+        Seuls les segments d'archive couverts par la page demandée sont lus.
+        Retourne (messages, total).
+        """
+        archived_total = MessageArchiveService.count_archived_messages(conversation_id, db)
+        hot_query = db.query(Message).filter(Message.conversation_id == conversation_id)
+        total = archived_total + hot_query.count()
+
+        page: list[dict] = []
+        if offset < archived_total:
+            page = MessageArchiveService.get_archived_messages(conversation_id, db, offset=offset, limit=limit)
+
+        hot_offset = max(0, offset - archived_total)
+        hot_limit = limit - len(page)
+        if hot_limit > 0:
+            hot = (
+                hot_query
+                .order_by(Message.created_at.asc().nullsfirst(), Message.id.asc())
+                .offset(hot_offset)
+                .limit(hot_limit)
+                .all()
+            )
+            page.extend(_message_to_dict(m) for m in hot)
+        return page, total
@@ -10,13 +10,14 @@ import os
 from datetime import datetime, timedelta
 from typing import Optional
 
-import httpx
 import sentry_sdk
 from sqlalchemy.orm import Session
 from sqlalchemy import func
 
 from ..models import ApiCredit
 from .email_service import send_internal_alert, SENDER_EMAIL, SENDER_NAME
+from ..http_client import get_client
+from ..state_backend import get_state_backend
 
 logger = logging.getLogger(__name__)
 
@@ -56,19 +57,19 @@ async def fetch_deepseek_balance() -> Optional[float]:
         return None
 
     try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            resp = await client.get(
-                "https://api.deepseek.com/user/balance",
-                headers={"Authorization": f"Bearer {DEEPSEEK_API_KEY}"},
-            )
-            resp.raise_for_status()
-            data = resp.json()
-            # Format DeepSeek : {"balance_infos": [{"currency": "USD", "total_balance": "8.42", ...}]}
-            for info in data.get("balance_infos", []):
-                if info.get("currency") == "USD":
-                    return float(info.get("total_balance", 0))
-            # Fallback : essayer balance directement
-            return float(data.get("balance", 0))
+        resp = await get_client("deepseek").get(
+            "https://api.deepseek.com/user/balance",
+            headers={"Authorization": f"Bearer {DEEPSEEK_API_KEY}"},
+            timeout=10.0,
+        )
+        resp.raise_for_status()
+        data = resp.json()
+        # Format DeepSeek : {"balance_infos": [{"currency": "USD", "total_balance": "8.42", ...}]}
+        for info in data.get("balance_infos", []):
+            if info.get("currency") == "USD":
+                return float(info.get("total_balance", 0))
+        # Fallback : essayer balance directement
+        return float(data.get("balance", 0))
     except Exception as exc:
         logger.error("Erreur fetch DeepSeek balance: %s", exc)
         sentry_sdk.capture_exception(exc)
@@ -91,41 +92,41 @@ async def fetch_anthropic_usage() -> Optional[float]:
 
     try:
         # Anthropic fournit un endpoint beta pour le solde de crédit
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            resp = await client.get(
-                "https://api.anthropic.com/v1/usage",
-                headers={
-                    "x-api-key": ANTHROPIC_API_KEY,
-                    "anthropic-version": "2023-06-01",
-                    "anthropic-beta": "usage-2024-10-01",
-                },
-                params={"limit": 1},
-            )
-            if resp.status_code == 200:
-                data = resp.json()
-                # Format possible : {"credits_remaining": 4.21}
-                credits = data.get("credits_remaining") or data.get("balance")
-                if credits is not None:
-                    return float(credits)
-
-            # Si l'endpoint ne retourne pas de solde direct,
-            # on tente /v1/account pour les informations de compte
-            resp2 = await client.get(
-                "https://console.anthropic.com/api/usage_metrics",
-                headers={"x-api-key": ANTHROPIC_API_KEY},
-            )
-            if resp2.status_code == 200:
-                data2 = resp2.json()
-                return float(data2.get("credits_remaining", -1))
-
-            # En dernier recours, retourner -1 (inconnu) pour afficher
-            # dans le dashboard "solde non disponible" plutôt que de crasher
-            logger.warning(
-                "Solde Anthropic non récupérable (status %s) — "
-                "vérifier l'endpoint dans la console Anthropic",
-                resp.status_code,
-            )
-            return -1.0
+        client = get_client("anthropic")
+        resp = await client.get(
+            "https://api.anthropic.com/v1/usage",
+            headers={
+                "x-api-key": ANTHROPIC_API_KEY,
+                "anthropic-version": "2023-06-01",
+                "anthropic-beta": "usage-2024-10-01",
+            },
+            params={"limit": 1},
+        )
+        if resp.status_code == 200:
+            data = resp.json()
+            # Format possible : {"credits_remaining": 4.21}
+            credits = data.get("credits_remaining") or data.get("balance")
+            if credits is not None:
+                return float(credits)
+
+        # Si l'endpoint ne retourne pas de solde direct,
+        # on tente /v1/account pour les informations de compte
+        resp2 = await client.get(
+            "https://console.anthropic.com/api/usage_metrics",
+            headers={"x-api-key": ANTHROPIC_API_KEY},
+        )
+        if resp2.status_code == 200:
+            data2 = resp2.json()
+            return float(data2.get("credits_remaining", -1))
+
+        # En dernier recours, retourner -1 (inconnu) pour afficher
+        # dans le dashboard "solde non disponible" plutôt que de crasher
+        logger.warning(
+            "Solde Anthropic non récupérable (status %s) — "
+            "vérifier l'endpoint dans la console Anthropic",
+            resp.status_code,
+        )
+        return -1.0
     except Exception as exc:
         logger.error("Erreur fetch Anthropic usage: %s", exc)
         sentry_sdk.capture_exception(exc)
@@ -211,18 +212,22 @@ def get_latest_balance(db: Session, provider: str) -> Optional[ApiCredit]:
 
 # ─── Mode dégradé DeepSeek ────────────────────────────────────────────────────
 
-DEGRADED_MODE_ACTIVE = False   # Flag in-process — persisté en DB aussi
+# Flag dans le backend d'état (visible par tous les workers) — persisté en DB aussi (api_credits)
+DEGRADED_MODE_KEY = "monitoring:degraded"
 
 
 def is_degraded_mode() -> bool:
     """Retourne True si NeoBot doit être en mode dégradé (DeepSeek vide)."""
-    return DEGRADED_MODE_ACTIVE
+    try:
+        return get_state_backend().get(DEGRADED_MODE_KEY) == "1"
+    except Exception as exc:
+        logger.warning(f"⚠️ Mode dégradé illisible (backend d'état) : {exc}")
+        return False
 
 
 def _set_degraded_mode(active: bool) -> None:
-    global DEGRADED_MODE_ACTIVE
-    if DEGRADED_MODE_ACTIVE != active:
-        DEGRADED_MODE_ACTIVE = active
+    if is_degraded_mode() != active:
+        get_state_backend().set(DEGRADED_MODE_KEY, "1" if active else "0")
         if active:
             logger.critical("🔴 MODE DÉGRADÉ ACTIVÉ — DeepSeek solde critique")
             sentry_sdk.capture_message("NeoBot mode dégradé activé — DeepSeek solde critique", level="critical")
@@ -233,8 +238,8 @@ def _set_degraded_mode(active: bool) -> None:
 
 # ─── Alertes ──────────────────────────────────────────────────────────────────
 
-# Tracking des dernières alertes (in-process, pour limiter les spams)
-_last_alert_sent: dict[str, datetime] = {}
+# Dernière alerte par provider:niveau dans le backend d'état (clé avec TTL = cooldown),
+# pour limiter les spams même si le check tourne sur une autre instance
 ALERT_COOLDOWN_HOURS = {"green": 999, "orange": 6, "red": 2, "critical": 1, "unknown": 6}
 
 
@@ -245,12 +250,11 @@ def _should_send_alert(provider: str, level: str, days_left: Optional[int] = Non
     # Si days_left est None, la consommation est nulle → pas d'urgence.
     if level == "orange" and (days_left is None or days_left >= 50):
         return False
-    key = f"{provider}:{level}"
-    last = _last_alert_sent.get(key)
-    if not last:
+    try:
+        return get_state_backend().get(f"alert:last:{provider}:{level}") is None
+    except Exception as exc:
+        logger.warning(f"⚠️ Dedup alertes indisponible (backend d'état) : {exc}")
         return True
-    cooldown_h = ALERT_COOLDOWN_HOURS.get(level, 2)
-    return (datetime.utcnow() - last).total_seconds() > cooldown_h * 3600
 
 
 async def _send_credits_alert(
@@ -291,7 +295,14 @@ async def _send_credits_alert(
 </p>
 """
     await send_internal_alert(subject=subject, body=body)
-    _last_alert_sent[f"{provider}:{level}"] = datetime.utcnow()
+    try:
+        get_state_backend().set(
+            f"alert:last:{provider}:{level}",
+            datetime.utcnow().isoformat(),
+            ttl=ALERT_COOLDOWN_HOURS.get(level, 2) * 3600,
+        )
+    except Exception as exc:
+        logger.warning(f"⚠️ Dedup alertes non enregistrée (backend d'état) : {exc}")
 
     # WhatsApp admin si critique DeepSeek (NeoBot serait mort sans ça)
     if level == "critical" and provider == "deepseek" and ADMIN_WHATSAPP:
@@ -305,11 +316,11 @@ async def _send_whatsapp_alert(message: str) -> None:
     """Envoie une alerte WhatsApp au numéro admin via le service WhatsApp NeoBot."""
     try:
         whatsapp_backend = os.getenv("WHATSAPP_BACKEND_URL", "http://localhost:3001")
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            await client.post(
-                f"{whatsapp_backend}/send-message",
-                json={"phone": ADMIN_WHATSAPP, "message": message},
-            )
+        client = get_client("whatsapp-service")
+        await client.post(
+            f"{whatsapp_backend}/send-message",
+            json={"phone": ADMIN_WHATSAPP, "message": message},
+        )
     except Exception as exc:
         logger.warning("Alerte WhatsApp admin non envoyée: %s", exc)
 
@@ -5,11 +5,11 @@ Phase 8M: Feature 3 - Temps de réponse modulable
 
 from sqlalchemy.orm import Session
 from sqlalchemy import and_
-from ..models import TenantSettings, QueuedMessage, ConversationHumanState, Message, Conversation
+from ..models import TenantSettings, QueuedMessage, ConversationHumanState
 from datetime import datetime, timedelta
 import logging
 import os
-import httpx
+from ..http_client import get_client
 
 logger = logging.getLogger(__name__)
 
@@ -192,6 +192,10 @@ class ResponseDelayService:
         )
         db.add(queued_msg)
         db.commit()
+
+        # Échéancier en mémoire : envoi à send_at exact, sans scruter la table
+        from .delayed_sender import schedule_delayed_send
+        schedule_delayed_send(queued_msg.id, tenant_id, send_at)
         
         label, _ = ResponseDelayService.DELAY_OPTIONS.get(delay, ("Custom", delay))
         logger.info(f"📅 Réponse en queue, envoi dans {delay}s ({label})")
@@ -214,115 +218,59 @@ class ResponseDelayService:
         tenant_send_url = f"{WHATSAPP_SERVICE_URL}/api/whatsapp/tenants/{tenant_id}/send-message"
         legacy_send_url = f"{WHATSAPP_SERVICE_URL}/send"
 
-        async with httpx.AsyncClient(timeout=WHATSAPP_SERVICE_TIMEOUT) as client:
-            # Endpoint multi-tenant moderne
-            tenant_payload = {
-                "to": phone_number,
-                "message": response_text,
-            }
-            try:
-                resp = await client.post(tenant_send_url, json=tenant_payload)
-                resp.raise_for_status()
-                return
-            except Exception as tenant_err:
-                logger.warning(
-                    "Tenant send endpoint failed, trying legacy /send",
-                    extra={
-                        "tenant_id": tenant_id,
-                        "phone": phone_number,
-                        "error": str(tenant_err),
-                    },
-                )
+        client = get_client("whatsapp-service")
+        # Endpoint multi-tenant moderne
+        tenant_payload = {
+            "to": phone_number,
+            "message": response_text,
+        }
+        try:
+            resp = await client.post(tenant_send_url, json=tenant_payload, timeout=WHATSAPP_SERVICE_TIMEOUT)
+            resp.raise_for_status()
+            return
+        except Exception as tenant_err:
+            logger.warning(
+                "Tenant send endpoint failed, trying legacy /send",
+                extra={
+                    "tenant_id": tenant_id,
+                    "phone": phone_number,
+                    "error": str(tenant_err),
+                },
+            )
 
-            # Fallback endpoint historique
-            legacy_payload = {
-                "to": phone_number,
-                "text": response_text,
-            }
-            legacy_resp = await client.post(legacy_send_url, json=legacy_payload)
-            legacy_resp.raise_for_status()
+        # Fallback endpoint historique
+        legacy_payload = {
+            "to": phone_number,
+            "text": response_text,
+        }
+        legacy_resp = await client.post(legacy_send_url, json=legacy_payload, timeout=WHATSAPP_SERVICE_TIMEOUT)
+        legacy_resp.raise_for_status()
 
     @staticmethod
     async def send_queued_messages(db: Session) -> dict:
         """
-        Task périodique (toutes les secondes): envoie les messages en queue dont le délai est passé
-        À appeler dans un background task
+        Passe ponctuelle pilotée par la base : envoie tous les messages dont le délai est passé.
+        L'envoi courant est fait par delayed_sender (échéancier en mémoire, réveil à send_at) ;
+        cette passe sert au rattrapage manuel et aux scripts.
         """
-        now = datetime.utcnow()
-        
-        # Trouve messages à envoyer
-        pending = db.query(QueuedMessage).filter(
+        from .delayed_sender import delayed_sender
+
+        pending = [message_id for (message_id,) in db.query(QueuedMessage.id).filter(
             and_(
-                QueuedMessage.send_at <= now,
+                QueuedMessage.send_at <= datetime.utcnow(),
                 QueuedMessage.sent == False,
                 QueuedMessage.retry_count < MAX_QUEUE_RETRIES,
             )
-        ).all()
-        
-        sent_count = 0
-        
-        for item in pending:
-            try:
-                # Vérifie toujours pas d'humain actif
-                state = db.query(ConversationHumanState).filter(
-                    ConversationHumanState.conversation_id == item.conversation_id
-                ).first()
-                
-                if state and state.human_active:
-                    # Rémet en queue (attendre fin intervention humain)
-                    item.send_at = datetime.utcnow() + timedelta(seconds=60)
-                    db.commit()
-                    logger.info(f"⏸️ {item.id}: Report envoi (humain actif)")
-                    continue
-                
-                # Envoi réel via le service WhatsApp/Baileys
-                await ResponseDelayService._send_via_whatsapp_service(
-                    tenant_id=item.tenant_id,
-                    phone_number=item.phone_number,
-                    response_text=item.response_text,
-                )
+        )]
+        db.commit()
 
-                # Historiser le message sortant dans la conversation
-                db_msg = Message(
-                    conversation_id=item.conversation_id,
-                    content=item.response_text,
-                    direction="outgoing",
-                    is_ai=True,
-                )
-                db.add(db_msg)
+        stats = await delayed_sender.send_due(pending, bind=db.get_bind())
+        logger.info(f"📊 Queue: {stats['sent']} messages envoyés")
 
-                conv = db.query(Conversation).filter(
-                    Conversation.id == item.conversation_id
-                ).first()
-                if conv:
-                    conv.last_message_at = now
-                
-                item.sent = True
-                item.sent_at = now
-                db.commit()
-                
-                sent_count += 1
-                logger.info(f"✅ Message {item.id} envoyé après délai")
-                
-            except Exception as e:
-                logger.error(f"❌ Erreur envoi message {item.id}: {e}")
-                item.retry_count = (item.retry_count or 0) + 1
-                item.last_retry_at = now
-                
-                # Après MAX_QUEUE_RETRIES tentatives, ne plus retraiter cet item
-                if item.retry_count >= MAX_QUEUE_RETRIES:
-                    logger.error(
-                        f"❌ Message {item.id}: abandon après {MAX_QUEUE_RETRIES} tentatives"
-                    )
-                
-                db.commit()
-        
-        logger.info(f"📊 Queue: {sent_count} messages envoyés")
-        
         return {
-            "sent": sent_count,
+            "sent": stats["sent"],
             "pending": len(pending),
-            "message": f"{sent_count} messages envoyés"
+            "message": f"{stats['sent']} messages envoyés"
         }
     
     @staticmethod
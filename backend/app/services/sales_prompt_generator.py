@@ -216,7 +216,14 @@ Termine TOUJOURS par: 🎯 QUESTION: [la question sélectionnée]
                 f"Merci pour votre message! Je n'ai pas bien compris votre question. "
                 f"Pouvez-vous reformuler?\n\n"
                 f"👉 Comment puis-je vous aider?"
-            )
+            ),
+            # Délestage (generation_scheduler) ou budget IA épuisé : aucune réponse ne suivra
+            # automatiquement → ne rien promettre, inviter à renvoyer le message
+            "overloaded": (
+                f"Merci pour votre message! 🙏 {business_name} reçoit beaucoup de demandes en ce moment "
+                f"et ne peut pas vous répondre automatiquement tout de suite.\n\n"
+                f"👉 Merci de renvoyer votre message un peu plus tard."
+            ),
         }
         
         return fallbacks.get(category, "Comment puis-je vous aider?")
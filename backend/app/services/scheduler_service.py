@@ -0,0 +1,430 @@
+"""
+Scheduler Service — Jobs planifiés avec élection de leader
+Remplace les boucles `while True: sleep()` de main.py : avec plusieurs workers
+uvicorn / instances, chaque job ne tourne qu'une fois (sur le leader).
+
+  - Leader : pg_try_advisory_lock sur une connexion dédiée (hors pool).
+    Si la connexion tombe, le verrou est libéré et une autre instance prend le relais.
+  - Planification : intervalle ("every 300s") ou cron 5 champs ("0 8 * * *", UTC).
+  - État persistant (scheduler_jobs) : au (re)démarrage, les échéances manquées
+    sont détectées et rattrapées en UN run (si catch_up et dans la fenêtre).
+  - Jitter par job : évite que tous les jobs partent à la même seconde.
+  - Historique (scheduler_runs) : GET /api/admin/scheduler/runs.
+
+Sur SQLite (dev/tests) pas de verrou consultatif : le process est toujours leader.
+"""
+
+import asyncio
+import os
+import random
+import socket
+import time
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Optional
+
+import sentry_sdk
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import NullPool
+
+from ..database import SessionLocal, engine as _default_engine
+from ..models import SchedulerJobState, SchedulerRun
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Clé du verrou consultatif Postgres (unique à NeoBot, arbitraire)
+SCHEDULER_LOCK_KEY = int(os.getenv("SCHEDULER_LOCK_KEY", "7305001"))
+SCHEDULER_ENABLED = os.getenv("SCHEDULER_ENABLED", "true").lower() != "false"
+# Non-leader : nouvelle tentative de prise du verrou
+LEADER_RETRY_SECONDS = 30
+# Le leader se réveille au moins toutes les 30s (heartbeat du verrou)
+TICK_MAX_SECONDS = 30
+# Retard toléré avant de considérer une échéance comme manquée
+MISSED_GRACE = timedelta(seconds=90)
+RUN_HISTORY_DAYS = 30
+
+INSTANCE_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+
+# ─── Planifications ───────────────────────────────────────────────────────────
+
+class IntervalSchedule:
+    def __init__(self, seconds: int):
+        self.seconds = seconds
+
+    def next_after(self, dt: datetime) -> datetime:
+        return dt + timedelta(seconds=self.seconds)
+
+    def __str__(self) -> str:
+        return f"every {self.seconds}s"
+
+
+def _parse_cron_field(field: str, lo: int, hi: int) -> set[int]:
+    values: set[int] = set()
+    for part in field.split(","):
+        step = 1
+        if "/" in part:
+            part, step_str = part.split("/", 1)
+            step = int(step_str)
+        if part in ("*", ""):
+            start, end = lo, hi
+        elif "-" in part:
+            a, b = part.split("-", 1)
+            start, end = int(a), int(b)
+        else:
+            start = end = int(part)
+        if start < lo or end > hi or start > end or step < 1:
+            raise ValueError(f"Champ cron invalide : {field}")
+        values.update(range(start, end + 1, step))
+    return values
+
+
+class CronSchedule:
+    """Cron 5 champs (minute heure jour mois jour_semaine), en UTC. 0 ou 7 = dimanche."""
+
+    def __init__(self, expr: str):
+        fields = expr.split()
+        if len(fields) != 5:
+            raise ValueError(f"Expression cron invalide : {expr}")
+        self.expr = expr
+        self.minutes = _parse_cron_field(fields[0], 0, 59)
+        self.hours = _parse_cron_field(fields[1], 0, 23)
+        self.days = _parse_cron_field(fields[2], 1, 31)
+        self.months = _parse_cron_field(fields[3], 1, 12)
+        self.weekdays = {d % 7 for d in _parse_cron_field(fields[4], 0, 7)}
+        self._dom_any = fields[2] == "*"
+        self._dow_any = fields[4] == "*"
+
+    def _day_matches(self, dt: datetime) -> bool:
+        dom_ok = dt.day in self.days
+        dow_ok = (dt.weekday() + 1) % 7 in self.weekdays   # Python : lundi=0 → cron : dimanche=0
+        if self._dom_any or self._dow_any:
+            return dom_ok and dow_ok
+        return dom_ok or dow_ok                             # sémantique cron : OU si les deux sont fixés
+
+    def next_after(self, dt: datetime) -> datetime:
+        t = dt.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = t + timedelta(days=366 * 5)
+        while t < limit:
+            if t.month not in self.months:
+                t = (t.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+                continue
+            if not self._day_matches(t):
+                t = t.replace(hour=0, minute=0) + timedelta(days=1)
+                continue
+            if t.hour not in self.hours:
+                t = t.replace(minute=0) + timedelta(hours=1)
+                continue
+            if t.minute not in self.minutes:
+                t += timedelta(minutes=1)
+                continue
+            return t
+        raise ValueError(f"Aucune échéance pour le cron : {self.expr}")
+
+    def __str__(self) -> str:
+        return f"cron {self.expr}"
+
+
+# ─── Jobs ─────────────────────────────────────────────────────────────────────
+
+class ScheduledJob:
+    """
+    func             : coroutine sans argument (ouvre sa propre session DB)
+    jitter           : délai aléatoire max (s) ajouté à chaque échéance
+    catch_up         : rattraper une échéance manquée (une seule fois)
+    catch_up_window  : au-delà de ce retard, l'échéance est abandonnée (None = toujours)
+    initial_delay    : premier run d'un job jamais exécuté (None = prochaine échéance)
+    """
+
+    def __init__(
+        self,
+        name: str,
+        func: Callable[[], Awaitable[None]],
+        schedule,
+        jitter: int = 0,
+        catch_up: bool = True,
+        catch_up_window: Optional[timedelta] = None,
+        initial_delay: Optional[int] = None,
+    ):
+        self.name = name
+        self.func = func
+        self.schedule = schedule
+        self.jitter = jitter
+        self.catch_up = catch_up
+        self.catch_up_window = catch_up_window
+        self.initial_delay = initial_delay
+
+
+# ─── Élection de leader ───────────────────────────────────────────────────────
+
+class LeaderLock:
+    """Verrou consultatif de session Postgres sur une connexion dédiée (hors pool)."""
+
+    def __init__(self, bind: Engine, key: int = SCHEDULER_LOCK_KEY):
+        self.key = key
+        self._is_postgres = bind.dialect.name == "postgresql"
+        # Engine NullPool : la connexion verrouillée n'occupe pas le pool Neon de l'API
+        self._engine = create_engine(bind.url, poolclass=NullPool) if self._is_postgres else None
+        self._conn: Optional[Connection] = None
+
+    def acquire(self) -> bool:
+        if not self._is_postgres:
+            return True
+        try:
+            if self._conn is None:
+                self._conn = self._engine.connect()
+            got = self._conn.execute(text("SELECT pg_try_advisory_lock(:k)"), {"k": self.key}).scalar()
+            self._conn.commit()
+            if not got:
+                self.release()
+            return bool(got)
+        except Exception as exc:
+            logger.warning(f"⚠️ Scheduler : prise du verrou leader impossible : {exc}")
+            self.release()
+            return False
+
+    def alive(self) -> bool:
+        """Heartbeat : la connexion qui porte le verrou est-elle toujours ouverte ?"""
+        if not self._is_postgres:
+            return True
+        if self._conn is None:
+            return False
+        try:
+            self._conn.execute(text("SELECT 1"))
+            self._conn.commit()
+            return True
+        except Exception:
+            self.release()
+            return False
+
+    def release(self) -> None:
+        if self._conn is None:
+            return
+        try:
+            # Fermer la connexion libère le verrou de session côté Postgres
+            self._conn.close()
+        except Exception:
+            pass
+        self._conn = None
+
+
+# ─── Scheduler ────────────────────────────────────────────────────────────────
+
+class Scheduler:
+
+    def __init__(self):
+        self.jobs: dict[str, ScheduledJob] = {}
+        self.is_leader = False
+        # name → (échéance théorique, heure de run avec jitter, runs fusionnés, rattrapage)
+        self._planned: dict[str, tuple[datetime, datetime, int, bool]] = {}
+        self._running: dict[str, asyncio.Task] = {}
+
+    def add_job(self, job: ScheduledJob) -> None:
+        self.jobs[job.name] = job
+
+    # ── État persistant ──────────────────────────────────────────────────────
+
+    def _load_state(self, db: Session, job: ScheduledJob) -> SchedulerJobState:
+        state = db.get(SchedulerJobState, job.name)
+        if state is None:
+            state = SchedulerJobState(name=job.name, schedule=str(job.schedule))
+            db.add(state)
+            db.commit()
+        elif state.schedule != str(job.schedule):
+            state.schedule = str(job.schedule)
+            db.commit()
+        return state
+
+    def _plan(self, db: Session, job: ScheduledJob, now: datetime) -> Optional[tuple]:
+        """
+        Calcule la prochaine exécution à partir de l'état persistant.
+        Détecte les échéances manquées et applique la politique de rattrapage.
+        """
+        state = self._load_state(db, job)
+        if state.last_scheduled_at is None:
+            due = (now + timedelta(seconds=job.initial_delay)) if job.initial_delay is not None \
+                else job.schedule.next_after(now)
+            missed, catch_up = 0, False
+        else:
+            # Échéances déjà passées depuis le dernier run
+            overdue, due = [], job.schedule.next_after(state.last_scheduled_at)
+            while due <= now and len(overdue) < 10_000:
+                overdue.append(due)
+                due = job.schedule.next_after(due)
+            missed, catch_up = 0, False
+            if len(overdue) == 1 and now - overdue[0] <= MISSED_GRACE:
+                due = overdue[0]                 # simplement en retard de quelques secondes
+            elif overdue:
+                latest = overdue[-1]
+                in_window = job.catch_up_window is None or now - latest <= job.catch_up_window
+                if job.catch_up and in_window:
+                    logger.warning(f"⏰ Scheduler : {job.name} — {len(overdue)} échéance(s) manquée(s), rattrapage")
+                    due, missed, catch_up = latest, len(overdue), True
+                else:
+                    logger.warning(f"⏭️ Scheduler : {job.name} — {len(overdue)} échéance(s) manquée(s) abandonnée(s)")
+                    db.add(SchedulerRun(
+                        job_name=job.name, scheduled_for=latest, started_at=now, finished_at=now,
+                        status="missed", missed=len(overdue), instance=INSTANCE_ID,
+                    ))
+                    state.last_scheduled_at = latest
+
+        run_at = now if catch_up else due + timedelta(seconds=random.uniform(0, job.jitter))
+        state.next_run_at = run_at
+        db.commit()
+        return due, run_at, missed, catch_up
+
+    # ── Exécution ────────────────────────────────────────────────────────────
+
+    async def _execute(self, job: ScheduledJob, due: datetime, missed: int, catch_up: bool) -> None:
+        db = SessionLocal()
+        try:
+            run = SchedulerRun(
+                job_name=job.name, scheduled_for=due, started_at=datetime.utcnow(),
+                status="running", catch_up=catch_up, missed=missed, instance=INSTANCE_ID,
+            )
+            db.add(run)
+            state = self._load_state(db, job)
+            state.last_scheduled_at = due
+            state.last_started_at = run.started_at
+            db.commit()
+
+            t0 = time.perf_counter()
+            status, error = "success", None
+            try:
+                await job.func()
+            except asyncio.CancelledError:
+                status, error = "failed", "cancelled (leadership perdue ou arrêt)"
+                raise
+            except Exception as exc:
+                status, error = "failed", f"{type(exc).__name__}: {exc}"[:2000]
+                sentry_sdk.capture_exception(exc)
+                logger.error(f"❌ Job {job.name} échoué : {exc}")
+            finally:
+                duration_ms = int((time.perf_counter() - t0) * 1000)
+                finished = datetime.utcnow()
+                run.status, run.error, run.finished_at, run.duration_ms = status, error, finished, duration_ms
+                state.last_status, state.last_error = status, error
+                state.last_finished_at, state.last_duration_ms = finished, duration_ms
+                db.commit()
+                logger.info(f"🕐 Job {job.name} : {status} en {duration_ms} ms")
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            # Erreur de persistance : ne pas tuer le scheduler
+            sentry_sdk.capture_exception(exc)
+            logger.error(f"❌ Scheduler : suivi du job {job.name} impossible : {exc}")
+            db.rollback()
+        finally:
+            db.close()
+
+    async def _lead(self, lock: LeaderLock) -> None:
+        """Boucle du leader : retourne dès que le verrou est perdu."""
+        self._planned.clear()
+        while True:
+            if not await asyncio.to_thread(lock.alive):
+                logger.error("🚨 Scheduler : verrou leader perdu")
+                return
+
+            now = datetime.utcnow()
+            db = SessionLocal()
+            try:
+                for name, job in self.jobs.items():
+                    task = self._running.get(name)
+                    if task is not None and not task.done():
+                        continue   # pas de chevauchement d'un même job
+                    self._running.pop(name, None)
+                    if name not in self._planned:
+                        self._planned[name] = self._plan(db, job, now)
+                    due, run_at, missed, catch_up = self._planned[name]
+                    if run_at <= now:
+                        del self._planned[name]
+                        self._running[name] = asyncio.create_task(
+                            self._execute(job, due, missed, catch_up), name=f"job:{name}"
+                        )
+            except Exception as exc:
+                sentry_sdk.capture_exception(exc)
+                logger.error(f"❌ Scheduler tick error: {exc}")
+                db.rollback()
+            finally:
+                db.close()
+
+            upcoming = [run_at for _, run_at, _, _ in self._planned.values()]
+            wait = TICK_MAX_SECONDS
+            if upcoming:
+                wait = min(wait, max((min(upcoming) - datetime.utcnow()).total_seconds(), 0.5))
+            await asyncio.sleep(wait)
+
+    async def run(self, bind: Optional[Engine] = None) -> None:
+        """Background task (lifespan) : élection puis planification tant que leader."""
+        if not SCHEDULER_ENABLED:
+            logger.info("Scheduler désactivé (SCHEDULER_ENABLED=false)")
+            return
+        lock = LeaderLock(bind or _default_engine)
+        try:
+            while True:
+                if not await asyncio.to_thread(lock.acquire):
+                    await asyncio.sleep(LEADER_RETRY_SECONDS + random.uniform(0, 5))
+                    continue
+                self.is_leader = True
+                logger.info(f"👑 Scheduler : leader = {INSTANCE_ID} ({len(self.jobs)} jobs)")
+                try:
+                    await self._lead(lock)
+                finally:
+                    self.is_leader = False
+                    for task in self._running.values():
+                        task.cancel()
+                    self._running.clear()
+        finally:
+            lock.release()
+
+    # ── Consultation / maintenance ──────────────────────────────────────────
+
+    def jobs_status(self, db: Session) -> list[dict]:
+        states = {s.name: s for s in db.query(SchedulerJobState).all()}
+        out = []
+        for name, job in self.jobs.items():
+            s = states.get(name)
+            out.append({
+                "name": name,
+                "schedule": str(job.schedule),
+                "jitter": job.jitter,
+                "catch_up": job.catch_up,
+                "running": name in self._running and not self._running[name].done(),
+                "last_scheduled_at": s.last_scheduled_at.isoformat() if s and s.last_scheduled_at else None,
+                "last_finished_at": s.last_finished_at.isoformat() if s and s.last_finished_at else None,
+                "last_status": s.last_status if s else None,
+                "last_duration_ms": s.last_duration_ms if s else None,
+                "last_error": s.last_error if s else None,
+                "next_run_at": s.next_run_at.isoformat() if s and s.next_run_at else None,
+            })
+        return out
+
+    @staticmethod
+    def purge_history(db: Session, retention_days: int = RUN_HISTORY_DAYS) -> int:
+        count = db.query(SchedulerRun).filter(
+            SchedulerRun.started_at < datetime.utcnow() - timedelta(days=retention_days),
+        ).delete(synchronize_session=False)
+        db.commit()
+        return count
+
+
+def run_to_dict(run: SchedulerRun) -> dict:
+    return {
+        "id": run.id,
+        "job": run.job_name,
+        "status": run.status,
+        "scheduled_for": run.scheduled_for.isoformat() if run.scheduled_for else None,
+        "started_at": run.started_at.isoformat() if run.started_at else None,
+        "finished_at": run.finished_at.isoformat() if run.finished_at else None,
+        "duration_ms": run.duration_ms,
+        "catch_up": run.catch_up,
+        "missed": run.missed,
+        "error": run.error,
+        "instance": run.instance,
+    }
+
+
+# Instance unique du process (jobs enregistrés par main.py)
+scheduler = Scheduler()
@@ -0,0 +1,302 @@
+"""
+Token Budget — Budgets DeepSeek par tenant et par usage (token buckets)
+Remplace le plafond global de 500 appels/jour : un tenant bruyant n'épuise
+plus le budget des autres, et le décompte se fait en tokens réellement
+consommés (usage.total_tokens renvoyé par DeepSeek), pas en appels.
+
+  - Un seau par (tenant, usage) : webhook_reply, chat_test, prompt_generation,
+    demo, neo_assistant ; remplissage continu (capacité / 24h).
+  - webhook_reply : capacité dérivée du quota payé (PLAN_LIMITS["whatsapp_messages"])
+    × tokens réels par message × TOKEN_BUDGET_HEADROOM. Garde-fou contre les boucles
+    et les fuites, jamais un plafond sous ce que le tenant paie (essai compris).
+  - Outils du dashboard : allocation fixe, large devant un usage normal.
+  - Un seau plateforme "_global" (DEEPSEEK_DAILY_TOKEN_CEILING) reste le garde-fou
+    contre les fuites, tous tenants confondus.
+  - Vérification O(1) en mémoire (allow), débit après l'appel (consume) : le
+    seau peut passer légèrement en négatif, l'appel suivant est alors refusé.
+  - Persistance : table token_buckets, synchronisée par lots toutes les
+    TOKEN_BUDGET_SYNC_SECONDS par chaque worker (token_budget_sync_loop).
+    La synchro fusionne la consommation des autres workers et survit aux redémarrages.
+"""
+
+import asyncio
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Optional
+import logging
+
+from ..models import PLAN_LIMITS, PlanType
+
+logger = logging.getLogger(__name__)
+
+TOKEN_BUDGET_SYNC_SECONDS = int(os.getenv("TOKEN_BUDGET_SYNC_SECONDS", "10"))
+DEEPSEEK_DAILY_TOKEN_CEILING = int(os.getenv("DEEPSEEK_DAILY_TOKEN_CEILING", "50000000"))
+# Tokens d'une réponse WhatsApp : prompt système + connaissances + historique + réponse
+TOKENS_PER_MESSAGE = int(os.getenv("TOKEN_BUDGET_TOKENS_PER_MESSAGE", "6000"))
+# Marge au-dessus du rythme moyen du quota (pics de trafic, campagnes, dépassement facturé)
+TOKEN_BUDGET_HEADROOM = float(os.getenv("TOKEN_BUDGET_HEADROOM", "5"))
+UNLIMITED_MONTHLY_MESSAGES = 20_000      # équivalent quota des plans illimités (-1)
+PLAN_CACHE_SECONDS = 300
+DAY_SECONDS = 86400
+
+# Outils du dashboard : allocation journalière fixe par tenant, quel que soit le plan
+# (une génération de prompt ≈ 5-8k tokens, un échange de test ≈ une réponse WhatsApp)
+PURPOSES: dict[str, int] = {
+    "chat_test":         300_000,
+    "prompt_generation": 200_000,
+    "neo_assistant":     200_000,
+}
+# Usages plateforme (sans tenant) : allocation fixe
+PLATFORM_PURPOSES: dict[str, int] = {
+    "demo": 80_000,
+}
+PLATFORM_TENANT = 0
+GLOBAL_PURPOSE = "_global"
+
+
+class TokenBudgetExceeded(Exception):
+    """Budget de tokens épuisé pour ce tenant / usage."""
+
+    def __init__(self, tenant_id: int, purpose: str):
+        super().__init__(f"Budget IA épuisé (tenant={tenant_id}, usage={purpose})")
+        self.tenant_id = tenant_id
+        self.purpose = purpose
+
+
+class _Bucket:
+    __slots__ = ("capacity", "refill", "level", "stamp", "pending", "synced_at", "denied")
+
+    def __init__(self, capacity: float):
+        self.capacity = capacity
+        self.refill = capacity / DAY_SECONDS
+        self.level = capacity
+        self.stamp = time.monotonic()
+        self.pending = 0.0         # tokens consommés localement, pas encore écrits en base
+        self.synced_at = 0.0       # 0 = jamais synchronisé avec la base
+        self.denied = 0
+
+    def current(self, now: float) -> float:
+        return min(self.capacity, self.level + self.refill * (now - self.stamp))
+
+    def advance(self, now: float) -> None:
+        self.level = self.current(now)
+        self.stamp = now
+
+
+def daily_reply_tokens(plan: Optional[str]) -> float:
+    """Allocation journalière des réponses WhatsApp, dérivée du quota mensuel du plan."""
+    try:
+        plan_type = PlanType((plan.value if isinstance(plan, PlanType) else plan or "").upper())
+    except ValueError:
+        plan_type = PlanType.BASIC
+    monthly = PLAN_LIMITS[plan_type]["whatsapp_messages"]
+    if monthly < 0:
+        monthly = UNLIMITED_MONTHLY_MESSAGES
+    return monthly / 30 * TOKENS_PER_MESSAGE * TOKEN_BUDGET_HEADROOM
+
+
+def capacity_for(plan: Optional[str], purpose: str) -> float:
+    """Capacité d'un seau tenant selon son plan et l'usage (essai = même quota que le plan)."""
+    if purpose in PURPOSES:
+        return float(PURPOSES[purpose])
+    return daily_reply_tokens(plan)
+
+
+class TokenBudget:
+
+    def __init__(self):
+        self._buckets: dict[tuple[int, str], _Bucket] = {}
+        self._plans: dict[int, tuple[Optional[str], float]] = {}
+        self._lock = threading.Lock()
+        self._loaded = False
+
+    # ── Capacités ─────────────────────────────────────────────────────────────
+
+    def _plan(self, tenant_id: int) -> Optional[str]:
+        cached = self._plans.get(tenant_id)
+        if cached and time.monotonic() - cached[1] < PLAN_CACHE_SECONDS:
+            return cached[0]
+        from ..database import SessionLocal
+        from ..models import Tenant
+        db = SessionLocal()
+        try:
+            row = db.query(Tenant.plan).filter(Tenant.id == tenant_id).first()
+        except Exception as exc:
+            logger.warning(f"⚠️ Plan tenant {tenant_id} illisible ({exc}) — allocation BASIC")
+            row = None
+        finally:
+            db.close()
+        plan = row.plan if row else None
+        self._plans[tenant_id] = (plan, time.monotonic())
+        return plan
+
+    def set_plan(self, tenant_id: int, plan: Optional[str]) -> None:
+        """Met à jour l'allocation d'un tenant (changement de plan, tests)."""
+        self._plans[tenant_id] = (plan, time.monotonic())
+        with self._lock:
+            for (tid, purpose), bucket in self._buckets.items():
+                if tid == tenant_id:
+                    bucket.capacity = capacity_for(plan, purpose)
+                    bucket.refill = bucket.capacity / DAY_SECONDS
+
+    def _capacity(self, tenant_id: int, purpose: str) -> float:
+        if purpose == GLOBAL_PURPOSE:
+            return float(DEEPSEEK_DAILY_TOKEN_CEILING)
+        if tenant_id == PLATFORM_TENANT:
+            return float(PLATFORM_PURPOSES.get(purpose, PLATFORM_PURPOSES["demo"]))
+        return capacity_for(self._plan(tenant_id), purpose)
+
+    def _bucket(self, tenant_id: int, purpose: str) -> _Bucket:
+        key = (tenant_id, purpose)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            capacity = self._capacity(tenant_id, purpose)   # hors verrou (lecture DB possible)
+            with self._lock:
+                bucket = self._buckets.setdefault(key, _Bucket(capacity))
+        return bucket
+
+    # ── Chemin chaud (O(1), mémoire) ─────────────────────────────────────────
+
+    def allow(self, tenant_id: Optional[int], purpose: str) -> bool:
+        """True si le seau du tenant/usage et le seau global ont encore des tokens."""
+        tenant_id = tenant_id or PLATFORM_TENANT
+        now = time.monotonic()
+        for key in ((tenant_id, purpose), (PLATFORM_TENANT, GLOBAL_PURPOSE)):
+            bucket = self._bucket(*key)
+            if bucket.current(now) <= 0:
+                bucket.denied += 1
+                if bucket.denied == 1 or bucket.denied % 100 == 0:
+                    logger.warning(f"🚨 Budget IA épuisé tenant={key[0]} usage={key[1]} ({bucket.denied} refus)")
+                return False
+        return True
+
+    def consume(self, tenant_id: Optional[int], purpose: str, tokens: int) -> None:
+        """Débite les tokens réellement consommés (usage.total_tokens)."""
+        if tokens <= 0:
+            return
+        tenant_id = tenant_id or PLATFORM_TENANT
+        now = time.monotonic()
+        for key in ((tenant_id, purpose), (PLATFORM_TENANT, GLOBAL_PURPOSE)):
+            bucket = self._bucket(*key)
+            with self._lock:
+                bucket.advance(now)
+                bucket.level -= tokens
+                bucket.pending += tokens
+
+    # ── Synchronisation par lots avec la base ────────────────────────────────
+
+    def load(self, db) -> int:
+        """Charge les seaux persistés (démarrage) : le budget survit aux redémarrages."""
+        from ..models import TokenBucket
+        now_dt, now = datetime.utcnow(), time.monotonic()
+        rows = db.query(TokenBucket).all()
+        with self._lock:
+            for row in rows:
+                bucket = self._buckets.setdefault((row.tenant_id, row.purpose), _Bucket(row.capacity))
+                elapsed = max((now_dt - row.updated_at).total_seconds(), 0.0)
+                bucket.level = min(bucket.capacity, row.level + bucket.refill * elapsed) - bucket.pending
+                bucket.stamp = now
+                bucket.synced_at = now
+        self._loaded = True
+        return len(rows)
+
+    def sync(self, db) -> int:
+        """
+        Écrit la consommation locale en base et relit le niveau partagé.
+        Une transaction pour tout le lot ; lignes verrouillées (FOR UPDATE) le temps du calcul.
+        Retourne le nombre de seaux synchronisés.
+        """
+        from ..models import TokenBucket
+        now = time.monotonic()
+        with self._lock:
+            batch = [
+                (key, bucket, bucket.pending)
+                for key, bucket in self._buckets.items()
+                if bucket.pending > 0 or now - bucket.synced_at > 6 * TOKEN_BUDGET_SYNC_SECONDS
+            ]
+        if not batch:
+            return 0
+
+        now_dt = datetime.utcnow()
+        levels = {}
+        for (tenant_id, purpose), bucket, pending in sorted(batch, key=lambda b: b[0]):
+            row = (
+                db.query(TokenBucket)
+                .filter(TokenBucket.tenant_id == tenant_id, TokenBucket.purpose == purpose)
+                .with_for_update()
+                .first()
+            )
+            if row is None:
+                row = TokenBucket(tenant_id=tenant_id, purpose=purpose, level=bucket.capacity, updated_at=now_dt)
+                db.add(row)
+            # Allocation recalculée (changement de plan pris en compte à la synchro)
+            bucket.capacity = self._capacity(tenant_id, purpose)
+            bucket.refill = bucket.capacity / DAY_SECONDS
+            elapsed = max((now_dt - row.updated_at).total_seconds(), 0.0)
+            row.capacity = bucket.capacity
+            row.level = min(bucket.capacity, row.level + bucket.refill * elapsed) - pending
+            row.updated_at = now_dt
+            levels[(tenant_id, purpose)] = row.level
+        db.commit()
+
+        now = time.monotonic()
+        with self._lock:
+            for key, bucket, pending in batch:
+                bucket.pending -= pending   # ce qui a été consommé pendant la synchro reste à écrire
+                bucket.level = levels[key] - bucket.pending
+                bucket.stamp = now
+                bucket.synced_at = now
+        return len(batch)
+
+    def stats(self, tenant_id: Optional[int] = None) -> list[dict]:
+        now = time.monotonic()
+        return [
+            {
+                "tenant_id": tid,
+                "purpose": purpose,
+                "capacity": round(bucket.capacity),
+                "remaining": round(bucket.current(now)),
+                "pending_sync": round(bucket.pending),
+                "denied": bucket.denied,
+            }
+            for (tid, purpose), bucket in sorted(self._buckets.items())
+            if tenant_id is None or tid == tenant_id
+        ]
+
+
+token_budget = TokenBudget()
+
+
+def _with_session(fn):
+    from ..database import SessionLocal
+    db = SessionLocal()
+    try:
+        return fn(db)
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+async def token_budget_sync_loop() -> None:
+    """Background task (chaque worker) : charge les seaux puis les synchronise par lots."""
+    while True:
+        try:
+            if not token_budget._loaded:
+                loaded = await asyncio.to_thread(_with_session, token_budget.load)
+                logger.info(f"🪙 Budgets IA : {loaded} seaux chargés")
+            await asyncio.to_thread(_with_session, token_budget.sync)
+        except Exception as exc:
+            logger.error(f"❌ token_budget_sync_loop error: {exc}")
+        await asyncio.sleep(TOKEN_BUDGET_SYNC_SECONDS)
+
+
+async def flush_token_budgets() -> None:
+    """Dernier flush de la consommation locale (shutdown)."""
+    try:
+        await asyncio.to_thread(_with_session, token_budget.sync)
+    except Exception as exc:
+        logger.error(f"❌ Flush budgets IA échoué : {exc}")
@@ -0,0 +1,163 @@
+"""
+Webhook Idempotency — Déduplication des livraisons WhatsApp sur messageKey.id
+Baileys / le service Node relivrent le même message (reconnexion, retry sur
+timeout) : sans garde, chaque relivraison repasse par le LLM et envoie une
+deuxième réponse au client.
+
+  - Clé = "{tenant_id}:{messageKey.id}" (l'id Baileys est unique par message).
+  - Niveau 1 : registre mémoire des clés récentes (LRU borné + TTL), avec le
+    résultat d'origine → une relivraison reçoit la même réponse, sans I/O.
+    Une clé "en cours" court-circuite aussi les relivraisons concurrentes.
+  - Niveau 2 : colonne messages.external_id (index unique) → couvre les autres
+    workers et les redémarrages ; l'INSERT du message entrant tranche les courses.
+  - Échec de traitement : forget() supprime le message déjà enregistré sous la clé
+    (pas de ligne orpheline, pas de copie) → la relivraison est retraitée en entier.
+  - Métriques : reçus, doublons (mémoire / base), taux de déduplication
+    (GET /api/admin/webhook-dedup).
+"""
+
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+WEBHOOK_DEDUP_TTL_SECONDS = int(os.getenv("WEBHOOK_DEDUP_TTL_SECONDS", "3600"))
+WEBHOOK_DEDUP_MAX_KEYS = int(os.getenv("WEBHOOK_DEDUP_MAX_KEYS", "20000"))
+EXTERNAL_ID_MAX_LENGTH = 128
+
+_IN_PROGRESS = object()
+
+
+class WebhookIdempotency:
+
+    def __init__(self, ttl: float = WEBHOOK_DEDUP_TTL_SECONDS, max_keys: int = WEBHOOK_DEDUP_MAX_KEYS):
+        self.ttl = ttl
+        self.max_keys = max_keys
+        self._recent: OrderedDict[str, tuple[object, float]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.received = 0
+        self.duplicates_memory = 0
+        self.duplicates_db = 0
+
+    @staticmethod
+    def key_for(tenant_id: int, message_key: Optional[dict]) -> Optional[str]:
+        """Clé d'idempotence d'un message, None si la livraison n'a pas d'id exploitable."""
+        message_id = (message_key or {}).get("id")
+        if not message_id:
+            return None
+        key = f"{tenant_id}:{message_id}"
+        if len(key) > EXTERNAL_ID_MAX_LENGTH:
+            key = f"{tenant_id}:sha256:{hashlib.sha256(str(message_id).encode()).hexdigest()}"
+        return key
+
+    # ── Niveau 1 : mémoire ────────────────────────────────────────────────────
+
+    def _lookup(self, key: str, now: float):
+        entry = self._recent.get(key)
+        if entry is None:
+            return None
+        if now - entry[1] > self.ttl:
+            del self._recent[key]
+            return None
+        self._recent.move_to_end(key)
+        return entry[0]
+
+    def _store(self, key: str, value: object, now: float) -> None:
+        self._recent[key] = (value, now)
+        self._recent.move_to_end(key)
+        while len(self._recent) > self.max_keys:
+            self._recent.popitem(last=False)
+
+    # ── API ───────────────────────────────────────────────────────────────────
+
+    def check(self, key: Optional[str], db) -> Optional[dict]:
+        """
+        Retourne la réponse à renvoyer si la livraison est un doublon, sinon None
+        (et la clé est réservée "en cours" pour les relivraisons concurrentes).
+        """
+        if key is None:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            self.received += 1
+            previous = self._lookup(key, now)
+            if previous is None:
+                self._store(key, _IN_PROGRESS, now)
+        if previous is not None:
+            self.duplicates_memory += 1
+            logger.info(f"♻️ Livraison webhook dupliquée {key} (mémoire) — court-circuitée")
+            if previous is _IN_PROGRESS:
+                return {"status": "received", "duplicate": True, "reason": "in_progress"}
+            return {**previous, "duplicate": True}
+
+        conversation_id = self._lookup_db(key, db)
+        if conversation_id is not None:
+            return self._db_duplicate(key, conversation_id)
+        return None
+
+    @staticmethod
+    def _lookup_db(key: str, db) -> Optional[int]:
+        from ..models import Message
+        try:
+            row = db.query(Message.conversation_id).filter(Message.external_id == key).first()
+        except Exception as exc:
+            logger.warning(f"⚠️ Déduplication webhook : lecture external_id impossible ({exc})")
+            return None
+        return row.conversation_id if row else None
+
+    def duplicate_from_db(self, key: str, db) -> dict:
+        """Doublon révélé par l'index unique (course sur l'INSERT entre workers)."""
+        return self._db_duplicate(key, self._lookup_db(key, db))
+
+    def _db_duplicate(self, key: str, conversation_id: Optional[int]) -> dict:
+        self.duplicates_db += 1
+        logger.info(f"♻️ Livraison webhook dupliquée {key} (base) — court-circuitée")
+        result = {"status": "received", "conversation_id": conversation_id}
+        with self._lock:
+            self._store(key, result, time.monotonic())
+        return {**result, "duplicate": True}
+
+    def remember(self, key: Optional[str], result: dict) -> dict:
+        """Mémorise le résultat d'origine (renvoyé tel quel aux relivraisons) et le retourne."""
+        if key is not None:
+            with self._lock:
+                self._store(key, result, time.monotonic())
+        return result
+
+    def forget(self, key: Optional[str], db=None) -> None:
+        """
+        Libère une clé après une erreur de traitement : la relivraison sera retraitée.
+        Avec db (appelant déjà rollbacké), le message enregistré sous cette clé est
+        supprimé : la relivraison le réenregistre une seule fois, dédup intacte.
+        """
+        if key is None:
+            return
+        with self._lock:
+            self._recent.pop(key, None)
+        if db is not None:
+            from ..models import Message
+            try:
+                db.query(Message).filter(Message.external_id == key).delete(synchronize_session=False)
+                db.commit()
+            except Exception as exc:
+                db.rollback()
+                logger.warning(f"⚠️ Déduplication webhook : libération de {key} impossible ({exc})")
+
+    def stats(self) -> dict:
+        duplicates = self.duplicates_memory + self.duplicates_db
+        return {
+            "received": self.received,
+            "duplicates": duplicates,
+            "duplicates_memory": self.duplicates_memory,
+            "duplicates_db": self.duplicates_db,
+            "dedup_rate": round(duplicates / self.received, 4) if self.received else 0.0,
+            "tracked_keys": len(self._recent),
+        }
+
+
+webhook_dedup = WebhookIdempotency()
@@ -14,14 +14,39 @@ import qrcode
 from sqlalchemy.orm import Session
 
 from app.models import WhatsAppSessionQR, Tenant
+from app.http_client import get_client
+from app.state_backend import get_state_backend
 
 logger = logging.getLogger(__name__)
 
 WHATSAPP_SERVICE_URL = os.getenv("WHATSAPP_SERVICE_URL", "http://whatsapp:3001")
-QR_CACHE_TTL_SECONDS = 5  # Cache local pendant 5 sec pour éviter surcharge
+QR_CACHE_TTL_SECONDS = 5  # Cache partagé pendant 5 sec pour éviter surcharge
 
-# Cache en mémoire pour les réponses QR — déduplicates les polls frontend
-_qr_response_cache: Dict[int, tuple[Dict[str, Any], datetime]] = {}
+
+# Cache des réponses QR dans le backend d'état — déduplique les polls frontend,
+# quel que soit le worker qui reçoit le poll. Best effort : une panne du backend
+# retombe sur le chemin DB normal.
+def _qr_cache_get(tenant_id: int) -> Optional[Dict[str, Any]]:
+    try:
+        return get_state_backend().get_json(f"qr:{tenant_id}")
+    except Exception as exc:
+        logger.debug(f"QR cache indisponible: {exc}")
+        return None
+
+
+def _qr_cache_set(tenant_id: int, result: Dict[str, Any]) -> None:
+    try:
+        get_state_backend().set_json(f"qr:{tenant_id}", result, ttl=QR_CACHE_TTL_SECONDS)
+    except Exception as exc:
+        logger.debug(f"QR cache indisponible: {exc}")
+
+
+def invalidate_qr_cache(tenant_id: int) -> None:
+    """Vide le cache QR du tenant (ex. session connectée → le prochain poll voit 'connected')."""
+    try:
+        get_state_backend().delete(f"qr:{tenant_id}")
+    except Exception as exc:
+        logger.warning(f"⚠️ Invalidation cache QR échouée (tenant {tenant_id}): {exc}")
 
 
 def _generate_qr_image_from_raw(qr_raw: str) -> str:
@@ -91,14 +116,11 @@ class WhatsAppQRService:
         """
         # ✅ CHECK CACHE — Si un résultat existe et n'a pas expiré, le retourner
         # Cela réduit drastiquement les requêtes DB lors du polling frontend
-        if not force_refresh and tenant_id in _qr_response_cache:
-            cached_response, cache_time = _qr_response_cache[tenant_id]
-            if (datetime.utcnow() - cache_time).total_seconds() < QR_CACHE_TTL_SECONDS:
-                logger.debug(f"✅ QR cache hit (in-memory) for tenant {tenant_id}")
+        if not force_refresh:
+            cached_response = _qr_cache_get(tenant_id)
+            if cached_response is not None:
+                logger.debug(f"✅ QR cache hit for tenant {tenant_id}")
                 return cached_response
-            else:
-                # Cache expiré, le nettoyer
-                del _qr_response_cache[tenant_id]
         
         # Vérifier que le tenant existe
         tenant = db.query(Tenant).filter(Tenant.id == tenant_id).first()
@@ -117,7 +139,7 @@ class WhatsAppQRService:
                 "connected": True,
                 "timestamp": datetime.utcnow().isoformat(),
             }
-            _qr_response_cache[tenant_id] = (connected_result, datetime.utcnow())
+            _qr_cache_set(tenant_id, connected_result)
             return connected_result
 
         # Vérifier le cache DB : y a-t-il un QR valide et non expiré ?
@@ -147,8 +169,8 @@ class WhatsAppQRService:
                     "connected": False,
                     "timestamp": datetime.utcnow().isoformat(),
                 }
-                # Mettre en cache mémoire
-                _qr_response_cache[tenant_id] = (result, datetime.utcnow())
+                # Mettre en cache partagé
+                _qr_cache_set(tenant_id, result)
                 return result
 
         # Pas de QR valide en cache → appeler le service WhatsApp
@@ -156,42 +178,42 @@ class WhatsAppQRService:
         # POST /connect uniquement si le service n'a pas encore de socket actif.
         # Appeler /connect quand un QR est déjà prêt tuerait le socket (code:null storm).
         try:
-            async with httpx.AsyncClient(timeout=15.0) as client:
-                # 1. GET QR d'abord — évite de tuer un socket actif
-                logger.debug(f"Fetching QR for tenant {tenant_id}...")
-                response = await client.get(
-                    f"{WHATSAPP_SERVICE_URL}/api/whatsapp/tenants/{tenant_id}/qr",
-                    headers={"Accept": "application/json"},
-                    timeout=15.0
-                )
-                response.raise_for_status()
-                wa_data = response.json()
+            client = get_client("whatsapp-service")
+            # 1. GET QR d'abord — évite de tuer un socket actif
+            logger.debug(f"Fetching QR for tenant {tenant_id}...")
+            response = await client.get(
+                f"{WHATSAPP_SERVICE_URL}/api/whatsapp/tenants/{tenant_id}/qr",
+                headers={"Accept": "application/json"},
+                timeout=15.0
+            )
+            response.raise_for_status()
+            wa_data = response.json()
 
-                # 2. POST /connect seulement si pas de QR ni de connexion
-                if not wa_data.get("qr_image") and not wa_data.get("connected"):
-                    logger.debug(f"No active QR — triggering connect for tenant {tenant_id}...")
-                    try:
-                        connect_resp = await client.post(
-                            f"{WHATSAPP_SERVICE_URL}/api/whatsapp/tenants/{tenant_id}/connect",
-                            json={},
-                            timeout=10.0
-                        )
-                        logger.debug(f"Connect response: {connect_resp.status_code}")
-                    except httpx.TimeoutException:
-                        logger.debug(f"Connect request timed out (service generating QR)")
-                    except httpx.HTTPError as e:
-                        logger.debug(f"Connect request error: {e}")
-                    # Re-fetch QR après le connect (le socket a besoin ~300ms pour générer le QR)
-                    try:
-                        response2 = await client.get(
-                            f"{WHATSAPP_SERVICE_URL}/api/whatsapp/tenants/{tenant_id}/qr",
-                            headers={"Accept": "application/json"},
-                            timeout=15.0
-                        )
-                        if response2.status_code == 200:
-                            wa_data = response2.json()
-                    except Exception:
-                        pass  # Garder wa_data du premier GET si le second échoue
+            # 2. POST /connect seulement si pas de QR ni de connexion
+            if not wa_data.get("qr_image") and not wa_data.get("connected"):
+                logger.debug(f"No active QR — triggering connect for tenant {tenant_id}...")
+                try:
+                    connect_resp = await client.post(
+                        f"{WHATSAPP_SERVICE_URL}/api/whatsapp/tenants/{tenant_id}/connect",
+                        json={},
+                        timeout=10.0
+                    )
+                    logger.debug(f"Connect response: {connect_resp.status_code}")
+                except httpx.TimeoutException:
+                    logger.debug(f"Connect request timed out (service generating QR)")
+                except httpx.HTTPError as e:
+                    logger.debug(f"Connect request error: {e}")
+                # Re-fetch QR après le connect (le socket a besoin ~300ms pour générer le QR)
+                try:
+                    response2 = await client.get(
+                        f"{WHATSAPP_SERVICE_URL}/api/whatsapp/tenants/{tenant_id}/qr",
+                        headers={"Accept": "application/json"},
+                        timeout=15.0
+                    )
+                    if response2.status_code == 200:
+                        wa_data = response2.json()
+                except Exception:
+                    pass  # Garder wa_data du premier GET si le second échoue
         except httpx.TimeoutException:
             logger.error(f"WhatsApp service timeout for tenant {tenant_id}")
             raise RuntimeError("WhatsApp service timeout — veuillez réessayer")
@@ -211,7 +233,7 @@ class WhatsAppQRService:
                 "connected": True,
                 "timestamp": datetime.utcnow().isoformat(),
             }
-            _qr_response_cache[tenant_id] = (result, datetime.utcnow())
+            _qr_cache_set(tenant_id, result)
             logger.info(f"✅ WhatsApp already connected for tenant {tenant_id}: {wa_data.get('phone')}")
             return result
 
@@ -271,8 +293,8 @@ class WhatsAppQRService:
             "timestamp": datetime.utcnow().isoformat(),
         }
 
-        # Cache mémoire 5s max — assez pour absorber le polling frontend sans servir un QR périmé
-        _qr_response_cache[tenant_id] = (result, datetime.utcnow())
+        # Cache 5s max — assez pour absorber le polling frontend sans servir un QR périmé
+        _qr_cache_set(tenant_id, result)
         
         return result
 
@@ -293,13 +315,13 @@ class WhatsAppQRService:
             raise ValueError(f"Tenant {tenant_id} not found")
 
         try:
-            async with httpx.AsyncClient(timeout=10.0) as client:
-                response = await client.get(
-                    f"{WHATSAPP_SERVICE_URL}/api/whatsapp/tenants/{tenant_id}/status",
-                    headers={"Accept": "application/json"}
-                )
-                response.raise_for_status()
-                wa_status = response.json()
+            client = get_client("whatsapp-service")
+            response = await client.get(
+                f"{WHATSAPP_SERVICE_URL}/api/whatsapp/tenants/{tenant_id}/status",
+                headers={"Accept": "application/json"}
+            )
+            response.raise_for_status()
+            wa_status = response.json()
         except httpx.HTTPError as e:
             logger.error(f"WhatsApp status check failed for tenant {tenant_id}: {e}")
             return {
@@ -0,0 +1,64 @@
+"""
+SSE — Réponses IA en streaming (text/event-stream) pour le dashboard et la démo
+
+    return sse_response(sse_from_llm(DeepSeekClient.stream(...), final=lambda text: {...}))
+
+Événements envoyés au navigateur :
+  event: delta  data: {"text": "fragment"}            (un par fragment DeepSeek)
+  event: done   data: {...final(texte), "ttft_ms": n}  (même contenu que la variante JSON)
+  event: error  data: {"detail": "..."}               (l'en-tête 200 est déjà parti)
+
+Déconnexion du navigateur : Starlette annule le générateur, qui ferme
+DeepSeekClient.stream → la connexion amont est coupée, la génération s'arrête.
+"""
+
+import json
+from typing import AsyncIterator, Callable, Optional
+
+from fastapi.responses import StreamingResponse
+
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "X-Accel-Buffering": "no",        # nginx / proxy Render : pas de mise en tampon
+    "Content-Encoding": "identity",   # GZipMiddleware laisse passer (sinon fragments retenus dans le buffer gzip)
+}
+
+
+def sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def sse_from_llm(
+    events: AsyncIterator[dict],
+    final: Callable[[str], dict],
+    error_detail: str = "Erreur lors de la génération de la réponse",
+    on_error: Optional[Callable[[dict], None]] = None,
+) -> AsyncIterator[str]:
+    """
+    Traduit les événements de DeepSeekClient.stream en SSE.
+    final(texte complet) construit le payload "done" (et peut persister l'échange) ;
+    on_error(événement) est appelé sur échec (ex. rendre l'échange réservé).
+    """
+    try:
+        async for event in events:
+            if "delta" in event:
+                yield sse_event("delta", {"text": event["delta"]})
+            elif "error" in event:
+                if on_error:
+                    on_error(event)
+                yield sse_event("error", {"detail": error_detail})
+                return
+            elif event.get("done"):
+                text = event["content"].strip()
+                if not text:
+                    if on_error:
+                        on_error({"error": "empty"})
+                    yield sse_event("error", {"detail": "Réponse IA invalide"})
+                    return
+                yield sse_event("done", {**final(text), "ttft_ms": event.get("ttft_ms")})
+    finally:
+        await events.aclose()
+
+
+def sse_response(stream: AsyncIterator[str]) -> StreamingResponse:
+    return StreamingResponse(stream, media_type="text/event-stream", headers=SSE_HEADERS)
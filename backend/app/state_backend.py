@@ -0,0 +1,520 @@
+"""
+Backend d'état partagé — compteurs, caches et sessions visibles par tous les workers
+Remplace les globals de module (sessions démo, cache QR, mode dégradé, dedup
+des alertes, rate limit slowapi) qui divergent dès qu'on lance plus d'un process.
+
+    state = get_state_backend()
+    calls = state.incr(f"demo:daily:{today}", ttl=2 * 86400)   # atomique
+    state.set_json("demo:session:abc", {...}, ttl=1800)
+
+STATE_BACKEND :
+  memory   (défaut) dict in-process — un seul worker, tests
+  postgres table state_kv (INSERT … ON CONFLICT), aucune infra en plus
+  redis    protocole RESP sur REDIS_URL (Redis, Valkey, Upstash…) — sans dépendance
+
+Les TTL sont en secondes (float accepté). incr() ne pose le TTL qu'à la création
+de la clé (sémantique fenêtre fixe) et repart de zéro une fois la clé expirée.
+"""
+
+import json
+import os
+import socket
+import ssl
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Optional
+from urllib.parse import unquote, urlparse
+import logging
+
+from limits.storage import Storage
+
+logger = logging.getLogger(__name__)
+
+STATE_BACKEND = os.getenv("STATE_BACKEND", "memory").lower()
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+REDIS_KEY_PREFIX = os.getenv("REDIS_KEY_PREFIX", "neobot:")
+
+
+class StateBackendError(Exception):
+    """Backend d'état injoignable ou réponse invalide."""
+
+
+class StateBackend:
+    """Interface commune. Les valeurs sont des chaînes ; get_json/set_json pour le reste."""
+
+    name = "abstract"
+
+    def get(self, key: str) -> Optional[str]:
+        raise NotImplementedError
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None, nx: bool = False) -> bool:
+        """Écrit la valeur. nx=True : seulement si la clé n'existe pas. Retourne True si écrite."""
+        raise NotImplementedError
+
+    def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        """Incrément atomique. ttl appliqué uniquement à la création de la clé."""
+        raise NotImplementedError
+
+    def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+    def ttl(self, key: str) -> Optional[float]:
+        """Secondes restantes, None si la clé n'existe pas ou n'expire pas."""
+        raise NotImplementedError
+
+    def clear(self, prefix: str = "") -> int:
+        """Supprime toutes les clés commençant par prefix. Retourne le nombre supprimé."""
+        raise NotImplementedError
+
+    def ping(self) -> bool:
+        return True
+
+    def purge_expired(self) -> int:
+        """Nettoyage des clés expirées (utile pour postgres uniquement)."""
+        return 0
+
+    def get_json(self, key: str, default: Any = None) -> Any:
+        raw = self.get(key)
+        return default if raw is None else json.loads(raw)
+
+    def set_json(self, key: str, value: Any, ttl: Optional[float] = None, nx: bool = False) -> bool:
+        return self.set(key, json.dumps(value, separators=(",", ":"), default=str), ttl=ttl, nx=nx)
+
+
+# ─── Mémoire ──────────────────────────────────────────────────────────────────
+
+class MemoryStateBackend(StateBackend):
+    """Dict protégé par un verrou. Expiration paresseuse + balayage périodique."""
+
+    name = "memory"
+    SWEEP_EVERY = 1000   # écritures entre deux balayages complets
+
+    def __init__(self):
+        self._data: dict[str, tuple[str, Optional[float]]] = {}
+        self._lock = threading.Lock()
+        self._writes = 0
+
+    def _alive(self, key: str, now: float) -> Optional[tuple[str, Optional[float]]]:
+        entry = self._data.get(key)
+        if entry is not None and entry[1] is not None and entry[1] <= now:
+            del self._data[key]
+            return None
+        return entry
+
+    def _written(self, now: float) -> None:
+        self._writes += 1
+        if self._writes >= self.SWEEP_EVERY:
+            self._writes = 0
+            for k in [k for k, (_, exp) in self._data.items() if exp is not None and exp <= now]:
+                del self._data[k]
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._alive(key, time.monotonic())
+            return entry[0] if entry else None
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None, nx: bool = False) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            if nx and self._alive(key, now) is not None:
+                return False
+            self._data[key] = (value, now + ttl if ttl else None)
+            self._written(now)
+            return True
+
+    def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._alive(key, now)
+            if entry is None:
+                value, expires = amount, (now + ttl if ttl else None)
+            else:
+                value, expires = int(entry[0]) + amount, entry[1]
+            self._data[key] = (str(value), expires)
+            self._written(now)
+            return value
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def ttl(self, key: str) -> Optional[float]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._alive(key, now)
+            return None if entry is None or entry[1] is None else entry[1] - now
+
+    def clear(self, prefix: str = "") -> int:
+        with self._lock:
+            keys = [k for k in self._data if k.startswith(prefix)]
+            for k in keys:
+                del self._data[k]
+            return len(keys)
+
+
+# ─── Postgres ─────────────────────────────────────────────────────────────────
+
+class PostgresStateBackend(StateBackend):
+    """
+    Table state_kv (models.StateEntry). Une requête par opération, atomicité
+    assurée par INSERT … ON CONFLICT DO UPDATE … RETURNING. Fonctionne aussi
+    sur SQLite (tests). Les lignes expirées sont ignorées à la lecture et
+    purgées par le job planifié state_purge.
+    """
+
+    name = "postgres"
+
+    def __init__(self, engine=None):
+        if engine is None:
+            from .database import engine
+        self._engine = engine
+        if engine.dialect.name == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert
+        elif engine.dialect.name == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            raise StateBackendError(f"Dialecte {engine.dialect.name} non supporté par le backend postgres")
+        from .models import StateEntry
+        self._insert = insert
+        self._table = StateEntry.__table__
+
+    @staticmethod
+    def _expiry(ttl: Optional[float]) -> Optional[datetime]:
+        return datetime.utcnow() + timedelta(seconds=ttl) if ttl else None
+
+    def _live(self, now: datetime):
+        from sqlalchemy import or_
+        t = self._table
+        return or_(t.c.expires_at.is_(None), t.c.expires_at > now)
+
+    def get(self, key: str) -> Optional[str]:
+        from sqlalchemy import select
+        t = self._table
+        with self._engine.connect() as conn:
+            return conn.execute(
+                select(t.c.value).where(t.c.key == key, self._live(datetime.utcnow()))
+            ).scalar()
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None, nx: bool = False) -> bool:
+        t = self._table
+        now = datetime.utcnow()
+        stmt = self._insert(t).values(key=key, value=value, expires_at=self._expiry(ttl))
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[t.c.key],
+            set_={"value": stmt.excluded.value, "expires_at": stmt.excluded.expires_at},
+            # nx : on n'écrase qu'une ligne expirée
+            where=~self._live(now) if nx else None,
+        ).returning(t.c.key)
+        with self._engine.begin() as conn:
+            return conn.execute(stmt).first() is not None
+
+    def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        from sqlalchemy import BigInteger, Text, case, cast
+        t = self._table
+        expired = ~self._live(datetime.utcnow())
+        stmt = self._insert(t).values(key=key, value=str(amount), expires_at=self._expiry(ttl))
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[t.c.key],
+            set_={
+                "value": case(
+                    (expired, stmt.excluded.value),
+                    else_=cast(cast(t.c.value, BigInteger) + amount, Text),
+                ),
+                "expires_at": case((expired, stmt.excluded.expires_at), else_=t.c.expires_at),
+            },
+        ).returning(t.c.value)
+        with self._engine.begin() as conn:
+            return int(conn.execute(stmt).scalar())
+
+    def delete(self, key: str) -> None:
+        t = self._table
+        with self._engine.begin() as conn:
+            conn.execute(t.delete().where(t.c.key == key))
+
+    def ttl(self, key: str) -> Optional[float]:
+        from sqlalchemy import select
+        t = self._table
+        now = datetime.utcnow()
+        with self._engine.connect() as conn:
+            expires_at = conn.execute(
+                select(t.c.expires_at).where(t.c.key == key, self._live(now))
+            ).scalar()
+        return None if expires_at is None else (expires_at - now).total_seconds()
+
+    def clear(self, prefix: str = "") -> int:
+        t = self._table
+        escaped = prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        with self._engine.begin() as conn:
+            return conn.execute(t.delete().where(t.c.key.like(f"{escaped}%", escape="\\"))).rowcount
+
+    def ping(self) -> bool:
+        from sqlalchemy import text
+        with self._engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+        return True
+
+    def purge_expired(self) -> int:
+        t = self._table
+        with self._engine.begin() as conn:
+            return conn.execute(t.delete().where(t.c.expires_at <= datetime.utcnow())).rowcount
+
+
+# ─── Redis (protocole RESP2, sans dépendance) ─────────────────────────────────
+
+class _ConnectionClosed(StateBackendError):
+    """EOF sur la connexion Redis."""
+
+
+class _StaleConnection(Exception):
+    """Connexion réutilisée déjà fermée côté serveur : aucune commande exécutée."""
+
+
+class _RespConnection:
+    """Connexion RESP2 bloquante minimale : envoi de commandes en pipeline + lecture des réponses."""
+
+    def __init__(self, url: str, timeout: float):
+        parsed = urlparse(url)
+        if parsed.scheme not in ("redis", "rediss"):
+            raise StateBackendError(f"URL Redis invalide : {parsed.scheme}://")
+        sock = socket.create_connection((parsed.hostname or "localhost", parsed.port or 6379), timeout=timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        if parsed.scheme == "rediss":
+            sock = ssl.create_default_context().wrap_socket(sock, server_hostname=parsed.hostname)
+        self._sock = sock
+        self._reader = sock.makefile("rb")
+        if parsed.password:
+            user = unquote(parsed.username) if parsed.username else None
+            self.execute(*(["AUTH", user] if user else ["AUTH"]), unquote(parsed.password))
+        db = (parsed.path or "/0").lstrip("/") or "0"
+        if db != "0":
+            self.execute("SELECT", db)
+
+    @staticmethod
+    def _encode(args: tuple) -> bytes:
+        out = [b"*%d\r\n" % len(args)]
+        for arg in args:
+            data = arg if isinstance(arg, bytes) else str(arg).encode()
+            out.append(b"$%d\r\n%s\r\n" % (len(data), data))
+        return b"".join(out)
+
+    def _read(self):
+        line = self._reader.readline()
+        if not line:
+            raise _ConnectionClosed("Connexion Redis fermée")
+        kind, payload = line[:1], line[1:-2]
+        if kind == b"+":
+            return payload.decode()
+        if kind == b"-":
+            raise StateBackendError(payload.decode())
+        if kind == b":":
+            return int(payload)
+        if kind == b"$":
+            size = int(payload)
+            if size < 0:
+                return None
+            data = self._reader.read(size + 2)
+            return data[:-2].decode()
+        if kind == b"*":
+            size = int(payload)
+            return None if size < 0 else [self._read() for _ in range(size)]
+        raise StateBackendError(f"Réponse RESP inattendue : {line[:20]!r}")
+
+    def pipeline(self, *commands: tuple) -> list:
+        """
+        Connexion fermée par le serveur avant lecture de nos commandes (écriture refusée,
+        RST ou EOF avant le moindre octet de réponse) → _StaleConnection : rien n'a été
+        exécuté, renvoyer est sûr. Toute autre erreur (dont timeout de lecture) : les
+        commandes ont pu être exécutées, ne jamais renvoyer.
+        """
+        try:
+            self._sock.sendall(b"".join(self._encode(c) for c in commands))
+            first = self._read()
+        except (BrokenPipeError, ConnectionResetError, _ConnectionClosed) as exc:
+            raise _StaleConnection(str(exc) or type(exc).__name__) from exc
+        return [first] + [self._read() for _ in commands[1:]]
+
+    def execute(self, *args):
+        return self.pipeline(args)[0]
+
+    def close(self) -> None:
+        try:
+            self._reader.close()
+            self._sock.close()
+        except OSError:
+            pass
+
+
+class RedisStateBackend(StateBackend):
+    """
+    Une connexion partagée sous verrou (opérations de l'ordre de la ms),
+    reconnexion automatique au premier échec. incr+TTL via MULTI/EXEC.
+    """
+
+    name = "redis"
+
+    def __init__(self, url: str = REDIS_URL, prefix: str = REDIS_KEY_PREFIX, timeout: float = 2.0):
+        self._url = url
+        self._prefix = prefix
+        self._timeout = timeout
+        self._conn: Optional[_RespConnection] = None
+        self._lock = threading.Lock()
+
+    def _drop(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def _pipeline(self, *commands: tuple) -> list:
+        """
+        Un seul renvoi, et seulement si la requête n'a pas pu atteindre Redis : échec de
+        connexion, ou connexion du pool trouvée fermée. Un timeout de lecture remonte en
+        StateBackendError sans renvoi — INCRBY / MULTI déjà exécutés ne sont pas recomptés.
+        """
+        with self._lock:
+            for attempt in (1, 2):
+                reused = self._conn is not None
+                try:
+                    if not reused:
+                        self._conn = _RespConnection(self._url, self._timeout)
+                    return self._conn.pipeline(*commands)
+                except _StaleConnection as exc:
+                    self._drop()
+                    if not reused or attempt == 2:
+                        raise StateBackendError(f"Connexion Redis fermée : {exc}") from exc
+                except OSError as exc:
+                    connecting = self._conn is None
+                    self._drop()
+                    if not (connecting and attempt == 1):
+                        raise StateBackendError(f"Redis injoignable : {exc}") from exc
+                except StateBackendError:
+                    self._drop()
+                    raise
+
+    def _k(self, key: str) -> str:
+        return self._prefix + key
+
+    def get(self, key: str) -> Optional[str]:
+        return self._pipeline(("GET", self._k(key)))[0]
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None, nx: bool = False) -> bool:
+        cmd = ["SET", self._k(key), value]
+        if ttl:
+            cmd += ["PX", max(1, int(ttl * 1000))]
+        if nx:
+            cmd.append("NX")
+        return self._pipeline(tuple(cmd))[0] == "OK"
+
+    def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        k = self._k(key)
+        if not ttl:
+            return self._pipeline(("INCRBY", k, amount))[0]
+        # Création avec TTL (NX) + incrément dans la même transaction : la clé ne peut
+        # pas expirer entre les deux et se retrouver sans TTL
+        replies = self._pipeline(
+            ("MULTI",),
+            ("SET", k, 0, "PX", max(1, int(ttl * 1000)), "NX"),
+            ("INCRBY", k, amount),
+            ("EXEC",),
+        )
+        return replies[-1][-1]
+
+    def delete(self, key: str) -> None:
+        self._pipeline(("DEL", self._k(key)))
+
+    def ttl(self, key: str) -> Optional[float]:
+        ms = self._pipeline(("PTTL", self._k(key)))[0]
+        return None if ms < 0 else ms / 1000
+
+    def clear(self, prefix: str = "") -> int:
+        deleted, cursor = 0, "0"
+        while True:
+            cursor, keys = self._pipeline(("SCAN", cursor, "MATCH", self._k(prefix) + "*", "COUNT", 500))[0]
+            if keys:
+                deleted += self._pipeline(("DEL", *keys))[0]
+            if cursor == "0":
+                return deleted
+
+    def ping(self) -> bool:
+        return self._pipeline(("PING",))[0] == "PONG"
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+# ─── Sélection ────────────────────────────────────────────────────────────────
+
+_backend: Optional[StateBackend] = None
+_backend_lock = threading.Lock()
+
+
+def _build_backend(kind: str) -> StateBackend:
+    if kind == "postgres":
+        return PostgresStateBackend()
+    if kind == "redis":
+        return RedisStateBackend()
+    if kind != "memory":
+        logger.warning(f"STATE_BACKEND={kind} inconnu — 'memory' utilisé")
+    return MemoryStateBackend()
+
+
+def get_state_backend() -> StateBackend:
+    """Backend partagé du process (construit au premier appel selon STATE_BACKEND)."""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = _build_backend(STATE_BACKEND)
+                logger.info(f"🗄️ Backend d'état : {_backend.name}")
+    return _backend
+
+
+def set_state_backend(backend: Optional[StateBackend]) -> None:
+    """Remplace le backend (tests, bench). None = reconstruit depuis STATE_BACKEND."""
+    global _backend
+    with _backend_lock:
+        _backend = backend
+
+
+# ─── Stockage slowapi / limits ────────────────────────────────────────────────
+
+class StateBackendStorage(Storage):
+    """
+    Stockage `limits` (donc slowapi) adossé au backend d'état : les compteurs de
+    rate limit sont partagés entre workers. URI : "state://".
+    Stratégie fenêtre fixe uniquement (défaut slowapi).
+    """
+
+    STORAGE_SCHEME = ["state"]
+    KEY_PREFIX = "rl:"
+
+    def __init__(self, uri: Optional[str] = None, wrap_exceptions: bool = False, **options):
+        super().__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+
+    @property
+    def base_exceptions(self):
+        return StateBackendError
+
+    def incr(self, key: str, expiry: int, elastic_expiry: bool = False, amount: int = 1) -> int:
+        return get_state_backend().incr(self.KEY_PREFIX + key, amount, ttl=expiry)
+
+    def get(self, key: str) -> int:
+        return int(get_state_backend().get(self.KEY_PREFIX + key) or 0)
+
+    def get_expiry(self, key: str) -> float:
+        return time.time() + (get_state_backend().ttl(self.KEY_PREFIX + key) or 0)
+
+    def check(self) -> bool:
+        try:
+            return get_state_backend().ping()
+        except Exception:
+            return False
+
+    def reset(self) -> Optional[int]:
+        return get_state_backend().clear(self.KEY_PREFIX)
+
+    def clear(self, key: str) -> None:
+        get_state_backend().delete(self.KEY_PREFIX + key)
@@ -11,20 +11,26 @@ import random
 import httpx
 import os
 import logging
-from app.services.http_client import get_http_client
+from app.http_client import get_client
+from app.services.conversation_lock import conversation_locks, get_or_create_conversation
 import hmac
 import hashlib
 import sentry_sdk
 from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy import func, insert
+from sqlalchemy.exc import IntegrityError
 
 # Imports locaux
 import asyncio
 from app.database import get_db
-from app.models import Conversation, Message, ConversationHumanState, TenantBusinessConfig
+from app.models import Conversation, Message, ConversationHumanState
 from app.services.business_kb_service import BusinessKBService
 from app.services.contact_filter_service import ContactFilterService
 from app.services.agent_service import AgentService
+from app.services.webhook_idempotency import webhook_dedup
+from app.services.media_store import media_path
+from app.services.catalog_index import CATALOG_FAST_PATH, get_catalog_index, images_already_sent, record_images_sent
+from app.metrics import span
 
 # Setup logging
 logger = logging.getLogger(__name__)
@@ -33,6 +39,7 @@ logger = logging.getLogger(__name__)
 router = APIRouter(tags=["webhooks"])
 
 WEBHOOK_SECRET = os.getenv("WHATSAPP_WEBHOOK_SECRET") or os.getenv("WHATSAPP_SECRET_KEY") or ""
+WEBHOOK_BATCH_MAX = int(os.getenv("WEBHOOK_BATCH_MAX", "500"))
 APP_ENV = os.getenv("APP_ENV", "development")
 
 
@@ -129,6 +136,15 @@ class BrainOrchestrator:
                 logger.info(f"Matched pattern '{keyword}': {response}")
                 return response
         
+        # Question exacte de prix / disponibilité d'un produit du catalogue → réponse directe, sans LLM
+        if db is not None and CATALOG_FAST_PATH:
+            with span("catalog_fast_path"):
+                catalog = get_catalog_index(tenant_id, db)
+                fast_answer = catalog.answer(message) if catalog else None
+            if fast_answer:
+                logger.info(f"⚡ Réponse catalogue directe (tenant {tenant_id}) — pas d'appel LLM")
+                return fast_answer
+
         # No pattern matched → call DeepSeek with business context
         logger.info(f"No pattern matched, calling DeepSeek with context")
         response = await self._call_deepseek(message, sender_name, db, tenant_id, conversation_id)
@@ -212,11 +228,12 @@ Ou posez votre question!
             # 🚨 PHASE 7F STEP 1: ESCALADE DETECTION
             from .services.escalation_service import EscalationService, EscalationReason
             
-            escalation_reason = EscalationService.detect_escalation_trigger(
-                user_message, 
-                conversation_id, 
-                db
-            )
+            with span("escalation"):
+                escalation_reason = EscalationService.detect_escalation_trigger(
+                    user_message, 
+                    conversation_id, 
+                    db
+                )
             
             if escalation_reason:
                 # Créer le ticket d'escalade
@@ -237,29 +254,31 @@ Ou posez votre question!
             from .models import Conversation
             
             # Get conversation for phone number
-            conversation = db.query(Conversation).filter_by(id=conversation_id).first() if conversation_id else None
-            phone_number = conversation.customer_phone if conversation else "unknown"
+            with span("memory"):
+                conversation = db.query(Conversation).filter_by(id=conversation_id).first() if conversation_id else None
+                phone_number = conversation.customer_phone if conversation else "unknown"
             
-            history = ConversationMemoryService.get_conversation_history(
-                phone_number, 
-                tenant_id, 
-                db, 
-                limit=5
-            )
-            history_text = ConversationMemoryService.format_history_for_prompt(history)
+                history = ConversationMemoryService.get_conversation_history(
+                    phone_number, 
+                    tenant_id, 
+                    db, 
+                    limit=5
+                )
+                history_text = ConversationMemoryService.format_history_for_prompt(history)
             
             # 👤 PHASE 7F STEP 3: CRM - Récupérer profil client
-            customer_info = ConversationMemoryService.extract_customer_info(history)
+            with span("crm"):
+                customer_info = ConversationMemoryService.extract_customer_info(history)
             
-            # Update conversation with name if extracted
-            if customer_info["name"] and conversation:
-                CRMService.update_conversation_metadata(
-                    conversation.id, 
-                    db, 
-                    customer_name=customer_info["name"]
-                )
+                # Update conversation with name if extracted
+                if customer_info["name"] and conversation:
+                    CRMService.update_conversation_metadata(
+                        conversation.id, 
+                        db, 
+                        customer_name=customer_info["name"]
+                    )
             
-            customer_context = CRMService.get_customer_summary(conversation_id if conversation_id else 1, db)
+                customer_context = CRMService.get_customer_summary(conversation_id if conversation_id else 1, db)
             
             # ✅ STEP 1: INTENT CLASSIFICATION
             from .services.intent_classifier import classify_intent
@@ -269,11 +288,12 @@ Ou posez votre question!
             logger.info(f"🔍 Classifying intent for message: '{user_message[:80]}'")
             
             # Récupérer le vrai business type du tenant
-            tenant = db.query(Tenant).filter_by(id=tenant_id).first()
-            business_type = tenant.business_type if tenant else "neobot"
+            with span("intent"):
+                tenant = db.query(Tenant).filter_by(id=tenant_id).first()
+                business_type = tenant.business_type if tenant else "neobot"
             
-            # Classifier le message avec le vrai business type
-            classification = classify_intent(user_message, business_type=business_type)
+                # Classifier le message avec le vrai business type
+                classification = classify_intent(user_message, business_type=business_type)
             is_relevant = classification.get("is_relevant", True)
             intent = classification.get("intent", "general_inquiry")
             category = classification.get("category", "unknown")
@@ -287,9 +307,10 @@ Ou posez votre question!
             logger.info(f"✅ PERTINENT - Intent: {intent}, Category: {category}")
             
             # ✅ STEP 2: RÉCUPÉRER LES DONNÉES MÉTIER POUR LES QUESTIONS
-            profile = KnowledgeBaseService.get_tenant_profile(db, tenant_id)
-            if not profile:
-                profile = KnowledgeBaseService.create_default_neobot_profile(db, tenant_id)
+            with span("profile"):
+                profile = KnowledgeBaseService.get_tenant_profile(db, tenant_id)
+                if not profile:
+                    profile = KnowledgeBaseService.create_default_neobot_profile(db, tenant_id)
             
             business_data = {
                 "company_name": profile.get('company_name', 'NéoBot'),
@@ -299,73 +320,88 @@ Ou posez votre question!
             
             # ✅ STEP 3: OBTENIR CONVERSATION HISTORY (3 échanges max, 400 chars/msg)
             conversation_history = None
-            if db and conversation_id:
-                try:
-                    # 20 messages = 10 échanges → contexte suffisant pour éviter les répétitions
-                    raw_messages = db.query(Message).filter(
-                        Message.conversation_id == conversation_id
-                    ).order_by(Message.id.desc()).limit(20).all()
-
-                    conversation_history = []
-                    for msg in reversed(raw_messages):
-                        conversation_history.append({
-                            "role": "user" if msg.direction == "incoming" else "assistant",
-                            "content": (msg.content or "")[:500]
-                        })
-                except Exception as e:
-                    logger.warning(f"Could not get conversation history: {e}")
+            with span("history"):
+                if db and conversation_id:
+                    try:
+                        # 20 messages = 10 échanges → contexte suffisant pour éviter les répétitions
+                        raw_messages = db.query(Message).filter(
+                            Message.conversation_id == conversation_id
+                        ).order_by(Message.id.desc()).limit(20).all()
+
+                        conversation_history = []
+                        for msg in reversed(raw_messages):
+                            conversation_history.append({
+                                "role": "user" if msg.direction == "incoming" else "assistant",
+                                "content": (msg.content or "")[:500]
+                            })
+                    except Exception as e:
+                        logger.warning(f"Could not get conversation history: {e}")
             
             # ✅ STEP 4: CONSTRUIRE LE PROMPT — agent actif ou fallback SalesPromptGenerator
             from .services.agent_service import AgentService, build_agent_system_prompt
             from .services.sales_prompt_generator import SalesPromptGenerator
             from .services.http_client import DeepSeekClient
+            from .services.generation_scheduler import GenerationShed
+            from .services.token_budget import TokenBudgetExceeded
+
+            with span("prompt_build"):
+                active_agent = AgentService.get_active_agent(tenant_id, db)
+
+                if active_agent:
+                    # Mode AGENT : utiliser le prompt système de l'agent configuré
+                    system_prompt = build_agent_system_prompt(active_agent, db)
+                    max_tokens = min(active_agent.max_response_length or 300, 350)
+
+                    # CRM uniquement — history_text est déjà dans conversation_history[:-1]
+                    # l'injecter ici aussi causerait une duplication → bot qui répète
+                    enriched_context = CRMService.get_customer_history_context(conversation_id if conversation_id else 1, db)
+
+                    messages = []
+                    messages.append({"role": "system", "content": system_prompt})
+                    if conversation_history:
+                        messages.extend(conversation_history[:-1])  # historique sauf dernier
+                    if enriched_context.strip():
+                        messages.append({"role": "user", "content": f"[Contexte client]\n{enriched_context.strip()}\n\n[Message]\n{user_message}"})
+                    else:
+                        messages.append({"role": "user", "content": user_message})
 
-            active_agent = AgentService.get_active_agent(tenant_id, db)
-
-            if active_agent:
-                # Mode AGENT : utiliser le prompt système de l'agent configuré
-                system_prompt = build_agent_system_prompt(active_agent, db)
-                max_tokens = min(active_agent.max_response_length or 300, 350)
-
-                # CRM uniquement — history_text est déjà dans conversation_history[:-1]
-                # l'injecter ici aussi causerait une duplication → bot qui répète
-                enriched_context = CRMService.get_customer_history_context(conversation_id if conversation_id else 1, db)
+                    logger.info(f"🤖 Using agent '{active_agent.name}' (type={active_agent.agent_type}, score={active_agent.prompt_score})")
 
-                messages = []
-                messages.append({"role": "system", "content": system_prompt})
-                if conversation_history:
-                    messages.extend(conversation_history[:-1])  # historique sauf dernier
-                if enriched_context.strip():
-                    messages.append({"role": "user", "content": f"[Contexte client]\n{enriched_context.strip()}\n\n[Message]\n{user_message}"})
                 else:
-                    messages.append({"role": "user", "content": user_message})
-
-                logger.info(f"🤖 Using agent '{active_agent.name}' (type={active_agent.agent_type}, score={active_agent.prompt_score})")
-
-            else:
-                # Mode FALLBACK : SalesPromptGenerator (comportement original)
-                # Même raison : conversation_history est déjà passé à generate(), history_text serait dupliqué
-                enriched_context = CRMService.get_customer_history_context(conversation_id if conversation_id else 1, db)
-
-                sales_prompt = SalesPromptGenerator.generate(
-                    message=user_message,
-                    intent=intent,
-                    category=category,
-                    business_data=business_data,
-                    conversation_history=conversation_history,
-                    extra_context=enriched_context,
-                )
-                messages = [{"role": "user", "content": sales_prompt}]
-                max_tokens = 200
-                logger.info(f"📝 No active agent — fallback SalesPromptGenerator (intent={intent})")
+                    # Mode FALLBACK : SalesPromptGenerator (comportement original)
+                    # Même raison : conversation_history est déjà passé à generate(), history_text serait dupliqué
+                    enriched_context = CRMService.get_customer_history_context(conversation_id if conversation_id else 1, db)
+
+                    sales_prompt = SalesPromptGenerator.generate(
+                        message=user_message,
+                        intent=intent,
+                        category=category,
+                        business_data=business_data,
+                        conversation_history=conversation_history,
+                        extra_context=enriched_context,
+                    )
+                    messages = [{"role": "user", "content": sales_prompt}]
+                    max_tokens = 200
+                    logger.info(f"📝 No active agent — fallback SalesPromptGenerator (intent={intent})")
 
             # ✅ STEP 5: APPELER DEEPSEEK
             http_client = DeepSeekClient(api_key=self.deepseek_api_key)
-            response = await http_client.call(
-                messages=messages,
-                temperature=0.7,
-                max_tokens=max_tokens,
-            )
+            try:
+                with span("llm"):
+                    response = await http_client.call(
+                        messages=messages,
+                        temperature=0.7,
+                        max_tokens=max_tokens,
+                        tenant_id=tenant_id,
+                    )
+            except (GenerationShed, TokenBudgetExceeded):
+                # File du tenant saturée (campagne, rafale) ou budget IA épuisé → réponse d'attente
+                # immédiate, ni facturée ni analysée (voir _reply_to_message)
+                return ShedReply(SalesPromptGenerator.generate_rejection_response(
+                    is_relevant=False,
+                    category="overloaded",
+                    business_name=business_data["company_name"],
+                ))
 
             logger.info(f"✅ DeepSeek response: {response[:100]}...")
             return response
@@ -377,6 +413,10 @@ Ou posez votre question!
             return "Je rencontre une petite difficulté. Réessayez ou tapez: prix, aide, demo"
 
 
+class ShedReply(str):
+    """Réponse d'attente (délestage, budget IA épuisé) : aucune génération n'a eu lieu."""
+
+
 # Create global brain instance
 brain = BrainOrchestrator()
 
@@ -438,7 +478,7 @@ async def _notify_admin_payment_whatsapp(
             f"🕐 {now} UTC\n\n"
             f"→ Vérifier le paiement et livrer le produit/service"
         )
-        client = get_http_client()
+        client = get_client("whatsapp-service")
         await client.post(
             f"{whatsapp_service_url}/api/whatsapp/tenants/1/send-message",
             json={"to": target_phone, "message": notif},
@@ -473,7 +513,7 @@ async def _notify_hot_lead_whatsapp(
             f"🕐 {now} UTC\n\n"
             f"→ Ouvrez la conversation dans votre dashboard NéoBot"
         )
-        client = get_http_client()
+        client = get_client("whatsapp-service")
         await client.post(
             f"{whatsapp_service_url}/api/whatsapp/tenants/1/send-message",
             json={"to": owner_phone, "message": msg},
@@ -553,6 +593,41 @@ async def _record_bot_payment(conversation_id: int, customer_name: str,
 
 # ===== Webhook Endpoint =====
 
+def _normalize_phone(raw: Optional[str]) -> str:
+    phone = raw or ""
+    return phone[1:] if phone.startswith('+') else phone
+
+
+def _resolve_tenant_id(message: WhatsAppMessage, phone: str, db: Session) -> Optional[int]:
+    """tenant_id envoyé par le service (autoritaire), sinon numéro du bot, sinon numéro client."""
+    from .services.whatsapp_mapping_service import WhatsAppMappingService
+    tenant_id = message.tenant_id
+
+    if not tenant_id and message.to:
+        tenant_id = WhatsAppMappingService.get_tenant_from_phone(message.to, db)
+
+    if not tenant_id:
+        tenant_id = WhatsAppMappingService.get_tenant_from_phone(phone, db)
+    return tenant_id
+
+
+def _activate_owner_takeover(conversation_id: int, db: Session) -> None:
+    """Le propriétaire a répondu depuis son téléphone : pause IA (human_takeover). Sans commit."""
+    human_state = db.query(ConversationHumanState).filter(
+        ConversationHumanState.conversation_id == conversation_id
+    ).first()
+    if not human_state:
+        human_state = ConversationHumanState(
+            conversation_id=conversation_id,
+            human_active=True,
+            last_human_message_at=datetime.utcnow(),
+        )
+        db.add(human_state)
+    else:
+        human_state.human_active = True
+        human_state.last_human_message_at = datetime.utcnow()
+
+
 @router.post("/api/v1/webhooks/whatsapp")
 @router.post("/webhooks/whatsapp", include_in_schema=False)
 async def whatsapp_webhook(request: Request, message: WhatsAppMessage, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
@@ -560,6 +635,7 @@ async def whatsapp_webhook(request: Request, message: WhatsAppMessage, backgroun
     Receive messages from WhatsApp service
     Process with business context and send response asynchronously
     """
+    dedup_key = None
     try:
         if not _is_valid_webhook_signature(request, message):
             logger.warning("Invalid webhook signature", extra={"path": str(request.url.path)})
@@ -573,20 +649,12 @@ async def whatsapp_webhook(request: Request, message: WhatsAppMessage, backgroun
         logger.info(f"📨 Received message from {message.senderName}: {message.text}")
         
         # Extract phone number (remove country code if needed)
-        phone = message.from_ or ""
-        if phone.startswith('+'):
-            phone = phone[1:]
+        phone = _normalize_phone(message.from_)
         
         # Resolve tenant context: tenant_id from service is authoritative.
-        from .services.whatsapp_mapping_service import WhatsAppMappingService
         from .services.usage_tracking_service import UsageTrackingService
-        tenant_id = message.tenant_id
-
-        if not tenant_id and message.to:
-            tenant_id = WhatsAppMappingService.get_tenant_from_phone(message.to, db)
-
-        if not tenant_id:
-            tenant_id = WhatsAppMappingService.get_tenant_from_phone(phone, db)
+        with span("tenant_mapping"):
+            tenant_id = _resolve_tenant_id(message, phone, db)
         
         if not tenant_id:
             logger.warning(f"⚠️  Phone {phone} not mapped to any tenant. Message ignored.")
@@ -594,6 +662,15 @@ async def whatsapp_webhook(request: Request, message: WhatsAppMessage, backgroun
         
         logger.info(f"✅ Phone {phone} mapped to tenant {tenant_id}")
 
+        # ── Idempotence : relivraison du même messageKey → résultat d'origine ─
+        # Avant quota, limites et LLM : un doublon ne coûte qu'une lecture mémoire
+        # (ou un lookup indexé sur messages.external_id).
+        with span("idempotency"):
+            dedup_key = webhook_dedup.key_for(tenant_id, message.messageKey)
+            duplicate = webhook_dedup.check(dedup_key, db)
+        if duplicate is not None:
+            return duplicate
+
         # ── Message du propriétaire (fromMe=true) ────────────────────────────
         # Le propriétaire a écrit manuellement depuis son téléphone WhatsApp.
         # Sauvegarder le message, activer human_takeover, NE PAS répondre avec l'IA.
@@ -608,106 +685,147 @@ async def whatsapp_webhook(request: Request, message: WhatsAppMessage, backgroun
                     tenant_id=tenant_id,
                     db=db,
                     is_ai=False,
+                    external_id=dedup_key,
                 )
-                # Activer human_takeover sur cette conversation
-                human_state = db.query(ConversationHumanState).filter(
-                    ConversationHumanState.conversation_id == conversation.id
-                ).first()
-                if not human_state:
-                    human_state = ConversationHumanState(
-                        conversation_id=conversation.id,
-                        human_active=True,
-                        last_human_message_at=datetime.utcnow(),
-                    )
-                    db.add(human_state)
-                else:
-                    human_state.human_active = True
-                    human_state.last_human_message_at = datetime.utcnow()
+                _activate_owner_takeover(conversation.id, db)
                 db.commit()
+            except IntegrityError:
+                db.rollback()
+                return webhook_dedup.duplicate_from_db(dedup_key, db)
             except Exception as e:
+                # Pas de "ok" mémorisé : rollback + clé libérée (handler ci-dessous) → 500,
+                # la relivraison réenregistre le message et active la pause IA
                 logger.error(f"Erreur sauvegarde message fromMe: {e}")
-            return {"status": "ok", "reason": "owner_message_saved"}
+                raise
+            return webhook_dedup.remember(dedup_key, {"status": "ok", "reason": "owner_message_saved"})
 
         # CHECK QUOTA before processing message
-        if UsageTrackingService.check_quota_exceeded(tenant_id, db):
+        with span("quota"):
+            quota_exceeded = UsageTrackingService.check_quota_exceeded(tenant_id, db)
+        if quota_exceeded:
             logger.warning(f"⚠️  Tenant {tenant_id} has exceeded quota. Message rejected.")
-            return {
+            return webhook_dedup.remember(dedup_key, {
                 "status": "error",
                 "message": "Quota dépassé. Veuillez renouveler votre plan."
-            }
+            })
         
         # Check per-customer guardrails (daily/monthly)
-        if is_daily_limit_reached(phone, tenant_id=tenant_id, db=db):
+        with span("rate_limits"):
+            daily_reached = is_daily_limit_reached(phone, tenant_id=tenant_id, db=db)
+            monthly_reached = not daily_reached and is_monthly_limit_reached(phone, tenant_id=tenant_id, db=db)
+        if daily_reached:
             logger.warning(f"⚠️  Daily customer limit reached for {phone} (tenant {tenant_id})")
-            return {
+            return webhook_dedup.remember(dedup_key, {
                 "status": "error",
                 "message": "Limite journaliere atteinte pour ce client.",
-            }
+            })
 
-        if is_monthly_limit_reached(phone, tenant_id=tenant_id, db=db):
+        if monthly_reached:
             logger.warning(f"⚠️  Monthly customer limit reached for {phone} (tenant {tenant_id})")
-            return {
+            return webhook_dedup.remember(dedup_key, {
                 "status": "error",
                 "message": "Limite mensuelle atteinte pour ce client.",
-            }
+            })
 
         # Save incoming message (create conversation if needed)
-        conversation, incoming_msg = await save_message_to_db(
-            phone=phone,
-            sender_name=message.senderName,
-            text=message.text,
-            direction="incoming",
-            tenant_id=tenant_id,
-            db=db,
-            is_ai=False,
-        )
+        # external_id unique : si un autre worker a déjà enregistré ce messageKey, on s'arrête là
+        try:
+            with span("save"):
+                conversation, incoming_msg = await save_message_to_db(
+                    phone=phone,
+                    sender_name=message.senderName,
+                    text=message.text,
+                    direction="incoming",
+                    tenant_id=tenant_id,
+                    db=db,
+                    is_ai=False,
+                    external_id=dedup_key,
+                )
+        except IntegrityError:
+            db.rollback()
+            return webhook_dedup.duplicate_from_db(dedup_key, db)
         logger.info(f"✅ Saved incoming message {incoming_msg.id}")
 
-        # Check contact blacklist — AI disabled for this contact?
-        if not ContactFilterService.is_ai_enabled_for_contact(tenant_id, phone, db):
-            logger.info(f"🚫 IA désactivée pour {phone} (tenant {tenant_id}) — réponse ignorée")
-            return {"status": "skipped", "reason": "ai_disabled_for_contact"}
+        return webhook_dedup.remember(dedup_key, await _reply_to_message(
+            message, phone, tenant_id, conversation, background_tasks, db,
+        ))
+    
+    except HTTPException:
+        webhook_dedup.forget(dedup_key)
+        raise
+    except Exception as e:
+        logger.error(f"Error processing webhook: {str(e)}")
+        db.rollback()
+        webhook_dedup.forget(dedup_key, db)
+        raise HTTPException(status_code=500, detail=str(e))
+
 
-        # Check human takeover — pause manuelle (indéfinie) ou temporaire (30 min) ?
+async def _reply_to_message(
+    message: WhatsAppMessage,
+    phone: str,
+    tenant_id: int,
+    conversation: Conversation,
+    background_tasks: BackgroundTasks,
+    db: Session,
+    usage_units: int = 2,
+) -> dict:
+    """
+    Pipeline de réponse IA d'un message entrant déjà enregistré :
+    filtre contact, pause humaine, agent actif, LLM, paiement, outcome, usage, envoi.
+    Partagé par le webhook unitaire et le webhook batch (1 réponse par conversation).
+    """
+    from .services.usage_tracking_service import UsageTrackingService
+
+    # Check contact blacklist — AI disabled for this contact?
+    with span("contact_filter"):
+        ai_enabled = ContactFilterService.is_ai_enabled_for_contact(tenant_id, phone, db)
+    if not ai_enabled:
+        logger.info(f"🚫 IA désactivée pour {phone} (tenant {tenant_id}) — réponse ignorée")
+        return {"status": "skipped", "reason": "ai_disabled_for_contact"}
+
+    # Check human takeover — pause manuelle (indéfinie) ou temporaire (30 min) ?
+    with span("human_state"):
         human_state = db.query(ConversationHumanState).filter(
             ConversationHumanState.conversation_id == conversation.id
         ).first()
-        if human_state and human_state.human_active:
-            if human_state.last_human_message_at is None:
-                # Pause manuelle indéfinie (toggle) — respecter sans limite de temps
-                logger.info(f"🔇 Bot en pause manuelle conv {conversation.id} — opérateur doit reprendre manuellement")
-                return {"status": "skipped", "reason": "human_takeover"}
-            pause_window = timedelta(minutes=30)
-            if (datetime.utcnow() - human_state.last_human_message_at) < pause_window:
-                logger.info(f"🔇 Bot en pause temporaire conv {conversation.id} — opérateur actif depuis {human_state.last_human_message_at}")
-                return {"status": "skipped", "reason": "human_takeover"}
-            else:
-                # Pause temporaire expirée — réactiver le bot automatiquement
-                human_state.human_active = False
-                db.commit()
-                logger.info(f"🔄 Pause temporaire expirée conv {conversation.id} — bot réactivé")
+    if human_state and human_state.human_active:
+        if human_state.last_human_message_at is None:
+            # Pause manuelle indéfinie (toggle) — respecter sans limite de temps
+            logger.info(f"🔇 Bot en pause manuelle conv {conversation.id} — opérateur doit reprendre manuellement")
+            return {"status": "skipped", "reason": "human_takeover"}
+        pause_window = timedelta(minutes=30)
+        if (datetime.utcnow() - human_state.last_human_message_at) < pause_window:
+            logger.info(f"🔇 Bot en pause temporaire conv {conversation.id} — opérateur actif depuis {human_state.last_human_message_at}")
+            return {"status": "skipped", "reason": "human_takeover"}
+        else:
+            # Pause temporaire expirée — réactiver le bot automatiquement
+            human_state.human_active = False
+            db.commit()
+            logger.info(f"🔄 Pause temporaire expirée conv {conversation.id} — bot réactivé")
 
-        # Fetch agent settings — lecture DB fraîche pour respecter les toggles en temps réel
+    # Fetch agent settings — lecture DB fraîche pour respecter les toggles en temps réel
+    with span("agent"):
         active_agent = AgentService.get_active_agent(tenant_id, db)
 
-        # Vérification is_active : si l'agent est désactivé (ou inexistant), ne pas répondre
-        if not active_agent or not active_agent.is_active:
-            logger.info(f"🔇 Agent désactivé ou absent pour tenant {tenant_id} — réponse IA ignorée")
-            return {"status": "skipped", "reason": "agent_disabled"}
-
-        response_delay = active_agent.response_delay if active_agent else "natural"
-        typing_indicator = active_agent.typing_indicator if active_agent else True
-
-        # Process message with brain (now with business context)
-        response_text = await brain.process(
-            message.text,
-            message.senderName,
-            db=db,
-            tenant_id=tenant_id,
-            conversation_id=conversation.id
-        )
-        
-        # ── Détection paiement — tous les tenants ──────────────────────────
+    # Vérification is_active : si l'agent est désactivé (ou inexistant), ne pas répondre
+    if not active_agent or not active_agent.is_active:
+        logger.info(f"🔇 Agent désactivé ou absent pour tenant {tenant_id} — réponse IA ignorée")
+        return {"status": "skipped", "reason": "agent_disabled"}
+
+    response_delay = active_agent.response_delay if active_agent else "natural"
+    typing_indicator = active_agent.typing_indicator if active_agent else True
+
+    # Process message with brain (now with business context)
+    response_text = await brain.process(
+        message.text,
+        message.senderName,
+        db=db,
+        tenant_id=tenant_id,
+        conversation_id=conversation.id
+    )
+    
+    # ── Détection paiement — tous les tenants ──────────────────────────
+    with span("payment"):
         if _message_has_payment_keyword(message.text):
             from .models import Tenant as _Tenant
             _tenant_obj = db.query(_Tenant).filter(_Tenant.id == tenant_id).first()
@@ -738,7 +856,8 @@ async def whatsapp_webhook(request: Request, message: WhatsAppMessage, backgroun
                         db=db,
                     )
 
-        # Save outgoing message to database
+    # Save outgoing message to database
+    with span("save"):
         _, outgoing_msg = await save_message_to_db(
             phone=phone,
             sender_name=message.senderName,
@@ -748,10 +867,16 @@ async def whatsapp_webhook(request: Request, message: WhatsAppMessage, backgroun
             db=db,
             is_ai=True,
         )
-        logger.info(f"✅ Saved outgoing message {outgoing_msg.id}")
-        
-        # DETECT OUTCOME: analyser la réponse IA pour détecter un résultat métier
-        if active_agent:
+    logger.info(f"✅ Saved outgoing message {outgoing_msg.id}")
+    
+    # Réponse d'attente (délestage / budget épuisé) : pas de réponse IA → ni outcome, ni usage, ni images
+    shed = isinstance(response_text, ShedReply)
+    if shed:
+        logger.info(f"⏳ Réponse d'attente envoyée conv {conversation.id} (tenant {tenant_id}) — non facturée")
+
+    # DETECT OUTCOME: analyser la réponse IA pour détecter un résultat métier
+    with span("outcome"):
+        if active_agent and not shed:
             from .services.outcome_detector import update_conversation_outcome
             from .models import Tenant as _TenantOutcome
 
@@ -779,68 +904,221 @@ async def whatsapp_webhook(request: Request, message: WhatsAppMessage, backgroun
                         outcome=_new_outcome,
                     )
 
-        # INCREMENT USAGE: 1 for incoming message + 1 for outgoing message = 2 total
-        UsageTrackingService.increment_whatsapp_usage(tenant_id, 2, db)
-        
-        # UPDATE OVERAGE COST: Recalculate based on new usage
-        from .services.overage_pricing_service import OveragePricingService
-        OveragePricingService.update_overage_cost(tenant_id, db)
-        
-        # Détecter les produits avec images mentionnés dans la réponse IA
-        # Règle : 1 seule photo par produit par conversation (pas de spam)
+    # INCREMENT USAGE: 1 per incoming message + 1 for outgoing message (2 for a single message)
+    with span("usage"):
+        if not shed:
+            UsageTrackingService.increment_whatsapp_usage(tenant_id, usage_units, db)
+
+            # UPDATE OVERAGE COST: Recalculate based on new usage
+            from .services.overage_pricing_service import OveragePricingService
+            OveragePricingService.update_overage_cost(tenant_id, db)
+    
+    # Détecter les produits avec images mentionnés dans la réponse IA
+    # Règle : 1 seule photo par produit par conversation (pas de spam)
+    with span("image_detection"):
         products_with_images = []
         try:
-            biz_config = db.query(TenantBusinessConfig).filter(
-                TenantBusinessConfig.tenant_id == tenant_id
-            ).first()
-            if biz_config and biz_config.products_services:
-                prods = biz_config.products_services if isinstance(biz_config.products_services, list) else []
-
-                # Produits déjà cités dans les messages IA précédents → photo déjà envoyée
-                already_sent: set[str] = set()
-                prev_ai_msgs = db.query(Message).filter(
-                    Message.conversation_id == conversation.id,
-                    Message.direction == "outgoing",
-                    Message.is_ai == True,
-                ).order_by(Message.id.desc()).limit(30).all()
-                for prev_msg in prev_ai_msgs:
-                    for p in prods:
-                        if isinstance(p, dict) and p.get('name'):
-                            if p['name'].lower() in (prev_msg.content or '').lower():
-                                already_sent.add(p['name'].lower())
-
-                for p in prods:
-                    if isinstance(p, dict) and p.get('image_url') and p.get('name'):
-                        if p['name'].lower() in response_text.lower():
-                            if p['name'].lower() not in already_sent:
-                                products_with_images.append(p)
+            catalog = get_catalog_index(tenant_id, db) if not shed else None
+            if catalog:
+                products_with_images = catalog.illustrate(response_text, images_already_sent(db, conversation.id))
+                if products_with_images:
+                    record_images_sent(db, conversation.id, products_with_images)
         except Exception as img_err:
             logger.debug(f"Product image detection failed (non-blocking): {img_err}")
 
-        # Send response in background — utiliser reply_jid si dispo (JID exact de l'expéditeur)
-        background_tasks.add_task(
-            send_whatsapp_response,
-            tenant_id=tenant_id,
-            phone=message.reply_jid or phone,
-            text=response_text,
-            response_delay=response_delay,
-            typing_indicator=typing_indicator,
-            products_with_images=products_with_images,
-        )
-        
+    # Send response in background — utiliser reply_jid si dispo (JID exact de l'expéditeur)
+    background_tasks.add_task(
+        send_whatsapp_response,
+        tenant_id=tenant_id,
+        phone=message.reply_jid or phone,
+        text=response_text,
+        response_delay=response_delay,
+        typing_indicator=typing_indicator,
+        products_with_images=products_with_images,
+    )
+    
+    return {
+        "status": "received",
+        "phone": phone,
+        "sender": message.senderName,
+        "conversation_id": conversation.id,
+        "timestamp": datetime.now().isoformat()
+    }
+
+
+# ===== Batch Webhook Endpoint =====
+
+def _bulk_insert_messages(db: Session, rows: list[dict], owners: list[int]) -> set[int]:
+    """
+    Un seul INSERT multi-lignes pour tout le lot. Si l'index unique external_id
+    rejette le lot (doublon livré entre-temps par un autre worker), on rejoue
+    ligne par ligne sous savepoint pour n'écarter que les doublons.
+    Retourne les index (owners) effectivement enregistrés.
+    """
+    if not rows:
+        return set()
+    try:
+        db.execute(insert(Message), rows)
+        db.commit()
+        return set(owners)
+    except IntegrityError:
+        db.rollback()
+
+    inserted = set()
+    for row, owner in zip(rows, owners):
+        try:
+            with db.begin_nested():
+                db.execute(insert(Message), [row])
+            inserted.add(owner)
+        except IntegrityError:
+            pass
+    db.commit()
+    return inserted
+
+
+@router.post("/api/v1/webhooks/whatsapp/batch")
+@router.post("/webhooks/whatsapp/batch", include_in_schema=False)
+async def whatsapp_webhook_batch(request: Request, messages: list[WhatsAppMessage], background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
+    """
+    Ingestion groupée (reconnexion Baileys, rattrapage d'historique) :
+    messages enregistrés en un INSERT groupé, regroupés par conversation,
+    puis au plus UNE réponse IA par conversation, sur son dernier message entrant.
+    Retourne un résultat par message, dans l'ordre reçu.
+    """
+    if len(messages) > WEBHOOK_BATCH_MAX:
+        raise HTTPException(status_code=413, detail=f"Lot trop gros ({len(messages)} > {WEBHOOK_BATCH_MAX})")
+    from .services.usage_tracking_service import UsageTrackingService
+
+    results: list[Optional[dict]] = [None] * len(messages)
+    keys: list[Optional[str]] = [None] * len(messages)
+    groups: dict[tuple[int, str], list[int]] = {}
+    try:
+        # 1. Tenant, idempotence, quota — résolus une fois par tenant / numéro
+        tenants: dict[tuple, Optional[int]] = {}
+        quota_exceeded: dict[int, bool] = {}
+        for i, message in enumerate(messages):
+            phone = _normalize_phone(message.from_)
+            lookup = (message.tenant_id, message.to, phone)
+            if lookup not in tenants:
+                tenants[lookup] = _resolve_tenant_id(message, phone, db)
+            tenant_id = tenants[lookup]
+            if not tenant_id:
+                results[i] = {"status": "error", "message": "Phone not registered"}
+                continue
+            keys[i] = webhook_dedup.key_for(tenant_id, message.messageKey)
+            duplicate = webhook_dedup.check(keys[i], db)
+            if duplicate is not None:
+                results[i] = duplicate
+                continue
+            if not message.fromMe:
+                if tenant_id not in quota_exceeded:
+                    quota_exceeded[tenant_id] = UsageTrackingService.check_quota_exceeded(tenant_id, db)
+                if quota_exceeded[tenant_id]:
+                    results[i] = webhook_dedup.remember(keys[i], {
+                        "status": "error",
+                        "message": "Quota dépassé. Veuillez renouveler votre plan.",
+                    })
+                    continue
+            groups.setdefault((tenant_id, phone), []).append(i)
+
+        # 2. Limites client + conversation (une par groupe), puis INSERT groupé
+        conversations: dict[tuple[int, str], Conversation] = {}
+        rows, owners = [], []
+        now = datetime.utcnow()
+        for (tenant_id, phone), idx in list(groups.items()):
+            idx.sort(key=lambda i: messages[i].timestamp)
+            limit_error = None
+            if is_daily_limit_reached(phone, tenant_id=tenant_id, db=db):
+                limit_error = "Limite journaliere atteinte pour ce client."
+            elif is_monthly_limit_reached(phone, tenant_id=tenant_id, db=db):
+                limit_error = "Limite mensuelle atteinte pour ce client."
+            if limit_error:
+                logger.warning(f"⚠️  Customer limit reached for {phone} (tenant {tenant_id}) — batch")
+                for i in [i for i in idx if not messages[i].fromMe]:
+                    results[i] = webhook_dedup.remember(keys[i], {"status": "error", "message": limit_error})
+                idx[:] = [i for i in idx if messages[i].fromMe]
+                if not idx:
+                    del groups[(tenant_id, phone)]
+                    continue
+
+            customer = [messages[i].senderName for i in idx if not messages[i].fromMe]
+            async with conversation_locks.hold(tenant_id, phone):
+                conversation, _ = get_or_create_conversation(db, tenant_id, phone, customer[-1] if customer else None)
+            conversations[(tenant_id, phone)] = conversation
+            for i in idx:
+                rows.append({
+                    "conversation_id": conversation.id,
+                    "content": messages[i].text,
+                    "direction": "outgoing" if messages[i].fromMe else "incoming",
+                    "is_ai": False,
+                    "external_id": keys[i],
+                    "created_at": now,
+                })
+                owners.append(i)
+        with span("save"):
+            inserted = _bulk_insert_messages(db, rows, owners)
+        logger.info(f"📦 Batch webhook : {len(inserted)}/{len(messages)} messages enregistrés, {len(groups)} conversations")
+
+        # 3. Par conversation : pause humaine (fromMe) puis une seule réponse IA
+        replies = 0
+        for (tenant_id, phone), idx in groups.items():
+            conversation = conversations[(tenant_id, phone)]
+            for i in idx:
+                if i not in inserted:
+                    results[i] = webhook_dedup.duplicate_from_db(keys[i], db)
+            saved = [i for i in idx if i in inserted]
+            if not saved:
+                continue
+            incoming = [i for i in saved if not messages[i].fromMe]
+            if incoming and conversation.customer_name != messages[incoming[-1]].senderName:
+                conversation.customer_name = messages[incoming[-1]].senderName
+            conversation.last_message_at = now
+            if len(incoming) < len(saved):
+                _activate_owner_takeover(conversation.id, db)
+            db.commit()
+            for i in saved:
+                if messages[i].fromMe:
+                    results[i] = webhook_dedup.remember(keys[i], {"status": "ok", "reason": "owner_message_saved"})
+            if not incoming:
+                continue
+
+            latest = incoming[-1]
+            try:
+                reply = await _reply_to_message(
+                    messages[latest], phone, tenant_id, conversation, background_tasks, db,
+                    usage_units=len(incoming) + 1,
+                )
+            except Exception as e:
+                logger.error(f"Error processing batch conversation {conversation.id}: {e}")
+                db.rollback()
+                for i in incoming:
+                    webhook_dedup.forget(keys[i], db)
+                    results[i] = {"status": "error", "message": "processing_failed"}
+                continue
+            replies += reply.get("status") == "received"
+            for i in incoming:
+                results[i] = webhook_dedup.remember(keys[i], reply if i == latest else {
+                    "status": "received",
+                    "conversation_id": conversation.id,
+                    "answered_with": (messages[latest].messageKey or {}).get("id"),
+                })
+
         return {
             "status": "received",
-            "phone": phone,
-            "sender": message.senderName,
-            "conversation_id": conversation.id,
-            "timestamp": datetime.now().isoformat()
+            "count": len(messages),
+            "conversations": len(groups),
+            "replies": replies,
+            "results": results,
         }
-    
+
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error processing webhook: {str(e)}")
+        logger.error(f"Error processing batch webhook: {str(e)}")
         db.rollback()
+        for i, key in enumerate(keys):
+            if results[i] is None:
+                webhook_dedup.forget(key, db)
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -892,7 +1170,7 @@ async def send_whatsapp_response(
         whatsapp_service_url = os.getenv('WHATSAPP_SERVICE_URL', 'http://localhost:3001')
         delay_secs = _compute_delay(response_delay, text)
         # Réutiliser le client HTTP global poolé — pas de nouvelle connexion TCP à chaque message
-        client = get_http_client()
+        client = get_client("whatsapp-service")
 
         # Envoyer l'indicateur de frappe puis attendre le délai configuré
         if typing_indicator and delay_secs > 0:
@@ -907,11 +1185,12 @@ async def send_whatsapp_response(
                 logger.debug(f"Typing indicator failed (non-blocking): {typing_err}")
             await asyncio.sleep(delay_secs)
 
-        response = await client.post(
-            f"{whatsapp_service_url}/api/whatsapp/tenants/{tenant_id}/send-message",
-            json={"to": phone, "message": text},
-            timeout=25,  # 10s était trop court sur connexion lente / free tier
-        )
+        with span("send"):
+            response = await client.post(
+                f"{whatsapp_service_url}/api/whatsapp/tenants/{tenant_id}/send-message",
+                json={"to": phone, "message": text},
+                timeout=25,  # 10s était trop court sur connexion lente / free tier
+            )
 
         # Backward compatibility with older service contracts.
         if response.status_code == 404:
@@ -955,14 +1234,15 @@ async def send_whatsapp_response(
         if products_with_images:
             for product in products_with_images:
                 try:
+                    payload = {"to": phone, "caption": product.get("name", ""), "mimetype": "image/jpeg"}
+                    if product.get("image_id"):
+                        # Le service WhatsApp télécharge l'image en streaming depuis GET /media/…
+                        payload["mediaPath"] = media_path(product["image_id"])
+                    else:
+                        payload["imageBase64"] = product["image_url"]   # ancien produit pas encore migré
                     img_response = await client.post(
                         f"{whatsapp_service_url}/api/whatsapp/tenants/{tenant_id}/send-image",
-                        json={
-                            "to": phone,
-                            "imageBase64": product["image_url"],
-                            "caption": product.get("name", ""),
-                            "mimetype": "image/jpeg",
-                        },
+                        json=payload,
                         timeout=20,
                     )
                     if img_response.status_code == 200:
@@ -978,20 +1258,6 @@ async def send_whatsapp_response(
 
 # ===== Utils =====
 
-# In-process lock par (tenant_id, phone) — sérialise la création de conversation
-# entre deux requêtes simultanées du même expéditeur (ex: retry webhook + original).
-# Single-process sur Render free tier → asyncio.Lock est suffisant.
-# La dict grossit au rythme des numéros uniques, négligeable en mémoire à l'échelle MVP.
-_conversation_locks: dict[tuple[int, str], asyncio.Lock] = {}
-
-
-def _get_conversation_lock(tenant_id: int, phone: str) -> asyncio.Lock:
-    key = (tenant_id, phone)
-    if key not in _conversation_locks:
-        _conversation_locks[key] = asyncio.Lock()
-    return _conversation_locks[key]
-
-
 async def save_message_to_db(
     phone: str,
     sender_name: str,
@@ -1000,30 +1266,19 @@ async def save_message_to_db(
     tenant_id: int,
     db: Session,
     is_ai: bool = False,
+    external_id: Optional[str] = None,
 ):
     """
     Save message for a tenant/customer pair and create conversation when missing.
+    external_id (idempotence webhook) est unique : un doublon lève IntegrityError au commit.
     """
     # Verrouillage par (tenant_id, phone) : évite la race condition SELECT→INSERT
     # qui créerait deux conversations dupliquées si deux messages arrivent en parallèle.
-    async with _get_conversation_lock(tenant_id, phone):
-        conversation = db.query(Conversation).filter(
-            Conversation.tenant_id == tenant_id,
-            Conversation.customer_phone == phone,
-        ).order_by(Conversation.id.desc()).first()
-
-        if not conversation:
-            conversation = Conversation(
-                tenant_id=tenant_id,
-                customer_phone=phone,
-                customer_name=sender_name,
-                channel="whatsapp",
-                status="active",
-            )
-            db.add(conversation)
-            db.commit()
-            db.refresh(conversation)
-            logger.info(f"✅ Created new conversation {conversation.id} for {phone}")
+    # Verrou in-process + upsert/advisory lock côté Postgres (plusieurs workers).
+    async with conversation_locks.hold(tenant_id, phone):
+        conversation, created = get_or_create_conversation(db, tenant_id, phone, sender_name)
+    if created:
+        logger.info(f"✅ Created new conversation {conversation.id} for {phone}")
 
     # Ne mettre à jour le nom du client que pour les messages entrants (incoming)
     # Les messages outgoing (IA ou propriétaire) ne doivent pas écraser le nom du client
@@ -1035,6 +1290,7 @@ async def save_message_to_db(
         content=text,
         direction=direction,
         is_ai=is_ai,
+        external_id=external_id,
     )
     db.add(message)
     conversation.last_message_at = datetime.utcnow()
@@ -0,0 +1,29 @@
+-- Migration 015: Archivage froid des messages
+-- Date: 2026-10-19
+-- Purpose: Index des segments NDJSON gzip (un fichier par tenant et par mois)
+--          + index created_at pour sélectionner les lots à archiver.
+
+CREATE TABLE IF NOT EXISTS message_archive_segments (
+    id                SERIAL PRIMARY KEY,
+    tenant_id         INTEGER      NOT NULL,
+    conversation_id   INTEGER      NOT NULL,
+    month             VARCHAR(7)   NOT NULL,           -- "YYYY-MM"
+    file_path         VARCHAR(500) NOT NULL,           -- Relatif à MESSAGE_ARCHIVE_DIR
+    byte_offset       INTEGER      NOT NULL,           -- Début du membre gzip
+    byte_length       INTEGER      NOT NULL,
+    message_count     INTEGER      NOT NULL DEFAULT 0,
+    first_message_id  INTEGER      NOT NULL,
+    last_message_id   INTEGER      NOT NULL,
+    first_created_at  TIMESTAMP    NULL,
+    last_created_at   TIMESTAMP    NULL,
+    created_at        TIMESTAMP    NOT NULL DEFAULT now()
+);
+CREATE INDEX IF NOT EXISTS ix_message_archive_segments_conversation_id
+    ON message_archive_segments (conversation_id);
+CREATE INDEX IF NOT EXISTS ix_message_archive_segments_tenant_id
+    ON message_archive_segments (tenant_id);
+
+CREATE INDEX IF NOT EXISTS idx_messages_created_at ON messages (created_at);
+
+-- Anti-join NOT EXISTS du cron d'archive des conversations
+CREATE INDEX IF NOT EXISTS idx_conversations_archive_id ON conversations_archive (id);
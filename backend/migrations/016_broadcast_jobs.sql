@@ -0,0 +1,21 @@
+-- Migration 016: Jobs de broadcast email superadmin
+-- Date: 2026-10-19
+-- Purpose: Envoi en arrière-plan, progression persistée (sent/failed/total).
+
+CREATE TABLE IF NOT EXISTS broadcast_jobs (
+    id           SERIAL PRIMARY KEY,
+    subject      VARCHAR(200) NOT NULL,
+    body         TEXT         NOT NULL,
+    target       VARCHAR(20)  NOT NULL DEFAULT 'all',   -- all | trial | single
+    tenant_id    INTEGER      NULL,                     -- si target = 'single'
+    status       VARCHAR(20)  NOT NULL DEFAULT 'pending',
+    total        INTEGER      NOT NULL DEFAULT 0,
+    sent         INTEGER      NOT NULL DEFAULT 0,
+    failed       INTEGER      NOT NULL DEFAULT 0,
+    error        TEXT         NULL,
+    created_by   INTEGER      NULL,
+    created_at   TIMESTAMP    NOT NULL DEFAULT now(),
+    started_at   TIMESTAMP    NULL,
+    finished_at  TIMESTAMP    NULL
+);
+CREATE INDEX IF NOT EXISTS ix_broadcast_jobs_status ON broadcast_jobs (status);
@@ -0,0 +1,25 @@
+-- Migration 017: Outbox des emails transactionnels
+-- Date: 2026-10-19
+-- Purpose: Les requêtes mettent l'email en file ; un worker envoie via Brevo
+--          (backoff exponentiel, dedup_key unique, dead-letter).
+
+CREATE TABLE IF NOT EXISTS email_outbox (
+    id               SERIAL PRIMARY KEY,
+    template         VARCHAR(50)  NOT NULL,
+    to_email         VARCHAR(255) NOT NULL,
+    payload          JSON         NOT NULL,          -- Payload Brevo complet
+    dedup_key        VARCHAR(255) NULL UNIQUE,
+    status           VARCHAR(20)  NOT NULL DEFAULT 'pending',   -- pending | sending | sent | dead
+    attempts         INTEGER      NOT NULL DEFAULT 0,
+    max_attempts     INTEGER      NOT NULL DEFAULT 6,
+    next_attempt_at  TIMESTAMP    NOT NULL DEFAULT now(),
+    last_error       TEXT         NULL,
+    created_at       TIMESTAMP    NOT NULL DEFAULT now(),
+    sent_at          TIMESTAMP    NULL
+);
+-- Index partiel : le worker ne lit que les lignes dues
+CREATE INDEX IF NOT EXISTS ix_email_outbox_due
+    ON email_outbox (next_attempt_at)
+    WHERE status = 'pending';
+CREATE INDEX IF NOT EXISTS ix_email_outbox_status ON email_outbox (status);
+CREATE INDEX IF NOT EXISTS ix_email_outbox_to_email ON email_outbox (to_email);
@@ -0,0 +1,33 @@
+-- Migration 018: Scheduler avec élection de leader
+-- Date: 2026-10-19
+-- Purpose: État persistant des jobs planifiés (détection/rattrapage des
+--          échéances manquées) + historique des exécutions.
+
+CREATE TABLE IF NOT EXISTS scheduler_jobs (
+    name               VARCHAR(100) PRIMARY KEY,
+    schedule           VARCHAR(100) NOT NULL,       -- "every 300s" | "cron 0 8 * * *"
+    last_scheduled_at  TIMESTAMP    NULL,           -- échéance théorique du dernier run
+    last_started_at    TIMESTAMP    NULL,
+    last_finished_at   TIMESTAMP    NULL,
+    last_status        VARCHAR(20)  NULL,           -- success | failed
+    last_duration_ms   INTEGER      NULL,
+    last_error         TEXT         NULL,
+    next_run_at        TIMESTAMP    NULL,
+    updated_at         TIMESTAMP    NOT NULL DEFAULT now()
+);
+
+CREATE TABLE IF NOT EXISTS scheduler_runs (
+    id             SERIAL PRIMARY KEY,
+    job_name       VARCHAR(100) NOT NULL,
+    scheduled_for  TIMESTAMP    NOT NULL,
+    started_at     TIMESTAMP    NOT NULL DEFAULT now(),
+    finished_at    TIMESTAMP    NULL,
+    status         VARCHAR(20)  NOT NULL DEFAULT 'running',   -- running | success | failed | missed
+    duration_ms    INTEGER      NULL,
+    error          TEXT         NULL,
+    catch_up       BOOLEAN      NOT NULL DEFAULT FALSE,
+    missed         INTEGER      NOT NULL DEFAULT 0,
+    instance       VARCHAR(100) NULL
+);
+CREATE INDEX IF NOT EXISTS ix_scheduler_runs_job_started ON scheduler_runs (job_name, started_at DESC);
+CREATE INDEX IF NOT EXISTS ix_scheduler_runs_started_at ON scheduler_runs (started_at);
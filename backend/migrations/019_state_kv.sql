@@ -0,0 +1,11 @@
+-- Migration 019: Backend d'état partagé (STATE_BACKEND=postgres)
+-- Date: 2026-10-19
+-- Purpose: Compteurs, caches et sessions partagés entre workers/instances
+--          (budget DeepSeek, sessions démo, cache QR, mode dégradé, rate limit).
+
+CREATE TABLE IF NOT EXISTS state_kv (
+    key         VARCHAR(255) PRIMARY KEY,
+    value       TEXT         NOT NULL,
+    expires_at  TIMESTAMP    NULL          -- NULL = pas d'expiration
+);
+CREATE INDEX IF NOT EXISTS ix_state_kv_expires_at ON state_kv (expires_at);
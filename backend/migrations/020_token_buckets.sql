@@ -0,0 +1,15 @@
+-- Migration 020: Budgets de tokens DeepSeek par tenant et par usage
+-- Date: 2026-10-19
+-- Purpose: Remplace le plafond global de 500 appels/jour (in-process) par des
+--          token buckets persistants, synchronisés par lots par chaque worker.
+
+CREATE TABLE IF NOT EXISTS token_buckets (
+    id          SERIAL PRIMARY KEY,
+    tenant_id   INTEGER          NOT NULL,      -- 0 = plateforme (démo, plafond global)
+    purpose     VARCHAR(40)      NOT NULL,      -- webhook_reply | chat_test | prompt_generation | demo | neo_assistant | _global
+    level       DOUBLE PRECISION NOT NULL,      -- tokens disponibles à updated_at
+    capacity    DOUBLE PRECISION NOT NULL,      -- allocation journalière
+    updated_at  TIMESTAMP        NOT NULL DEFAULT now(),
+    CONSTRAINT uq_token_bucket_tenant_purpose UNIQUE (tenant_id, purpose)
+);
+CREATE INDEX IF NOT EXISTS ix_token_buckets_tenant_id ON token_buckets (tenant_id);
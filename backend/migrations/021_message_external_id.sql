@@ -0,0 +1,12 @@
+-- Migration 021: Idempotence du webhook WhatsApp
+-- Date: 2026-10-19
+-- Purpose: Stocker l'id WhatsApp (messageKey.id, préfixé du tenant) du message
+--          entrant : une relivraison du même message est court-circuitée avant
+--          tout appel LLM. L'index unique tranche les courses entre workers.
+
+ALTER TABLE messages
+    ADD COLUMN IF NOT EXISTS external_id VARCHAR(128);   -- "{tenant_id}:{messageKey.id}"
+
+CREATE UNIQUE INDEX IF NOT EXISTS uq_messages_external_id
+    ON messages (external_id)
+    WHERE external_id IS NOT NULL;
@@ -0,0 +1,17 @@
+-- Migration 022: Ingestion des PDF hors boucle d'événements
+-- Date: 2026-10-19
+-- Purpose: L'upload écrit le fichier sur disque et met la source en 'pending' ;
+--          le worker d'ingestion extrait les pages (pool de processus) et passe
+--          la source en 'synced'. Le hash SHA-256
+--          du fichier rend un réupload du même PDF gratuit (copie du contenu).
+
+ALTER TABLE knowledge_sources
+    ADD COLUMN IF NOT EXISTS content_hash VARCHAR(64);
+
+CREATE INDEX IF NOT EXISTS ix_knowledge_sources_content_hash
+    ON knowledge_sources (content_hash);
+
+-- Le worker réclame les sources en attente (sync_status = 'pending')
+CREATE INDEX IF NOT EXISTS ix_knowledge_sources_pending
+    ON knowledge_sources (created_at)
+    WHERE sync_status = 'pending';
@@ -0,0 +1,16 @@
+-- Migration 023: Synchronisation des sources URL / YouTube
+-- Date: 2026-10-19
+-- Purpose: Le worker de synchronisation récupère les sources en attente ou
+--          périmées (next_sync_at échu) avec des GET conditionnels : ETag et
+--          Last-Modified du dernier fetch → une page inchangée coûte un 304.
+--          content_hash (SHA-256 du texte extrait) : le contenu n'est réécrit
+--          que s'il a changé.
+
+ALTER TABLE knowledge_sources
+    ADD COLUMN IF NOT EXISTS next_sync_at  TIMESTAMP,
+    ADD COLUMN IF NOT EXISTS etag          VARCHAR(255),
+    ADD COLUMN IF NOT EXISTS last_modified VARCHAR(64);
+
+CREATE INDEX IF NOT EXISTS ix_knowledge_sources_next_sync_at
+    ON knowledge_sources (next_sync_at)
+    WHERE source_type IN ('URL', 'YOUTUBE');
@@ -0,0 +1,16 @@
+-- Migration 024: Media store des images produits
+-- Date: 2026-10-19
+-- Purpose: Les images produits quittent le JSON products_services (base64) :
+--          stockées une fois, adressées par le SHA-256 du JPEG recompressé,
+--          les produits ne gardent qu'une référence "image_id".
+--          Migration des données existantes : scripts/migrate_product_images.py
+
+CREATE TABLE IF NOT EXISTS media_blobs (
+    sha256        VARCHAR(64) NOT NULL,
+    variant       VARCHAR(16) NOT NULL,          -- full | thumb
+    content_type  VARCHAR(50) NOT NULL DEFAULT 'image/jpeg',
+    size_bytes    INTEGER     NOT NULL,
+    data          BYTEA       NOT NULL,
+    created_at    TIMESTAMP   NOT NULL DEFAULT now(),
+    PRIMARY KEY (sha256, variant)
+);
@@ -0,0 +1,12 @@
+-- Migration 025: Photos produits déjà envoyées par conversation
+-- Date: 2026-10-19
+-- Purpose: L'index catalogue (services/catalog_index.py) détecte les produits cités
+--          dans la réponse IA ; l'ensemble des photos déjà envoyées est persisté ici,
+--          une ligne par envoi, au lieu de rescanner les 30 derniers messages IA.
+
+CREATE TABLE IF NOT EXISTS conversation_product_images (
+    conversation_id  INTEGER     NOT NULL REFERENCES conversations(id) ON DELETE CASCADE,
+    image_key        VARCHAR(80) NOT NULL,       -- image_id (sha256) ou "name:<nom normalisé>"
+    sent_at          TIMESTAMP   DEFAULT now(),
+    PRIMARY KEY (conversation_id, image_key)
+);
@@ -0,0 +1,28 @@
+-- Migration 026: Import de contacts en arrière-plan
+-- Date: 2026-10-19
+-- Purpose: Suivi des imports CSV / XLSX de la liste clients d'un tenant
+--          (services/contact_import.py). Les contacts sont chargés par lots
+--          dans contact_settings (COPY + INSERT … ON CONFLICT DO UPDATE).
+
+CREATE TABLE IF NOT EXISTS contact_import_jobs (
+    id           SERIAL PRIMARY KEY,
+    tenant_id    INTEGER      NOT NULL REFERENCES tenants(id),
+    filename     VARCHAR(255),
+    file_type    VARCHAR(10)  NOT NULL DEFAULT 'csv',
+    status       VARCHAR(20)  NOT NULL DEFAULT 'pending',
+    ai_enabled   BOOLEAN,
+    bytes_total  INTEGER      NOT NULL DEFAULT 0,
+    bytes_read   INTEGER      NOT NULL DEFAULT 0,
+    rows_read    INTEGER      NOT NULL DEFAULT 0,
+    created      INTEGER      NOT NULL DEFAULT 0,
+    updated      INTEGER      NOT NULL DEFAULT 0,
+    invalid      INTEGER      NOT NULL DEFAULT 0,
+    duplicates   INTEGER      NOT NULL DEFAULT 0,
+    error        TEXT,
+    created_by   INTEGER,
+    created_at   TIMESTAMP    NOT NULL DEFAULT now(),
+    started_at   TIMESTAMP,
+    finished_at  TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS ix_contact_import_jobs_tenant_id ON contact_import_jobs (tenant_id);
@@ -0,0 +1,49 @@
+-- Migration 027: Campagnes WhatsApp sortantes
+-- Date: 2026-10-19
+-- Purpose: Campagnes (promo, rappels, suivi commande) envoyées en arrière-plan
+--          avec cadence par tenant / session WhatsApp (services/campaign_service.py).
+--          Destinataires matérialisés à la création : suivi d'envoi individuel,
+--          pause / reprise sans renvoi.
+
+CREATE TABLE IF NOT EXISTS campaigns (
+    id            SERIAL PRIMARY KEY,
+    tenant_id     INTEGER      NOT NULL REFERENCES tenants(id),
+    name          VARCHAR(120) NOT NULL,
+    trigger_type  VARCHAR(30)  NOT NULL DEFAULT 'promo',
+    template      TEXT         NOT NULL,
+    variables     JSON,
+    audience      JSON,
+    status        VARCHAR(20)  NOT NULL DEFAULT 'pending',
+    total         INTEGER      NOT NULL DEFAULT 0,
+    excluded      INTEGER      NOT NULL DEFAULT 0,
+    sent          INTEGER      NOT NULL DEFAULT 0,
+    failed        INTEGER      NOT NULL DEFAULT 0,
+    skipped       INTEGER      NOT NULL DEFAULT 0,
+    error         TEXT,
+    locked_by     VARCHAR(120),
+    heartbeat_at  TIMESTAMP,
+    created_by    INTEGER,
+    created_at    TIMESTAMP    NOT NULL DEFAULT now(),
+    started_at    TIMESTAMP,
+    finished_at   TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS ix_campaigns_tenant_id ON campaigns (tenant_id);
+CREATE INDEX IF NOT EXISTS ix_campaigns_status ON campaigns (status);
+
+CREATE TABLE IF NOT EXISTS campaign_recipients (
+    id               SERIAL PRIMARY KEY,
+    campaign_id      INTEGER      NOT NULL REFERENCES campaigns(id) ON DELETE CASCADE,
+    conversation_id  INTEGER,
+    phone_number     VARCHAR(50)  NOT NULL,
+    contact_name     VARCHAR(255),
+    status           VARCHAR(20)  NOT NULL DEFAULT 'pending',
+    reason           VARCHAR(200),
+    message_id       VARCHAR(128),
+    sent_at          TIMESTAMP,
+    CONSTRAINT uq_campaign_recipient_phone UNIQUE (campaign_id, phone_number)
+);
+
+-- Lecture des destinataires restants : (campaign_id, status, id)
+CREATE INDEX IF NOT EXISTS ix_campaign_recipients_pending
+    ON campaign_recipients (campaign_id, status, id);
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Benchmark du débit de broadcast email contre le faux serveur Brevo (in-process).
+Compare l'ancien envoi séquentiel (1 requête par destinataire) au batch
+messageVersions avec concurrence bornée.
+
+Usage :
+  cd backend
+  python scripts/bench_broadcast.py --recipients 2000 --latency-ms 80
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+os.environ.setdefault("BREVO_API_KEY", "fake")
+
+import httpx  # noqa: E402
+
+from scripts.fake_brevo_server import create_app  # noqa: E402
+from app import http_client  # noqa: E402
+from app.services import email_service  # noqa: E402
+from app.services import broadcast_service  # noqa: E402
+
+
+async def _run(recipients: int, latency_ms: float, fail_rate: float, sequential_cap: int) -> None:
+    fake = create_app(latency_ms=latency_ms, fail_rate=fail_rate, record=False)
+    email_service.BREVO_API_KEY = "fake"
+    email_service.BREVO_API_URL = "http://fake-brevo/v3/smtp/email"
+    await http_client.set_transport("brevo", httpx.ASGITransport(app=fake))
+    people = [{"email": f"client{i}@bench.test", "name": f"Client {i}"} for i in range(recipients)]
+
+    # 1. Séquentiel (comportement historique), extrapolé sur un échantillon
+    sample = people[:sequential_cap]
+    t0 = time.perf_counter()
+    html = email_service._render_broadcast_html("Bench", "Corps du message")
+    for p in sample:
+        await email_service._deliver({
+            "sender": {"email": email_service.SENDER_EMAIL},
+            "to": [p], "subject": "Bench", "htmlContent": html,
+        })
+    seq_rate = len(sample) / (time.perf_counter() - t0)
+    print(f"Séquentiel      : {seq_rate:8.1f} emails/s  (≈ {recipients / seq_rate:6.1f}s pour {recipients})")
+
+    # 2. Batch messageVersions + concurrence bornée
+    size, conc = broadcast_service.BROADCAST_BATCH_SIZE, broadcast_service.BROADCAST_CONCURRENCY
+    sem = asyncio.Semaphore(conc)
+
+    async def _batch(chunk):
+        async with sem:
+            return await email_service.send_broadcast_batch(chunk, "Bench", "Corps du message")
+
+    t0 = time.perf_counter()
+    results = await asyncio.gather(*(_batch(people[i:i + size]) for i in range(0, recipients, size)))
+    elapsed = time.perf_counter() - t0
+    print(f"Batch {size}×{conc}     : {recipients / elapsed:8.1f} emails/s  ({elapsed:6.2f}s, "
+          f"{results.count(False)} lot(s) en échec)")
+    print(f"Fake Brevo      : {fake.state.stats}")
+
+    print(f"Pool brevo      : {http_client.http_client_stats()['brevo']}")
+    await http_client.close_http_clients()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark broadcast email")
+    parser.add_argument("--recipients", type=int, default=2000)
+    parser.add_argument("--latency-ms", type=float, default=80.0)
+    parser.add_argument("--fail-rate", type=float, default=0.0)
+    parser.add_argument("--sequential-sample", type=int, default=50)
+    args = parser.parse_args()
+    asyncio.run(_run(args.recipients, args.latency_ms, args.fail_rate, args.sequential_sample))
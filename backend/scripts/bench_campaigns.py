@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+Benchmark du moteur de campagnes (services/campaign_service.py) contre le faux
+service WhatsApp (in-process, latence simulée).
+
+1. Référence : boucle message par message comme un appelant d'OutboundService
+   (check_can_send + envoi + record_outbound, un commit par message)
+2. Moteur sans cadence : N campagnes de tenants différents en parallèle —
+   débit brut, requêtes SQL par message (audience en masse, comptabilité par lot)
+3. Cadence : seau à jetons + écart par session avec jitter — débit obtenu par
+   tenant comparé à la cible, régularité des écarts
+
+Base SQLite temporaire (fichier) ; --database-url postgresql://… pour une vraie base
+(tables créées si absentes, tenants de bench supprimés à la fin).
+
+Usage :
+  cd backend
+  python scripts/bench_campaigns.py --tenants 20 --recipients 500 --latency-ms 30
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+import httpx  # noqa: E402
+from sqlalchemy import create_engine, event  # noqa: E402
+from sqlalchemy.orm import Session  # noqa: E402
+
+from app import http_client  # noqa: E402
+from app.database import Base  # noqa: E402
+from app.models import (  # noqa: E402
+    Campaign, CampaignRecipient, Conversation, Message, OutboundTracking, PlanType, Tenant,
+)
+from app.services import campaign_service  # noqa: E402
+from app.services.agent_service import OutboundService  # noqa: E402
+from app.services.campaign_service import CampaignService, CampaignWorker, deliver  # noqa: E402
+from app.services.contact_policy import reset_contact_policies  # noqa: E402
+from scripts.fake_whatsapp_service import create_app  # noqa: E402
+
+
+def _seed(engine, tenants: int, recipients: int) -> list:
+    ids = []
+    with Session(engine) as db:
+        for t in range(tenants):
+            tenant = Tenant(name=f"Bench {t}", email=f"bench-campaign-{t}-{time.time_ns()}@bench.test",
+                            phone="237600000000", plan=PlanType.PRO)
+            db.add(tenant)
+            db.flush()
+            db.add_all(
+                Conversation(tenant_id=tenant.id, customer_phone=f"2376{t:03d}{i:05d}", customer_name=f"Client {i}")
+                for i in range(recipients)
+            )
+            ids.append(tenant.id)
+        db.commit()
+    return ids
+
+
+def _cleanup(engine, tenant_ids: list) -> None:
+    with Session(engine) as db:
+        campaign_ids = [c for (c,) in db.query(Campaign.id).filter(Campaign.tenant_id.in_(tenant_ids))]
+        db.query(CampaignRecipient).filter(CampaignRecipient.campaign_id.in_(campaign_ids)).delete(synchronize_session=False)
+        db.query(Campaign).filter(Campaign.id.in_(campaign_ids)).delete(synchronize_session=False)
+        conv_ids = db.query(Conversation.id).filter(Conversation.tenant_id.in_(tenant_ids))
+        db.query(Message).filter(Message.conversation_id.in_(conv_ids)).delete(synchronize_session=False)
+        db.query(Conversation).filter(Conversation.tenant_id.in_(tenant_ids)).delete(synchronize_session=False)
+        db.query(OutboundTracking).filter(OutboundTracking.tenant_id.in_(tenant_ids)).delete(synchronize_session=False)
+        db.query(Tenant).filter(Tenant.id.in_(tenant_ids)).delete(synchronize_session=False)
+        db.commit()
+
+
+class _Counter:
+    def __init__(self, engine):
+        self.count = 0
+        event.listen(engine, "before_cursor_execute", self._on)
+
+    def _on(self, *_args):
+        self.count += 1
+
+
+async def _baseline(engine, tenant_id: int, sample: int, counter: _Counter) -> None:
+    with Session(engine) as db:
+        phones = [p for (p,) in db.query(Conversation.customer_phone)
+                  .filter(Conversation.tenant_id == tenant_id).limit(sample)]
+        start_q, t0 = counter.count, time.perf_counter()
+        for phone in phones:
+            ok, _ = OutboundService.check_can_send(tenant_id, phone, "promo", db, PlanType.PRO)
+            if ok and (await deliver(tenant_id, phone, "Bonjour, -20% cette semaine"))[0] == "sent":
+                OutboundService.record_outbound(tenant_id, phone, "promo", db)
+        elapsed = time.perf_counter() - t0
+    print(f"Référence       : {len(phones) / elapsed:8.1f} msg/s   "
+          f"{(counter.count - start_q) / len(phones):5.1f} requêtes SQL/msg   (séquentiel, {len(phones)} msgs)")
+
+
+async def _engine_run(engine, tenant_ids: list, counter: _Counter, label: str) -> dict:
+    with Session(engine) as db:
+        t0, start_q = time.perf_counter(), counter.count
+        for tenant_id in tenant_ids:
+            CampaignService.create(db, db.get(Tenant, tenant_id), "Bench", "Bonjour {{first_name|}} 👋 -20% chez {{business}}")
+        created = time.perf_counter() - t0
+        claimed = CampaignWorker.claim(db, len(tenant_ids), set())
+    start_q, t0 = counter.count, time.perf_counter()
+    statuses = await asyncio.gather(*(CampaignWorker.run(cid, bind=engine) for cid in claimed))
+    elapsed = time.perf_counter() - t0
+    with Session(engine) as db:
+        sent = sum(c.sent for c in db.query(Campaign).filter(Campaign.id.in_(claimed)))
+    print(f"{label:<16}: {sent / elapsed:8.1f} msg/s   {(counter.count - start_q) / max(sent, 1):5.1f} requêtes SQL/msg   "
+          f"({len(claimed)} campagnes, {sent} msgs en {elapsed:.2f}s ; création {created:.2f}s ; "
+          f"{statuses.count('completed')} terminées)")
+    return {"sent": sent, "elapsed": elapsed}
+
+
+async def _run(args) -> None:
+    workdir = tempfile.mkdtemp(prefix="bench_campaigns_")
+    url = args.database_url or f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    engine = create_engine(url)
+    Base.metadata.create_all(engine)
+    campaign_service.SessionLocal = lambda: Session(bind=engine, expire_on_commit=False)
+    counter = _Counter(engine)
+
+    arrivals = defaultdict(list)
+    fake = create_app(latency_ms=args.latency_ms, record=False,
+                      on_send=lambda tenant_id, _to, at: arrivals[tenant_id].append(at))
+    await http_client.set_transport("whatsapp-service", httpx.ASGITransport(app=fake))
+    tenant_ids = []
+    try:
+        # 1. Référence
+        tenant_ids += _seed(engine, 1, args.baseline_sample)
+        await _baseline(engine, tenant_ids[0], args.baseline_sample, counter)
+
+        # 2. Moteur, cadence désactivée : débit brut
+        campaign_service.CAMPAIGN_TENANT_PER_MINUTE = 0
+        campaign_service.CAMPAIGN_SESSION_GAP_SECONDS = 0
+        campaign_service.reset_pacers()
+        reset_contact_policies()
+        raw_ids = _seed(engine, args.tenants, args.recipients)
+        tenant_ids += raw_ids
+        await _engine_run(engine, raw_ids, counter, "Moteur (brut)")
+
+        # 3. Cadence : cible par tenant = min(seau, 60 / écart)
+        campaign_service.CAMPAIGN_TENANT_PER_MINUTE = args.per_minute
+        campaign_service.CAMPAIGN_TENANT_BURST = 3
+        campaign_service.CAMPAIGN_SESSION_GAP_SECONDS = args.gap
+        campaign_service.CAMPAIGN_JITTER = 0.5
+        campaign_service.reset_pacers()
+        paced_ids = _seed(engine, args.tenants, args.paced_recipients)
+        tenant_ids += paced_ids
+        arrivals.clear()
+        await _engine_run(engine, paced_ids, counter, "Moteur (cadencé)")
+        target = min(args.per_minute, 60 / args.gap) if args.gap else args.per_minute
+        rates, cvs = [], []
+        for tenant_id in paced_ids:
+            times = sorted(arrivals[tenant_id])
+            if len(times) < 3:
+                continue
+            gaps = [b - a for a, b in zip(times, times[1:])]
+            rates.append(60 * (len(times) - 1) / (times[-1] - times[0]))
+            cvs.append(statistics.pstdev(gaps) / statistics.mean(gaps))
+        print(f"Cadence         : cible {target:.0f} msg/min/tenant → obtenu {statistics.mean(rates):.0f} "
+              f"(min {min(rates):.0f}, max {max(rates):.0f}) ; jitter CV des écarts {statistics.mean(cvs):.2f}")
+        print(f"Fake WhatsApp   : {fake.state.stats}")
+    finally:
+        await http_client.set_transport("whatsapp-service", None)
+        await http_client.close_http_clients()
+        if args.database_url:
+            _cleanup(engine, tenant_ids)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark campagnes WhatsApp sortantes")
+    parser.add_argument("--tenants", type=int, default=20)
+    parser.add_argument("--recipients", type=int, default=500, help="destinataires par campagne (débit brut)")
+    parser.add_argument("--paced-recipients", type=int, default=25, help="destinataires par campagne (cadence)")
+    parser.add_argument("--baseline-sample", type=int, default=300)
+    parser.add_argument("--latency-ms", type=float, default=30.0)
+    parser.add_argument("--per-minute", type=float, default=600.0)
+    parser.add_argument("--gap", type=float, default=0.1)
+    parser.add_argument("--database-url", default=None)
+    asyncio.run(_run(parser.parse_args()))
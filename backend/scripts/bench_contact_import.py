@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Benchmark de l'import de contacts (services/contact_import.py) sur un fichier
+généré : lecture en flux + normalisation + dédoublonnage, puis chargement par lots.
+
+Par défaut la base est un SQLite en mémoire (INSERT … ON CONFLICT multi-lignes) ;
+avec --database-url postgresql://… le chemin COPY + INSERT … SELECT est mesuré
+(tenant temporaire créé puis supprimé avec ses contacts).
+
+Usage :
+  cd backend
+  python scripts/bench_contact_import.py --rows 100000
+  python scripts/bench_contact_import.py --rows 100000 --format xlsx
+  python scripts/bench_contact_import.py --rows 100000 --database-url postgresql://...
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+import zipfile
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from sqlalchemy import create_engine  # noqa: E402
+from sqlalchemy.orm import Session  # noqa: E402
+from sqlalchemy.pool import StaticPool  # noqa: E402
+
+from app.database import Base  # noqa: E402
+from app.models import ContactImportJob, ContactSetting, PlanType, Tenant  # noqa: E402
+from app.services import contact_import  # noqa: E402
+from app.services.contact_import import ContactImportService, iter_contacts  # noqa: E402
+
+FIRST_NAMES = ("Awa", "Paul", "Chantal", "Ibrahim", "Grace", "Jean", "Aïcha", "Brice", "Mireille", "Samuel")
+
+
+def _phones(rows: int) -> list:
+    """Numéros aux formats variés, ~2 % de doublons et ~1 % d'invalides."""
+    random.seed(7)
+    out = []
+    for i in range(rows):
+        n = 690000000 + (i if random.random() > 0.02 else random.randrange(max(i, 1)))
+        out.append(random.choice((f"+237 {n}", f"00237{n}", f"{n}", f"237-{n}")) if random.random() > 0.01 else "n/a")
+    return out
+
+
+def write_csv(path: str, rows: int) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("Nom;Téléphone;Ville\n")
+        for i, phone in enumerate(_phones(rows)):
+            f.write(f"{FIRST_NAMES[i % 10]} {i};{phone};Douala\n")
+
+
+def write_xlsx(path: str, rows: int) -> None:
+    ns = 'xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"'
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as zf:
+        with zf.open("xl/worksheets/sheet1.xml", "w") as f:
+            f.write(f'<worksheet {ns}><sheetData><row r="1"><c r="A1" t="inlineStr"><is><t>Nom</t></is></c>'
+                    f'<c r="B1" t="inlineStr"><is><t>Téléphone</t></is></c></row>'.encode())
+            for i, phone in enumerate(_phones(rows), start=2):
+                f.write(f'<row r="{i}"><c r="A{i}" t="inlineStr"><is><t>{FIRST_NAMES[i % 10]} {i}</t></is></c>'
+                        f'<c r="B{i}" t="inlineStr"><is><t>{phone}</t></is></c></row>'.encode())
+            f.write(b"</sheetData></worksheet>")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark import de contacts")
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--format", choices=("csv", "xlsx"), default="csv")
+    parser.add_argument("--database-url", default="sqlite://")
+    parser.add_argument("--chunk", type=int, default=contact_import.CONTACT_IMPORT_CHUNK)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_contacts_")
+    path = os.path.join(workdir, f"contacts.{args.format}")
+    (write_xlsx if args.format == "xlsx" else write_csv)(path, args.rows)
+    size = os.path.getsize(path)
+    print(f"Fichier {args.format} : {args.rows} lignes, {size / 1e6:.1f} Mo")
+
+    # 1. Lecture seule : flux + normalisation + dédoublonnage
+    stats = {"bytes_total": size, "bytes_read": 0, "rows_read": 0, "invalid": 0, "duplicates": 0}
+    t0 = time.perf_counter()
+    unique = sum(1 for _ in iter_contacts(path, args.format, stats))
+    parse_s = time.perf_counter() - t0
+    print(f"Lecture         : {parse_s:6.2f}s  ({args.rows / parse_s:,.0f} lignes/s) — "
+          f"{unique} uniques, {stats['duplicates']} doublons, {stats['invalid']} invalides")
+
+    # 2. Import complet (job) : lecture + chargement par lots
+    kwargs = {"poolclass": StaticPool, "connect_args": {"check_same_thread": False}} \
+        if args.database_url.startswith("sqlite") else {}
+    engine = create_engine(args.database_url, **kwargs)
+    Base.metadata.create_all(engine)
+    contact_import.CONTACT_IMPORT_CHUNK = args.chunk
+    db = Session(bind=engine, expire_on_commit=False)
+    tenant = Tenant(name="Bench import", email=f"bench-import-{int(time.time())}@loadtest.local",
+                    phone="237600000000", business_type="autre", plan=PlanType.BASIC)
+    db.add(tenant)
+    db.commit()
+    try:
+        job = ContactImportService.create_job(db, tenant.id, "bench", args.format, size)
+        t0 = time.perf_counter()
+        ContactImportService.run_job(job.id, path, engine)
+        total_s = time.perf_counter() - t0
+        db.expire_all()
+        job = db.get(ContactImportJob, job.id)
+        print(f"Import complet  : {total_s:6.2f}s  ({args.rows / total_s:,.0f} lignes/s, lots de {args.chunk}) — "
+              f"{job.status}, {job.created} créés, {job.updated} mis à jour")
+    finally:
+        db.query(ContactSetting).filter(ContactSetting.tenant_id == tenant.id).delete()
+        db.query(ContactImportJob).filter(ContactImportJob.tenant_id == tenant.id).delete()
+        db.query(Tenant).filter(Tenant.id == tenant.id).delete()
+        db.commit()
+        db.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Benchmark de contention sur la création de conversation (tenant, téléphone).
+
+1. In-process : ancien dict de verrous (jamais purgé) vs ConversationLockManager
+   (verrous retirés dès qu'ils sont libres) — débit et taille du registre.
+2. Cross-process : P processus × T threads créent en même temps les conversations
+   des mêmes numéros, pour chaque mode (local, upsert, advisory). On compte les
+   doublons (doivent être 0), les conflits rattrapés et le temps total.
+
+Usage :
+  cd backend
+  DATABASE_URL=postgresql://... python scripts/bench_conversation_lock.py --processes 4 --threads 8
+  (SQLite fonctionne aussi mais sérialise les écritures : chiffres peu représentatifs)
+"""
+
+import argparse
+import asyncio
+import multiprocessing as mp
+import os
+import random
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from sqlalchemy import create_engine, func  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+from app.database import Base  # noqa: E402
+from app.models import Conversation, Tenant  # noqa: E402
+from app.services.conversation_lock import (  # noqa: E402
+    ConversationLockManager, get_or_create_conversation, CONVERSATION_LOCK_MODES,
+)
+
+
+# ─── 1. In-process ────────────────────────────────────────────────────────────
+
+async def _bench_in_process(messages: int, phones: int, concurrency: int) -> None:
+    legacy: dict = {}
+
+    def _legacy_lock(key):
+        if key not in legacy:
+            legacy[key] = asyncio.Lock()
+        return legacy[key]
+
+    manager = ConversationLockManager()
+    keys = [(1, f"2376{i:08d}") for i in range(phones)]
+    sem = asyncio.Semaphore(concurrency)
+
+    async def _legacy_one(key):
+        async with sem:
+            async with _legacy_lock(key):
+                await asyncio.sleep(0)
+
+    async def _manager_one(key):
+        async with sem:
+            async with manager.hold(*key):
+                await asyncio.sleep(0)
+
+    for label, fn, size in (
+        ("dict (ancien)", _legacy_one, lambda: len(legacy)),
+        ("LockManager  ", _manager_one, lambda: len(manager)),
+    ):
+        picks = [random.choice(keys) for _ in range(messages)]
+        t0 = time.perf_counter()
+        await asyncio.gather(*(fn(k) for k in picks))
+        elapsed = time.perf_counter() - t0
+        print(f"{label} : {messages / elapsed:10.0f} acquisitions/s — verrous en mémoire : {size()}")
+
+
+# ─── 2. Cross-process ─────────────────────────────────────────────────────────
+
+def _worker(url: str, mode: str, tenant_id: int, phones: list[str], threads: int, seed: int, out) -> None:
+    engine = create_engine(url, pool_size=threads, max_overflow=0)
+    Session = sessionmaker(bind=engine, expire_on_commit=False)
+    rnd = random.Random(seed)
+    order = phones[:]
+    rnd.shuffle(order)
+    created = 0
+
+    def _one(phone: str) -> bool:
+        db = Session()
+        try:
+            return get_or_create_conversation(db, tenant_id, phone, phone, mode=mode)[1]
+        finally:
+            db.close()
+
+    with ThreadPoolExecutor(threads) as pool:
+        created = sum(pool.map(_one, order))
+    engine.dispose()
+    out.put(created)
+
+
+def _bench_cross_process(url: str, phones: int, processes: int, threads: int) -> None:
+    engine = create_engine(url)
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(bind=engine)
+
+    for mode in CONVERSATION_LOCK_MODES:
+        db = Session()
+        tenant = Tenant(name="bench-lock", email=f"bench-lock-{mode}-{time.time_ns()}@bench.test", phone="0")
+        db.add(tenant)
+        db.commit()
+        tenant_id = tenant.id
+        db.close()
+
+        numbers = [f"+2376{i:08d}" for i in range(phones)]
+        out = mp.Queue()
+        procs = [
+            mp.Process(target=_worker, args=(url, mode, tenant_id, numbers, threads, seed, out))
+            for seed in range(processes)
+        ]
+        t0 = time.perf_counter()
+        for p in procs:
+            p.start()
+        created = sum(out.get() for _ in procs)
+        for p in procs:
+            p.join()
+        elapsed = time.perf_counter() - t0
+
+        db = Session()
+        rows = db.query(func.count(Conversation.id)).filter(Conversation.tenant_id == tenant_id).scalar()
+        db.query(Conversation).filter(Conversation.tenant_id == tenant_id).delete()
+        db.query(Tenant).filter(Tenant.id == tenant_id).delete()
+        db.commit()
+        db.close()
+
+        attempts = phones * processes
+        print(
+            f"{mode:9s}: {attempts / elapsed:8.0f} appels/s ({elapsed:5.2f}s) — "
+            f"conversations={rows} (attendu {phones}), créations revendiquées={created}, "
+            f"doublons={rows - phones}"
+        )
+    engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark verrous de conversation")
+    parser.add_argument("--messages", type=int, default=200_000)
+    parser.add_argument("--phones", type=int, default=2_000)
+    parser.add_argument("--concurrency", type=int, default=500)
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--skip-db", action="store_true", help="uniquement le benchmark in-process")
+    args = parser.parse_args()
+
+    print("── In-process ──")
+    asyncio.run(_bench_in_process(args.messages, args.phones, args.concurrency))
+    if not args.skip_db:
+        print("── Cross-process ──")
+        _bench_cross_process(os.environ["DATABASE_URL"], args.phones, args.processes, args.threads)
@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmarks du travail CPU par message (fonctions Python pures du pipeline).
+
+Chaque cas traite un corpus fixe (messages clients, réponses IA, historiques
+réalistes) ; la mesure est le temps par élément du corpus en µs (meilleur de
+--repeat séries, timeit, GC désactivé). Aucune base ni réseau : le prompt agent
+est construit avec une session simulée.
+
+Cas :
+  intent_classify      IntentClassifier.classify
+  escalation_trigger   EscalationService.detect_escalation_trigger (sans conversation → pas de DB)
+  outcome_detect       outcome_detector.detect_outcome
+  agent_system_prompt  build_agent_system_prompt (session simulée, 3 sources de 2 Ko)
+  sales_prompt         SalesPromptGenerator.generate
+  customer_info        ConversationMemoryService.extract_customer_info (historique de 30 messages)
+  compute_delay        _compute_delay
+  product_image_scan   CatalogIndex.illustrate (catalogue de 60 produits compilé, 10 photos déjà envoyées)
+  catalog_fast_answer  CatalogIndex.answer (réponse directe prix / disponibilité)
+
+Usage :
+  cd backend
+  python scripts/bench_hot_paths.py                          # mesure et affiche
+  python scripts/bench_hot_paths.py --save                   # enregistre la baseline
+  python scripts/bench_hot_paths.py --compare --threshold 0.15
+      → code de sortie 1 si un cas est plus lent que la baseline de plus de 15 %
+
+Les baselines dépendent de la machine : les régénérer (--save) sur la machine
+de comparaison avant une série d'optimisations.
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import sys
+import timeit
+from datetime import datetime
+from types import SimpleNamespace
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+os.environ.setdefault("DATABASE_URL", "sqlite://")   # app.database l'exige ; aucune requête n'est faite
+
+logging.disable(logging.CRITICAL)   # les fonctions mesurées journalisent en INFO
+
+from app.models import AgentTemplate, KnowledgeSource, PromptVariable, Tenant, TenantBusinessConfig  # noqa: E402
+from app.services.agent_service import build_agent_system_prompt  # noqa: E402
+from app.services.conversation_memory_service import ConversationMemoryService  # noqa: E402
+from app.services.escalation_service import EscalationService  # noqa: E402
+from app.services.intent_classifier import IntentClassifier  # noqa: E402
+from app.services.outcome_detector import detect_outcome  # noqa: E402
+from app.services.sales_prompt_generator import SalesPromptGenerator  # noqa: E402
+from app.services.catalog_index import CatalogIndex, image_key  # noqa: E402
+from app.whatsapp_webhook import _compute_delay  # noqa: E402
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), "bench_hot_paths_baseline.json")
+MIN_DELTA_US = 0.25   # en dessous, l'écart est du bruit de mesure (fonctions sub-µs)
+
+# ── Corpus fixes ──────────────────────────────────────────────────────────────
+
+CUSTOMER_MESSAGES = [
+    "Bonjour",
+    "Bonsoir, vous êtes ouverts demain ?",
+    "Combien coûte la robe wax taille M ?",
+    "Je veux commander 2 sacs en cuir noir, livraison à Douala svp",
+    "Vous acceptez Orange Money ou seulement MTN ?",
+    "C'est quoi vos horaires le week-end ?",
+    "Je suis très mécontent, ma commande n'est jamais arrivée",
+    "Pouvez-vous m'envoyer le menu du restaurant ?",
+    "Je m'appelle Aïcha, je tiens une boutique de vêtements à Yaoundé et je cherche une solution pour répondre à mes clientes",
+    "Quel est le prix du plan ? Il y a un essai gratuit ? Ça marche comment ? Et l'intégration ?",
+    "Qui a gagné le match hier soir ?",
+    "Merci beaucoup pour votre aide !",
+    "ça plante quand j'essaie de payer",
+    "Je veux parler à un humain",
+    "Mon budget est de 50 000 FCFA par mois, vous avez quelque chose ?",
+    "ok",
+    "Est-ce que la livraison est gratuite à partir de 3 articles ?",
+    "Le téléphone Samsung A15 est encore disponible ?",
+    "J'ai besoin d'un rendez-vous pour jeudi 10h",
+    "Remboursement svp, le produit est défectueux",
+] * 5
+
+AI_RESPONSES = [
+    "Bonjour ! Comment puis-je vous aider aujourd'hui ? 😊",
+    "Votre rendez-vous est prévu jeudi à 10h, je vous envoie un rappel la veille.",
+    "Parfait, votre commande est confirmée : 2 sacs cuir noir, livraison demain à Douala.",
+    "La robe wax taille M est à 15 000 FCFA. Souhaitez-vous la commander ?",
+    "Je comprends, je transmets votre demande à notre équipe qui vous recontacte rapidement.",
+    "Merci pour ces informations, votre budget correspond à notre offre Essential.",
+    "Votre problème est résolu, n'hésitez pas si vous avez d'autres questions.",
+    "Pas de souci, je reste disponible si vous changez d'avis.",
+    "Nous livrons à Yaoundé en 48h pour 2 000 FCFA. Le Sac cuir 7 est en stock.",
+    "Le Téléphone pro 17 et les Écouteurs sport 8 sont disponibles, voici les prix.",
+] * 10
+
+AGENT_TYPES = ["vente", "rdv", "support", "faq", "qualification", "libre"]
+
+PRODUCT_WORDS = ("Robe", "Chemise", "Pagne", "Sac", "Sandales", "Montre", "Parfum", "Téléphone", "Écouteurs", "Pizza")
+PRODUCT_ADJECTIVES = ("wax", "premium", "classique", "slim", "cuir", "sport", "mini", "pro", "famille", "XL")
+PRODUCTS = [
+    {
+        "name": f"{PRODUCT_WORDS[i % 10]} {PRODUCT_ADJECTIVES[(i // 10) % 10]} {i}",
+        "price": 1000 * (i % 50 + 2),
+        "description": "Disponible en plusieurs tailles et couleurs.",
+        **({"image_url": f"data:image/jpeg;base64,IMG{i}"} if i % 3 == 0 else {}),
+    }
+    for i in range(60)
+]
+
+HISTORY = [
+    SimpleNamespace(is_ai=i % 2 == 1, content=(AI_RESPONSES if i % 2 else CUSTOMER_MESSAGES)[i])
+    for i in range(30)
+]
+
+
+# ── Session simulée pour build_agent_system_prompt ────────────────────────────
+
+class _FakeQuery:
+    def __init__(self, rows: list):
+        self._rows = rows
+
+    def filter(self, *_args):
+        return self
+
+    def all(self):
+        return self._rows
+
+    def first(self):
+        return self._rows[0] if self._rows else None
+
+
+class _FakeSession:
+    def __init__(self, rows_by_model: dict):
+        self._rows = rows_by_model
+
+    def query(self, *columns):
+        if len(columns) > 1:
+            # Version du cache du bloc de connaissance : constante → régime établi (cache chaud)
+            return _FakeQuery([(len(self._rows.get(KnowledgeSource, [])), None)])
+        return _FakeQuery(self._rows.get(columns[0], []))
+
+
+def _agent_fixture():
+    agent = AgentTemplate(
+        id=1, tenant_id=1, name="Bench", agent_type="vente", tone="Friendly", language="fr",
+        max_response_length=400, emoji_enabled=True,
+        system_prompt="Tu es l'assistant de {{nom_entreprise}}. Catalogue : {{lien_catalogue}}.",
+    )
+    session = _FakeSession({
+        Tenant: [Tenant(id=1, name="Boutique Bench", phone="237690000000", business_type="ecommerce")],
+        TenantBusinessConfig: [TenantBusinessConfig(tenant_id=1, company_name="Boutique Bench", company_description="Bienvenue !")],
+        PromptVariable: [
+            PromptVariable(key="nom_entreprise", value="Boutique Bench"),
+            PromptVariable(key="lien_catalogue", value="https://exemple.cm/catalogue"),
+        ],
+        KnowledgeSource: [
+            KnowledgeSource(name=f"Source {i}", source_type="text", content_extracted="Livraison à Douala sous 24h. " * 80)
+            for i in range(3)
+        ],
+    })
+    return agent, session
+
+
+# ── Cas ───────────────────────────────────────────────────────────────────────
+
+def _cases() -> dict:
+    """nom → (callable traitant tout le corpus, nombre d'éléments)."""
+    agent, session = _agent_fixture()
+    business_data = {"company_name": "Boutique Bench", "tone": "Friendly", "products_services": PRODUCTS[:10]}
+    catalog = CatalogIndex(PRODUCTS)
+    already_sent = {image_key(p) for p in PRODUCTS[:30] if p.get("image_url")}
+
+    def intent_classify():
+        for m in CUSTOMER_MESSAGES:
+            IntentClassifier.classify(m, "ecommerce")
+
+    def escalation_trigger():
+        for m in CUSTOMER_MESSAGES:
+            EscalationService.detect_escalation_trigger(m, None, None)
+
+    def outcome_detect():
+        for i, r in enumerate(AI_RESPONSES):
+            detect_outcome(AGENT_TYPES[i % len(AGENT_TYPES)], r)
+
+    def agent_system_prompt():
+        for _ in range(10):
+            build_agent_system_prompt(agent, session)
+
+    def sales_prompt():
+        for m in CUSTOMER_MESSAGES:
+            SalesPromptGenerator.generate(m, "pricing_inquiry", "pricing", business_data, extra_context="Client fidèle")
+
+    def customer_info():
+        for _ in range(10):
+            ConversationMemoryService.extract_customer_info(HISTORY)
+
+    def compute_delay():
+        for _ in range(10):
+            for mode, r in zip(["immediate", "natural", "human", "slow"] * 25, AI_RESPONSES):
+                _compute_delay(mode, r)
+
+    def product_image_scan():
+        for r in AI_RESPONSES:
+            catalog.illustrate(r, already_sent)
+
+    def catalog_fast_answer():
+        for m in CUSTOMER_MESSAGES:
+            catalog.answer(m)
+
+    return {
+        "intent_classify": (intent_classify, len(CUSTOMER_MESSAGES)),
+        "escalation_trigger": (escalation_trigger, len(CUSTOMER_MESSAGES)),
+        "outcome_detect": (outcome_detect, len(AI_RESPONSES)),
+        "agent_system_prompt": (agent_system_prompt, 10),
+        "sales_prompt": (sales_prompt, len(CUSTOMER_MESSAGES)),
+        "customer_info": (customer_info, 10),
+        "compute_delay": (compute_delay, 1000),
+        "product_image_scan": (product_image_scan, len(AI_RESPONSES)),
+        "catalog_fast_answer": (catalog_fast_answer, len(CUSTOMER_MESSAGES)),
+    }
+
+
+def measure(only: list[str], repeat: int) -> dict:
+    random.seed(42)   # SalesPromptGenerator / _compute_delay tirent au hasard
+    results = {}
+    for name, (fn, items) in _cases().items():
+        if only and name not in only:
+            continue
+        timer = timeit.Timer(fn)
+        loops, _ = timer.autorange()
+        best = min(timer.repeat(repeat=repeat, number=loops)) / loops
+        results[name] = {"us_per_call": round(best / items * 1e6, 3), "items": items}
+        print(f"  {name:22s} {results[name]['us_per_call']:10.2f} µs/élément")
+    return results
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list[str]:
+    """Noms des cas plus lents que la baseline au-delà du seuil (0.15 = +15 %)."""
+    regressions = []
+    print(f"\n{'cas':22s} {'baseline':>10s} {'actuel':>10s} {'écart':>8s}")
+    for name, current in results.items():
+        base = baseline["results"].get(name)
+        if base is None:
+            print(f"  {name:22s} {'—':>10s} {current['us_per_call']:10.2f}   (nouveau)")
+            continue
+        ratio = current["us_per_call"] / base["us_per_call"] - 1
+        flag = ""
+        significant = abs(current["us_per_call"] - base["us_per_call"]) >= MIN_DELTA_US
+        if ratio > threshold and significant:
+            flag = "  ❌ RÉGRESSION"
+            regressions.append(name)
+        elif ratio < -threshold and significant:
+            flag = "  ✅ amélioration"
+        print(f"  {name:22s} {base['us_per_call']:10.2f} {current['us_per_call']:10.2f} {ratio:+8.1%}{flag}")
+    return regressions
+
+
+def main(args) -> int:
+    only = [n for n in args.only.split(",") if n]
+    print(f"Micro-benchmarks (Python {platform.python_version()}, {args.repeat} séries)")
+    results = measure(only, args.repeat)
+
+    if args.save:
+        with open(args.baseline, "w") as f:
+            json.dump({
+                "meta": {
+                    "python": platform.python_version(), "machine": platform.machine(),
+                    "platform": platform.platform(), "created_at": datetime.utcnow().isoformat(timespec="seconds"),
+                },
+                "results": results,
+            }, f, indent=2, ensure_ascii=False)
+        print(f"📄 Baseline enregistrée : {args.baseline}")
+        return 0
+
+    if args.compare:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        meta = baseline.get("meta", {})
+        if meta.get("python") != platform.python_version() or meta.get("machine") != platform.machine():
+            print(f"⚠️ Baseline mesurée sur {meta.get('platform')} / Python {meta.get('python')} — écarts peu fiables")
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"\n❌ {len(regressions)} régression(s) > {args.threshold:.0%} : {', '.join(regressions)}")
+            return 1
+        print(f"\n✅ Aucune régression > {args.threshold:.0%}")
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Micro-benchmarks des fonctions chaudes du pipeline message")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save", action="store_true", help="enregistre les mesures comme baseline")
+    parser.add_argument("--compare", action="store_true", help="compare à la baseline")
+    parser.add_argument("--threshold", type=float, default=0.15, help="écart toléré (0.15 = +15 %%)")
+    parser.add_argument("--repeat", type=int, default=7)
+    parser.add_argument("--only", default="", help="cas séparés par des virgules")
+    sys.exit(main(parser.parse_args()))
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Benchmark d'ingestion webhook : rafale de reconnexion Baileys.
+
+C conversations × M messages en attente arrivent d'un coup :
+  - unitaire : un appel /api/v1/webhooks/whatsapp par message (une session DB
+    chacun, pipeline complet, une réponse IA par message) ;
+  - batch    : /api/v1/webhooks/whatsapp/batch par lots de B messages
+    (INSERT groupé, une réponse IA par conversation).
+
+Le LLM est simulé (brain.process → sleep --llm-ms) : on mesure l'ingestion et
+le nombre d'appels IA, pas DeepSeek. Les envois WhatsApp (BackgroundTasks) ne
+sont pas exécutés.
+
+Usage :
+  cd backend
+  DATABASE_URL=postgresql://... python scripts/bench_webhook_batch.py --conversations 40 --messages 10
+  (SQLite fonctionne aussi : DATABASE_URL=sqlite:////tmp/bench.db)
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from fastapi import BackgroundTasks  # noqa: E402
+from sqlalchemy import create_engine  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+from starlette.requests import Request  # noqa: E402
+
+from app.database import Base  # noqa: E402
+from app.models import AgentTemplate, Conversation, Message, PlanType, Tenant  # noqa: E402
+from app import whatsapp_webhook as wh  # noqa: E402
+
+
+def _setup(Session) -> int:
+    db = Session()
+    tenant = Tenant(
+        name="bench-webhook", email=f"bench-webhook-{time.time_ns()}@bench.test", phone="0",
+        plan=PlanType.PRO, messages_used=0, messages_limit=-1,
+    )
+    db.add(tenant)
+    db.flush()
+    db.add(AgentTemplate(tenant_id=tenant.id, name="Bench", is_active=True, response_delay="immediate"))
+    db.commit()
+    tenant_id = tenant.id
+    db.close()
+    return tenant_id
+
+
+def _cleanup(Session, tenant_id: int) -> None:
+    db = Session()
+    conv_ids = [c.id for c in db.query(Conversation.id).filter(Conversation.tenant_id == tenant_id)]
+    if conv_ids:
+        db.query(Message).filter(Message.conversation_id.in_(conv_ids)).delete(synchronize_session=False)
+    db.query(Conversation).filter(Conversation.tenant_id == tenant_id).delete()
+    db.commit()
+    db.close()
+
+
+def _flood(tenant_id: int, conversations: int, messages: int, run: str) -> list:
+    return [
+        wh.WhatsAppMessage(
+            tenant_id=tenant_id, from_=f"2376{c:08d}", text=f"message {m}", senderName=f"Client {c}",
+            messageKey={"id": f"{run}-{c}-{m}"}, timestamp=1760000000 + m,
+        )
+        for m in range(messages)
+        for c in range(conversations)
+    ]
+
+
+def _request(path: str) -> Request:
+    return Request({"type": "http", "method": "POST", "path": path, "headers": []})
+
+
+async def _run_single(Session, flood) -> float:
+    t0 = time.perf_counter()
+    for message in flood:
+        db = Session()
+        try:
+            await wh.whatsapp_webhook(_request("/api/v1/webhooks/whatsapp"), message, BackgroundTasks(), db)
+        finally:
+            db.close()
+    return time.perf_counter() - t0
+
+
+async def _run_batch(Session, flood, batch_size: int) -> float:
+    t0 = time.perf_counter()
+    for start in range(0, len(flood), batch_size):
+        db = Session()
+        try:
+            await wh.whatsapp_webhook_batch(
+                _request("/api/v1/webhooks/whatsapp/batch"), flood[start:start + batch_size], BackgroundTasks(), db,
+            )
+        finally:
+            db.close()
+    return time.perf_counter() - t0
+
+
+async def main(args) -> None:
+    engine = create_engine(os.environ["DATABASE_URL"])
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(bind=engine)
+
+    llm_calls = 0
+
+    async def _fake_llm(*_a, **_k):
+        nonlocal llm_calls
+        llm_calls += 1
+        await asyncio.sleep(args.llm_ms / 1000)
+        return "Merci pour votre message, je reviens vers vous."
+
+    wh.brain.process = _fake_llm
+    total = args.conversations * args.messages
+    print(f"{args.conversations} conversations × {args.messages} messages = {total} messages, LLM simulé {args.llm_ms} ms")
+
+    for label, runner in (
+        ("unitaire", lambda flood: _run_single(Session, flood)),
+        (f"batch {args.batch_size:<4d}", lambda flood: _run_batch(Session, flood, args.batch_size)),
+    ):
+        tenant_id = _setup(Session)
+        llm_calls = 0
+        elapsed = await runner(_flood(tenant_id, args.conversations, args.messages, f"{label}-{time.time_ns()}"))
+        print(f"{label:10s}: {total / elapsed:8.0f} messages/s ({elapsed:6.2f}s) — appels IA={llm_calls}")
+        _cleanup(Session, tenant_id)
+    engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark webhook unitaire vs batch")
+    parser.add_argument("--conversations", type=int, default=40)
+    parser.add_argument("--messages", type=int, default=10)
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--llm-ms", type=int, default=20)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Faux serveur Brevo (POST /v3/smtp/email) pour les tests et benchmarks d'envoi.
+Aucun email n'est envoyé : les payloads sont comptés/enregistrés en mémoire.
+
+Usage :
+  cd backend
+  python scripts/fake_brevo_server.py --port 8025 --latency-ms 80 --fail-rate 0.05
+
+Puis pointer le backend dessus :
+  BREVO_API_URL=http://127.0.0.1:8025/v3/smtp/email BREVO_API_KEY=fake
+
+Statistiques : GET /stats — remise à zéro : POST /reset
+"""
+
+import argparse
+import asyncio
+import random
+import uuid
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+
+def create_app(latency_ms: float = 0.0, fail_rate: float = 0.0, rate_limit_every: int = 0,
+               record: bool = True) -> FastAPI:
+    """
+    latency_ms       : délai simulé par requête
+    fail_rate        : proportion de réponses 503 (0.0 → 1.0)
+    rate_limit_every : renvoie un 429 (Retry-After: 1) toutes les N requêtes (0 = jamais)
+    record           : conserve les payloads reçus dans app.state.received
+    """
+    app = FastAPI(title="Fake Brevo")
+    app.state.received = []
+    app.state.stats = {"requests": 0, "emails": 0, "errors": 0, "rate_limited": 0}
+
+    @app.post("/v3/smtp/email")
+    async def send_email(request: Request):
+        stats = app.state.stats
+        stats["requests"] += 1
+        if not request.headers.get("api-key"):
+            return JSONResponse({"code": "unauthorized", "message": "Key not found"}, status_code=401)
+        if latency_ms:
+            await asyncio.sleep(latency_ms / 1000)
+        if rate_limit_every and stats["requests"] % rate_limit_every == 0:
+            stats["rate_limited"] += 1
+            return JSONResponse({"code": "too_many_requests"}, status_code=429, headers={"Retry-After": "1"})
+        if fail_rate and random.random() < fail_rate:
+            stats["errors"] += 1
+            return JSONResponse({"code": "internal_error"}, status_code=503)
+
+        payload = await request.json()
+        versions = payload.get("messageVersions")
+        count = sum(len(v.get("to", [])) for v in versions) if versions else len(payload.get("to", []))
+        stats["emails"] += count
+        if record:
+            app.state.received.append(payload)
+        if versions:
+            return JSONResponse({"messageIds": [f"<{uuid.uuid4()}@fake.brevo>" for _ in versions]}, status_code=201)
+        return JSONResponse({"messageId": f"<{uuid.uuid4()}@fake.brevo>"}, status_code=201)
+
+    @app.get("/stats")
+    async def get_stats():
+        return app.state.stats
+
+    @app.post("/reset")
+    async def reset():
+        app.state.received.clear()
+        for k in app.state.stats:
+            app.state.stats[k] = 0
+        return {"status": "reset"}
+
+    return app
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Faux serveur Brevo")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8025)
+    parser.add_argument("--latency-ms", type=float, default=50.0)
+    parser.add_argument("--fail-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-every", type=int, default=0)
+    args = parser.parse_args()
+
+    uvicorn.run(
+        create_app(args.latency_ms, args.fail_rate, args.rate_limit_every, record=False),
+        host=args.host, port=args.port, log_level="warning",
+    )
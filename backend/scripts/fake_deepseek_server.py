@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+Faux DeepSeek (API compatible OpenAI : POST /v1/chat/completions) pour les tests de charge.
+Aucun appel réel : réponse canned après une latence tirée d'une distribution.
+Avec "stream": true, la latence tirée est le délai avant le premier token, puis
+un fragment SSE par mot toutes les --token-ms (fin : usage puis data: [DONE]).
+
+Distributions (--latency) :
+  fixed:800              800 ms
+  uniform:300:1500       uniforme entre 300 et 1500 ms
+  normal:1000:250        gaussienne moyenne 1000 ms, écart-type 250 ms (bornée à 0)
+  lognormal:900:0.5      log-normale de médiane 900 ms, sigma 0.5 (queue longue réaliste)
+
+Usage :
+  cd backend
+  python scripts/fake_deepseek_server.py --port 3902 --latency lognormal:900:0.5 --fail-rate 0.01
+
+Puis pointer le backend dessus :
+  DEEPSEEK_BASE_URL=http://127.0.0.1:3902 DEEPSEEK_API_KEY=fake
+
+Statistiques : GET /stats — remise à zéro : POST /reset
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import random
+import time
+import uuid
+from typing import Callable
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+CANNED_REPLIES = (
+    "Bonjour ! Merci pour votre message 😊 Comment puis-je vous aider aujourd'hui ?",
+    "Oui, ce produit est disponible. Voulez-vous que je vous envoie le prix et les délais de livraison ?",
+    "Nos horaires : du lundi au samedi, de 8h à 20h. Je peux prendre votre commande dès maintenant.",
+    "Parfait, je note votre demande. Pouvez-vous me confirmer votre adresse de livraison ?",
+    "Le paiement se fait par Mobile Money ou à la livraison, comme vous préférez.",
+)
+
+
+def parse_latency(spec: str) -> Callable[[], float]:
+    """"lognormal:900:0.5" → fonction qui tire une latence en secondes."""
+    kind, *params = spec.split(":")
+    values = [float(p) for p in params]
+    if kind == "fixed" and len(values) == 1:
+        return lambda: values[0] / 1000
+    if kind == "uniform" and len(values) == 2:
+        return lambda: random.uniform(values[0], values[1]) / 1000
+    if kind == "normal" and len(values) == 2:
+        return lambda: max(0.0, random.gauss(values[0], values[1])) / 1000
+    if kind == "lognormal" and len(values) == 2:
+        mu = math.log(values[0])
+        return lambda: random.lognormvariate(mu, values[1]) / 1000
+    raise ValueError(f"Distribution de latence invalide : {spec!r}")
+
+
+def create_app(latency: str = "fixed:0", fail_rate: float = 0.0, rate_limit_every: int = 0,
+               token_ms: float = 0.0) -> FastAPI:
+    """
+    latency          : distribution de latence (voir parse_latency) — TTFT en streaming
+    token_ms         : délai entre deux fragments en streaming
+    fail_rate        : proportion de réponses 500 (0.0 → 1.0)
+    rate_limit_every : renvoie un 429 toutes les N requêtes (0 = jamais)
+    """
+    draw = parse_latency(latency)
+    app = FastAPI(title="Fake DeepSeek")
+    app.state.stats = {"requests": 0, "completions": 0, "streams": 0, "streams_aborted": 0, "errors": 0,
+                       "rate_limited": 0, "in_flight": 0, "max_in_flight": 0, "latency_total_ms": 0.0}
+
+    async def _sse(content: str, usage: dict, model: str):
+        stats = app.state.stats
+        chunk_id = f"chatcmpl-{uuid.uuid4().hex}"
+        words = content.split(" ")
+        try:
+            for i, word in enumerate(words):
+                if i and token_ms:
+                    await asyncio.sleep(token_ms / 1000)
+                delta = {"content": word if i == 0 else f" {word}"}
+                chunk = {"id": chunk_id, "object": "chat.completion.chunk", "model": model,
+                         "choices": [{"index": 0, "delta": delta, "finish_reason": None}]}
+                yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+            final = {"id": chunk_id, "object": "chat.completion.chunk", "model": model,
+                     "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}], "usage": usage}
+            yield f"data: {json.dumps(final)}\n\n"
+            yield "data: [DONE]\n\n"
+        except asyncio.CancelledError:
+            stats["streams_aborted"] += 1   # client (backend) parti : génération interrompue
+            raise
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        stats = app.state.stats
+        stats["requests"] += 1
+        if not request.headers.get("authorization"):
+            return JSONResponse({"error": {"message": "Authentication Fails"}}, status_code=401)
+        payload = await request.json()
+
+        stats["in_flight"] += 1
+        stats["max_in_flight"] = max(stats["max_in_flight"], stats["in_flight"])
+        started = time.perf_counter()
+        try:
+            await asyncio.sleep(draw())
+        finally:
+            stats["in_flight"] -= 1
+            stats["latency_total_ms"] += (time.perf_counter() - started) * 1000
+
+        if rate_limit_every and stats["requests"] % rate_limit_every == 0:
+            stats["rate_limited"] += 1
+            return JSONResponse({"error": {"message": "Rate limit reached"}}, status_code=429)
+        if fail_rate and random.random() < fail_rate:
+            stats["errors"] += 1
+            return JSONResponse({"error": {"message": "Server busy"}}, status_code=500)
+
+        content = random.choice(CANNED_REPLIES)
+        prompt_tokens = sum(len(m.get("content") or "") for m in payload.get("messages", [])) // 4
+        completion_tokens = len(content) // 4
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        }
+        if payload.get("stream"):
+            stats["streams"] += 1
+            return StreamingResponse(_sse(content, usage, payload.get("model", "deepseek-chat")),
+                                     media_type="text/event-stream")
+        stats["completions"] += 1
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": payload.get("model", "deepseek-chat"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": usage,
+        }
+
+    @app.get("/stats")
+    async def get_stats():
+        stats = app.state.stats
+        done = stats["requests"] - stats["in_flight"]
+        return {**stats, "latency_avg_ms": round(stats["latency_total_ms"] / done, 1) if done else 0.0}
+
+    @app.post("/reset")
+    async def reset():
+        for k in app.state.stats:
+            app.state.stats[k] = 0
+        return {"status": "reset"}
+
+    return app
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Faux serveur DeepSeek")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=3902)
+    parser.add_argument("--latency", default="lognormal:900:0.5")
+    parser.add_argument("--fail-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-every", type=int, default=0)
+    parser.add_argument("--token-ms", type=float, default=30.0, help="délai entre fragments en streaming")
+    args = parser.parse_args()
+
+    uvicorn.run(
+        create_app(args.latency, args.fail_rate, args.rate_limit_every, args.token_ms),
+        host=args.host, port=args.port, log_level="warning",
+    )
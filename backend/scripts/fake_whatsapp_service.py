@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Faux service WhatsApp (contrat du service Node/Baileys) pour les tests de charge.
+Aucun message n'est envoyé : chaque envoi est horodaté à l'arrivée, ce qui
+permet au driver de mesurer la latence bout en bout (webhook → réponse envoyée).
+
+  POST /api/whatsapp/tenants/{id}/send-message  {"to", "message"}
+  POST /api/whatsapp/tenants/{id}/typing        {"to"}
+  POST /api/whatsapp/tenants/{id}/send-image    {"to", "imageBase64", "caption", "mimetype"}
+  GET  /api/whatsapp/tenants/{id}/status        toujours connecté
+
+Usage :
+  cd backend
+  python scripts/fake_whatsapp_service.py --port 3901 --latency-ms 40 --unavailable-rate 0.01
+
+Puis pointer le backend dessus :
+  WHATSAPP_SERVICE_URL=http://127.0.0.1:3901
+
+Statistiques : GET /stats — remise à zéro : POST /reset
+"""
+
+import argparse
+import asyncio
+import random
+import time
+from typing import Callable, Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+
+def create_app(latency_ms: float = 0.0, unavailable_rate: float = 0.0,
+               on_send: Optional[Callable[[int, str, float], None]] = None,
+               record: bool = True, unavailable_first: int = 0) -> FastAPI:
+    """
+    latency_ms       : délai simulé par requête
+    unavailable_rate : proportion de 503 sur send-message (WA en reconnexion → retries du backend)
+    on_send          : rappel (tenant_id, to, horodatage time.time()) à chaque message texte accepté
+    record           : conserve les envois dans app.state.sent
+    unavailable_first: les N premiers send-message en 503 (session lente à se reconnecter)
+    """
+    app = FastAPI(title="Fake WhatsApp service")
+    app.state.sent = []
+    app.state.stats = {"messages": 0, "typing": 0, "images": 0, "unavailable": 0}
+
+    async def _simulate() -> None:
+        if latency_ms:
+            await asyncio.sleep(latency_ms / 1000)
+
+    @app.post("/api/whatsapp/tenants/{tenant_id}/send-message")
+    async def send_message(tenant_id: int, request: Request):
+        await _simulate()
+        stats = app.state.stats
+        if stats["unavailable"] < unavailable_first or (unavailable_rate and random.random() < unavailable_rate):
+            stats["unavailable"] += 1
+            return JSONResponse({"success": False, "error": "WhatsApp not connected"}, status_code=503)
+        payload = await request.json()
+        arrived = time.time()
+        stats["messages"] += 1
+        if record:
+            app.state.sent.append({"tenant_id": tenant_id, "at": arrived, **payload})
+        if on_send:
+            on_send(tenant_id, payload.get("to", ""), arrived)
+        return {"success": True, "messageId": f"FAKE{stats['messages']:010d}"}
+
+    @app.post("/api/whatsapp/tenants/{tenant_id}/typing")
+    async def typing(tenant_id: int):
+        await _simulate()
+        app.state.stats["typing"] += 1
+        return {"success": True}
+
+    @app.post("/api/whatsapp/tenants/{tenant_id}/send-image")
+    async def send_image(tenant_id: int):
+        await _simulate()
+        app.state.stats["images"] += 1
+        return {"success": True}
+
+    @app.get("/api/whatsapp/tenants/{tenant_id}/status")
+    async def status(tenant_id: int):
+        return {"tenantId": tenant_id, "connected": True, "status": "connected"}
+
+    @app.get("/stats")
+    async def get_stats():
+        return app.state.stats
+
+    @app.post("/reset")
+    async def reset():
+        app.state.sent.clear()
+        for k in app.state.stats:
+            app.state.stats[k] = 0
+        return {"status": "reset"}
+
+    return app
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Faux service WhatsApp")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=3901)
+    parser.add_argument("--latency-ms", type=float, default=30.0)
+    parser.add_argument("--unavailable-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    uvicorn.run(
+        create_app(args.latency_ms, args.unavailable_rate, record=False),
+        host=args.host, port=args.port, log_level="warning",
+    )
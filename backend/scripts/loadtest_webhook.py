@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+"""
+Test de charge du pipeline message : trafic webhook WhatsApp à débit cible
+contre un backend lancé localement, avec faux service WhatsApp et faux DeepSeek.
+
+Mesures :
+  - latence webhook (POST → réponse HTTP) p50/p95/p99 ;
+  - latence bout en bout (POST → send-message reçu par le faux service WhatsApp) ;
+  - requêtes SQL par message : chemin synchrone (en-tête Server-Timing db_queries)
+    et total process, tâches de fond comprises (delta neobot_db_queries_total de /metrics) ;
+  - taux d'erreur (HTTP ≠ 200, timeouts, statut applicatif).
+
+Arrivées en boucle ouverte (Poisson par défaut) : le débit ne ralentit pas quand
+le backend sature, la latence mesurée inclut donc la file d'attente.
+
+Usage :
+  cd backend
+  DATABASE_URL=postgresql://... python scripts/seed_loadtest_data.py --tenants 20 --conversations 50
+
+  # Backend pointé sur les faux services (les ports par défaut sont ceux de --fakes)
+  WHATSAPP_SERVICE_URL=http://127.0.0.1:3901 DEEPSEEK_BASE_URL=http://127.0.0.1:3902 DEEPSEEK_API_KEY=fake \\
+    DATABASE_URL=postgresql://... uvicorn app.main:app --port 8000 --workers 2
+
+  python scripts/loadtest_webhook.py --fakes --rate 30 --duration 60 --deepseek-latency lognormal:900:0.5
+
+Sans --fakes, les faux services tournent à part (scripts/fake_whatsapp_service.py,
+scripts/fake_deepseek_server.py) et la latence bout en bout n'est pas mesurée.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import sys
+import time
+from collections import Counter, defaultdict, deque
+
+import httpx
+
+sys.path.append(os.path.dirname(__file__))
+
+from fake_deepseek_server import create_app as create_fake_deepseek  # noqa: E402
+from fake_whatsapp_service import create_app as create_fake_whatsapp  # noqa: E402
+
+MESSAGES = (
+    "Bonjour", "Vous avez la robe wax en taille L ?", "C'est combien la livraison à Douala ?",
+    "Je veux commander 2 sacs cuir", "Vous acceptez Orange Money ?", "Quels sont vos horaires ?",
+    "Merci beaucoup", "Le produit est encore disponible ?", "Je peux payer à la livraison ?",
+    "Envoyez-moi le catalogue svp", "Ok je prends", "Vous êtes où exactement ?",
+)
+_DB_QUERIES_RE = re.compile(r'db_queries;desc="(\d+)"')
+
+
+def percentile(values: list[float], p: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+def _digits(jid: str) -> str:
+    return jid.split("@", 1)[0].split(":", 1)[0].lstrip("+")
+
+
+class LoadRun:
+
+    def __init__(self, dataset: dict, args):
+        self.args = args
+        self.targets = [(t["id"], phone) for t in dataset["tenants"] for phone in t["phones"]]
+        self.tenant_ids = [t["id"] for t in dataset["tenants"]]
+        if not self.targets:
+            raise SystemExit("Manifeste vide : lancer scripts/seed_loadtest_data.py d'abord")
+        self.run_id = time.strftime("%H%M%S")
+        self.pending: dict[tuple[int, str], deque] = defaultdict(deque)
+        self.webhook_ms: list[float] = []
+        self.e2e_ms: list[float] = []
+        self.sync_queries: list[int] = []
+        self.outcomes: Counter = Counter()
+        self.unmatched_replies = 0
+        self.in_flight = 0
+        self.sent = 0
+
+    # ── Corrélation envoi webhook → réponse reçue par le faux WhatsApp ───────
+
+    def on_reply(self, tenant_id: int, to: str, arrived: float) -> None:
+        queue = self.pending.get((tenant_id, _digits(to)))
+        if not queue:
+            self.unmatched_replies += 1
+            return
+        self.e2e_ms.append((arrived - queue.popleft()) * 1000)
+
+    def _pick(self) -> tuple[int, str]:
+        if random.random() < self.args.new_contact_rate:
+            return random.choice(self.tenant_ids), f"2379{random.randint(0, 99_999_999):08d}"
+        return random.choice(self.targets)
+
+    async def _post(self, client: httpx.AsyncClient, seq: int) -> None:
+        tenant_id, phone = self._pick()
+        payload = {
+            "tenant_id": tenant_id, "from_": phone, "text": random.choice(MESSAGES),
+            "senderName": "Client charge", "messageKey": {"id": f"LT{self.run_id}{seq:08d}"},
+            "timestamp": int(time.time()),
+        }
+        self.in_flight += 1
+        started = time.time()
+        self.pending[(tenant_id, phone)].append(started)
+        try:
+            response = await client.post("/api/v1/webhooks/whatsapp", json=payload)
+        except httpx.TimeoutException:
+            self.outcomes["timeout"] += 1
+            return
+        except httpx.HTTPError as exc:
+            self.outcomes[f"transport:{type(exc).__name__}"] += 1
+            return
+        finally:
+            self.in_flight -= 1
+        self.webhook_ms.append((time.time() - started) * 1000)
+        match = _DB_QUERIES_RE.search(response.headers.get("server-timing", ""))
+        if match:
+            self.sync_queries.append(int(match.group(1)))
+        if response.status_code != 200:
+            self.outcomes[f"http_{response.status_code}"] += 1
+            return
+        status = response.json().get("status", "?")
+        self.outcomes[status if status in ("received", "success", "queued") else f"status:{status}"] += 1
+
+    async def drive(self, client: httpx.AsyncClient) -> float:
+        """Arrivées en boucle ouverte au débit --rate pendant --duration secondes."""
+        tasks = []
+        started = time.perf_counter()
+        next_at = 0.0
+        seq = 0
+        while next_at < self.args.duration:
+            delay = started + next_at - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if self.in_flight >= self.args.max_in_flight:
+                self.outcomes["client_dropped"] += 1
+            else:
+                tasks.append(asyncio.create_task(self._post(client, seq)))
+                self.sent += 1
+            seq += 1
+            gap = 1 / self.args.rate
+            next_at += random.expovariate(self.args.rate) if self.args.arrivals == "poisson" else gap
+        await asyncio.gather(*tasks)
+        return time.perf_counter() - started
+
+
+async def _scrape_db_queries(client: httpx.AsyncClient, token: str) -> float:
+    headers = {"Authorization": f"Bearer {token}"} if token else {}
+    try:
+        response = await client.get("/metrics", headers=headers)
+    except httpx.HTTPError:
+        return -1.0
+    if response.status_code != 200:
+        return -1.0
+    for line in response.text.splitlines():
+        if line.startswith("neobot_db_queries_total "):
+            return float(line.split()[1])
+    return 0.0   # aucune requête SQL depuis le démarrage du worker
+
+
+async def _serve(app, port: int):
+    import uvicorn
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+    return server, task
+
+
+def _line(label: str, values: list[float], unit: str = "ms") -> str:
+    if not values:
+        return f"  {label:28s}: n/a"
+    return (
+        f"  {label:28s}: p50={percentile(values, 50):8.1f}{unit}  p95={percentile(values, 95):8.1f}{unit}"
+        f"  p99={percentile(values, 99):8.1f}{unit}  max={max(values):8.1f}{unit}  (n={len(values)})"
+    )
+
+
+async def main(args) -> None:
+    with open(args.dataset) as f:
+        run = LoadRun(json.load(f), args)
+
+    servers = []
+    fake_wa = fake_ds = None
+    if args.fakes:
+        fake_wa = create_fake_whatsapp(args.wa_latency_ms, args.wa_unavailable_rate, on_send=run.on_reply, record=False)
+        fake_ds = create_fake_deepseek(args.deepseek_latency, args.deepseek_fail_rate)
+        servers.append(await _serve(fake_wa, args.wa_port))
+        servers.append(await _serve(fake_ds, args.deepseek_port))
+        print(f"🧪 Faux WhatsApp :{args.wa_port} (latence {args.wa_latency_ms} ms) — "
+              f"faux DeepSeek :{args.deepseek_port} ({args.deepseek_latency})")
+
+    limits = httpx.Limits(max_connections=args.max_in_flight, max_keepalive_connections=args.max_in_flight)
+    async with httpx.AsyncClient(base_url=args.backend, timeout=args.timeout, limits=limits) as client:
+        queries_before = await _scrape_db_queries(client, args.metrics_token)
+        print(f"🚀 {args.rate} msg/s pendant {args.duration}s ({args.arrivals}) → {args.backend}")
+        elapsed = await run.drive(client)
+        if args.fakes and args.drain:
+            deadline = time.time() + args.drain
+            while time.time() < deadline and sum(len(q) for q in run.pending.values()):
+                await asyncio.sleep(0.2)
+        queries_after = await _scrape_db_queries(client, args.metrics_token)
+
+    for server, task in servers:
+        server.should_exit = True
+        await task
+
+    answered = len(run.webhook_ms)
+    errors = sum(v for k, v in run.outcomes.items() if k not in ("received", "success", "queued"))
+    print(f"\n📊 {run.sent} messages envoyés en {elapsed:.1f}s ({run.sent / elapsed:.1f} msg/s effectifs)")
+    print(_line("Webhook (HTTP)", run.webhook_ms))
+    print(_line("Bout en bout (réponse WA)", run.e2e_ms))
+    if args.fakes:
+        waiting = sum(len(q) for q in run.pending.values())
+        print(f"  Réponses reçues             : {len(run.e2e_ms)}/{answered} (sans réponse={waiting}, non corrélées={run.unmatched_replies})")
+    if run.sync_queries:
+        print(f"  Requêtes SQL / message      : chemin synchrone p50={percentile(run.sync_queries, 50):.0f} "
+              f"p95={percentile(run.sync_queries, 95):.0f} max={max(run.sync_queries)}")
+    if queries_before >= 0 and queries_after >= 0 and run.sent:
+        print(f"  Requêtes SQL / message      : total process (tâches de fond comprises) "
+              f"{(queries_after - queries_before) / run.sent:.1f} (un seul worker scrapé)")
+    if run.sent:
+        print(f"  Erreurs                     : {errors}/{run.sent} ({errors / run.sent:.2%})")
+    for outcome, count in run.outcomes.most_common():
+        print(f"    {outcome:26s}: {count}")
+    if fake_ds is not None:
+        print(f"  Faux DeepSeek               : {fake_ds.state.stats}")
+        print(f"  Faux WhatsApp               : {fake_wa.state.stats}")
+
+    if args.json_out:
+        with open(args.json_out, "w") as f:
+            json.dump({
+                "rate": args.rate, "duration": args.duration, "sent": run.sent,
+                "webhook_ms": {p: percentile(run.webhook_ms, p) for p in (50, 95, 99)},
+                "e2e_ms": {p: percentile(run.e2e_ms, p) for p in (50, 95, 99)},
+                "sync_queries_p50": percentile(run.sync_queries, 50),
+                "outcomes": dict(run.outcomes),
+            }, f, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Test de charge webhook WhatsApp")
+    parser.add_argument("--backend", default="http://127.0.0.1:8000")
+    parser.add_argument("--dataset", default="loadtest_dataset.json", help="manifeste de seed_loadtest_data.py")
+    parser.add_argument("--rate", type=float, default=20.0, help="messages par seconde")
+    parser.add_argument("--duration", type=float, default=60.0, help="secondes")
+    parser.add_argument("--arrivals", choices=("poisson", "constant"), default="poisson")
+    parser.add_argument("--new-contact-rate", type=float, default=0.1, help="part de messages de nouveaux numéros")
+    parser.add_argument("--max-in-flight", type=int, default=500)
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--drain", type=float, default=60.0, help="attente max des réponses après le tir (s)")
+    parser.add_argument("--metrics-token", default=os.getenv("METRICS_TOKEN", ""))
+    parser.add_argument("--json-out", default="")
+    parser.add_argument("--fakes", action="store_true", help="lance les faux services dans ce process")
+    parser.add_argument("--wa-port", type=int, default=3901)
+    parser.add_argument("--wa-latency-ms", type=float, default=30.0)
+    parser.add_argument("--wa-unavailable-rate", type=float, default=0.0)
+    parser.add_argument("--deepseek-port", type=int, default=3902)
+    parser.add_argument("--deepseek-latency", default="lognormal:900:0.5")
+    parser.add_argument("--deepseek-fail-rate", type=float, default=0.0)
+    asyncio.run(main(parser.parse_args()))
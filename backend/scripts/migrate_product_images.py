@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Migration unique : images produits base64 → media store.
+
+Parcourt TenantBusinessConfig.products_services, stocke chaque image "data:…"
+(ou base64 nu) dans le media store (MEDIA_STORE) et ne garde que la référence
+image_id dans le JSON. Idempotent : un produit déjà migré n'est pas retouché,
+deux images identiques ne sont stockées qu'une fois.
+
+Usage :
+  cd backend
+  DATABASE_URL=postgresql://... python scripts/migrate_product_images.py --dry-run
+  DATABASE_URL=postgresql://... MEDIA_STORE=db python scripts/migrate_product_images.py
+"""
+
+import argparse
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from app.database import SessionLocal  # noqa: E402
+from app.models import TenantBusinessConfig  # noqa: E402
+from app.services.media_store import MediaRejected, normalize_product_images  # noqa: E402
+
+
+def _needs_migration(products) -> bool:
+    return any(isinstance(p, dict) and p.get("image_url") for p in products or [])
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Déplace les images produits base64 vers le media store")
+    parser.add_argument("--dry-run", action="store_true", help="compte sans rien écrire")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    migrated = skipped = failed = 0
+    try:
+        configs = db.query(TenantBusinessConfig).filter(TenantBusinessConfig.products_services.isnot(None)).all()
+        for config in configs:
+            if not _needs_migration(config.products_services):
+                skipped += 1
+                continue
+            if args.dry_run:
+                migrated += 1
+                continue
+            try:
+                config.products_services = normalize_product_images(config.products_services)
+                db.commit()
+                migrated += 1
+            except MediaRejected as e:
+                db.rollback()
+                failed += 1
+                print(f"⚠️ tenant {config.tenant_id} : image ignorée ({e})")
+    finally:
+        db.close()
+
+    verb = "à migrer" if args.dry_run else "migrés"
+    print(f"✅ {migrated} catalogue(s) {verb}, {skipped} déjà propre(s), {failed} en erreur")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+Jeu de données pour les tests de charge : tenants, agents, connaissances,
+catalogue produits et conversations avec historique.
+
+Tous les tenants créés ont un email "loadtest-…@loadtest.local" : --cleanup les
+supprime (avec leurs conversations et messages) sans toucher au reste de la base.
+Le manifeste JSON (--out) liste les tenants et numéros clients pour
+scripts/loadtest_webhook.py.
+
+Usage :
+  cd backend
+  DATABASE_URL=postgresql://... python scripts/seed_loadtest_data.py --tenants 20 --conversations 50 --history 30
+  DATABASE_URL=postgresql://... python scripts/seed_loadtest_data.py --cleanup
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from sqlalchemy import create_engine, insert  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+from app.database import Base  # noqa: E402
+from app.models import (  # noqa: E402
+    AgentTemplate, BusinessTypeModel, Contact, ContactSetting, Conversation, ConversationContext,
+    ConversationHumanState, Escalation, KnowledgeSource, KnowledgeSourceType, Message, PlanType,
+    PromptVariable, QueuedMessage, Tenant, TenantBusinessConfig, TenantSettings, TokenBucket, UsageTracking,
+)
+
+EMAIL_DOMAIN = "loadtest.local"
+PLANS = (PlanType.BASIC, PlanType.BASIC, PlanType.STANDARD, PlanType.PRO)
+AGENT_TYPES = ("vente", "support", "faq", "rdv", "qualification", "libre")
+PRODUCT_WORDS = ("Robe", "Chemise", "Pagne", "Sac", "Sandales", "Montre", "Parfum", "Téléphone", "Écouteurs", "Pizza")
+PRODUCT_ADJECTIVES = ("wax", "premium", "classique", "slim", "cuir", "sport", "mini", "pro", "famille", "XL")
+HISTORY_LINES = (
+    ("incoming", "Bonjour, vous êtes ouverts aujourd'hui ?"),
+    ("outgoing", "Bonjour ! Oui, nous sommes ouverts de 8h à 20h 😊"),
+    ("incoming", "Combien coûte la robe wax taille M ?"),
+    ("outgoing", "La robe wax taille M est à 15 000 FCFA, livraison incluse à Douala."),
+    ("incoming", "Vous livrez à Yaoundé ?"),
+    ("outgoing", "Oui, livraison à Yaoundé en 48h pour 2 000 FCFA."),
+    ("incoming", "Ok je réfléchis, merci"),
+    ("outgoing", "Avec plaisir, je reste disponible si vous avez d'autres questions !"),
+)
+
+
+def _knowledge_text(kb: int, company: str) -> str:
+    paragraph = (
+        f"{company} vend des vêtements, accessoires et produits du quotidien. "
+        "Livraison à Douala sous 24h, Yaoundé sous 48h, autres villes sous 72h. "
+        "Paiement Mobile Money (MTN, Orange) ou à la livraison. Retours acceptés sous 7 jours. "
+    )
+    return (paragraph * (kb * 1024 // len(paragraph) + 1))[: kb * 1024]
+
+
+def _products(count: int) -> list[dict]:
+    return [
+        {
+            "name": f"{PRODUCT_WORDS[i % len(PRODUCT_WORDS)]} {PRODUCT_ADJECTIVES[(i // len(PRODUCT_WORDS)) % len(PRODUCT_ADJECTIVES)]} {i}",
+            "price": 1000 * random.randint(2, 60),
+            "description": "Disponible en plusieurs tailles et couleurs.",
+        }
+        for i in range(count)
+    ]
+
+
+def _business_type(db) -> BusinessTypeModel:
+    business_type = db.query(BusinessTypeModel).filter(BusinessTypeModel.slug == "ecommerce").first()
+    if business_type is None:
+        business_type = BusinessTypeModel(slug="ecommerce", name="E-commerce", icon="🛍️")
+        db.add(business_type)
+        db.flush()
+    return business_type
+
+
+def seed(Session, args) -> dict:
+    db = Session()
+    run = time.strftime("%Y%m%d%H%M%S")
+    manifest = {"created_at": datetime.utcnow().isoformat(), "tenants": []}
+    try:
+        business_type = _business_type(db)
+        for t in range(args.tenants):
+            company = f"Boutique Charge {t}"
+            tenant = Tenant(
+                name=company, email=f"loadtest-{run}-{t}@{EMAIL_DOMAIN}", phone=f"2376990{t:05d}",
+                business_type="ecommerce", plan=PLANS[t % len(PLANS)], whatsapp_connected=True,
+                messages_used=0, messages_limit=-1, is_trial=False,
+            )
+            db.add(tenant)
+            db.flush()
+
+            agent = AgentTemplate(
+                tenant_id=tenant.id, name=f"Agent {company}", agent_type=AGENT_TYPES[t % len(AGENT_TYPES)],
+                system_prompt=f"Tu es l'assistant commercial de {company}. Réponds en français, brièvement.",
+                response_delay=args.response_delay, typing_indicator=args.response_delay != "immediate",
+                is_active=True,
+            )
+            db.add(agent)
+            db.flush()
+            db.add_all([
+                KnowledgeSource(
+                    agent_id=agent.id, tenant_id=tenant.id, source_type=KnowledgeSourceType.TEXT,
+                    name="Présentation", content_extracted=_knowledge_text(args.knowledge_kb, company),
+                    sync_status="synced", last_synced_at=datetime.utcnow(),
+                ),
+                KnowledgeSource(
+                    agent_id=agent.id, tenant_id=tenant.id, source_type=KnowledgeSourceType.FAQ,
+                    name="FAQ", content_extracted="Q: Livrez-vous le dimanche ?\nR: Non, du lundi au samedi.",
+                    sync_status="synced", last_synced_at=datetime.utcnow(),
+                ),
+                PromptVariable(agent_id=agent.id, tenant_id=tenant.id, key="nom_entreprise", value=company),
+                TenantBusinessConfig(
+                    tenant_id=tenant.id, business_type_id=business_type.id, company_name=company,
+                    company_description=f"{company}, boutique en ligne au Cameroun.",
+                    products_services=_products(args.products), tone="Friendly",
+                ),
+            ])
+
+            phones = [f"2376{t:03d}{c:05d}" for c in range(args.conversations)]
+            conversations = [
+                Conversation(tenant_id=tenant.id, customer_phone=phone, customer_name=f"Client {c}", status="active")
+                for c, phone in enumerate(phones)
+            ]
+            db.add_all(conversations)
+            db.flush()
+
+            # Historique daté des jours précédents : ne compte pas dans la limite journalière par client
+            rows = []
+            for conv in conversations:
+                start = datetime.utcnow() - timedelta(days=random.randint(1, 25))
+                for h in range(args.history):
+                    direction, content = HISTORY_LINES[h % len(HISTORY_LINES)]
+                    rows.append({
+                        "conversation_id": conv.id, "content": content, "direction": direction,
+                        "is_ai": direction == "outgoing", "created_at": start + timedelta(minutes=h),
+                    })
+            if rows:
+                db.execute(insert(Message), rows)
+            db.commit()
+            manifest["tenants"].append({"id": tenant.id, "plan": tenant.plan.value, "phones": phones})
+            print(f"✅ Tenant {tenant.id} ({tenant.plan.value}) : {len(phones)} conversations, {len(rows)} messages")
+    finally:
+        db.close()
+    return manifest
+
+
+def cleanup(Session) -> None:
+    db = Session()
+    try:
+        tenant_ids = [t.id for t in db.query(Tenant.id).filter(Tenant.email.like(f"loadtest-%@{EMAIL_DOMAIN}"))]
+        if not tenant_ids:
+            print("Aucun tenant de charge à supprimer")
+            return
+        # Lignes créées par le run de charge (historique, escalades, quotas...) puis données seedées
+        conv_ids = db.query(Conversation.id).filter(Conversation.tenant_id.in_(tenant_ids)).scalar_subquery()
+        for model in (Message, ConversationHumanState, ConversationContext, Escalation, QueuedMessage):
+            db.query(model).filter(model.conversation_id.in_(conv_ids)).delete(synchronize_session=False)
+        for model in (
+            Conversation, Contact, ContactSetting, UsageTracking, TokenBucket, TenantSettings,
+            KnowledgeSource, PromptVariable, TenantBusinessConfig, AgentTemplate,
+        ):
+            db.query(model).filter(model.tenant_id.in_(tenant_ids)).delete(synchronize_session=False)
+        db.query(Tenant).filter(Tenant.id.in_(tenant_ids)).delete(synchronize_session=False)
+        db.commit()
+        print(f"🧹 {len(tenant_ids)} tenants de charge supprimés")
+    finally:
+        db.close()
+
+
+def main(args) -> None:
+    engine = create_engine(os.environ["DATABASE_URL"])
+    Session = sessionmaker(bind=engine)
+    if args.cleanup:
+        cleanup(Session)
+    else:
+        Base.metadata.create_all(bind=engine)
+        manifest = seed(Session, args)
+        with open(args.out, "w") as f:
+            json.dump(manifest, f, indent=2)
+        print(f"📄 Manifeste : {args.out}")
+    engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Seed des données de test de charge")
+    parser.add_argument("--tenants", type=int, default=20)
+    parser.add_argument("--conversations", type=int, default=50, help="conversations existantes par tenant")
+    parser.add_argument("--history", type=int, default=30, help="messages d'historique par conversation")
+    parser.add_argument("--products", type=int, default=40, help="produits au catalogue par tenant")
+    parser.add_argument("--knowledge-kb", type=int, default=8, help="taille de la source texte par agent (Ko)")
+    parser.add_argument("--response-delay", default="immediate", choices=("immediate", "natural", "human", "slow"))
+    parser.add_argument("--out", default="loadtest_dataset.json")
+    parser.add_argument("--cleanup", action="store_true", help="supprime les tenants de charge")
+    main(parser.parse_args())
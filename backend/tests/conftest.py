@@ -44,6 +44,43 @@ def reset_db():
     Base.metadata.drop_all(bind=engine)
 
 
+@pytest.fixture(autouse=True)
+def reset_contact_policies():
+    """Index mémoire des règles contacts : la DB est recréée à chaque test, l'index aussi."""
+    from app.services.contact_policy import reset_contact_policies as _reset
+    _reset()
+    yield
+    _reset()
+
+
+@pytest.fixture(autouse=True)
+def reset_campaign_pacers():
+    """Cadences de campagne par tenant / session : les ids de tenant sont réutilisés d'un test à l'autre."""
+    from app.services.campaign_service import reset_pacers
+    reset_pacers()
+    yield
+    reset_pacers()
+
+
+@pytest.fixture(autouse=True)
+def reset_delayed_sender():
+    """Échéancier des réponses différées : singleton de module, les ids de queued_messages sont réutilisés."""
+    from app.services.delayed_sender import delayed_sender
+    delayed_sender.clear()
+    yield
+    delayed_sender.stop()
+    delayed_sender.clear()
+
+
+@pytest.fixture(autouse=True)
+def reset_auth_cache():
+    """Cache des principals / blacklist JWT : ids d'utilisateurs et jti repartent de zéro à chaque test."""
+    from app.services.auth_cache import reset_auth_cache as _reset
+    _reset()
+    yield
+    _reset()
+
+
 @pytest.fixture(autouse=True)
 def reset_rate_limiter():
     """Vide le storage du rate limiter AVANT chaque test.
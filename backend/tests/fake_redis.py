@@ -0,0 +1,177 @@
+"""
+Faux serveur Redis in-process pour les tests du backend d'état.
+
+Parle le vrai protocole RESP2 sur un port local : RedisStateBackend est testé
+de bout en bout (encodage, pipeline, MULTI/EXEC, reconnexion) sans Redis installé.
+Couvre uniquement les commandes utilisées par app/state_backend.py.
+"""
+import fnmatch
+import socket
+import socketserver
+import threading
+import time
+
+
+class _Store:
+    def __init__(self):
+        self.data: dict[bytes, tuple[bytes, float | None]] = {}
+        self.lock = threading.Lock()
+
+    def alive(self, key: bytes):
+        entry = self.data.get(key)
+        if entry and entry[1] is not None and entry[1] <= time.monotonic():
+            del self.data[key]
+            return None
+        return entry
+
+
+def _bulk(value: bytes | None) -> bytes:
+    return b"$-1\r\n" if value is None else b"$%d\r\n%s\r\n" % (len(value), value)
+
+
+def _array(items: list[bytes]) -> bytes:
+    return b"*%d\r\n" % len(items) + b"".join(items)
+
+
+def _int(value: int) -> bytes:
+    return b":%d\r\n" % value
+
+
+OK = b"+OK\r\n"
+
+
+def _run(store: _Store, args: list[bytes]) -> bytes:
+    cmd = args[0].upper()
+    now = time.monotonic()
+    if cmd == b"PING":
+        return b"+PONG\r\n"
+    if cmd in (b"AUTH", b"SELECT"):
+        return OK
+    if cmd == b"GET":
+        entry = store.alive(args[1])
+        return _bulk(entry[0] if entry else None)
+    if cmd == b"SET":
+        key, value, opts = args[1], args[2], [a.upper() for a in args[3:]]
+        expires = None
+        if b"PX" in opts:
+            expires = now + int(args[3 + opts.index(b"PX") + 1]) / 1000
+        if b"EX" in opts:
+            expires = now + int(args[3 + opts.index(b"EX") + 1])
+        if b"NX" in opts and store.alive(key) is not None:
+            return _bulk(None)
+        store.data[key] = (value, expires)
+        return OK
+    if cmd in (b"INCR", b"INCRBY"):
+        key = args[1]
+        amount = int(args[2]) if cmd == b"INCRBY" else 1
+        entry = store.alive(key)
+        try:
+            value = (int(entry[0]) if entry else 0) + amount
+        except ValueError:
+            return b"-ERR value is not an integer or out of range\r\n"
+        store.data[key] = (str(value).encode(), entry[1] if entry else None)
+        return _int(value)
+    if cmd == b"DEL":
+        return _int(sum(1 for k in args[1:] if store.alive(k) is not None and store.data.pop(k)))
+    if cmd == b"PTTL":
+        entry = store.alive(args[1])
+        if entry is None:
+            return _int(-2)
+        return _int(-1 if entry[1] is None else int((entry[1] - now) * 1000))
+    if cmd == b"SCAN":
+        pattern = args[args.index(b"MATCH") + 1].decode() if b"MATCH" in args else "*"
+        keys = [k for k in list(store.data) if store.alive(k) and fnmatch.fnmatchcase(k.decode(), pattern)]
+        return _array([_bulk(b"0"), _array([_bulk(k) for k in keys])])
+    if cmd == b"FLUSHDB":
+        store.data.clear()
+        return OK
+    return b"-ERR unknown command '%s'\r\n" % cmd
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    disable_nagle_algorithm = True
+
+    def _read_command(self) -> list[bytes] | None:
+        line = self.rfile.readline()
+        if not line:
+            return None
+        count = int(line[1:-2])
+        args = []
+        for _ in range(count):
+            size = int(self.rfile.readline()[1:-2])
+            args.append(self.rfile.read(size + 2)[:-2])
+        return args
+
+    def _reply(self, data: bytes) -> None:
+        if self.server.reply_delay:
+            time.sleep(self.server.reply_delay)           # exécuté, réponse en retard (timeout client)
+        self.wfile.write(data)
+
+    def handle(self):
+        store: _Store = self.server.store
+        queued: list[list[bytes]] | None = None
+        self.server.connections.append(self.connection)
+        while True:
+            try:
+                args = self._read_command()
+            except (OSError, ValueError):
+                return
+            if args is None:
+                return
+            self.server.commands += 1
+            cmd = args[0].upper()
+            if cmd == b"MULTI":
+                queued = []
+                self._reply(OK)
+            elif cmd == b"EXEC" and queued is not None:
+                with store.lock:
+                    replies = [_run(store, a) for a in queued]
+                queued = None
+                self._reply(b"*%d\r\n" % len(replies) + b"".join(replies))
+            elif queued is not None:
+                queued.append(args)
+                self._reply(b"+QUEUED\r\n")
+            else:
+                with store.lock:
+                    reply = _run(store, args)
+                self._reply(reply)
+
+
+class FakeRedisServer(socketserver.ThreadingTCPServer):
+    """
+    with FakeRedisServer() as server:
+        backend = RedisStateBackend(server.url)
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _Handler)
+        self.store = _Store()
+        self.commands = 0
+        self.reply_delay = 0.0
+        self.connections: list = []
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        return f"redis://127.0.0.1:{self.server_address[1]}/0"
+
+    def drop_connections(self) -> None:
+        """Ferme côté serveur les connexions ouvertes (redémarrage, timeout d'inactivité)."""
+        for conn in self.connections:
+            try:
+                conn.shutdown(socket.SHUT_RDWR)
+                conn.close()
+            except OSError:
+                pass
+        self.connections.clear()
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+        self.server_close()
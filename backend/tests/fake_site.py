@@ -0,0 +1,86 @@
+"""
+Faux site web in-process pour les tests de synchronisation des sources URL.
+
+Vrai serveur HTTP/1.1 sur un port local (http.server) : le worker est testé de
+bout en bout (GET conditionnel, redirections, décodage du charset) sans réseau.
+
+    site = FakeSite().start()
+    site.pages["/menu"] = FakePage("<html>…</html>", etag='"v1"')
+    url = site.url("/menu")
+"""
+import threading
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+
+@dataclass
+class FakePage:
+    body: str
+    content_type: str = "text/html; charset=utf-8"
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    redirect_to: Optional[str] = None
+
+
+class FakeSite:
+    def __init__(self):
+        self.pages: dict[str, FakePage] = {}
+        self.stats = {"requests": 0, "not_modified": 0}
+        self.received: list[dict] = []
+        self._server: Optional[ThreadingHTTPServer] = None
+
+    def start(self) -> "FakeSite":
+        site = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                site.stats["requests"] += 1
+                site.received.append({"path": self.path, "headers": dict(self.headers)})
+                page = site.pages.get(self.path)
+                if page is None:
+                    return self._reply(404, b"", "text/plain")
+                if page.redirect_to:
+                    self.send_response(302)
+                    self.send_header("Location", page.redirect_to)
+                    self.send_header("Content-Length", "0")
+                    return self.end_headers()
+                if (page.etag and self.headers.get("If-None-Match") == page.etag) or (
+                    page.last_modified and not page.etag
+                    and self.headers.get("If-Modified-Since") == page.last_modified
+                ):
+                    site.stats["not_modified"] += 1
+                    self.send_response(304)
+                    self.send_header("Content-Length", "0")
+                    return self.end_headers()
+                charset = page.content_type.partition("charset=")[2] or "utf-8"
+                extra = {"ETag": page.etag, "Last-Modified": page.last_modified}
+                self._reply(200, page.body.encode(charset), page.content_type, extra)
+
+            def _reply(self, status, body, content_type, extra=None):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                for key, value in (extra or {}).items():
+                    if value:
+                        self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *_args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def url(self, path: str) -> str:
+        return f"http://127.0.0.1:{self._server.server_address[1]}{path}"
+
+    def stop(self) -> None:
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
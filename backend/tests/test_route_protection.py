@@ -6,7 +6,7 @@ Vérifie que TOUTES les routes protégées :
 - Retournent 403 si le tenant_id ne correspond pas
 - Retournent 200/404 si le tenant est le bon
 
-Routes testées : contacts, tenant_settings, human_detection, setup
+Routes testées : contacts, tenant_settings, human_detection, setup, export
 """
 import pytest
 from tests.conftest import _create_tenant_user, _get_token
@@ -216,3 +216,113 @@ class TestSetupProtection:
             headers=superadmin_headers,
         )
         assert resp.status_code not in (401, 403)
+
+
+# ════════════════════════════════════════════════════════════════
+# EXPORT — /api/tenants/{tenant_id}/export
+# ════════════════════════════════════════════════════════════════
+
+class TestExportProtection:
+
+    def test_export_requires_auth(self, client, regular_user):
+        resp = client.get(f"/api/tenants/{regular_user[0].id}/export")
+        assert resp.status_code == 401
+
+    def test_export_wrong_tenant_returns_403(self, client, regular_user, other_user, auth_headers):
+        resp = client.get(f"/api/tenants/{other_user[0].id}/export", headers=auth_headers)
+        assert resp.status_code == 403
+
+    def test_export_streams_own_messages_and_resumes(self, client, db, regular_user, auth_headers):
+        import json
+        from app.models import Conversation, Message
+        tid = regular_user[0].id
+        conv = Conversation(tenant_id=tid, customer_phone="237600000009", outcome_type="vente")
+        db.add(conv)
+        db.flush()
+        for i in range(5):
+            db.add(Message(conversation_id=conv.id, content=f"msg {i}",
+                           direction="incoming" if i % 2 else "outgoing"))
+        db.commit()
+
+        resp = client.get(f"/api/tenants/{tid}/export?format=ndjson", headers=auth_headers)
+        assert resp.status_code == 200
+        rows = [json.loads(line) for line in resp.text.splitlines()]
+        assert [r["content"] for r in rows] == [f"msg {i}" for i in range(5)]
+
+        resumed = client.get(
+            f"/api/tenants/{tid}/export?format=ndjson&cursor={rows[1]['cursor']}", headers=auth_headers
+        )
+        assert [json.loads(line)["content"] for line in resumed.text.splitlines()] == ["msg 2", "msg 3", "msg 4"]
+
+    def test_export_invalid_cursor_returns_400(self, client, regular_user, auth_headers):
+        resp = client.get(f"/api/tenants/{regular_user[0].id}/export?cursor=zzz", headers=auth_headers)
+        assert resp.status_code == 400
+
+
+class TestSchedulerAdminProtection:
+
+    def test_scheduler_runs_requires_auth(self, client):
+        assert client.get("/api/admin/scheduler/runs").status_code == 401
+
+    def test_scheduler_jobs_forbidden_for_tenant_user(self, client, auth_headers):
+        assert client.get("/api/admin/scheduler/jobs", headers=auth_headers).status_code == 403
+
+
+class TestGenerationSchedulerAdminProtection:
+
+    def test_generation_scheduler_requires_auth(self, client):
+        assert client.get("/api/admin/generation-scheduler").status_code == 401
+
+    def test_generation_scheduler_forbidden_for_tenant_user(self, client, auth_headers):
+        assert client.get("/api/admin/generation-scheduler", headers=auth_headers).status_code == 403
+
+
+class TestTokenBudgetAdminProtection:
+
+    def test_token_budgets_requires_auth(self, client):
+        assert client.get("/api/admin/token-budgets").status_code == 401
+
+    def test_token_budgets_forbidden_for_tenant_user(self, client, auth_headers):
+        assert client.get("/api/admin/token-budgets", headers=auth_headers).status_code == 403
+
+
+class TestWebhookDedupAdminProtection:
+
+    def test_webhook_dedup_requires_auth(self, client):
+        assert client.get("/api/admin/webhook-dedup").status_code == 401
+
+    def test_webhook_dedup_forbidden_for_tenant_user(self, client, auth_headers):
+        assert client.get("/api/admin/webhook-dedup", headers=auth_headers).status_code == 403
+
+
+class TestMetricsEndpointProtection:
+
+    def test_metrics_closed_in_production_without_token(self, client, monkeypatch):
+        from app import main
+        monkeypatch.setattr(main, "METRICS_TOKEN", "")
+        monkeypatch.setenv("APP_ENV", "production")
+        assert client.get("/metrics").status_code == 403
+
+    def test_metrics_requires_token_when_configured(self, client, monkeypatch):
+        from app import main
+        monkeypatch.setattr(main, "METRICS_TOKEN", "scrape-secret")
+        assert client.get("/metrics").status_code == 401
+        response = client.get("/metrics", headers={"Authorization": "Bearer scrape-secret"})
+        assert response.status_code == 200
+        assert "neobot_http_request_seconds" in response.text or "neobot_webhook_deliveries_total" in response.text
+
+
+class TestStreamingChatProtection:
+
+    def test_chat_test_stream_requires_auth(self, client):
+        response = client.post("/api/tenants/1/agents/1/chat-test/stream", json={"message": "Bonjour"})
+        assert response.status_code == 401
+
+    def test_chat_test_stream_forbidden_for_other_tenant(self, client, auth_headers):
+        response = client.post(
+            "/api/tenants/999999/agents/1/chat-test/stream", json={"message": "Bonjour"}, headers=auth_headers,
+        )
+        assert response.status_code == 403
+
+    def test_neo_assistant_stream_requires_auth(self, client):
+        assert client.post("/api/neo-assistant/chat/stream", json={"message": "Bonjour"}).status_code == 401
@@ -169,3 +169,2118 @@ class TestAuthServiceTokens:
                 f"Attendu '{expected_detail}' dans le détail pour '{pwd}', "
                 f"reçu: '{exc_info.value.detail}'"
             )
+
+
+# ════════════════════════════════════════════════════════════════
+# ARCHIVE MESSAGES — stockage froid + relecture transparente
+# ════════════════════════════════════════════════════════════════
+
+class TestMessageArchive:
+
+    def _seed(self, db, old_count=5, recent_count=3):
+        from datetime import datetime, timedelta
+        from app.models import Conversation, Message
+        from tests.conftest import _create_tenant_user
+        tenant, _ = _create_tenant_user(db, "archive@test.com", "Test@1234", "Archive Co")
+        conv = Conversation(tenant_id=tenant.id, customer_phone="237600000001")
+        db.add(conv)
+        db.flush()
+        old = datetime.utcnow() - timedelta(days=400)
+        for i in range(old_count):
+            db.add(Message(conversation_id=conv.id, content=f"ancien {i}", direction="incoming",
+                           created_at=old + timedelta(minutes=i)))
+        for i in range(recent_count):
+            db.add(Message(conversation_id=conv.id, content=f"récent {i}", direction="outgoing",
+                           is_ai=True, created_at=datetime.utcnow() - timedelta(minutes=recent_count - i)))
+        db.commit()
+        return tenant, conv
+
+    @staticmethod
+    def _storage(tmp_path, monkeypatch):
+        from app.services import message_archive_service as svc
+        monkeypatch.setattr(svc, "MESSAGE_ARCHIVE_ENABLED", True)
+        monkeypatch.setattr(svc, "MESSAGE_ARCHIVE_DIR", str(tmp_path))
+        (tmp_path / svc.ARCHIVE_MARKER).touch()
+        return svc
+
+    def test_refuses_without_durable_storage(self, db, tmp_path, monkeypatch):
+        from app.models import Message
+        from app.services import message_archive_service as svc
+        _, conv = self._seed(db)
+        assert svc.MessageArchiveService.archive_old_messages(db)["skipped"]          # désactivé par défaut
+
+        monkeypatch.setattr(svc, "MESSAGE_ARCHIVE_ENABLED", True)
+        monkeypatch.setattr(svc, "MESSAGE_ARCHIVE_DIR", str(tmp_path))             # volume sans témoin
+        stats = svc.MessageArchiveService.archive_old_messages(db)
+        assert stats["archived"] == 0 and "témoin" in stats["skipped"]
+        assert db.query(Message).filter(Message.conversation_id == conv.id).count() == 8
+
+    def test_old_messages_leave_hot_table(self, db, tmp_path, monkeypatch):
+        from app.models import Message, MessageArchiveSegment
+        svc = self._storage(tmp_path, monkeypatch)
+        _, conv = self._seed(db)
+
+        stats = svc.MessageArchiveService.archive_old_messages(db, batch_size=2)
+
+        assert stats["archived"] == 5
+        assert stats["batches"] == 3
+        assert db.query(Message).filter(Message.conversation_id == conv.id).count() == 3
+        assert db.query(MessageArchiveSegment).count() == 3
+        # Un seul fichier par tenant/mois, plusieurs membres gzip ajoutés
+        assert len(list(tmp_path.rglob("*.ndjson.gz"))) == 1
+
+    def test_read_through_merges_archive_and_hot(self, db, tmp_path, monkeypatch):
+        svc = self._storage(tmp_path, monkeypatch)
+        _, conv = self._seed(db)
+        svc.MessageArchiveService.archive_old_messages(db, batch_size=2)
+
+        msgs, total = svc.MessageArchiveService.get_conversation_messages(conv.id, db)
+        assert total == 8
+        assert [m["content"] for m in msgs] == [f"ancien {i}" for i in range(5)] + [f"récent {i}" for i in range(3)]
+
+        # Page à cheval sur archive et table chaude
+        page, _ = svc.MessageArchiveService.get_conversation_messages(conv.id, db, limit=3, offset=4)
+        assert [m["content"] for m in page] == ["ancien 4", "récent 0", "récent 1"]
+
+    def test_page_reads_only_covering_segments(self, db, tmp_path, monkeypatch):
+        svc = self._storage(tmp_path, monkeypatch)
+        _, conv = self._seed(db, old_count=7)
+        svc.MessageArchiveService.archive_old_messages(db, batch_size=2)      # segments de 2, 2, 2, 1
+        reads = []
+        real_read = svc.MessageArchiveService._read_member
+        monkeypatch.setattr(svc.MessageArchiveService, "_read_member",
+                            staticmethod(lambda *a: reads.append(a[1]) or real_read(*a)))
+
+        page, total = svc.MessageArchiveService.get_conversation_messages(conv.id, db, limit=2, offset=3)
+        assert [m["content"] for m in page] == ["ancien 3", "ancien 4"] and total == 10
+        assert len(reads) == 2                                                # segments 2 et 3 seulement
+        reads.clear()
+        svc.MessageArchiveService.get_conversation_messages(conv.id, db, limit=2, offset=7)
+        assert reads == []                                                    # page hors archive
+
+    def test_archive_is_idempotent(self, db, tmp_path, monkeypatch):
+        svc = self._storage(tmp_path, monkeypatch)
+        self._seed(db)
+        svc.MessageArchiveService.archive_old_messages(db)
+        assert svc.MessageArchiveService.archive_old_messages(db)["archived"] == 0
+
+
+# ════════════════════════════════════════════════════════════════
+# BROADCAST EMAIL — job en arrière-plan contre le faux serveur Brevo
+# ════════════════════════════════════════════════════════════════
+
+class TestBroadcastJob:
+
+    @pytest.fixture
+    async def fake_brevo(self, monkeypatch):
+        import httpx
+        from scripts.fake_brevo_server import create_app
+        from app.http_client import set_transport
+        from app.services import email_service, broadcast_service
+        fake = create_app()
+        monkeypatch.setattr(email_service, "BREVO_API_KEY", "fake")
+        monkeypatch.setattr(email_service, "BREVO_API_URL", "http://fake-brevo/v3/smtp/email")
+        await set_transport("brevo", httpx.ASGITransport(app=fake))
+        monkeypatch.setattr(broadcast_service, "BROADCAST_BATCH_SIZE", 2)
+        yield fake
+        await set_transport("brevo", None)
+
+    async def test_job_sends_batches_and_persists_progress(self, db, fake_brevo):
+        from app.services.broadcast_service import BroadcastService
+        from tests.conftest import _create_tenant_user
+        for i in range(5):
+            _create_tenant_user(db, f"client{i}@test.com", "Test@1234", f"Client {i}")
+
+        job = BroadcastService.create_job(db, subject="Nouveauté", body="Bonjour !")
+        assert job.status == "pending" and job.total == 5
+
+        await BroadcastService.run_job(job.id, bind=db.get_bind())
+
+        db.expire_all()
+        job = BroadcastService.get_job(db, job.id)
+        assert job.status == "completed"
+        assert (job.sent, job.failed) == (5, 0)
+        # 3 requêtes Brevo (2 + 2 + 1) au lieu de 5
+        assert fake_brevo.state.stats["requests"] == 3
+        assert all("messageVersions" in p for p in fake_brevo.state.received)
+
+    def test_broadcast_endpoint_requires_superadmin(self, client, regular_user, auth_headers):
+        resp = client.post("/api/admin/broadcast-email", json={"subject": "x", "body": "y"}, headers=auth_headers)
+        assert resp.status_code == 403
+
+    def test_broadcast_status_unknown_job_returns_404(self, client, superadmin_user, superadmin_headers):
+        resp = client.get("/api/admin/broadcast-email/999", headers=superadmin_headers)
+        assert resp.status_code == 404
+
+
+# ════════════════════════════════════════════════════════════════
+# OUTBOX EMAIL — mise en file, dedup, retry, dead-letter
+# ════════════════════════════════════════════════════════════════
+
+class TestEmailOutbox:
+
+    @pytest.fixture
+    async def outbox(self, monkeypatch):
+        import httpx
+        from scripts.fake_brevo_server import create_app
+        from app.http_client import set_transport
+        from app.services import email_service, email_outbox
+        from tests.conftest import TestingSessionLocal
+        fake = create_app()
+        monkeypatch.setattr(email_outbox, "SessionLocal", TestingSessionLocal)
+        monkeypatch.setattr(email_service, "BREVO_API_KEY", "fake")
+        monkeypatch.setattr(email_service, "BREVO_API_URL", "http://fake-brevo/v3/smtp/email")
+        await set_transport("brevo", httpx.ASGITransport(app=fake))
+        yield fake
+        await set_transport("brevo", None)
+
+    async def test_send_enqueues_then_worker_delivers(self, db, outbox):
+        from app.models import EmailOutbox
+        from app.services.email_service import send_password_reset_email
+        from app.services.email_outbox import EmailOutboxWorker
+
+        assert await send_password_reset_email("user@test.com", "https://neobot-ai.com/reset?t=1")
+        assert outbox.state.stats["requests"] == 0          # rien n'est envoyé inline
+        row = db.query(EmailOutbox).one()
+        assert row.status == "pending"
+
+        assert await EmailOutboxWorker.process_once(db) == 1
+        db.refresh(row)
+        assert row.status == "sent" and row.attempts == 1
+        assert "https://neobot-ai.com/reset?t=1" in outbox.state.received[0]["htmlContent"]
+        assert row.payload == {"sender": row.payload["sender"], "to": [{"email": "user@test.com"}],
+                               "subject": row.payload["subject"], "redacted": True}   # lien effacé après envoi
+
+    async def test_welcome_is_deduplicated_per_address(self, db, outbox):
+        from app.models import EmailOutbox
+        from app.services.email_service import send_welcome_email
+        assert await send_welcome_email("New@test.com", "Awa", "Boutique")
+        assert await send_welcome_email("new@test.com", "Awa", "Boutique")
+        assert db.query(EmailOutbox).count() == 1
+
+    async def test_cached_render_escapes_each_recipient(self, db, outbox):
+        from app.models import EmailOutbox
+        from app.services.email_service import send_welcome_email
+        await send_welcome_email("a@test.com", "<script>", "A & B")
+        await send_welcome_email("b@test.com", "Moussa", "Kiosque")
+        html_a, html_b = [r.payload["htmlContent"] for r in db.query(EmailOutbox).order_by(EmailOutbox.id)]
+        assert "&lt;script&gt;" in html_a and "A &amp; B" in html_a
+        assert "Moussa" in html_b and "<script>" not in html_b
+
+    async def test_retryable_failure_backs_off_then_dead_letters(self, db, outbox):
+        from datetime import datetime
+        import httpx
+        from scripts.fake_brevo_server import create_app
+        from app.http_client import set_transport
+        from app.models import EmailOutbox
+        from app.services import email_service
+        from app.services.email_outbox import EmailOutboxWorker
+        # Brevo indisponible : toutes les requêtes en 503
+        await set_transport("brevo", httpx.ASGITransport(app=create_app(fail_rate=1.0)))
+
+        await email_service.send_confirmation_email("c@test.com", "https://neobot-ai.com/confirm")
+        row = db.query(EmailOutbox).one()
+        row.max_attempts = 2
+        db.commit()
+
+        await EmailOutboxWorker.process_once(db)
+        db.refresh(row)
+        assert row.status == "pending" and row.attempts == 1
+        assert row.next_attempt_at > datetime.utcnow()
+
+        row.next_attempt_at = datetime.utcnow()
+        db.commit()
+        await EmailOutboxWorker.process_once(db)
+        db.refresh(row)
+        assert row.status == "dead" and row.attempts == 2
+        assert "htmlContent" not in row.payload                       # lien de confirmation effacé
+        assert EmailOutboxWorker.requeue(db, row.id) is None
+
+    async def test_loop_resends_rows_stuck_in_sending(self, db, outbox, monkeypatch):
+        import asyncio
+        from datetime import datetime, timedelta
+        from app.models import EmailOutbox
+        from app.services import email_outbox
+        from app.services.email_service import send_password_reset_email
+        monkeypatch.setattr(email_outbox, "RECOVER_SECONDS", 0.1)
+        monkeypatch.setattr(email_outbox, "OUTBOX_POLL_SECONDS", 0.1)
+        await send_password_reset_email("user@test.com", "https://neobot-ai.com/reset?t=2")
+        row = db.query(EmailOutbox).one()
+        row.status = "sending"                                        # crash pendant l'envoi (déploiement)
+        row.next_attempt_at = datetime.utcnow() + timedelta(seconds=0.3)   # bail encore valide au démarrage
+        db.commit()
+
+        task = asyncio.create_task(email_outbox.email_outbox_loop())
+        try:
+            for _ in range(30):
+                await asyncio.sleep(0.1)
+                db.expire_all()
+                if db.get(EmailOutbox, row.id).status == "sent":
+                    break
+        finally:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+        assert db.get(EmailOutbox, row.id).status == "sent"           # repris bien avant l'heure suivante
+
+
+# ════════════════════════════════════════════════════════════════
+# SCHEDULER — planification, échéances manquées, historique
+# ════════════════════════════════════════════════════════════════
+
+class TestScheduler:
+
+    @pytest.fixture
+    def sched(self, monkeypatch):
+        from app.services import scheduler_service
+        from tests.conftest import TestingSessionLocal
+        monkeypatch.setattr(scheduler_service, "SessionLocal", TestingSessionLocal)
+        return scheduler_service.Scheduler()
+
+    def test_cron_next_occurrence(self):
+        from datetime import datetime
+        from app.services.scheduler_service import CronSchedule
+        sunday_3am = CronSchedule("0 3 * * 0")
+        # Lundi 19 oct. 2026 10h → dimanche 25 oct. 3h
+        assert sunday_3am.next_after(datetime(2026, 10, 19, 10, 0)) == datetime(2026, 10, 25, 3, 0)
+        every_15 = CronSchedule("*/15 8-9 * * *")
+        assert every_15.next_after(datetime(2026, 10, 19, 8, 14)) == datetime(2026, 10, 19, 8, 15)
+        assert every_15.next_after(datetime(2026, 10, 19, 9, 45)) == datetime(2026, 10, 20, 8, 0)
+        with pytest.raises(ValueError):
+            CronSchedule("61 * * * *")
+
+    async def test_missed_runs_are_caught_up_once(self, db, sched):
+        from datetime import datetime, timedelta
+        from app.models import SchedulerJobState, SchedulerRun
+        from app.services.scheduler_service import ScheduledJob, IntervalSchedule
+        calls = []
+
+        async def _job():
+            calls.append(1)
+
+        job = ScheduledJob("retry", _job, IntervalSchedule(300))
+        sched.add_job(job)
+        now = datetime.utcnow()
+        db.add(SchedulerJobState(name="retry", schedule="every 300s",
+                                 last_scheduled_at=now - timedelta(minutes=31)))
+        db.commit()
+
+        due, run_at, missed, catch_up = sched._plan(db, job, now)
+        assert catch_up and missed == 6 and run_at == now
+        await sched._execute(job, due, missed, catch_up)
+
+        assert calls == [1]                      # une seule exécution pour 6 échéances
+        run = db.query(SchedulerRun).one()
+        assert run.status == "success" and run.catch_up and run.missed == 6
+        db.expire_all()
+        assert db.get(SchedulerJobState, "retry").last_scheduled_at == due
+
+    def test_missed_run_outside_window_is_skipped(self, db, sched):
+        from datetime import datetime, timedelta
+        from app.models import SchedulerJobState, SchedulerRun
+        from app.services.scheduler_service import ScheduledJob, CronSchedule
+
+        async def _job():
+            pass
+
+        job = ScheduledJob("summary", _job, CronSchedule("0 8 * * *"), catch_up_window=timedelta(hours=4))
+        now = datetime(2026, 10, 19, 15, 0)
+        db.add(SchedulerJobState(name="summary", schedule="cron 0 8 * * *",
+                                 last_scheduled_at=datetime(2026, 10, 18, 8, 0)))
+        db.commit()
+
+        due, run_at, missed, catch_up = sched._plan(db, job, now)
+        assert not catch_up and due == datetime(2026, 10, 20, 8, 0)
+        assert db.query(SchedulerRun).one().status == "missed"
+
+    async def test_failed_job_is_recorded(self, db, sched):
+        from datetime import datetime
+        from app.models import SchedulerRun
+        from app.services.scheduler_service import ScheduledJob, IntervalSchedule
+
+        async def _boom():
+            raise RuntimeError("neon down")
+
+        job = ScheduledJob("boom", _boom, IntervalSchedule(60))
+        await sched._execute(job, datetime.utcnow(), 0, False)
+        run = db.query(SchedulerRun).one()
+        assert run.status == "failed" and "neon down" in run.error
+
+
+# ════════════════════════════════════════════════════════════════
+# VERROUS DE CONVERSATION — mémoire bornée, pas de doublon
+# ════════════════════════════════════════════════════════════════
+
+class TestConversationLock:
+
+    async def test_locks_are_released_when_idle(self):
+        import asyncio
+        from app.services.conversation_lock import ConversationLockManager
+        manager = ConversationLockManager()
+        order = []
+
+        async def _hold(i):
+            async with manager.hold(1, "237600000001"):
+                order.append(("in", i))
+                await asyncio.sleep(0)
+                order.append(("out", i))
+
+        await asyncio.gather(*(_hold(i) for i in range(5)))
+        # Sérialisé : chaque entrée est suivie de sa sortie
+        assert all(order[k][1] == order[k + 1][1] for k in range(0, 10, 2))
+        assert len(manager) == 0
+
+    @pytest.mark.parametrize("mode", ["upsert", "advisory", "local"])
+    def test_get_or_create_is_idempotent(self, db, regular_user, mode):
+        from app.models import Conversation
+        from app.services.conversation_lock import get_or_create_conversation
+        tid = regular_user[0].id
+        first, created = get_or_create_conversation(db, tid, "+237600000002", "Awa", mode=mode)
+        again, created_again = get_or_create_conversation(db, tid, "+237600000002", "Awa", mode=mode)
+        assert created and not created_again
+        assert first.id == again.id
+        assert db.query(Conversation).filter(Conversation.tenant_id == tid).count() == 1
+
+    async def test_concurrent_messages_share_one_conversation(self, db, regular_user):
+        import asyncio
+        from app.models import Conversation, Message
+        from app.whatsapp_webhook import save_message_to_db
+        tid = regular_user[0].id
+        await asyncio.gather(*(
+            save_message_to_db("+237600000003", "Moussa", f"msg {i}", "incoming", tid, db)
+            for i in range(10)
+        ))
+        convs = db.query(Conversation).filter(Conversation.tenant_id == tid).all()
+        assert len(convs) == 1
+        assert db.query(Message).filter(Message.conversation_id == convs[0].id).count() == 10
+
+
+# ════════════════════════════════════════════════════════════════
+# BACKEND D'ÉTAT PARTAGÉ — même contrat en mémoire, Postgres et Redis
+# ════════════════════════════════════════════════════════════════
+
+class TestStateBackend:
+
+    @pytest.fixture
+    def fake_redis(self):
+        from tests.fake_redis import FakeRedisServer
+        with FakeRedisServer() as server:
+            yield server
+
+    @pytest.fixture(params=["memory", "postgres", "redis"])
+    def backend(self, request, db):
+        from app.state_backend import MemoryStateBackend, PostgresStateBackend, RedisStateBackend
+        if request.param == "memory":
+            yield MemoryStateBackend()
+        elif request.param == "postgres":
+            yield PostgresStateBackend(db.get_bind())
+        else:
+            server = request.getfixturevalue("fake_redis")
+            backend = RedisStateBackend(server.url)
+            yield backend
+            backend.close()
+
+    @pytest.fixture
+    def shared(self, fake_redis):
+        """Backend global du process remplacé par un Redis (faux) pour les call sites."""
+        from app.state_backend import RedisStateBackend, set_state_backend
+        backend = RedisStateBackend(fake_redis.url)
+        set_state_backend(backend)
+        yield backend
+        set_state_backend(None)
+        backend.close()
+
+    def test_incr_is_counter_with_ttl_set_on_creation(self, backend):
+        import time
+        assert [backend.incr("c", ttl=0.2) for _ in range(3)] == [1, 2, 3]
+        assert backend.incr("c", 5) == 8
+        assert 0 < backend.ttl("c") <= 0.2
+        time.sleep(0.25)
+        assert backend.get("c") is None
+        assert backend.incr("c", ttl=60) == 1
+
+    def test_set_nx_json_delete_and_clear(self, backend):
+        assert backend.set_json("s:1", {"messages": [1, 2]}, ttl=60)
+        assert not backend.set("s:1", "x", nx=True)
+        assert backend.get_json("s:1") == {"messages": [1, 2]}
+        assert backend.ttl("s:1") > 50
+        backend.set("s:2", "y")
+        backend.set("other", "z")
+        assert backend.ttl("s:2") is None
+        backend.delete("s:1")
+        assert backend.get("s:1") is None and backend.set("s:1", "x", nx=True)
+        assert backend.clear("s:") == 2
+        assert backend.get("other") == "z"
+
+    def test_concurrent_incr_loses_no_update(self, fake_redis):
+        from concurrent.futures import ThreadPoolExecutor
+        from app.state_backend import MemoryStateBackend, RedisStateBackend
+        workers = [RedisStateBackend(fake_redis.url) for _ in range(4)]   # 4 "processus"
+        for backends in ([MemoryStateBackend()] * 4, workers):
+            with ThreadPoolExecutor(8) as pool:
+                list(pool.map(lambda i: backends[i % 4].incr("n", ttl=60), range(400)))
+            assert int(backends[0].get("n")) == 400
+        for w in workers:
+            w.close()
+
+    def test_stale_connection_retried_timeout_never_resent(self, fake_redis):
+        from app.state_backend import RedisStateBackend, StateBackendError
+        backend = RedisStateBackend(fake_redis.url, timeout=0.2)
+        try:
+            assert backend.incr("n") == 1
+            fake_redis.drop_connections()                 # connexion du pool fermée par le serveur
+            assert backend.incr("n") == 2                 # rien n'avait été exécuté : renvoi sûr
+
+            fake_redis.reply_delay = 0.5                  # INCRBY exécuté, réponse après le timeout
+            with pytest.raises(StateBackendError):
+                backend.incr("n")
+            fake_redis.reply_delay = 0.0
+            assert backend.get("n") == "3"                # compté une seule fois
+        finally:
+            backend.close()
+
+    def test_demo_daily_cap_shared_across_workers(self, shared):
+        from app.routers import demo
+        shared.set(demo._daily_key(), str(demo._DAILY_CALL_LIMIT - 1))   # compté par un autre worker
+        assert demo._check_daily_limit() is False
+        demo._increment_daily()
+        assert demo._check_daily_limit() is True
+
+    def test_degraded_mode_and_alert_cooldown(self, shared):
+        from app.services import monitoring_service as ms
+        assert ms.is_degraded_mode() is False
+        ms._set_degraded_mode(True)
+        assert shared.get(ms.DEGRADED_MODE_KEY) == "1" and ms.is_degraded_mode()
+        ms._set_degraded_mode(False)
+        assert ms._should_send_alert("deepseek", "red")
+        shared.set("alert:last:deepseek:red", "x", ttl=3600)
+        assert not ms._should_send_alert("deepseek", "red")
+
+    def test_rate_limit_storage_uses_backend(self, shared):
+        from limits import parse
+        from limits.strategies import FixedWindowRateLimiter
+        from app.state_backend import StateBackendStorage
+        limiter = FixedWindowRateLimiter(StateBackendStorage("state://"))
+        limit = parse("2/minute")
+        assert [limiter.hit(limit, "1.2.3.4") for _ in range(3)] == [True, True, False]
+        assert StateBackendStorage("state://").reset() == 1
+        assert limiter.hit(limit, "1.2.3.4")
+
+
+# ════════════════════════════════════════════════════════════════
+# FILE DE GÉNÉRATION LLM — équité par plan, plafonds, délestage
+# ════════════════════════════════════════════════════════════════
+
+class TestGenerationScheduler:
+
+    def test_plan_and_trial_drive_weights(self):
+        from app.services.generation_scheduler import profile_for
+        pro, basic, trial = profile_for("PRO", False), profile_for("BASIC", False), profile_for("PRO", True)
+        assert pro.weight > basic.weight and trial.weight < pro.weight
+        assert trial.max_in_flight <= 2 and trial.slo_seconds < pro.slo_seconds
+
+    async def test_weighted_fair_share_between_tenants(self):
+        import asyncio
+        from app.services.generation_scheduler import GenerationScheduler, TenantProfile
+        sched = GenerationScheduler(max_concurrency=1)
+        sched.set_profile("campaign", TenantProfile(1.0, 4, 60.0, "BASIC"))
+        sched.set_profile("vip", TenantProfile(4.0, 4, 60.0, "PRO"))
+        served = []
+
+        async def _call(tenant):
+            async with sched.slot(tenant):
+                served.append(tenant)
+                await asyncio.sleep(0.001)
+
+        # La campagne arrive la première avec 10 appels, le tenant PRO juste après
+        await asyncio.gather(*[_call("campaign") for _ in range(10)], *[_call("vip") for _ in range(5)])
+        # Le tenant PRO n'attend pas la fin de la campagne : servi ~4x plus souvent
+        first_ten = served[:10]
+        assert first_ten.count("vip") >= 4
+        assert sched.stats()["in_flight"] == 0
+
+    async def test_per_tenant_in_flight_cap(self):
+        import asyncio
+        from app.services.generation_scheduler import GenerationScheduler, TenantProfile
+        sched = GenerationScheduler(max_concurrency=10)
+        sched.set_profile(1, TenantProfile(1.0, 2, 60.0, "BASIC"))
+        peak = running = 0
+
+        async def _call():
+            nonlocal peak, running
+            async with sched.slot(1):
+                running += 1
+                peak = max(peak, running)
+                await asyncio.sleep(0.005)
+                running -= 1
+
+        await asyncio.gather(*(_call() for _ in range(6)))
+        assert peak == 2
+        assert sched.stats()["tenants"]["1"]["dispatched"] == 6
+
+    async def test_sheds_when_queue_exceeds_slo(self):
+        import asyncio
+        from app.services.generation_scheduler import GenerationScheduler, GenerationShed, TenantProfile
+        sched = GenerationScheduler(max_concurrency=10)
+        sched.set_profile(2, TenantProfile(1.0, 1, 0.05, "BASIC:trial"))
+        release = asyncio.Event()
+
+        async def _holder():
+            async with sched.slot(2):
+                await release.wait()
+
+        holder = asyncio.create_task(_holder())
+        await asyncio.sleep(0)
+        state = sched._tenants[2]
+        # Attente prévue OK (appels courts) mais attente réelle > SLO → délesté au timeout
+        state.service_ewma = 0.01
+        with pytest.raises(GenerationShed) as exc:
+            async with sched.slot(2):
+                pass
+        assert exc.value.reason.startswith("attente")
+        # Attente prévue > SLO (appels de 1s, 1 slot) → délesté sans attendre
+        state.service_ewma = 1.0
+        with pytest.raises(GenerationShed) as exc:
+            async with sched.slot(2):
+                pass
+        assert exc.value.reason == "file pleine"
+        release.set()
+        await holder
+        assert sched.stats()["tenants"]["2"]["shed"] == 2
+
+    def test_overloaded_canned_reply(self):
+        from app.services.sales_prompt_generator import SalesPromptGenerator
+        reply = SalesPromptGenerator.generate_rejection_response(False, "overloaded", business_name="Boutique Awa")
+        assert "Boutique Awa" in reply
+        assert "quelques instants" not in reply                     # rien n'est remis en file : aucune promesse
+
+    async def test_shed_reply_sent_but_not_billed(self, db, regular_user, monkeypatch):
+        from fastapi import BackgroundTasks
+        from app import whatsapp_webhook as wh
+        from app.models import AgentTemplate, Conversation, Message
+        from app.services.usage_tracking_service import UsageTrackingService
+        tenant, _ = regular_user
+        db.add(AgentTemplate(tenant_id=tenant.id, name="Agent", agent_type="vente", is_active=True))
+        conv = Conversation(tenant_id=tenant.id, customer_phone="237690000001")
+        db.add(conv)
+        db.commit()
+        billed = []
+        monkeypatch.setattr(UsageTrackingService, "increment_whatsapp_usage",
+                            staticmethod(lambda tenant_id, units, db: billed.append(units)))
+
+        async def _process(text, sender, **kw):
+            return wh.ShedReply("Merci de renvoyer votre message un peu plus tard.")
+
+        monkeypatch.setattr(wh.brain, "process", _process)
+        message = wh.WhatsAppMessage(tenant_id=tenant.id, from_="237690000001", text="Bonjour",
+                                     senderName="Client", messageKey={"id": "S1"}, timestamp=1760000000)
+        tasks = BackgroundTasks()
+        await wh._reply_to_message(message, "237690000001", tenant.id, conv, tasks, db)
+        assert billed == []
+        assert db.query(Message).filter(Message.direction == "outgoing").count() == 1
+        assert len(tasks.tasks) == 1                                 # réponse d'attente quand même envoyée
+
+
+# ════════════════════════════════════════════════════════════════
+# BUDGETS DE TOKENS — par tenant / usage, persistés par lots
+# ════════════════════════════════════════════════════════════════
+
+class TestTokenBudget:
+
+    @pytest.fixture
+    def budget(self):
+        from app.services.token_budget import TokenBudget
+        budget = TokenBudget()
+        budget.set_plan(1, "BASIC")
+        budget.set_plan(2, "BASIC")
+        return budget
+
+    def test_capacity_covers_paid_quota(self):
+        from app.models import PLAN_LIMITS, PlanType
+        from app.services.token_budget import TOKENS_PER_MESSAGE, capacity_for
+        for plan in (PlanType.BASIC, PlanType.STANDARD):
+            paid_per_day = PLAN_LIMITS[plan]["whatsapp_messages"] / 30 * TOKENS_PER_MESSAGE
+            assert capacity_for(plan.value, "webhook_reply") >= 3 * paid_per_day
+        assert capacity_for("PRO", "webhook_reply") > capacity_for("STANDARD", "webhook_reply")
+        assert capacity_for("BASIC", "prompt_generation") >= 20 * 8000     # ≥ 20 générations de prompt / jour
+        assert capacity_for(None, "webhook_reply") == capacity_for("BASIC", "webhook_reply")
+
+    def test_noisy_tenant_does_not_starve_others(self, budget):
+        from app.services.token_budget import capacity_for
+        cap = capacity_for("BASIC", "chat_test")
+        assert budget.allow(1, "chat_test")
+        budget.consume(1, "chat_test", int(cap) + 10)        # le tenant 1 épuise son seau chat-test
+        assert not budget.allow(1, "chat_test")
+        assert budget.allow(1, "webhook_reply")               # ses réponses clients continuent
+        assert budget.allow(2, "chat_test")                   # les autres tenants aussi
+
+    def test_sync_persists_and_merges_workers(self, db, budget):
+        from app.models import TokenBucket
+        from app.services.token_budget import TokenBudget, capacity_for
+        other = TokenBudget()                                 # second worker
+        other.set_plan(1, "BASIC")
+        budget.consume(1, "webhook_reply", 1000)
+        other.consume(1, "webhook_reply", 500)
+        assert budget.sync(db) == 2 and other.sync(db) == 2   # seau tenant + seau global
+        row = db.query(TokenBucket).filter_by(tenant_id=1, purpose="webhook_reply").one()
+        cap = capacity_for("BASIC", "webhook_reply")
+        assert cap - 1500 <= row.level < cap - 1499
+        # Redémarrage : un nouveau process repart du niveau persisté
+        fresh = TokenBudget()
+        fresh.set_plan(1, "BASIC")
+        assert fresh.load(db) == 2
+        assert fresh.stats(1)[0]["remaining"] <= cap - 1499
+
+    def test_global_ceiling_blocks_every_tenant(self, budget, monkeypatch):
+        from app.services import token_budget as tb
+        monkeypatch.setattr(tb, "DEEPSEEK_DAILY_TOKEN_CEILING", 100)
+        budget.consume(1, "webhook_reply", 150)
+        assert not budget.allow(2, "webhook_reply")
+
+
+# ════════════════════════════════════════════════════════════════
+# IDEMPOTENCE WEBHOOK — relivraisons du même messageKey
+# ════════════════════════════════════════════════════════════════
+
+class TestWebhookIdempotency:
+
+    @pytest.fixture
+    def dedup(self, monkeypatch):
+        from app import whatsapp_webhook as wh
+        from app.services.webhook_idempotency import WebhookIdempotency
+        dedup = WebhookIdempotency()
+        monkeypatch.setattr(wh, "webhook_dedup", dedup)
+        return dedup
+
+    def _delivery(self, tenant_id, message_id="3EB0A1B2C3D4E5F6", text="Bonjour"):
+        from app.whatsapp_webhook import WhatsAppMessage
+        return WhatsAppMessage(
+            tenant_id=tenant_id,
+            from_="237690000001",
+            text=text,
+            senderName="Client",
+            messageKey={"id": message_id, "remoteJid": "237690000001@s.whatsapp.net", "fromMe": False},
+            timestamp=1760000000,
+        )
+
+    async def _post(self, db, message):
+        from fastapi import BackgroundTasks
+        from starlette.requests import Request
+        from app.whatsapp_webhook import whatsapp_webhook
+        request = Request({"type": "http", "method": "POST", "path": "/webhooks/whatsapp", "headers": []})
+        return await whatsapp_webhook(request, message, BackgroundTasks(), db)
+
+    def test_key_is_tenant_scoped_and_bounded(self):
+        from app.services.webhook_idempotency import WebhookIdempotency, EXTERNAL_ID_MAX_LENGTH
+        assert WebhookIdempotency.key_for(1, {}) is None
+        assert WebhookIdempotency.key_for(1, {"id": "ABC"}) != WebhookIdempotency.key_for(2, {"id": "ABC"})
+        assert len(WebhookIdempotency.key_for(1, {"id": "x" * 500})) <= EXTERNAL_ID_MAX_LENGTH
+
+    def test_memory_hit_returns_original_result(self, db):
+        from app.services.webhook_idempotency import WebhookIdempotency
+        dedup = WebhookIdempotency()
+        assert dedup.check("1:A", db) is None
+        assert dedup.check("1:A", db)["reason"] == "in_progress"       # relivraison concurrente
+        dedup.remember("1:A", {"status": "received", "conversation_id": 7})
+        assert dedup.check("1:A", db) == {"status": "received", "conversation_id": 7, "duplicate": True}
+        assert dedup.stats()["dedup_rate"] == round(2 / 3, 4)
+
+    def test_unique_external_id_blocks_second_insert(self, db, regular_user):
+        from sqlalchemy.exc import IntegrityError
+        from app.models import Conversation, Message
+        tenant, _ = regular_user
+        conv = Conversation(tenant_id=tenant.id, customer_phone="237690000001")
+        db.add(conv)
+        db.commit()
+        db.add(Message(conversation_id=conv.id, content="a", direction="incoming", external_id="1:A"))
+        db.commit()
+        db.add(Message(conversation_id=conv.id, content="a", direction="incoming", external_id="1:A"))
+        with pytest.raises(IntegrityError):
+            db.commit()
+        db.rollback()
+
+    async def test_redelivery_short_circuits_before_processing(self, db, regular_user, dedup):
+        from app.models import Message
+        tenant, _ = regular_user
+        first = await self._post(db, self._delivery(tenant.id))
+        second = await self._post(db, self._delivery(tenant.id))
+        assert second == {**first, "duplicate": True}
+        assert db.query(Message).filter(Message.direction == "incoming").count() == 1
+
+    async def test_other_worker_delivery_is_caught_by_db(self, db, regular_user, dedup):
+        from app.models import Message
+        tenant, _ = regular_user
+        await self._post(db, self._delivery(tenant.id))
+        dedup.__init__()                                                 # autre worker : mémoire vide
+        second = await self._post(db, self._delivery(tenant.id))
+        assert second["duplicate"] and second["conversation_id"] == db.query(Message).one().conversation_id
+        assert dedup.stats()["duplicates_db"] == 1
+
+    def test_forget_releases_key_for_retry(self, db, regular_user):
+        from app.models import Conversation, Message
+        from app.services.webhook_idempotency import WebhookIdempotency
+        tenant, _ = regular_user
+        conv = Conversation(tenant_id=tenant.id, customer_phone="237690000001")
+        db.add(conv)
+        db.commit()
+        db.add(Message(conversation_id=conv.id, content="a", direction="incoming", external_id="1:B"))
+        db.commit()
+        dedup = WebhookIdempotency()
+        assert dedup.check("1:B", db)["duplicate"]
+        dedup.forget("1:B", db)
+        assert dedup.check("1:B", db) is None
+        assert db.query(Message).filter(Message.conversation_id == conv.id).count() == 0   # pas d'orphelin
+
+    async def test_failed_reply_is_retried_without_duplicate_message(self, db, regular_user, dedup, monkeypatch):
+        from fastapi import HTTPException
+        from app import whatsapp_webhook as wh
+        from app.models import Message
+        tenant, _ = regular_user
+        real_reply, calls = wh._reply_to_message, []
+
+        async def _flaky_reply(*args, **kwargs):
+            calls.append(1)
+            if len(calls) == 1:
+                raise RuntimeError("DeepSeek down")
+            return await real_reply(*args, **kwargs)
+
+        monkeypatch.setattr(wh, "_reply_to_message", _flaky_reply)
+        with pytest.raises(HTTPException):
+            await self._post(db, self._delivery(tenant.id))
+        retry = await self._post(db, self._delivery(tenant.id))          # relivraison Baileys
+        assert "duplicate" not in retry and len(calls) == 2
+        incoming = db.query(Message).filter(Message.direction == "incoming").all()
+        assert len(incoming) == 1 and incoming[0].external_id is not None
+        assert (await self._post(db, self._delivery(tenant.id)))["duplicate"]
+
+    async def test_failed_owner_message_is_retried(self, db, regular_user, dedup, monkeypatch):
+        from fastapi import HTTPException
+        from app import whatsapp_webhook as wh
+        from app.models import ConversationHumanState, Message
+        tenant, _ = regular_user
+        real_takeover, calls = wh._activate_owner_takeover, []
+
+        def _flaky_takeover(conversation_id, db):
+            calls.append(1)
+            if len(calls) == 1:
+                raise RuntimeError("connexion perdue")
+            real_takeover(conversation_id, db)
+
+        monkeypatch.setattr(wh, "_activate_owner_takeover", _flaky_takeover)
+        owner = self._delivery(tenant.id, message_id="OWNER1", text="Je m'en occupe")
+        owner.fromMe = True
+        with pytest.raises(HTTPException):
+            await self._post(db, owner)
+        assert await self._post(db, owner) == {"status": "ok", "reason": "owner_message_saved"}
+        saved = db.query(Message).filter(Message.direction == "outgoing", Message.is_ai == False).all()  # noqa: E712
+        assert [m.content for m in saved] == ["Je m'en occupe"]
+        assert db.query(ConversationHumanState).filter_by(conversation_id=saved[0].conversation_id).one().human_active
+
+
+# ════════════════════════════════════════════════════════════════
+# WEBHOOK BATCH — INSERT groupé, 1 réponse IA par conversation
+# ════════════════════════════════════════════════════════════════
+
+class TestWebhookBatch:
+
+    @pytest.fixture
+    def replies(self, monkeypatch):
+        from app import whatsapp_webhook as wh
+        from app.services.webhook_idempotency import WebhookIdempotency
+        monkeypatch.setattr(wh, "webhook_dedup", WebhookIdempotency())
+        calls = []
+
+        async def _fake_reply(message, phone, tenant_id, conversation, background_tasks, db, usage_units=2):
+            calls.append((phone, message.text, usage_units))
+            return {"status": "received", "conversation_id": conversation.id}
+
+        monkeypatch.setattr(wh, "_reply_to_message", _fake_reply)
+        return calls
+
+    def _msg(self, tenant_id, phone, n, from_me=False):
+        from app.whatsapp_webhook import WhatsAppMessage
+        return WhatsAppMessage(
+            tenant_id=tenant_id, from_=phone, text=f"msg {n}", senderName="Client",
+            messageKey={"id": f"ID{phone}{n}"}, timestamp=1760000000 + n, fromMe=from_me,
+        )
+
+    async def _post(self, db, messages):
+        from fastapi import BackgroundTasks
+        from starlette.requests import Request
+        from app.whatsapp_webhook import whatsapp_webhook_batch
+        request = Request({"type": "http", "method": "POST", "path": "/webhooks/whatsapp/batch", "headers": []})
+        return await whatsapp_webhook_batch(request, messages, BackgroundTasks(), db)
+
+    async def test_one_reply_per_conversation_on_latest_message(self, db, regular_user, replies):
+        from app.models import Message
+        tenant, _ = regular_user
+        batch = [self._msg(tenant.id, "237690000001", n) for n in (3, 1, 2)]
+        batch += [self._msg(tenant.id, "237690000002", n) for n in (1, 2)]
+        out = await self._post(db, batch)
+        assert out["conversations"] == 2 and out["replies"] == 2
+        assert sorted(replies) == [("237690000001", "msg 3", 4), ("237690000002", "msg 2", 3)]
+        assert db.query(Message).count() == 5
+        assert [r["status"] for r in out["results"]] == ["received"] * 5
+
+    async def test_duplicates_and_owner_messages_do_not_trigger_replies(self, db, regular_user, replies):
+        from app.models import ConversationHumanState
+        tenant, _ = regular_user
+        await self._post(db, [self._msg(tenant.id, "237690000001", 1)])
+        out = await self._post(db, [
+            self._msg(tenant.id, "237690000001", 1),                   # relivraison
+            self._msg(tenant.id, "237690000003", 1, from_me=True),     # propriétaire
+        ])
+        assert out["results"][0]["duplicate"]
+        assert out["results"][1]["reason"] == "owner_message_saved"
+        assert len(replies) == 1
+        assert db.query(ConversationHumanState).one().human_active
+
+    def test_bulk_insert_skips_only_conflicting_rows(self, db, regular_user):
+        from app.models import Conversation, Message
+        from app.whatsapp_webhook import _bulk_insert_messages
+        tenant, _ = regular_user
+        conv = Conversation(tenant_id=tenant.id, customer_phone="237690000001")
+        db.add(conv)
+        db.commit()
+        db.add(Message(conversation_id=conv.id, content="x", direction="incoming", external_id="1:B"))
+        db.commit()
+        rows = [
+            {"conversation_id": conv.id, "content": t, "direction": "incoming", "is_ai": False, "external_id": k}
+            for t, k in (("a", "1:A"), ("b", "1:B"), ("c", None))
+        ]
+        assert _bulk_insert_messages(db, rows, [0, 1, 2]) == {0, 2}
+        assert db.query(Message).count() == 3
+
+    async def test_oversized_batch_is_rejected(self, db, regular_user, monkeypatch):
+        from fastapi import HTTPException
+        from app import whatsapp_webhook as wh
+        monkeypatch.setattr(wh, "WEBHOOK_BATCH_MAX", 2)
+        tenant, _ = regular_user
+        with pytest.raises(HTTPException) as exc:
+            await self._post(db, [self._msg(tenant.id, "237690000001", n) for n in range(3)])
+        assert exc.value.status_code == 413
+
+
+# ════════════════════════════════════════════════════════════════
+# MÉTRIQUES — spans par étape, Server-Timing, export Prometheus
+# ════════════════════════════════════════════════════════════════
+
+class TestMetrics:
+
+    @pytest.fixture
+    def timed_app(self):
+        from starlette.applications import Starlette
+        from starlette.responses import PlainTextResponse
+        from starlette.routing import Route
+        from app.metrics import TimingMiddleware, span
+
+        async def _handler(request):
+            with span("quota"):
+                pass
+            with span("llm"):
+                pass
+            return PlainTextResponse("ok")
+
+        return TimingMiddleware(Starlette(routes=[Route("/items/{item_id}", _handler)]))
+
+    def test_span_feeds_histogram_and_render(self):
+        from app.metrics import MetricsRegistry
+        registry = MetricsRegistry()
+        registry.observe("neobot_stage_seconds", 0.003, stage="save")
+        registry.observe("neobot_stage_seconds", 2.0, stage="save")
+        registry.inc("neobot_slow_requests_total", route="/x")
+        text = registry.render()
+        assert 'neobot_stage_seconds_bucket{le="0.005",stage="save"} 1' in text
+        assert 'neobot_stage_seconds_bucket{le="+Inf",stage="save"} 2' in text
+        assert 'neobot_stage_seconds_count{stage="save"} 2' in text
+        assert "# TYPE neobot_slow_requests_total counter" in text
+
+    def test_server_timing_header_and_route_template(self, timed_app):
+        from starlette.testclient import TestClient
+        from app.metrics import metrics
+        metrics.reset()
+        response = TestClient(timed_app).get("/items/42")
+        timing = response.headers["server-timing"]
+        assert "quota;dur=" in timing and "llm;dur=" in timing and "total;dur=" in timing
+        assert metrics.histogram("neobot_http_request_seconds", method="GET", route="/items/{item_id}", status="200").count == 1
+
+    def test_slow_request_log_has_breakdown(self, timed_app, monkeypatch, caplog):
+        import logging
+        from starlette.testclient import TestClient
+        from app import metrics as metrics_module
+        monkeypatch.setattr(metrics_module, "SLOW_REQUEST_MS", 0.0001)
+        with caplog.at_level(logging.WARNING, logger="app.metrics"):
+            TestClient(timed_app).get("/items/1")
+        assert any("Requête lente" in r.message and "quota=" in r.message for r in caplog.records)
+
+    async def test_webhook_records_stage_spans(self, db, regular_user, monkeypatch):
+        from fastapi import BackgroundTasks
+        from starlette.requests import Request
+        from app import whatsapp_webhook as wh
+        from app.metrics import RequestTimings, _current_timings
+        from app.services.webhook_idempotency import WebhookIdempotency
+        monkeypatch.setattr(wh, "webhook_dedup", WebhookIdempotency())
+        tenant, _ = regular_user
+        message = wh.WhatsAppMessage(
+            tenant_id=tenant.id, from_="237690000001", text="Bonjour", senderName="Client",
+            messageKey={"id": "SPAN1"}, timestamp=1760000000,
+        )
+        timings = RequestTimings()
+        token = _current_timings.set(timings)
+        try:
+            request = Request({"type": "http", "method": "POST", "path": "/webhooks/whatsapp", "headers": []})
+            await wh.whatsapp_webhook(request, message, BackgroundTasks(), db)
+        finally:
+            _current_timings.reset(token)
+        stages = timings.by_stage()
+        for stage in ("tenant_mapping", "idempotency", "quota", "rate_limits", "save", "contact_filter", "human_state", "agent"):
+            assert stage in stages
+
+    def test_db_queries_counted_per_request(self, db):
+        from sqlalchemy import text
+        from app.metrics import RequestTimings, _current_timings, instrument_engine, metrics
+        instrument_engine(db.get_bind())
+        instrument_engine(db.get_bind())   # idempotent : pas de double comptage
+        metrics.reset()
+        timings = RequestTimings()
+        token = _current_timings.set(timings)
+        try:
+            db.execute(text("SELECT 1"))
+            db.execute(text("SELECT 2"))
+        finally:
+            _current_timings.reset(token)
+        assert timings.queries == 2
+        assert 'db_queries;desc="2"' in timings.server_timing()
+        assert "neobot_db_queries_total 2" in metrics.render()
+
+
+# ════════════════════════════════════════════════════════════════
+# IMAGES PRODUITS — produits cités dans la réponse IA
+# ════════════════════════════════════════════════════════════════
+
+class TestProductImageScan:
+
+    def test_only_unsent_products_with_images_are_selected(self):
+        from app.services.catalog_index import CatalogIndex, image_key
+        products = [
+            {"name": "Robe Wax", "image_url": "img1"},
+            {"name": "Sac Cuir", "image_id": "b" * 64},
+            {"name": "Montre"},                      # pas d'image
+            "invalide",
+        ]
+        catalog = CatalogIndex(products)
+        selected = catalog.illustrate(
+            "Les robes wax, le sac cuir et la montre sont dispo", {image_key(products[1])},
+        )
+        assert [p["name"] for p in selected] == ["Robe Wax"]
+
+    def test_longest_alias_wins_and_accents_are_ignored(self):
+        from app.services.catalog_index import CatalogIndex
+        catalog = CatalogIndex([
+            {"name": "Robe wax", "image_url": "a"},
+            {"name": "Robe wax longue", "image_url": "b"},
+            {"name": "Écouteurs sport", "aliases": "airpods, ecouteurs", "image_url": "c"},
+        ])
+        assert catalog.find("La ROBE WAX LONGUE et des écouteurs") == [1, 2]
+        assert catalog.find("robe wax ? oui, airpods") == [0, 2]
+
+
+# ════════════════════════════════════════════════════════════════
+# STREAMING DEEPSEEK — SSE incrémental, TTFT, annulation
+# ════════════════════════════════════════════════════════════════
+
+class TestDeepSeekStream:
+
+    class _Budget:
+        def __init__(self):
+            self.consumed = []
+
+        def allow(self, tenant_id, purpose):
+            return True
+
+        def consume(self, tenant_id, purpose, tokens):
+            self.consumed.append((purpose, tokens))
+
+        def stats(self):
+            return []
+
+    @pytest.fixture
+    def deepseek(self, monkeypatch):
+        """Pool deepseek simulé ; yield setter(octets SSE ou httpx.AsyncByteStream, statut)."""
+        import httpx
+        from app import http_client
+        from app.services import token_budget as token_budget_module
+        budget = self._Budget()
+        monkeypatch.setattr(token_budget_module, "token_budget", budget)
+        monkeypatch.setattr(http_client.DeepSeekClient, "DEEPSEEK_API_KEY", "test-key")
+
+        def _install(body, status=200):
+            def _handler(request):
+                if isinstance(body, httpx.AsyncByteStream):
+                    return httpx.Response(status, headers={"content-type": "text/event-stream"}, stream=body)
+                return httpx.Response(status, headers={"content-type": "text/event-stream"}, content=body)
+            client = httpx.AsyncClient(transport=httpx.MockTransport(_handler))
+            monkeypatch.setattr(http_client, "get_client", lambda name: client)
+
+        return _install, budget
+
+    @staticmethod
+    def _chunks(*parts, usage=None):
+        import json
+        lines = [
+            "data: " + json.dumps({"choices": [{"delta": {"content": p}}]}) + "\n\n" for p in parts
+        ]
+        if usage:
+            lines.append("data: " + json.dumps({"choices": [], "usage": usage}) + "\n\n")
+        return ": keep-alive\n\n" + "".join(lines) + "data: [DONE]\n\n"
+
+    async def test_stream_yields_deltas_then_done_with_usage(self, deepseek):
+        from app.http_client import DeepSeekClient
+        from app.metrics import metrics
+        install, budget = deepseek
+        install(self._chunks("Bon", "jour", " !", usage={"total_tokens": 42}).encode())
+        metrics.reset()
+        events = [e async for e in DeepSeekClient.stream([{"role": "user", "content": "salut"}], purpose="chat_test")]
+        assert [e["delta"] for e in events if "delta" in e] == ["Bon", "jour", " !"]
+        assert events[-1]["done"] and events[-1]["content"] == "Bonjour !"
+        assert events[-1]["ttft_ms"] is not None
+        assert budget.consumed == [("chat_test", 42)]
+        assert metrics.histogram("neobot_llm_ttft_seconds", purpose="chat_test").count == 1
+
+    async def test_stream_error_status_yields_single_error(self, deepseek):
+        from app.http_client import DeepSeekClient
+        install, budget = deepseek
+        install(b'{"error": "busy"}', status=500)
+        events = [e async for e in DeepSeekClient.stream([{"role": "user", "content": "salut"}])]
+        assert events == [{"error": "API returned 500"}]
+        assert budget.consumed == []
+
+    async def test_closing_stream_cancels_upstream_and_bills_partial_output(self, deepseek):
+        import asyncio
+        import httpx
+        from app.http_client import DeepSeekClient
+        from app.metrics import metrics
+        install, budget = deepseek
+        upstream_closed = asyncio.Event()
+
+        class _Endless(httpx.AsyncByteStream):
+            async def __aiter__(self):
+                yield b'data: {"choices": [{"delta": {"content": "Bonjour"}}]}\n\n'
+                await asyncio.sleep(3600)
+
+            async def aclose(self):
+                upstream_closed.set()
+
+        install(_Endless())
+        metrics.reset()
+        stream = DeepSeekClient.stream([{"role": "user", "content": "x" * 40}], purpose="demo")
+        assert (await stream.__anext__()) == {"delta": "Bonjour"}
+        await stream.aclose()   # navigateur déconnecté
+        assert upstream_closed.is_set()
+        assert "neobot_llm_stream_cancelled_total{purpose=\"demo\"} 1" in metrics.render()
+        assert budget.consumed == [("demo", (40 + len("Bonjour")) // 4)]
+
+    async def test_sse_from_llm_formats_events_and_reports_errors(self):
+        from app.sse import sse_from_llm
+
+        async def _ok():
+            yield {"delta": "Sa"}
+            yield {"delta": "lut"}
+            yield {"done": True, "content": "Salut", "ttft_ms": 12}
+
+        out = [chunk async for chunk in sse_from_llm(_ok(), final=lambda text: {"response": text})]
+        assert out[0] == 'event: delta\ndata: {"text": "Sa"}\n\n'
+        assert out[-1] == 'event: done\ndata: {"response": "Salut", "ttft_ms": 12}\n\n'
+
+        errors = []
+
+        async def _ko():
+            yield {"error": "API timeout"}
+
+        out = [chunk async for chunk in sse_from_llm(_ko(), final=dict, error_detail="Indispo", on_error=errors.append)]
+        assert out == ['event: error\ndata: {"detail": "Indispo"}\n\n']
+        assert errors == [{"error": "API timeout"}]
+
+
+# ════════════════════════════════════════════════════════════════
+# INGESTION PDF — upload en file, extraction hors boucle, dédup par hash
+# ════════════════════════════════════════════════════════════════
+
+class TestKnowledgeIngestion:
+
+    @staticmethod
+    def _pdf(pages) -> bytes:
+        """PDF minimal : une ligne de texte (Helvetica) par page."""
+        n = len(pages)
+        objects = [
+            "<< /Type /Catalog /Pages 2 0 R >>",
+            "<< /Type /Pages /Kids [%s] /Count %d >>" % (" ".join(f"{4 + 2 * i} 0 R" for i in range(n)), n),
+            "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+        ]
+        for i, text in enumerate(pages):
+            stream = f"BT /F1 12 Tf 72 720 Td ({text}) Tj ET"
+            objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+                           f"/Resources << /Font << /F1 3 0 R >> >> /Contents {5 + 2 * i} 0 R >>")
+            objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+        out, offsets = "%PDF-1.4\n", []
+        for i, body in enumerate(objects, start=1):
+            offsets.append(len(out))
+            out += f"{i} 0 obj\n{body}\nendobj\n"
+        xref = len(out)
+        out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n"
+        out += "".join(f"{o:010d} 00000 n \n" for o in offsets)
+        out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n"
+        return out.encode("latin-1")
+
+    @pytest.fixture
+    def ingestion(self, monkeypatch, tmp_path):
+        from app.services import knowledge_ingestion
+        monkeypatch.setattr(knowledge_ingestion, "KNOWLEDGE_UPLOAD_DIR", str(tmp_path))
+        monkeypatch.setattr(knowledge_ingestion, "KNOWLEDGE_PDF_WORKERS", 0)   # thread au lieu d'un processus
+        monkeypatch.setattr(knowledge_ingestion, "PAGES_PER_TASK", 1)
+        return knowledge_ingestion
+
+    @pytest.fixture
+    def agent(self, db, regular_user):
+        from app.models import AgentTemplate
+        tenant, _ = regular_user
+        agent = AgentTemplate(tenant_id=tenant.id, name="Agent PDF", agent_type="faq", is_active=True)
+        db.add(agent)
+        db.commit()
+        return agent
+
+    async def _upload(self, ingestion, agent, db, content: bytes):
+        import io
+        from starlette.datastructures import UploadFile
+        from app.services.agent_service import AgentService
+        path, content_hash, _ = await ingestion.save_upload(UploadFile(io.BytesIO(content), filename="cat.pdf"))
+        return AgentService.add_knowledge_source(
+            agent_id=agent.id, tenant_id=agent.tenant_id, source_type="pdf", db=db,
+            name="Catalogue", file_path=path, content_hash=content_hash,
+        )
+
+    async def test_upload_is_queued_then_worker_extracts_pages(self, db, agent, ingestion):
+        import os
+        from app.services.knowledge_ingestion import KnowledgeIngestionWorker
+        source = await self._upload(ingestion, agent, db, self._pdf(["Robe wax 15000 FCFA", "Livraison Douala 24h"]))
+        assert source.sync_status == "pending" and source.content_extracted is None
+        path = source.file_path
+        assert os.path.exists(path)
+
+        assert await KnowledgeIngestionWorker.process_once(db) == 1
+        db.refresh(source)
+        assert source.sync_status == "synced"
+        assert "Robe wax" in source.content_extracted and "Livraison Douala" in source.content_extracted
+        assert source.file_path is None and not os.path.exists(path)
+        assert await KnowledgeIngestionWorker.process_once(db) == 0
+
+    async def test_reupload_same_pdf_is_copied_without_extraction(self, db, agent, ingestion, monkeypatch):
+        import os
+        from app.services.knowledge_ingestion import KnowledgeIngestionWorker
+        content = self._pdf(["Menu du jour"])
+        first = await self._upload(ingestion, agent, db, content)
+        await KnowledgeIngestionWorker.process_once(db)
+
+        async def _no_extract(path):
+            raise AssertionError("réextraction inattendue")
+        monkeypatch.setattr(ingestion, "extract_pdf_text", _no_extract)
+        second = await self._upload(ingestion, agent, db, content)
+        assert second.sync_status == "synced" and second.content_hash == first.content_hash
+        assert second.content_extracted == first.content_extracted
+        assert os.listdir(ingestion.KNOWLEDGE_UPLOAD_DIR) == []
+
+    async def test_upload_rejects_non_pdf_and_oversize(self, ingestion, monkeypatch):
+        import io
+        import os
+        from starlette.datastructures import UploadFile
+        with pytest.raises(ingestion.UploadRejected):
+            await ingestion.save_upload(UploadFile(io.BytesIO(b"GIF89a..."), filename="x.pdf"))
+        monkeypatch.setattr(ingestion, "MAX_PDF_BYTES", 1000)
+        with pytest.raises(ingestion.UploadRejected):
+            await ingestion.save_upload(UploadFile(io.BytesIO(b"%PDF-" + b"0" * 2000), filename="x.pdf"))
+        assert os.listdir(ingestion.KNOWLEDGE_UPLOAD_DIR) == []
+
+
+# ════════════════════════════════════════════════════════════════
+# SYNC SOURCES URL / YOUTUBE — GET conditionnel, hash, cache du prompt
+# ════════════════════════════════════════════════════════════════
+
+class TestKnowledgeSync:
+
+    PAGE = (
+        "<html><head><title>Boutique Awa</title>"
+        '<meta name="description" content="Pagnes et robes wax à Douala">'
+        "<script>var tracking = 1;</script><style>p { color: red }</style></head>"
+        "<body><nav>Accueil | Contact</nav><h1>Nos prix</h1>"
+        "<p>Robe wax : 15 000 FCFA</p><p>Livraison&nbsp;gratuite dès 30 000 FCFA</p>"
+        "<footer>© 2026</footer></body></html>"
+    )
+
+    @pytest.fixture
+    def site(self, monkeypatch):
+        import httpx
+        from app.services import knowledge_sync
+        from tests.fake_site import FakeSite
+        site = FakeSite().start()
+        client = httpx.AsyncClient()
+        monkeypatch.setattr(knowledge_sync, "get_client", lambda name: client)
+        monkeypatch.setattr(knowledge_sync, "KNOWLEDGE_FETCH_ALLOW_PRIVATE", True)
+        yield site
+        site.stop()
+
+    @pytest.fixture
+    def agent(self, db, regular_user):
+        from app.models import AgentTemplate
+        tenant, _ = regular_user
+        agent = AgentTemplate(tenant_id=tenant.id, name="Agent Web", agent_type="faq", is_active=True)
+        db.add(agent)
+        db.commit()
+        return agent
+
+    def _add(self, db, agent, url, source_type="url"):
+        from app.services.agent_service import AgentService
+        return AgentService.add_knowledge_source(
+            agent_id=agent.id, tenant_id=agent.tenant_id, source_type=source_type, db=db,
+            name="Site", source_url=url,
+        )
+
+    @staticmethod
+    def _make_due(db, source):
+        from datetime import datetime, timedelta
+        from app.models import KnowledgeSource
+        db.query(KnowledgeSource).filter(KnowledgeSource.id == source.id).update(
+            {"next_sync_at": datetime.utcnow() - timedelta(seconds=1), "updated_at": KnowledgeSource.updated_at},
+            synchronize_session=False,
+        )
+        db.commit()
+
+    def test_parser_keeps_readable_text_only(self):
+        from app.services.knowledge_sync import ReadableTextParser
+        parser = ReadableTextParser()
+        for i in range(0, len(self.PAGE), 7):          # alimenté par petits blocs, comme en streaming
+            parser.feed(self.PAGE[i:i + 7])
+        parser.close()
+        assert parser.text().splitlines() == [
+            "Boutique Awa", "Pagnes et robes wax à Douala", "Nos prix",
+            "Robe wax : 15 000 FCFA", "Livraison gratuite dès 30 000 FCFA",
+        ]
+
+    async def test_pending_source_synced_then_304_keeps_prompt_cache(self, db, agent, site):
+        from app.services.agent_service import build_agent_system_prompt, _knowledge_blocks
+        from app.services.knowledge_sync import KnowledgeSyncWorker
+        from tests.fake_site import FakePage
+        site.pages["/prix"] = FakePage(self.PAGE, etag='"v1"', last_modified="Mon, 19 Oct 2026 08:00:00 GMT")
+        source = self._add(db, agent, site.url("/prix"))
+        assert source.sync_status == "pending"
+
+        assert await KnowledgeSyncWorker.process_once(db) == 1
+        db.refresh(source)
+        assert source.sync_status == "synced" and source.etag == '"v1"'
+        assert "Robe wax : 15 000 FCFA" in source.content_extracted
+        assert "Robe wax : 15 000 FCFA" in build_agent_system_prompt(agent, db)
+        version = _knowledge_blocks[agent.id][0]
+
+        assert await KnowledgeSyncWorker.process_once(db) == 0          # pas encore périmée
+        self._make_due(db, source)
+        assert await KnowledgeSyncWorker.process_once(db) == 1
+        assert site.stats["not_modified"] == 1
+        assert site.received[-1]["headers"]["If-None-Match"] == '"v1"'
+        db.refresh(source)
+        assert source.sync_status == "synced" and source.next_sync_at > source.last_synced_at
+        build_agent_system_prompt(agent, db)
+        assert _knowledge_blocks[agent.id][0] == version                # 304 : cache du prompt intact
+
+    async def test_changed_page_updates_content_and_prompt(self, db, agent, site):
+        from app.services.agent_service import build_agent_system_prompt
+        from app.services.knowledge_sync import KnowledgeSyncWorker
+        from tests.fake_site import FakePage
+        site.pages["/prix"] = FakePage(self.PAGE, etag='"v1"')
+        source = self._add(db, agent, site.url("/prix"))
+        await KnowledgeSyncWorker.process_once(db)
+        first_hash = source.content_hash
+        assert "15 000 FCFA" in build_agent_system_prompt(agent, db)
+
+        site.pages["/prix"] = FakePage(self.PAGE.replace("15 000", "12 500"), etag='"v2"')
+        self._make_due(db, source)
+        await KnowledgeSyncWorker.process_once(db)
+        db.refresh(source)
+        assert source.content_hash != first_hash and source.etag == '"v2"'
+        prompt = build_agent_system_prompt(agent, db)
+        assert "12 500 FCFA" in prompt and "15 000 FCFA" not in prompt
+
+    async def test_youtube_meta_redirect_and_private_address(self, db, agent, site, monkeypatch):
+        from app.services import knowledge_sync
+        from app.services.knowledge_sync import KnowledgeSyncWorker
+        from tests.fake_site import FakePage
+        site.pages["/youtu.be/abc"] = FakePage("", redirect_to="/watch?v=abc")
+        site.pages["/watch?v=abc"] = FakePage(
+            '<html><head><meta property="og:title" content="Démo Robe wax">'
+            '<meta property="og:description" content="Essayage en vidéo"></head>'
+            "<body><div>Abonnez-vous</div><script>ytInitialData = {}</script></body></html>"
+        )
+        video = self._add(db, agent, site.url("/youtu.be/abc"), source_type="youtube")
+        await KnowledgeSyncWorker.process_once(db)
+        db.refresh(video)
+        assert video.sync_status == "synced"
+        assert video.content_extracted == "Démo Robe wax\nEssayage en vidéo"
+
+        monkeypatch.setattr(knowledge_sync, "KNOWLEDGE_FETCH_ALLOW_PRIVATE", False)
+        local = self._add(db, agent, site.url("/prix"))
+        requests_before = site.stats["requests"]
+        await KnowledgeSyncWorker.process_once(db)
+        db.refresh(local)
+        assert local.sync_status == "error" and "non publique" in local.sync_error
+        assert site.stats["requests"] == requests_before
+
+
+# ════════════════════════════════════════════════════════════════
+# MEDIA STORE — images produits adressées par SHA-256
+# ════════════════════════════════════════════════════════════════
+
+class TestMediaStore:
+
+    @staticmethod
+    def _png(width, height, color=(200, 30, 30, 128)):
+        import io
+        from PIL import Image
+        out = io.BytesIO()
+        Image.new("RGBA", (width, height), color).save(out, format="PNG")
+        return out.getvalue()
+
+    @pytest.fixture
+    def store(self, tmp_path):
+        from app.services.media_store import LocalMediaStore, set_media_store
+        store = LocalMediaStore(str(tmp_path))
+        set_media_store(store)
+        yield store
+        set_media_store(None)
+
+    def test_prepare_image_resizes_flattens_and_thumbnails(self):
+        import io
+        from PIL import Image
+        from app.services.media_store import MediaRejected, prepare_image
+        prepared = prepare_image(self._png(1800, 900))
+        assert (prepared["width"], prepared["height"]) == (900, 450)
+        full = Image.open(io.BytesIO(prepared["full"]))
+        thumb = Image.open(io.BytesIO(prepared["thumb"]))
+        assert full.format == "JPEG" and full.mode == "RGB"
+        assert thumb.size == (200, 100)
+        with pytest.raises(MediaRejected):
+            prepare_image(b"pas une image")
+
+    def test_store_image_is_content_addressed(self, store):
+        from app.services.media_store import store_image
+        first = store_image(self._png(400, 300))
+        second = store_image(self._png(400, 300))
+        assert first["image_id"] == second["image_id"]
+        assert store.exists(first["image_id"], "full") and store.exists(first["image_id"], "thumb")
+        assert store.path(first["image_id"], "full").endswith(f"{first['image_id']}.jpg")
+
+    def test_normalize_product_images(self, store):
+        import base64
+        from app.services.media_store import media_path, normalize_product_images, present_products
+        data_url = "data:image/png;base64," + base64.b64encode(self._png(120, 120)).decode()
+        products = normalize_product_images([
+            {"name": "Robe", "image_url": data_url},
+            {"name": "Sac", "image_url": "https://api.neobot.app" + media_path("a" * 64)},
+            {"name": "Montre", "image_url": "", "image_id": "b" * 64},     # photo supprimée
+            {"name": "Pagne", "image_id": "c" * 64},
+        ])
+        assert all("image_url" not in p for p in products)
+        robe_id = products[0]["image_id"]
+        assert store.exists(robe_id)
+        assert products[1]["image_id"] == "a" * 64
+        assert "image_id" not in products[2]
+        assert products[3]["image_id"] == "c" * 64
+        assert present_products(products)[0]["image_url"] == f"/media/{robe_id}.jpg"
+
+    def test_database_store_and_illustration(self, monkeypatch):
+        from tests.conftest import TestingSessionLocal
+        from app.services import media_store
+        from app.services.catalog_index import CatalogIndex
+        monkeypatch.setattr(media_store, "SessionLocal", TestingSessionLocal)
+        media_store.set_media_store(media_store.DatabaseMediaStore())
+        try:
+            image_id = media_store.store_image(self._png(300, 300))["image_id"]
+            media_store.store_image(self._png(300, 300))       # doublon : aucune ligne de plus
+            assert media_store.get_media_store().get(image_id, "thumb")[:2] == b"\xff\xd8"
+        finally:
+            media_store.set_media_store(None)
+        selected = CatalogIndex([{"name": "Robe Wax", "image_id": image_id}]).illustrate("La robe wax est dispo", set())
+        assert [p["name"] for p in selected] == ["Robe Wax"]
+
+
+# ════════════════════════════════════════════════════════════════
+# INDEX CATALOGUE — cache par version, photos envoyées, réponses directes
+# ════════════════════════════════════════════════════════════════
+
+class TestCatalogIndex:
+
+    PRODUCTS = [
+        {"name": "Robe wax", "price": 15000, "image_id": "a" * 64},
+        {"name": "Sac cuir", "price": 12500.0, "in_stock": True},
+        {"name": "Retouche sur mesure", "price": 0},
+        {"name": "Pagne bogolan", "price": 9000, "in_stock": False},
+    ]
+
+    @pytest.fixture
+    def config(self, db, regular_user):
+        from app.models import BusinessTypeModel, TenantBusinessConfig
+        tenant, _ = regular_user
+        business_type = BusinessTypeModel(slug="ecommerce-catalog", name="E-commerce")
+        db.add(business_type)
+        db.flush()
+        config = TenantBusinessConfig(tenant_id=tenant.id, business_type_id=business_type.id,
+                                      company_name="Boutique", products_services=self.PRODUCTS)
+        db.add(config)
+        db.commit()
+        yield config
+        from app.services.catalog_index import invalidate_catalog_index
+        invalidate_catalog_index(tenant.id)
+
+    def test_fast_path_answers_only_exact_questions(self):
+        from app.services.catalog_index import CatalogIndex
+        catalog = CatalogIndex(self.PRODUCTS)
+        assert catalog.answer("Bonjour, c'est combien la robe wax ?").startswith("Robe wax : 15 000 FCFA")
+        assert catalog.answer("Vous avez encore des sacs cuir svp ?").startswith(
+            "Oui, Sac cuir est disponible à 12 500 FCFA")
+        assert catalog.answer("Pagne bogolan dispo ?").startswith("Désolé, Pagne bogolan n'est plus disponible")
+        assert catalog.answer("Vous avez la robe wax ?") is None                    # stock non renseigné → LLM
+        assert catalog.answer("Prix de la robe wax en taille M ?") is None          # précision → LLM
+        assert catalog.answer("Combien la robe wax et le sac cuir ?") is None       # deux produits
+        assert catalog.answer("Prix retouche sur mesure ?") is None                 # sur devis
+        assert catalog.answer("La robe wax est jolie") is None                      # pas une question prix/dispo
+
+    def test_index_rebuilt_when_config_changes(self, db, config):
+        from datetime import timedelta
+        from app.services.catalog_index import get_catalog_index
+        first = get_catalog_index(config.tenant_id, db)
+        assert get_catalog_index(config.tenant_id, db) is first            # version inchangée → cache
+        config.products_services = self.PRODUCTS + [{"name": "Pagne", "price": 8000}]
+        config.updated_at = config.updated_at + timedelta(seconds=1)      # modification depuis un autre worker
+        db.commit()
+        rebuilt = get_catalog_index(config.tenant_id, db)
+        assert rebuilt is not first and rebuilt.answer("prix pagne ?").startswith("Pagne : 8 000 FCFA")
+
+    def test_sent_images_are_persisted_per_conversation(self, db, config):
+        from app.models import Conversation
+        from app.services.catalog_index import get_catalog_index, images_already_sent, record_images_sent
+        conv = Conversation(tenant_id=config.tenant_id, customer_phone="237690000077")
+        db.add(conv)
+        db.commit()
+        catalog = get_catalog_index(config.tenant_id, db)
+        selected = catalog.illustrate("La robe wax est à 15 000 FCFA", images_already_sent(db, conv.id))
+        assert [p["name"] for p in selected] == ["Robe wax"]
+        record_images_sent(db, conv.id, selected)
+        record_images_sent(db, conv.id, selected)                           # rejoué : ignoré
+        assert images_already_sent(db, conv.id) == {"a" * 64}
+        assert catalog.illustrate("Oui la robe wax !", images_already_sent(db, conv.id)) == []
+
+    async def test_brain_answers_catalog_question_without_llm(self, db, config, monkeypatch):
+        from app.whatsapp_webhook import BrainOrchestrator
+
+        async def _no_llm(*args, **kwargs):
+            raise AssertionError("LLM appelé")
+
+        brain = BrainOrchestrator()
+        monkeypatch.setattr(brain, "_call_deepseek", _no_llm)
+        reply = await brain.process("C'est combien le sac cuir ?", "Awa", db=db, tenant_id=config.tenant_id)
+        assert reply.startswith("Sac cuir : 12 500 FCFA")
+
+    async def test_stock_question_without_flag_goes_to_llm(self, db, config, monkeypatch):
+        from app.whatsapp_webhook import BrainOrchestrator
+
+        async def _llm(*args, **kwargs):
+            return "réponse LLM"
+
+        brain = BrainOrchestrator()
+        monkeypatch.setattr(brain, "_call_deepseek", _llm)
+        assert await brain.process("La robe wax est disponible ?", "Awa", db=db, tenant_id=config.tenant_id) == "réponse LLM"
+
+    async def test_config_endpoint_stores_aliases_and_stock(self, db, config):
+        from app.routers.tenant_business import BusinessConfigRequest, configure_business
+        from app.services.catalog_index import get_catalog_index
+        request = BusinessConfigRequest(business_type_slug="ecommerce-catalog", company_name="Boutique", products_services=[
+            {"name": "Grand boubou brodé", "price": 25000, "aliases": ["boubou", " "], "in_stock": True},
+            {"name": "Robe wax", "price": 15000},
+        ])
+        await configure_business(config.tenant_id, request, db=db, _=True)
+        db.refresh(config)
+        assert config.products_services[0]["aliases"] == ["boubou"]
+        assert config.products_services[0]["in_stock"] is True
+        assert config.products_services[1]["in_stock"] is None
+        catalog = get_catalog_index(config.tenant_id, db)
+        assert catalog.answer("Le boubou est disponible ?").startswith("Oui, Grand boubou brodé est disponible")
+        assert catalog.answer("La robe wax est disponible ?") is None              # stock non renseigné → LLM
+
+
+# ════════════════════════════════════════════════════════════════
+# INDEX DES RÈGLES CONTACTS — IA off, STOP, compteurs sortants
+# ════════════════════════════════════════════════════════════════
+
+class TestContactPolicy:
+
+    @pytest.fixture(autouse=True)
+    def _fresh(self, monkeypatch):
+        from app.services import contact_policy
+        from app.state_backend import MemoryStateBackend, set_state_backend
+        set_state_backend(MemoryStateBackend())
+        contact_policy.reset_contact_policies()
+        yield
+        contact_policy.reset_contact_policies()
+        set_state_backend(None)
+
+    def test_phone_set_is_compact_and_exact(self):
+        from app.services.contact_policy import PhoneCounter, PhoneSet
+        phones = PhoneSet(["237690000001", "237690000002", "0690000003", "123@lid"])
+        assert "237690000001" in phones and "0690000003" in phones and "123@lid" in phones
+        assert "690000003" not in phones and "237690000003" not in phones
+        assert len(phones._ints) == 2 and phones._ints.itemsize == 8      # int64 triés
+        phones.update(["237690000000", "237690000001"])
+        phones.difference_update(["237690000002", "123@lid"])
+        phones.add("237690000009")
+        assert list(phones._ints) == [237690000000, 237690000001, 237690000009]
+        assert len(phones) == 4
+        counter = PhoneCounter([("237690000001", 1), ("237690000005", 0)])
+        assert counter.incr("237690000001") == 2 and counter.incr("237690000004") == 1
+        assert counter.get("237690000005") == 0 and list(counter._keys) == [237690000001, 237690000004]
+
+    def test_ai_toggle_is_served_from_index_and_kept_coherent(self, db, regular_user, monkeypatch):
+        from app.models import ContactSetting
+        from app.services import contact_policy
+        from app.services.contact_filter_service import ContactFilterService
+        tenant, _ = regular_user
+        ContactFilterService.bulk_disable_ai(tenant.id, ["237690000001", "237690000002"], db)
+        assert ContactFilterService.is_ai_enabled_for_contact(tenant.id, "237690000001", db) is False
+
+        # Écriture directe en base (sans passer par le service) : l'index n'interroge plus la base
+        db.query(ContactSetting).filter(ContactSetting.phone_number == "237690000002").update({"ai_enabled": True})
+        db.commit()
+        assert ContactFilterService.is_ai_enabled_for_contact(tenant.id, "237690000002", db) is False
+
+        # ... jusqu'à ce qu'un autre worker publie une écriture (génération partagée)
+        from app.state_backend import get_state_backend
+        get_state_backend().incr(f"contact_policy:gen:{tenant.id}")
+        monkeypatch.setattr(contact_policy, "CONTACT_POLICY_RECHECK_SECONDS", 0)
+        assert ContactFilterService.is_ai_enabled_for_contact(tenant.id, "237690000002", db) is True
+
+        ContactFilterService.toggle_ai_for_contact(tenant.id, "237690000001", True, db)
+        ContactFilterService.bulk_enable_ai(tenant.id, ["237690000003"], db)
+        policy = contact_policy.get_contact_policy(tenant.id, db)
+        assert len(policy.ai_disabled) == 0
+        assert policy.generation == int(get_state_backend().get(f"contact_policy:gen:{tenant.id}"))
+
+    def test_outbound_checks_history_stop_and_limit(self, db, regular_user):
+        from app.models import Conversation, OutboundTracking
+        from app.services.agent_service import OutboundService
+        tenant, _ = regular_user
+        phone = "237690000010"
+        assert OutboundService.check_can_send(tenant.id, phone, "promo", db) == (
+            False, "Aucun historique — cold outreach interdit")
+        db.add(Conversation(tenant_id=tenant.id, customer_phone=phone))
+        db.commit()
+        assert OutboundService.check_can_send(tenant.id, phone, "promo", db) == (True, "OK")
+
+        OutboundService.record_outbound(tenant.id, phone, "promo", db)
+        OutboundService.record_outbound(tenant.id, phone, "rdv_reminder", db)
+        can_send, reason = OutboundService.check_can_send(tenant.id, phone, "promo", db)
+        assert not can_send and "Limite 2" in reason
+        assert db.query(OutboundTracking).filter_by(phone_number=phone).one().total_outbound_count == 2
+
+        other = "237690000011"
+        db.add(Conversation(tenant_id=tenant.id, customer_phone=other))
+        db.commit()
+        OutboundService.handle_stop(tenant.id, other, db)
+        assert OutboundService.check_can_send(tenant.id, other, "promo", db) == (False, "Contact a demandé STOP")
+
+
+# ════════════════════════════════════════════════════════════════
+# IMPORT DE CONTACTS — CSV / XLSX en flux, lots, progression
+# ════════════════════════════════════════════════════════════════
+
+class TestContactImport:
+
+    @staticmethod
+    def _xlsx(path, rows):
+        """Classeur minimal : chaînes partagées + cellules numériques (comme Excel)."""
+        import zipfile
+        from xml.sax.saxutils import escape
+        strings, xml_rows = [], []
+        for r, row in enumerate(rows, start=1):
+            cells = []
+            for c, value in enumerate(row):
+                ref = f"{chr(65 + c)}{r}"
+                if isinstance(value, (int, float)):
+                    cells.append(f'<c r="{ref}"><v>{value}</v></c>')
+                else:
+                    strings.append(value)
+                    cells.append(f'<c r="{ref}" t="s"><v>{len(strings) - 1}</v></c>')
+            xml_rows.append(f'<row r="{r}">{"".join(cells)}</row>')
+        ns = 'xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"'
+        with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as zf:
+            zf.writestr("xl/sharedStrings.xml",
+                        f'<sst {ns}>' + "".join(f"<si><t>{escape(s)}</t></si>" for s in strings) + "</sst>")
+            zf.writestr("xl/worksheets/sheet1.xml", f'<worksheet {ns}><sheetData>{"".join(xml_rows)}</sheetData></worksheet>')
+
+    def _run(self, db, tenant_id, path, kind, ai_enabled=None):
+        import os
+        from app.models import ContactImportJob
+        from app.services.contact_import import ContactImportService
+        job = ContactImportService.create_job(db, tenant_id, os.path.basename(path), kind,
+                                              os.path.getsize(path), ai_enabled=ai_enabled)
+        ContactImportService.run_job(job.id, str(path), db.get_bind())
+        db.expire_all()
+        assert not os.path.exists(path)               # fichier supprimé après import
+        return db.get(ContactImportJob, job.id)
+
+    def test_normalize_phone(self):
+        from app.services.contact_import import normalize_phone
+        assert normalize_phone("+237 690-00-00-01") == "237690000001"
+        assert normalize_phone("00237690000001") == "237690000001"
+        assert normalize_phone("690 00 00 01") == "237690000001"
+        assert normalize_phone("2.37690000001E+11") == "237690000001"
+        assert normalize_phone("33612345678") == "33612345678"
+        assert normalize_phone("12") is None and normalize_phone("abc") is None
+
+    def test_csv_import_dedupes_and_upserts_in_chunks(self, db, regular_user, tmp_path, monkeypatch):
+        from app.models import ContactSetting
+        from app.services import contact_import
+        from app.services.contact_filter_service import ContactFilterService
+        tenant, _ = regular_user
+        monkeypatch.setattr(contact_import, "CONTACT_IMPORT_CHUNK", 2)
+        db.add(ContactSetting(tenant_id=tenant.id, phone_number="237690000001", contact_name=None,
+                              ai_enabled=False, message_count=4))
+        db.commit()
+        path = tmp_path / "clients.csv"
+        path.write_text(
+            "Nom;Téléphone;Ville\n"
+            "Awa;+237 690 00 00 01;Douala\n"
+            "Paul;690000002;Yaoundé\n"
+            "Paul bis;00237690000002;Yaoundé\n"
+            "Inconnu;pas de numéro;\n"
+            "Chantal;690000003;Kribi\n",
+            encoding="utf-8",
+        )
+        job = self._run(db, tenant.id, path, "csv")
+        assert (job.status, job.rows_read, job.created, job.updated, job.invalid, job.duplicates) == (
+            "completed", 5, 2, 1, 1, 1)
+        assert job.bytes_read == job.bytes_total
+        awa = db.query(ContactSetting).filter_by(tenant_id=tenant.id, phone_number="237690000001").one()
+        assert awa.contact_name == "Awa" and awa.ai_enabled is False and awa.message_count == 4
+        assert ContactFilterService.is_ai_enabled_for_contact(tenant.id, "237690000003", db) is True
+
+    def test_xlsx_import_without_header_applies_ai_setting(self, db, regular_user, tmp_path):
+        from app.services.contact_filter_service import ContactFilterService
+        tenant, _ = regular_user
+        assert ContactFilterService.is_ai_enabled_for_contact(tenant.id, "237690000011", db) is True
+        path = tmp_path / "famille.xlsx"
+        self._xlsx(path, [[237690000011, "Maman"], ["690000012", "Frère"], [2.37690000011e11, "Maman (doublon)"]])
+        job = self._run(db, tenant.id, path, "xlsx", ai_enabled=False)
+        assert (job.status, job.created, job.duplicates) == ("completed", 2, 1)
+        # L'index des règles contacts est mis à jour sans relecture
+        assert ContactFilterService.is_ai_enabled_for_contact(tenant.id, "237690000011", db) is False
+        assert ContactFilterService.is_ai_enabled_for_contact(tenant.id, "237690000012", db) is False
+
+    def test_import_without_phone_column_fails_cleanly(self, db, regular_user, tmp_path):
+        tenant, _ = regular_user
+        path = tmp_path / "mauvais.csv"
+        path.write_text("Nom,Ville\nAwa,Douala\n", encoding="utf-8")
+        job = self._run(db, tenant.id, path, "csv")
+        assert job.status == "failed" and "Colonne téléphone introuvable" in job.error
+
+    def test_bulk_toggle_is_set_based(self, db, regular_user):
+        from sqlalchemy import event
+        from app.services.contact_filter_service import ContactFilterService
+        tenant, _ = regular_user
+        phones = [f"2376900{i:05d}" for i in range(1200)] + ["237690000000"]
+        statements = []
+        listener = lambda *args: statements.append(args[2])  # noqa: E731
+        engine = db.get_bind()
+        event.listen(engine, "before_cursor_execute", listener)
+        try:
+            result = ContactFilterService.bulk_disable_ai(tenant.id, phones, db)
+        finally:
+            event.remove(engine, "before_cursor_execute", listener)
+        assert result["updated"] == 1200
+        assert sum("INSERT INTO contact_settings" in s for s in statements) == 3   # lots de 500 (SQLite)
+        assert ContactFilterService.bulk_enable_ai(tenant.id, phones[:10], db)["updated"] == 10
+        assert len(ContactFilterService.get_disabled_contacts(tenant.id, db)) == 1190
+
+
+# ════════════════════════════════════════════════════════════════
+# CAMPAGNES SORTANTES — audience en masse, template, cadence, pause / reprise
+# ════════════════════════════════════════════════════════════════
+
+class TestCampaigns:
+
+    @pytest.fixture(autouse=True)
+    def _fresh(self, monkeypatch):
+        from app.services import campaign_service
+        from app.state_backend import MemoryStateBackend, set_state_backend
+        set_state_backend(MemoryStateBackend())
+        monkeypatch.setattr(campaign_service, "CAMPAIGN_TENANT_PER_MINUTE", 0)
+        monkeypatch.setattr(campaign_service, "CAMPAIGN_SESSION_GAP_SECONDS", 0)
+        monkeypatch.setattr(campaign_service, "CONTROL_SECONDS", 0)
+        monkeypatch.setattr(campaign_service, "RETRY_DELAYS", (0,))
+        yield
+        set_state_backend(None)
+
+    @staticmethod
+    def _audience(db, tenant, n=5):
+        from app.models import ContactSetting, Conversation, OutboundTracking, PlanType
+        tenant.plan = PlanType.PRO
+        for i in range(n):
+            db.add(Conversation(tenant_id=tenant.id, customer_phone=f"23769000{i:04d}", customer_name=f"awa {i}"))
+        db.add(ContactSetting(tenant_id=tenant.id, phone_number="237690000001", contact_name="Marie Ngo"))
+        db.add(OutboundTracking(tenant_id=tenant.id, phone_number="237690000002", opted_out=True))
+        db.add(OutboundTracking(tenant_id=tenant.id, phone_number="237690000003", total_outbound_count=2))
+        db.commit()
+
+    @staticmethod
+    async def _run(db, campaign, app=None):
+        import httpx
+        from app.http_client import set_transport
+        from app.services.campaign_service import CampaignWorker
+        from scripts.fake_whatsapp_service import create_app
+        fake = app or create_app()
+        await set_transport("whatsapp-service", httpx.ASGITransport(app=fake))
+        try:
+            assert CampaignWorker.claim(db, 5, set()) == [campaign.id]
+            status = await CampaignWorker.run(campaign.id, bind=db.get_bind())
+        finally:
+            await set_transport("whatsapp-service", None)
+        db.expire_all()
+        return status, fake
+
+    def test_template_folds_constants_and_rejects_unknown(self):
+        from app.services.campaign_service import CampaignRejected, CampaignTemplate
+        tpl = CampaignTemplate("Bonjour {{ first_name | cher client }} ! -20% chez {{business}} ({{code}})",
+                               {"business": "Chez Awa", "code": "WAX20"})
+        assert tpl.parts[-1] == " ! -20% chez Chez Awa (WAX20)"          # constantes résolues une fois
+        assert tpl.render("marie ngo", "237690000001") == "Bonjour marie ! -20% chez Chez Awa (WAX20)"
+        assert tpl.render(None, "237690000001") == "Bonjour cher client ! -20% chez Chez Awa (WAX20)"
+        with pytest.raises(CampaignRejected, match="inconnue"):
+            CampaignTemplate("Salut {{prenom}}", {})
+
+    def test_pacing_bucket_and_session_gap(self):
+        from app.services.campaign_service import SessionPacer, TokenBucket
+        now = [0.0]
+        bucket = TokenBucket(per_minute=60, burst=2, clock=lambda: now[0])
+        assert [bucket.reserve() for _ in range(4)] == [0.0, 0.0, 1.0, 2.0]   # rafale de 2 puis 1/s
+        now[0] = 10.0
+        assert bucket.reserve() == 0.0
+        pacer = SessionPacer(gap=2.0, jitter=0.5, clock=lambda: now[0], rng=lambda: 1.0)
+        assert pacer.reserve() == 0.0 and pacer.reserve() == 3.0             # 2s + 50% de jitter
+
+    def test_create_selects_eligible_audience_in_bulk(self, db, regular_user):
+        from app.models import CampaignRecipient, PlanType
+        from app.services.campaign_service import CampaignRejected, CampaignService
+        tenant, _ = regular_user
+        self._audience(db, tenant)
+        preview = CampaignService.preview(db, tenant, "Bonjour {{first_name|}}", "promo", {})
+        assert (preview["audience"], preview["eligible"], preview["excluded_stop"], preview["excluded_limit"]) == (5, 3, 1, 1)
+        campaign = CampaignService.create(db, tenant, "Promo", "Bonjour {{first_name|}}", "promo",
+                                          audience={"phones": ["237690000001", "237690000002", "237699999999"]})
+        assert (campaign.total, campaign.excluded, campaign.status) == (1, 1, "pending")
+        recipient = db.query(CampaignRecipient).filter(CampaignRecipient.campaign_id == campaign.id).one()
+        assert (recipient.phone_number, recipient.contact_name) == ("237690000001", "Marie Ngo")
+
+        tenant.plan = PlanType.BASIC
+        with pytest.raises(CampaignRejected) as exc:
+            CampaignService.create(db, tenant, "Promo", "Bonjour", "promo")
+        assert exc.value.status_code == 403
+
+    async def test_run_sends_paced_batch_with_accounting(self, db, regular_user):
+        from app.models import Campaign, CampaignRecipient, Message, OutboundTracking
+        from app.services.agent_service import OutboundService
+        from app.services.campaign_service import CampaignService
+        tenant, _ = regular_user
+        self._audience(db, tenant)
+        campaign = CampaignService.create(db, tenant, "Promo", "Bonjour {{first_name|}}, -20% chez {{business}}", "promo")
+        OutboundService.handle_stop(tenant.id, "237690000004", db)        # STOP reçu après la création
+
+        status, fake = await self._run(db, campaign)
+        campaign = db.get(Campaign, campaign.id)
+        assert status == "completed" and (campaign.sent, campaign.skipped, campaign.failed) == (2, 1, 0)
+        assert sorted(m["message"] for m in fake.state.sent) == [
+            "Bonjour Marie, -20% chez TestBiz", "Bonjour awa, -20% chez TestBiz"]
+        sent = db.query(CampaignRecipient).filter(CampaignRecipient.status == "sent").all()
+        assert all(r.message_id and r.sent_at for r in sent)
+        assert db.query(Message).filter(Message.direction == "outgoing").count() == 2
+        tracking = db.query(OutboundTracking).filter(OutboundTracking.phone_number == "237690000000").one()
+        assert (tracking.total_outbound_count, tracking.promo_outbound_count) == (1, 1)
+        report = CampaignService.delivery_report(db, campaign.id)
+        assert report["by_status"] == {"sent": 2, "skipped": 1}
+        assert report["reasons"][0]["reason"] == "Contact a demandé STOP"
+
+    async def test_pause_resume_and_auto_pause_on_disconnect(self, db, regular_user):
+        from scripts.fake_whatsapp_service import create_app
+        from app.models import Campaign
+        from app.services.campaign_service import CampaignRejected, CampaignService, CampaignWorker
+        tenant, _ = regular_user
+        self._audience(db, tenant)
+        campaign = CampaignService.create(db, tenant, "Promo", "Bonjour", "promo")
+        CampaignService.transition(db, campaign, "pause")
+        assert CampaignWorker.claim(db, 5, set()) == []
+        with pytest.raises(CampaignRejected) as exc:
+            CampaignService.transition(db, campaign, "pause")
+        assert exc.value.status_code == 409
+
+        # Session WhatsApp déconnectée : rien n'est perdu, la campagne se met en pause
+        CampaignService.transition(db, campaign, "resume")
+        status, _ = await self._run(db, campaign, app=create_app(unavailable_rate=1.0))
+        campaign = db.get(Campaign, campaign.id)
+        assert status == "paused" and campaign.sent == 0 and "WhatsApp déconnecté" in campaign.error
+
+        CampaignService.transition(db, campaign, "resume")
+        status, fake = await self._run(db, campaign)
+        campaign = db.get(Campaign, campaign.id)
+        assert status == "completed" and campaign.sent == 3 and len(fake.state.sent) == 3
+
+    async def test_slow_delivery_keeps_lease_and_heartbeat(self, db, regular_user, monkeypatch):
+        from datetime import datetime
+        from scripts.fake_whatsapp_service import create_app
+        from app.models import Campaign
+        from app.services import campaign_service
+        from app.services.campaign_service import CampaignService, CampaignWorker
+        from app.state_backend import get_state_backend
+        # Un seul envoi (3 × 503 + latence) dure bien plus que le bail
+        monkeypatch.setattr(campaign_service, "LEASE_TTL_SECONDS", 0.2)
+        monkeypatch.setattr(campaign_service, "RETRY_DELAYS", (0.15, 0.15, 0.15))
+        tenant, _ = regular_user
+        self._audience(db, tenant, n=1)
+        campaign = CampaignService.create(db, tenant, "Promo", "Bonjour", "promo")
+        seen = []
+
+        def _on_send(tenant_id, to, at):
+            lease = get_state_backend().get(campaign_service._lease_key(tenant_id))
+            heartbeat = db.query(Campaign.heartbeat_at).filter(Campaign.id == campaign.id).scalar()
+            seen.append((lease, (datetime.utcnow() - heartbeat).total_seconds()))
+
+        slow = create_app(latency_ms=100, unavailable_first=3, on_send=_on_send)
+        status, fake = await self._run(db, campaign, app=slow)
+        assert status == "completed" and fake.state.stats["unavailable"] == 3
+        lease, heartbeat_age = seen[0]
+        assert lease == campaign_service._lease_value(campaign.id)         # bail jamais expiré
+        assert heartbeat_age < 0.5                                         # pas vue comme morte
+        assert CampaignWorker.recover_stale(db) == 0
+
+
+# ════════════════════════════════════════════════════════════════════════════
+# Réponses différées — échéancier en mémoire (services/delayed_sender.py)
+# ════════════════════════════════════════════════════════════════════════════
+
+class TestDelayedSender:
+
+    @staticmethod
+    def _queue(db, tenant, n=3, delay=0, start=0):
+        from datetime import datetime, timedelta
+        from app.models import Conversation, QueuedMessage
+        send_at = datetime.utcnow() + timedelta(seconds=delay)
+        items = []
+        for i in range(start, start + n):
+            conv = Conversation(tenant_id=tenant.id, customer_phone=f"23769100{i:04d}", customer_name=f"client {i}")
+            db.add(conv)
+            db.flush()
+            items.append(QueuedMessage(conversation_id=conv.id, phone_number=conv.customer_phone, tenant_id=tenant.id,
+                                       response_text=f"Réponse {i}", send_at=send_at, sent=False))
+        db.add_all(items)
+        db.commit()
+        return items
+
+    @staticmethod
+    async def _send(db, ids, app=None):
+        import httpx
+        from app.http_client import set_transport
+        from app.services.delayed_sender import delayed_sender
+        from scripts.fake_whatsapp_service import create_app
+        fake = app or create_app()
+        await set_transport("whatsapp-service", httpx.ASGITransport(app=fake))
+        try:
+            stats = await delayed_sender.send_due(ids, bind=db.get_bind())
+        finally:
+            await set_transport("whatsapp-service", None)
+        db.expire_all()
+        return stats, fake
+
+    def test_heap_orders_dedupes_and_reschedules(self):
+        from datetime import datetime, timedelta
+        from app.services.delayed_sender import DelayedSender
+        now = datetime(2026, 10, 19, 12, 0, 0)
+        sender = DelayedSender()
+        sender.schedule(1, 7, now + timedelta(seconds=30))
+        sender.schedule(2, 7, now + timedelta(seconds=10))
+        sender.schedule(2, 7, now + timedelta(seconds=10))            # doublon ignoré
+        sender.schedule(3, 8, now + timedelta(seconds=5))
+        sender.schedule(3, 8, now + timedelta(seconds=40))            # reprogrammé : l'ancienne entrée est périmée
+        assert len(sender) == 3
+        assert sender.next_delay(now) == 10.0
+        assert sender.pop_due(now + timedelta(seconds=30)) == [(2, 7), (1, 7)]
+        assert sender.next_delay(now) == 40.0 and sender.pop_due(now + timedelta(seconds=60)) == [(3, 8)]
+        assert sender.next_delay(now) is None
+
+    async def test_due_batch_sent_and_recorded_once(self, db, regular_user):
+        from app.models import Message, QueuedMessage
+        tenant, _ = regular_user
+        items = self._queue(db, tenant)
+        ids = [m.id for m in items]
+
+        stats, fake = await self._send(db, ids)
+        assert stats == {"claimed": 3, "sent": 3, "failed": 0, "deferred": 0}
+        assert [m["message"] for m in fake.state.sent] == ["Réponse 0", "Réponse 1", "Réponse 2"]
+        assert all(q.sent and q.sent_at for q in db.query(QueuedMessage))
+        assert db.query(Message).filter(Message.is_ai == True, Message.direction == "outgoing").count() == 3  # noqa: E712
+
+        # Deuxième worker (ou échéance en double) : rien n'est réclamé, rien n'est renvoyé
+        stats, fake = await self._send(db, ids)
+        assert stats["claimed"] == 0 and fake.state.sent == []
+
+    async def test_human_active_deferred_and_failures_retried(self, db, regular_user):
+        from datetime import datetime
+        from app.models import ConversationHumanState, QueuedMessage
+        from app.services.delayed_sender import delayed_sender
+        from scripts.fake_whatsapp_service import create_app
+        tenant, _ = regular_user
+        items = self._queue(db, tenant, n=2)
+        db.add(ConversationHumanState(conversation_id=items[0].conversation_id, human_active=True))
+        db.commit()
+
+        stats, _ = await self._send(db, [m.id for m in items], app=create_app(unavailable_rate=1.0))
+        assert (stats["deferred"], stats["sent"], stats["failed"]) == (1, 0, 1)
+        human, failed = db.get(QueuedMessage, items[0].id), db.get(QueuedMessage, items[1].id)
+        assert not human.sent and human.retry_count == 0 and human.send_at > datetime.utcnow()
+        assert not failed.sent and failed.retry_count == 1 and failed.send_at > datetime.utcnow()
+        assert len(delayed_sender) == 2                               # les deux remis dans l'échéancier
+
+    async def test_loop_wakes_at_send_at(self, db, regular_user):
+        import asyncio
+        import httpx
+        import time
+        from app.http_client import set_transport
+        from app.services.delayed_sender import DelayedSender
+        from app.services.response_delay_service import ResponseDelayService
+        from scripts.fake_whatsapp_service import create_app
+        tenant, _ = regular_user
+        self._queue(db, tenant, n=1, delay=-1)                        # en attente avant démarrage → relu
+        arrivals = []
+        fake = create_app(on_send=lambda _tenant, _to, at: arrivals.append(at))
+        sender = DelayedSender()
+        await set_transport("whatsapp-service", httpx.ASGITransport(app=fake))
+        task = asyncio.create_task(sender.run(bind=db.get_bind()))
+        try:
+            await asyncio.sleep(0.2)
+            assert len(fake.state.sent) == 1
+            queued = self._queue(db, tenant, n=1, delay=0.3, start=1)[0]
+            t0 = time.time()
+            sender.schedule(queued.id, tenant.id, queued.send_at)
+            for _ in range(40):
+                await asyncio.sleep(0.05)
+                if len(fake.state.sent) == 2:
+                    break
+            assert len(fake.state.sent) == 2 and 0.2 <= arrivals[-1] - t0 < 0.8
+            db.expire_all()
+            assert ResponseDelayService.get_pending_queue(tenant.id, db)["pending_count"] == 0
+        finally:
+            task.cancel()
+            await set_transport("whatsapp-service", None)
+
+    async def test_stale_rows_expired_and_loop_started_on_demand(self, db, regular_user):
+        from app.models import QueuedMessage
+        from app.services.delayed_sender import DelayedSender
+        from app.services.response_delay_service import MAX_QUEUE_RETRIES
+        tenant, _ = regular_user
+        stale = self._queue(db, tenant, n=1, delay=-3600)[0]           # d'avant un long arrêt
+        fresh = self._queue(db, tenant, n=1, delay=60, start=1)[0]
+        sender = DelayedSender()
+        assert sender.load(db) == 1 and len(sender) == 1
+        db.expire_all()
+        assert db.get(QueuedMessage, stale.id).retry_count == MAX_QUEUE_RETRIES   # expiré, jamais envoyé
+        assert not db.get(QueuedMessage, fresh.id).sent
+
+        idle = DelayedSender()
+        assert idle._task is None                                      # pas de queue_response → pas de boucle
+        idle.schedule(fresh.id, tenant.id, fresh.send_at)
+        try:
+            assert idle._task is not None and not idle._task.done()
+        finally:
+            idle.stop()
+
+
+# ════════════════════════════════════════════════════════════════════════════
+# Cache d'authentification — principal par jti + blacklist en mémoire
+# ════════════════════════════════════════════════════════════════════════════
+
+class TestAuthCache:
+
+    @staticmethod
+    def _token(user):
+        from app.services.auth_service import create_access_token, decode_access_token
+        token = create_access_token({"sub": user.email, "user_id": user.id, "tenant_id": user.tenant_id})
+        return token, decode_access_token(token)
+
+    @staticmethod
+    async def _auth(db, token):
+        from fastapi.security import HTTPAuthorizationCredentials
+        from app.dependencies import get_current_user
+        return await get_current_user(HTTPAuthorizationCredentials(scheme="Bearer", credentials=token), db)
+
+    @staticmethod
+    def _count_queries(db):
+        from sqlalchemy import event
+        queries = []
+        event.listen(db.get_bind(), "before_cursor_execute", lambda *args: queries.append(args[2]))
+        return queries
+
+    async def test_cached_principal_needs_no_query(self, db, regular_user):
+        tenant, user = regular_user
+        token, _ = self._token(user)
+        assert (await self._auth(db, token)).id == user.id            # premier appel : chargement
+
+        db.expunge_all()
+        queries = self._count_queries(db)
+        current = await self._auth(db, token)
+        assert queries == []
+        assert (current.id, current.email, current.tenant_id) == (user.id, user.email, tenant.id)
+        assert current in db and current.tenant.name == "TestBiz"     # rattaché à la session de la requête
+
+    async def test_revoke_token_and_role_change_take_effect(self, db, regular_user):
+        from datetime import datetime, timezone
+        from fastapi import HTTPException
+        from app.services.auth_service import revoke_token
+        _, user = regular_user
+        token, payload = self._token(user)
+        other, _ = self._token(user)
+        await self._auth(db, token)
+        await self._auth(db, other)
+
+        revoke_token(db, payload["jti"], user.id, datetime.fromtimestamp(payload["exp"], tz=timezone.utc))
+        with pytest.raises(HTTPException) as exc:
+            await self._auth(db, token)
+        assert exc.value.status_code == 401
+
+        user.role = "admin"                                          # écriture ORM → principals invalidés
+        db.commit()
+        db.expunge_all()
+        assert (await self._auth(db, other)).role == "admin"
+
+    async def test_revocation_from_other_worker_picked_up(self, db, regular_user, monkeypatch):
+        from datetime import datetime
+        from fastapi import HTTPException
+        from app.models import RevokedToken
+        from app.services import auth_cache
+        from app.state_backend import get_state_backend
+        _, user = regular_user
+        token, payload = self._token(user)
+        await self._auth(db, token)
+
+        # Logout traité par un autre worker : ligne en base + génération publiée, rien en local
+        db.add(RevokedToken(jti=payload["jti"], user_id=user.id, expires_at=datetime.utcfromtimestamp(payload["exp"])))
+        db.commit()
+        get_state_backend().incr("auth:revoked:gen")
+        queries = self._count_queries(db)
+        await self._auth(db, token)                                   # fenêtre de revérification pas écoulée
+        assert queries == []
+
+        monkeypatch.setattr(auth_cache, "AUTH_RECHECK_SECONDS", 0)
+        with pytest.raises(HTTPException) as exc:
+            await self._auth(db, token)
+        assert exc.value.status_code == 401
@@ -257,11 +257,16 @@ export default function AdminPage() {
     setBroadcastSending(true);
     setBroadcastResult(null);
     try {
-      const res = await adminCall('/api/admin/broadcast-email', {
+      let job = await adminCall('/api/admin/broadcast-email', {
         method: 'POST',
         body: JSON.stringify({ subject: broadcastSubject, body: broadcastBody, target: broadcastTarget }),
       }).then(r => r.json());
-      setBroadcastResult(res);
+      // Envoi en arrière-plan côté backend : on suit la progression du job
+      while (job?.job_id && (job.status === 'pending' || job.status === 'running')) {
+        await new Promise(res => setTimeout(res, 1500));
+        job = await adminCall(`/api/admin/broadcast-email/${job.job_id}`).then(r => r.json());
+      }
+      setBroadcastResult(job);
     } catch (e: any) {
       console.error('[broadcast]', e);
       showToast(`❌ ${e.message}`);
@@ -415,7 +415,7 @@ export default function AgentPage() {
         headers: uploadHeaders,
         body: form,
       });
-      showToast(`PDF "${pdfFile.name}" importé ✓`);
+      showToast(`PDF "${pdfFile.name}" reçu — indexation en cours`);
       setPdfFile(null);
       await loadAgentDetails(selectedAgent);
     } catch { showToast('Erreur upload PDF', false); }
@@ -889,8 +889,11 @@ export default function AgentPage() {
                           <p className="text-sm font-medium text-white truncate">{s.name || s.source_url || 'Sans nom'}</p>
                           <p className="text-xs mt-0.5" style={{ color: 'rgba(255,255,255,0.3)' }}>
                             {s.source_type} ·{' '}
-                            <span style={{ color: s.sync_status === 'synced' ? '#FF4D00' : s.sync_status === 'pending' ? '#F59E0B' : '#EF4444' }}>
-                              {s.sync_status === 'synced' ? '● Indexé' : s.sync_status === 'pending' ? '● En attente' : '● Erreur'}
+                            <span style={{ color: s.sync_status === 'synced' ? '#FF4D00' : s.sync_status === 'error' ? '#EF4444' : '#F59E0B' }}>
+                              {s.sync_status === 'synced' ? '● Indexé'
+                                : s.sync_status === 'extracting' ? '● Extraction…'
+                                : s.sync_status === 'fetching' ? '● Synchronisation…'
+                                : s.sync_status === 'pending' ? '● En attente' : '● Erreur'}
                             </span>
                           </p>
                           {s.content_preview && (
@@ -1,7 +1,7 @@
 'use client';
 
 import { useState, useEffect } from 'react';
-import { apiCall, getBusinessInfo } from '@/lib/api';
+import { apiCall, buildApiUrl, getBusinessInfo, getToken } from '@/lib/api';
 
 interface ProductServiceItem {
   name: string;
@@ -9,7 +9,10 @@ interface ProductServiceItem {
   description: string;
   category?: string;
   url?: string; // lien page produit — bot l'envoie quand client demande ce produit
-  image_url?: string; // base64 — envoyé par le bot si le client demande ce produit
+  image_url?: string; // /media/{sha}.jpg — renvoyé par POST /api/tenants/{id}/media
+  image_id?: string;  // référence media store — envoyée par le bot si le client demande ce produit
+  aliases?: string[]; // autres noms du produit — le bot les reconnaît dans les questions clients
+  in_stock?: boolean | null; // null = non renseigné : le bot ne répond pas lui-même sur la disponibilité
 }
 
 interface BusinessConfigData {
@@ -118,7 +121,7 @@ export default function BusinessConfigForm({ tenantId }: { tenantId: number }) {
     }));
   };
 
-  const handleProductChange = (index: number, field: string, value: string | number) => {
+  const handleProductChange = (index: number, field: string, value: string | number | string[] | boolean | null) => {
     const updated = [...config.products_services];
     updated[index] = { ...updated[index], [field]: value };
     setConfig(prev => ({ ...prev, products_services: updated }));
@@ -132,7 +135,7 @@ export default function BusinessConfigForm({ tenantId }: { tenantId: number }) {
   };
 
   const handleProductImage = (index: number, file: File) => {
-    // Compression automatique par canvas — cible <200 Ko, max 900px côté le plus long
+    // Redimensionnement canvas (max 900px) avant upload — moins d'octets sur le réseau mobile
     const img = new Image();
     const objectUrl = URL.createObjectURL(file);
     img.onload = () => {
@@ -148,15 +151,24 @@ export default function BusinessConfigForm({ tenantId }: { tenantId: number }) {
       canvas.height = height;
       const ctx = canvas.getContext('2d')!;
       ctx.drawImage(img, 0, 0, width, height);
-      // Réduction de qualité par paliers jusqu'à atteindre < 200 Ko
-      let quality = 0.82;
-      let dataUrl = canvas.toDataURL('image/jpeg', quality);
-      while (dataUrl.length > 200 * 1024 * 1.37 && quality > 0.3) {
-        // base64 expand x1.37 vs octets binaires
-        quality -= 0.1;
-        dataUrl = canvas.toDataURL('image/jpeg', quality);
-      }
-      handleProductChange(index, 'image_url', dataUrl);
+      // Upload binaire (pas de base64) — le serveur recompresse et crée la vignette une fois
+      canvas.toBlob(async (blob) => {
+        if (!blob) { alert('Fichier image non lisible.'); return; }
+        const form = new FormData();
+        form.append('file', blob, 'product.jpg');
+        const token = getToken();
+        try {
+          const res = await apiCall(`/api/tenants/${tenantId}/media`, {
+            method: 'POST',
+            body: form,
+            headers: token ? { Authorization: `Bearer ${token}` } : {},
+          });
+          const data = await res.json();
+          handleProductChange(index, 'image_url', data.image_url);
+        } catch (err) {
+          alert(err instanceof Error ? err.message : "Échec de l'envoi de la photo.");
+        }
+      }, 'image/jpeg', 0.9);
     };
     img.onerror = () => { URL.revokeObjectURL(objectUrl); alert('Fichier image non lisible.'); };
     img.src = objectUrl;
@@ -386,10 +398,28 @@ export default function BusinessConfigForm({ tenantId }: { tenantId: number }) {
                   style={{ ...fieldStyle, flex: 1, padding: '5px 10px', fontSize: 12, color: MUTED }}
                 />
               </div>
+              <div style={{ display: 'flex', gap: 8, alignItems: 'center' }}>
+                <input
+                  type="text"
+                  placeholder="Autres noms (optionnel, séparés par des virgules) — ex: boubou, grand boubou"
+                  value={(item.aliases || []).join(', ')}
+                  onChange={(e) => handleProductChange(index, 'aliases', e.target.value.split(','))}
+                  style={{ ...fieldStyle, flex: 1, padding: '5px 10px', fontSize: 12, color: MUTED }}
+                />
+                <select
+                  value={item.in_stock === true ? 'yes' : item.in_stock === false ? 'no' : ''}
+                  onChange={(e) => handleProductChange(index, 'in_stock', e.target.value === '' ? null : e.target.value === 'yes')}
+                  style={{ ...fieldStyle, width: 'auto', padding: '5px 10px', fontSize: 12, color: MUTED }}
+                >
+                  <option value="">Stock non renseigné</option>
+                  <option value="yes">En stock</option>
+                  <option value="no">Rupture</option>
+                </select>
+              </div>
               <div style={{ display: 'flex', gap: 10, alignItems: 'center' }}>
                 {item.image_url && (
                   // eslint-disable-next-line @next/next/no-img-element
-                  <img src={item.image_url} alt={item.name} style={{ width: 48, height: 48, objectFit: 'cover', borderRadius: 6, border: `1px solid ${BORDER}`, flexShrink: 0 }} />
+                  <img src={item.image_url.startsWith('/media/') ? buildApiUrl(item.image_url.replace(/\.jpg$/, '.thumb.jpg')) : item.image_url} alt={item.name} style={{ width: 48, height: 48, objectFit: 'cover', borderRadius: 6, border: `1px solid ${BORDER}`, flexShrink: 0 }} />
                 )}
                 <label style={{ ...fieldStyle, padding: '6px 12px', display: 'flex', alignItems: 'center', gap: 8, cursor: 'pointer', width: 'auto', fontSize: 12, color: MUTED, boxSizing: 'border-box' as const }}>
                   📷 {item.image_url ? 'Changer la photo' : 'Ajouter une photo'} <span style={{ fontSize: 10, opacity: 0.6 }}>(compressée auto)</span>
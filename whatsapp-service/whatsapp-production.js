@@ -1029,19 +1029,23 @@ app.post('/api/whatsapp/tenants/:id/send-message', async (req, res) => {
 
 app.post('/api/whatsapp/tenants/:id/send-image', async (req, res) => {
   const tenantId = parseInt(req.params.id, 10);
-  const { to, imageBase64, caption = '', mimetype = 'image/jpeg' } = req.body || {};
+  const { to, mediaPath, imageBase64, caption = '', mimetype = 'image/jpeg' } = req.body || {};
   if (!tenantId || tenantId <= 0) return res.status(400).json({ error: 'Invalid tenantId' });
-  if (!to || !imageBase64) return res.status(400).json({ error: 'Missing: to, imageBase64' });
+  if (!to || !(mediaPath || imageBase64)) return res.status(400).json({ error: 'Missing: to, mediaPath (or imageBase64)' });
+  // mediaPath : image du media store backend (/media/<sha256>.jpg) — uniquement ce format
+  if (mediaPath && !/^\/media\/[0-9a-f]{64}(\.thumb)?\.jpg$/.test(mediaPath)) {
+    return res.status(400).json({ error: 'Invalid mediaPath' });
+  }
   const session = getTenantSession(tenantId);
   if (!session.connected || !session.socket) return res.status(503).json({ error: 'Not connected' });
   try {
     const jid = normalizeJid(to);
-    const buffer = Buffer.from(
-      imageBase64.replace(/^data:[^;]+;base64,/, ''),
-      'base64'
-    );
+    // Baileys télécharge l'URL en streaming : pas de base64 en mémoire ni dans la requête
+    const image = mediaPath
+      ? { url: `${BACKEND_URL}${mediaPath}` }
+      : Buffer.from(imageBase64.replace(/^data:[^;]+;base64,/, ''), 'base64');
     const result = await session.socket.sendMessage(jid, {
-      image: buffer,
+      image,
       caption,
       mimetype,
     });